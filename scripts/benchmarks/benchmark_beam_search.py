@@ -0,0 +1,176 @@
+"""Benchmark the decoding speed of the beam search with TransformerNMTInference.
+
+We measure the number of decoding steps per second of `BeamSearchSampler` under the following
+settings, which can be combined:
+
+- "early_return_interval": check whether all beams are dead every N steps, instead of
+  synchronizing the device with the host in every step.
+- "fuse_step": hybridize the decoder step and the beam search update as a single graph.
+- "max_cache_length": preallocate the key/value cache of the decoder.
+
+The model is randomly initialized, so the scores are meaningless but the cost of every step
+is the same as the trained model. With `--decoder rnn`, a single-layer RNN decoder replaces the
+Transformer. Its steps are cheap, so the overhead of the sampler dominates the time, and the
+settings of the key/value cache do not apply.
+
+Usage:
+
+    python3 benchmark_beam_search.py --cfg transformer_base --batch-size 32 --beam-size 4 \
+        --max-length 200 --gpu 0
+
+"""
+import argparse
+import csv
+import functools
+import itertools
+import logging
+import time
+
+import mxnet as mx
+import numpy as np
+from mxnet.gluon import nn, HybridBlock
+from gluonnlp.models.transformer import TransformerModel, TransformerNMTInference
+from gluonnlp.sequence_sampler import BeamSearchSampler, BeamSearchScorer
+from gluonnlp.utils.misc import logging_config
+
+mx.npx.set_np()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the beam search of Transformer.')
+    parser.add_argument('--decoder', choices=['transformer', 'rnn'], default='transformer',
+                        help='The decoder. "rnn" is a single-layer RNN decoder.')
+    parser.add_argument('--cfg', type=str, default='transformer_base',
+                        help='The configuration of the Transformer model.')
+    parser.add_argument('--rnn-units', type=int, default=512,
+                        help='The number of hidden units of the RNN decoder.')
+    parser.add_argument('--vocab-size', type=int, default=32000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--beam-size', type=int, default=4)
+    parser.add_argument('--src-length', type=int, default=30,
+                        help='The length of the source sentences.')
+    parser.add_argument('--max-length', type=int, default=200,
+                        help='The maximal number of decoding steps.')
+    parser.add_argument('--eos-id', type=int, default=None,
+                        help='By default, the beams never terminate so every setting runs '
+                             'max_length steps.')
+    parser.add_argument('--early-return-intervals', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeat each measurement and report the fastest one.')
+    parser.add_argument('--gpu', type=int, default=None,
+                        help='The GPU to use. By default, we use the CPU.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='beam_search_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+class RNNStepDecoder(HybridBlock):
+    def __init__(self, vocab_size, units):
+        super().__init__()
+        self.embed = nn.Embedding(input_dim=vocab_size, output_dim=units)
+        self.h2h = nn.Dense(units=units, in_units=units, flatten=False)
+        self.out_proj = nn.Dense(units=vocab_size, in_units=units, flatten=False)
+
+    @property
+    def state_batch_axis(self):
+        return 0
+
+    def forward(self, data, state):
+        new_state = mx.np.tanh(self.h2h(state) + self.embed(data))
+        return self.out_proj(new_state), new_state
+
+
+def benchmark_sampler(sampler, init_states, bos_ids, repeat):
+    """Return the number of steps and the fastest time of the beam search"""
+    best_time = None
+    num_steps = None
+    for i in range(repeat + 1):
+        mx.npx.waitall()
+        start = time.time()
+        states = init_states()
+        samples, scores, valid_length = sampler(bos_ids, states)
+        samples.wait_to_read()
+        spent = time.time() - start
+        # The first run is the warm-up
+        if i == 0:
+            continue
+        num_steps = samples.shape[2] - 1
+        if best_time is None or spent < best_time:
+            best_time = spent
+    return num_steps, best_time
+
+
+def main(args):
+    logging_config(console=True)
+    np.random.seed(args.seed)
+    mx.random.seed(args.seed)
+    ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+    bos_ids = mx.np.full((args.batch_size,), 2, ctx=ctx, dtype=np.int32)
+    if args.decoder == 'rnn':
+        rnn_decoder = RNNStepDecoder(args.vocab_size, args.rnn_units)
+        rnn_decoder.initialize(ctx=ctx)
+        rnn_decoder.hybridize()
+        cache_modes = ['none']
+    else:
+        cfg = TransformerModel.get_cfg(args.cfg)
+        cfg.defrost()
+        cfg.MODEL.src_vocab_size = args.vocab_size
+        cfg.MODEL.tgt_vocab_size = args.vocab_size
+        cfg.MODEL.max_tgt_length = max(cfg.MODEL.max_tgt_length, args.max_length + 1)
+        cfg.MODEL.layout = 'NT'
+        cfg.freeze()
+        model = TransformerModel.from_cfg(cfg)
+        model.initialize(ctx=ctx)
+        model.hybridize()
+        src_data = mx.np.random.randint(0, args.vocab_size, (args.batch_size, args.src_length),
+                                        ctx=ctx, dtype=np.int32)
+        src_valid_length = mx.np.full((args.batch_size,), args.src_length, ctx=ctx,
+                                      dtype=np.int32)
+        cache_modes = ['none', 'preallocated']
+
+    def init_states(inference_model):
+        if args.decoder == 'rnn':
+            return mx.np.zeros((args.batch_size, args.rnn_units), ctx=ctx)
+        return inference_model.init_states(src_data, src_valid_length)
+
+    results = []
+    for early_return_interval, fuse_step, cache_mode in itertools.product(
+            args.early_return_intervals, [False, True], cache_modes):
+        if args.decoder == 'rnn':
+            inference_model = rnn_decoder
+        else:
+            max_cache_length = None if cache_mode == 'none' else args.max_length + 1
+            inference_model = TransformerNMTInference(model=model,
+                                                      max_cache_length=max_cache_length)
+            inference_model.hybridize()
+        sampler = BeamSearchSampler(beam_size=args.beam_size,
+                                    decoder=inference_model,
+                                    vocab_size=args.vocab_size,
+                                    eos_id=args.eos_id,
+                                    scorer=BeamSearchScorer(alpha=0.6, K=5.0),
+                                    max_length_b=args.max_length,
+                                    early_return_interval=early_return_interval,
+                                    fuse_step=fuse_step)
+        num_steps, spent = benchmark_sampler(sampler,
+                                             functools.partial(init_states, inference_model),
+                                             bos_ids, args.repeat)
+        result = {'decoder': args.decoder,
+                  'early_return_interval': early_return_interval,
+                  'fuse_step': fuse_step,
+                  'max_cache_length': None if cache_mode == 'none' else args.max_length + 1,
+                  'num_steps': num_steps,
+                  'time': spent,
+                  'steps/sec': num_steps / spent,
+                  'sentences/sec': args.batch_size / spent}
+        logging.info(result)
+        results.append(result)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info('Results are saved to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
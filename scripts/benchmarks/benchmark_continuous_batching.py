@@ -0,0 +1,194 @@
+"""Benchmark the serving latency and throughput of the continuous batching.
+
+A local load generator sends the translation requests to a randomly initialized Transformer with
+Poisson arrivals. Each request asks for a random number of decoding steps, which mimics the
+different lengths of the translations. We compare two schedulers:
+
+- "continuous": `ContinuousBatchingScheduler`, which inserts the new requests into the free slots
+  of the state pool in every step and evicts the finished ones.
+- "static": collect up to `num_slots` waiting requests, decode them with `BeamSearchSampler`
+  (beam_size=1) until the longest request finishes and then serve the next batch.
+
+We report the p50/p99 latency of the requests, the requests/sec and the generated tokens/sec.
+
+Usage:
+
+    python3 benchmark_continuous_batching.py --cfg transformer_base --num-slots 32 \
+        --num-requests 512 --request-rate 50 --gpu 0
+
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import mxnet as mx
+import numpy as np
+from gluonnlp.models.transformer import TransformerModel, TransformerNMTInference
+from gluonnlp.sequence_sampler import BeamSearchSampler, BeamSearchScorer,\
+    ContinuousBatchingScheduler
+from gluonnlp.utils.misc import logging_config
+
+mx.npx.set_np()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the continuous batching of '
+                                                 'Transformer.')
+    parser.add_argument('--cfg', type=str, default='transformer_base',
+                        help='The configuration of the Transformer model.')
+    parser.add_argument('--vocab-size', type=int, default=32000)
+    parser.add_argument('--num-slots', type=int, default=32,
+                        help='The number of requests that are decoded together.')
+    parser.add_argument('--num-requests', type=int, default=512)
+    parser.add_argument('--request-rate', type=float, default=50.0,
+                        help='The average number of requests per second.')
+    parser.add_argument('--src-length', type=int, default=50,
+                        help='The sources are padded to this length.')
+    parser.add_argument('--min-length', type=int, default=10,
+                        help='The minimal number of decoding steps of a request.')
+    parser.add_argument('--max-length', type=int, default=100,
+                        help='The maximal number of decoding steps of a request.')
+    parser.add_argument('--modes', type=str, nargs='+', default=['continuous', 'static'],
+                        choices=['continuous', 'static'])
+    parser.add_argument('--gpu', type=int, default=None,
+                        help='The GPU to use. By default, we use the CPU.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='continuous_batching_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+def generate_requests(args, ctx):
+    """Generate the arrival times, the inputs and the number of decoding steps of the requests"""
+    arrival_times = np.cumsum(np.random.exponential(1.0 / args.request_rate, args.num_requests))
+    requests = []
+    for arrival_time in arrival_times:
+        src_valid_length = np.random.randint(1, args.src_length + 1)
+        src_data = np.random.randint(0, args.vocab_size, (1, args.src_length))
+        requests.append((arrival_time,
+                         mx.np.array(src_data, ctx=ctx, dtype=np.int32),
+                         mx.np.array([src_valid_length], ctx=ctx, dtype=np.int32),
+                         np.random.randint(args.min_length, args.max_length + 1)))
+    return requests
+
+
+async def run_load(requests, handle_request):
+    """Send the requests at their arrival times and return the latency of each request"""
+    start = time.time()
+
+    async def send(arrival_time, src_data, src_valid_length, num_steps):
+        await asyncio.sleep(max(arrival_time - (time.time() - start), 0))
+        send_time = time.time()
+        await handle_request(src_data, src_valid_length, num_steps)
+        return time.time() - send_time
+
+    latencies = await asyncio.gather(*[send(*ele) for ele in requests])
+    return np.array(latencies), time.time() - start
+
+
+async def benchmark_continuous(args, inference_model, requests):
+    scheduler = ContinuousBatchingScheduler(inference_model, num_slots=args.num_slots,
+                                            max_length=args.max_length)
+    serve_task = asyncio.ensure_future(scheduler.serve())
+    await asyncio.sleep(0)
+
+    async def handle_request(src_data, src_valid_length, num_steps):
+        await scheduler.submit(2, num_steps, src_data=src_data,
+                               src_valid_length=src_valid_length)
+
+    latencies, spent = await run_load(requests, handle_request)
+    scheduler.stop()
+    await serve_task
+    return latencies, spent
+
+
+async def benchmark_static(args, inference_model, requests):
+    queue = asyncio.Queue()
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+    scorer = BeamSearchScorer(alpha=0.0, K=0.0, from_logits=False)
+    ctx = requests[0][1].ctx
+
+    def decode_batch(batch):
+        src_data = mx.np.concatenate([ele[0] for ele in batch], axis=0)
+        src_valid_length = mx.np.concatenate([ele[1] for ele in batch], axis=0)
+        sampler = BeamSearchSampler(beam_size=1, decoder=inference_model,
+                                    vocab_size=args.vocab_size, eos_id=None, scorer=scorer,
+                                    max_length_b=max(ele[2] for ele in batch))
+        states = inference_model.init_states(src_data, src_valid_length)
+        bos_ids = mx.np.full((len(batch),), 2, ctx=ctx, dtype=np.int32)
+        samples, _, _ = sampler(bos_ids, states)
+        samples.wait_to_read()
+
+    async def serve():
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < args.num_slots and not queue.empty():
+                batch.append(queue.get_nowait())
+            await loop.run_in_executor(executor, decode_batch, batch)
+            for ele in batch:
+                ele[3].set_result(None)
+
+    serve_task = asyncio.ensure_future(serve())
+
+    async def handle_request(src_data, src_valid_length, num_steps):
+        future = loop.create_future()
+        queue.put_nowait((src_data, src_valid_length, num_steps, future))
+        await future
+
+    latencies, spent = await run_load(requests, handle_request)
+    serve_task.cancel()
+    executor.shutdown(wait=True)
+    return latencies, spent
+
+
+def main(args):
+    logging_config(console=True)
+    np.random.seed(args.seed)
+    mx.random.seed(args.seed)
+    ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+    cfg = TransformerModel.get_cfg(args.cfg)
+    cfg.defrost()
+    cfg.MODEL.src_vocab_size = args.vocab_size
+    cfg.MODEL.tgt_vocab_size = args.vocab_size
+    cfg.MODEL.max_src_length = max(cfg.MODEL.max_src_length, args.src_length)
+    cfg.MODEL.max_tgt_length = max(cfg.MODEL.max_tgt_length, args.max_length + 1)
+    cfg.MODEL.layout = 'NT'
+    cfg.freeze()
+    model = TransformerModel.from_cfg(cfg)
+    model.initialize(ctx=ctx)
+    model.hybridize()
+    inference_model = TransformerNMTInference(model=model, max_cache_length=args.max_length + 1)
+    inference_model.hybridize()
+    requests = generate_requests(args, ctx)
+    num_tokens = sum(ele[3] for ele in requests)
+    results = []
+    for mode in args.modes:
+        if mode == 'continuous':
+            benchmark_fn = benchmark_continuous
+        else:
+            benchmark_fn = benchmark_static
+        # Warm up with a few requests
+        asyncio.run(benchmark_fn(args, inference_model, requests[:args.num_slots]))
+        latencies, spent = asyncio.run(benchmark_fn(args, inference_model, requests))
+        result = {'mode': mode,
+                  'num_slots': args.num_slots,
+                  'request_rate': args.request_rate,
+                  'p50_latency': np.percentile(latencies, 50),
+                  'p99_latency': np.percentile(latencies, 99),
+                  'requests/sec': len(requests) / spent,
+                  'tokens/sec': num_tokens / spent}
+        logging.info(result)
+        results.append(result)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info('Results are saved to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -0,0 +1,104 @@
+"""Benchmark the step time of the incremental decoding of GPT-2 against max_length.
+
+We decode max_length tokens one by one with `GPT2ForLM` and report the average time of a step
+when the key/value states grow by concatenation in each step (the default), with and without
+hybridization, and when they are preallocated with `max_cache_length=max_length` and written in
+place, which requires the model not to be hybridized. The model is randomly initialized, so only
+the speed is meaningful.
+
+Usage:
+
+    python3 benchmark_kv_cache.py --cfg gpt2_124M --batch-size 8 \
+        --max-lengths 64 128 256 512 --gpu 0
+
+"""
+import argparse
+import csv
+import logging
+import time
+
+import mxnet as mx
+import numpy as np
+from gluonnlp.models.gpt2 import GPT2Model, GPT2ForLM
+from gluonnlp.utils.misc import logging_config
+
+mx.npx.set_np()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the key/value cache of GPT-2.')
+    parser.add_argument('--cfg', type=str, default='gpt2_124M',
+                        help='The configuration of the GPT-2 model.')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-lengths', type=int, nargs='+', default=[64, 128, 256, 512],
+                        help='The number of decoding steps, which is also the capacity of the '
+                             'preallocated cache.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeat each measurement and report the fastest one.')
+    parser.add_argument('--gpu', type=int, default=None,
+                        help='The GPU to use. By default, we use the CPU.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='kv_cache_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+def benchmark_decoding(model, inputs, num_steps, ctx, repeat):
+    """Return the fastest time of decoding num_steps tokens one by one"""
+    best_time = None
+    for i in range(repeat + 1):
+        mx.npx.waitall()
+        start = time.time()
+        states = model.init_states(inputs.shape[0], ctx)
+        for step in range(num_steps):
+            logits, states = model(inputs[:, step:(step + 1)], states,
+                                   mx.np.array(step, dtype=np.int32, ctx=ctx))
+        logits.wait_to_read()
+        spent = time.time() - start
+        # The first run is the warm-up
+        if i == 0:
+            continue
+        if best_time is None or spent < best_time:
+            best_time = spent
+    return best_time
+
+
+def main(args):
+    logging_config(console=True)
+    np.random.seed(args.seed)
+    mx.random.seed(args.seed)
+    ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+    cfg = GPT2Model.get_cfg(args.cfg)
+    cfg.defrost()
+    cfg.MODEL.layout = 'NT'
+    cfg.MODEL.max_length = max(cfg.MODEL.max_length, max(args.max_lengths))
+    cfg.freeze()
+    model = GPT2ForLM(cfg)
+    model.initialize(ctx=ctx)
+    results = []
+    for max_length in args.max_lengths:
+        inputs = mx.np.random.randint(0, cfg.MODEL.vocab_size, (args.batch_size, max_length),
+                                      ctx=ctx, dtype=np.int32)
+        for preallocated, hybridize in [(False, True), (False, False), (True, False)]:
+            step_model = GPT2ForLM(cfg, max_cache_length=max_length if preallocated else None)
+            step_model.share_parameters(model.collect_params())
+            if hybridize:
+                step_model.hybridize()
+            spent = benchmark_decoding(step_model, inputs, max_length, ctx, args.repeat)
+            result = {'max_length': max_length,
+                      'max_cache_length': max_length if preallocated else None,
+                      'hybridize': hybridize,
+                      'time': spent,
+                      'ms/step': 1000 * spent / max_length,
+                      'tokens/sec': args.batch_size * max_length / spent}
+            logging.info(result)
+            results.append(result)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info('Results are saved to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
@@ -0,0 +1,130 @@
+"""Benchmark the decoding speed of the beam search with the lexical shortlist.
+
+We measure the number of decoding steps per second of `BeamSearchSampler` with
+`TransformerNMTInference`, whose output layer computes the logits of either the whole target
+vocabulary or only the candidates in a shortlist of the given size. The model is randomly
+initialized and the candidates are sampled randomly, so only the speed is meaningful. Use
+`scripts/machine_translation/evaluate_transformer.py --shortlist_path` to measure the BLEU of a
+trained model with the shortlist built by `scripts/machine_translation/build_shortlist.py`.
+
+Usage:
+
+    python3 benchmark_shortlist.py --cfg transformer_base --batch-size 8 --beam-size 4 \
+        --shortlist-sizes 256 1024 4096
+
+"""
+import argparse
+import csv
+import logging
+import time
+
+import mxnet as mx
+import numpy as np
+from gluonnlp.models.transformer import TransformerModel, TransformerNMTInference
+from gluonnlp.sequence_sampler import BeamSearchSampler, BeamSearchScorer
+from gluonnlp.utils.misc import logging_config
+
+mx.npx.set_np()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the beam search of Transformer with '
+                                                 'the lexical shortlist.')
+    parser.add_argument('--cfg', type=str, default='transformer_base',
+                        help='The configuration of the Transformer model.')
+    parser.add_argument('--vocab-size', type=int, default=32000)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--beam-size', type=int, default=4)
+    parser.add_argument('--src-length', type=int, default=30,
+                        help='The length of the source sentences.')
+    parser.add_argument('--max-length', type=int, default=100,
+                        help='The number of decoding steps.')
+    parser.add_argument('--shortlist-sizes', type=int, nargs='+', default=[256, 1024, 4096],
+                        help='The number of the candidates in the shortlist of a batch.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeat each measurement and report the fastest one.')
+    parser.add_argument('--gpu', type=int, default=None,
+                        help='The GPU to use. By default, we use the CPU.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='shortlist_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+def benchmark_sampler(sampler, inference_model, src_data, src_valid_length, bos_ids, shortlist,
+                      repeat):
+    """Return the number of steps and the fastest time of the beam search"""
+    best_time = None
+    num_steps = None
+    for i in range(repeat + 1):
+        mx.npx.waitall()
+        start = time.time()
+        states = inference_model.init_states(src_data, src_valid_length, shortlist=shortlist)
+        samples, scores, valid_length = sampler(bos_ids, states)
+        samples.wait_to_read()
+        spent = time.time() - start
+        # The first run is the warm-up
+        if i == 0:
+            continue
+        num_steps = samples.shape[2] - 1
+        if best_time is None or spent < best_time:
+            best_time = spent
+    return num_steps, best_time
+
+
+def main(args):
+    logging_config(console=True)
+    np.random.seed(args.seed)
+    mx.random.seed(args.seed)
+    ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+    cfg = TransformerModel.get_cfg(args.cfg)
+    cfg.defrost()
+    cfg.MODEL.src_vocab_size = args.vocab_size
+    cfg.MODEL.tgt_vocab_size = args.vocab_size
+    cfg.MODEL.max_tgt_length = max(cfg.MODEL.max_tgt_length, args.max_length + 1)
+    cfg.MODEL.layout = 'NT'
+    cfg.freeze()
+    model = TransformerModel.from_cfg(cfg)
+    model.initialize(ctx=ctx)
+    model.hybridize()
+    src_data = mx.np.random.randint(0, args.vocab_size, (args.batch_size, args.src_length),
+                                    ctx=ctx, dtype=np.int32)
+    src_valid_length = mx.np.full((args.batch_size,), args.src_length, ctx=ctx, dtype=np.int32)
+    bos_ids = mx.np.full((args.batch_size,), 2, ctx=ctx, dtype=np.int32)
+    results = []
+    for shortlist_size in [None] + args.shortlist_sizes:
+        inference_model = TransformerNMTInference(model=model,
+                                                  max_cache_length=args.max_length + 1,
+                                                  use_shortlist=shortlist_size is not None)
+        inference_model.hybridize()
+        if shortlist_size is None:
+            shortlist = None
+        else:
+            candidate_ids = np.sort(np.random.choice(args.vocab_size, shortlist_size,
+                                                     replace=False))
+            shortlist = (candidate_ids, np.ones((args.batch_size, shortlist_size), dtype=bool))
+        # The beams never terminate so every setting runs max_length steps
+        sampler = BeamSearchSampler(beam_size=args.beam_size,
+                                    decoder=inference_model,
+                                    vocab_size=args.vocab_size,
+                                    eos_id=None,
+                                    scorer=BeamSearchScorer(alpha=0.6, K=5.0),
+                                    max_length_b=args.max_length)
+        num_steps, spent = benchmark_sampler(sampler, inference_model, src_data,
+                                             src_valid_length, bos_ids, shortlist, args.repeat)
+        result = {'shortlist_size': shortlist_size,
+                  'num_steps': num_steps,
+                  'time': spent,
+                  'steps/sec': num_steps / spent,
+                  'sentences/sec': args.batch_size / spent}
+        logging.info(result)
+        results.append(result)
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info('Results are saved to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
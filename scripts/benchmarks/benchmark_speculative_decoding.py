@@ -0,0 +1,145 @@
+"""Benchmark the speculative decoding of GPT-2.
+
+We compare the tokens/sec of sampling from the target GPT-2 model token by token with
+`SpeculativeSampler`, which verifies the tokens proposed by a small draft GPT-2 model in a
+single forward pass of the target model. We also report the acceptance rate of the proposed
+tokens and the number of generated tokens per forward pass of the target model.
+
+Usage:
+
+    python3 benchmark_speculative_decoding.py --target-model gpt2_774M --draft-model gpt2_124M \
+        --num-draft-tokens 2 4 6 --max-length 128
+
+"""
+import argparse
+import csv
+import logging
+import time
+
+import mxnet as mx
+import numpy as np
+from gluonnlp.models.gpt2 import GPT2ForLM, get_pretrained_gpt2
+from gluonnlp.sequence_sampler import SpeculativeSampler
+from gluonnlp.utils.misc import logging_config
+
+mx.npx.set_np()
+
+
+DEFAULT_PROMPTS = [
+    'The capital of France is',
+    'In a shocking finding, scientists discovered a herd of unicorns living in',
+    'Deep learning is a subfield of machine learning that',
+    'Once upon a time, there was a little girl who',
+]
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the speculative decoding of GPT-2.')
+    parser.add_argument('--target-model', type=str, default='gpt2_774M')
+    parser.add_argument('--draft-model', type=str, default='gpt2_124M')
+    parser.add_argument('--num-draft-tokens', type=int, nargs='+', default=[2, 4, 6])
+    parser.add_argument('--max-length', type=int, default=128,
+                        help='The number of generated tokens.')
+    parser.add_argument('--prompts', type=str, nargs='+', default=DEFAULT_PROMPTS,
+                        help='Each prompt is sampled separately with batch size 1.')
+    parser.add_argument('--greedy', action='store_true',
+                        help='Use the greedy decoding instead of the sampling.')
+    parser.add_argument('--temperature', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeat each measurement and report the fastest one.')
+    parser.add_argument('--gpu', type=int, default=None,
+                        help='The GPU to use. By default, we use the CPU.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='speculative_decoding_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+def get_lm_model(model_name, max_cache_length, ctx):
+    cfg, tokenizer, _, lm_params_path = get_pretrained_gpt2(model_name, load_backbone=False,
+                                                            load_lm=True)
+    model = GPT2ForLM(cfg, max_cache_length=max_cache_length)
+    model.load_parameters(lm_params_path, ctx=ctx)
+    model.hybridize()
+    return model, tokenizer
+
+
+def generate_autoregressive(model, inputs, max_length, greedy, temperature):
+    """Generate the tokens one by one with the target model"""
+    ctx = inputs.ctx
+    states = model.init_states(inputs.shape[0], ctx)
+    step_inputs = inputs
+    prev_len = 0
+    tokens = []
+    for _ in range(max_length):
+        logits, states = model(step_inputs, states,
+                               mx.np.array(prev_len, dtype=np.int32, ctx=ctx))
+        prev_len += step_inputs.shape[1]
+        if greedy:
+            step_inputs = mx.np.argmax(logits[:, -1], axis=-1).astype(np.int32)
+        else:
+            step_inputs = mx.npx.random.categorical(
+                mx.npx.softmax(logits[:, -1] / temperature)).astype(np.int32)
+        step_inputs = mx.np.expand_dims(step_inputs, axis=1)
+        tokens.append(step_inputs)
+    return mx.np.concatenate(tokens, axis=1)
+
+
+def benchmark(generate_fn, all_inputs, repeat):
+    """Return the fastest time of generating the continuations of all the prompts"""
+    best_time = None
+    for i in range(repeat + 1):
+        mx.npx.waitall()
+        start = time.time()
+        for inputs in all_inputs:
+            generate_fn(inputs).wait_to_read()
+        spent = time.time() - start
+        # The first run is the warm-up
+        if i > 0 and (best_time is None or spent < best_time):
+            best_time = spent
+    return best_time
+
+
+def main(args):
+    logging_config(console=True)
+    np.random.seed(args.seed)
+    mx.random.seed(args.seed)
+    ctx = mx.cpu() if args.gpu is None else mx.gpu(args.gpu)
+    target_model, tokenizer = get_lm_model(args.target_model, None, ctx)
+    draft_model, _ = get_lm_model(args.draft_model, None, ctx)
+    all_inputs = [mx.np.array([tokenizer.encode(prompt, int)], dtype=np.int32, ctx=ctx)
+                  for prompt in args.prompts]
+    num_tokens = args.max_length * len(all_inputs)
+    results = []
+    spent = benchmark(lambda inputs: generate_autoregressive(target_model, inputs,
+                                                             args.max_length, args.greedy,
+                                                             args.temperature),
+                      all_inputs, args.repeat)
+    results.append({'num_draft_tokens': 0,
+                    'tokens/sec': num_tokens / spent,
+                    'acceptance_rate': None,
+                    'tokens/target_call': 1.0})
+    logging.info(results[-1])
+    for num_draft_tokens in args.num_draft_tokens:
+        sampler = SpeculativeSampler(target_model, draft_model,
+                                     num_draft_tokens=num_draft_tokens,
+                                     max_length=args.max_length,
+                                     sampling=not args.greedy,
+                                     temperature=args.temperature)
+        spent = benchmark(lambda inputs: sampler(inputs)[0], all_inputs, args.repeat)
+        # The sampler is called repeat + 1 times, including the warm-up
+        num_target_calls = sampler.num_target_calls / (args.repeat + 1)
+        results.append({'num_draft_tokens': num_draft_tokens,
+                        'tokens/sec': num_tokens / spent,
+                        'acceptance_rate': sampler.acceptance_rate,
+                        'tokens/target_call': num_tokens / num_target_calls})
+        logging.info(results[-1])
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    logging.info('Results are saved to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
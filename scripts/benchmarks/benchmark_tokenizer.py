@@ -0,0 +1,304 @@
+"""Benchmark the throughput of the tokenizers in GluonNLP.
+
+For every tokenizer registered in `gluonnlp.data.tokenizers`, we measure
+
+- the cold start latency, i.e., the time of constructing the tokenizer + the first call of encode
+- the latency of pickling + unpickling the tokenizer and the size of the pickled object
+- the sentences/sec and tokens/sec of `encode`, `encode_with_offsets` and `decode`,
+  with one sentence per call ("single") or the whole corpus in one call ("batch").
+
+Usage:
+
+    python3 benchmark_tokenizer.py --corpus my_corpus.txt --out tokenizer_benchmark.csv
+
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import pickle
+import random
+import tempfile
+import timeit
+from collections import Counter
+
+import numpy as np
+from gluonnlp.base import get_repo_url
+from gluonnlp.data import Vocab
+from gluonnlp.data import tokenizers
+from gluonnlp.utils.misc import download, logging_config
+
+
+# The test models that are used to construct the tokenizers. Keys of the form "*_url" are
+# downloaded and passed to the tokenizer with the "_url" suffix removed.
+TOKENIZER_TEST_MODELS = {
+    'whitespace': {},
+    'moses': {'lang': 'en'},
+    'jieba': {},
+    'spacy': {'lang': 'en'},
+    'subword_nmt': {
+        'codec_path_url': 'tokenizer_test_models/subword-nmt/test_ende-d189ff.model',
+        'vocab_path_url': 'tokenizer_test_models/subword-nmt/test_ende_vocab-900f81.json'},
+    'yttm': {
+        'model_path_url': 'tokenizer_test_models/yttm/test_ende_yttm-6f2c39.model'},
+    'spm': {
+        'model_path_url': 'tokenizer_test_models/sentencepiece/case1/test_ende-a9bee4.model'},
+    'hf_bpe': {
+        'merges_file_url': 'tokenizer_test_models/hf_bpe/test_hf_bpe.model',
+        'vocab_file_url': 'tokenizer_test_models/hf_bpe/test_hf_bpe.vocab'},
+    'hf_bytebpe': {
+        'merges_file_url': 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.model',
+        'vocab_file_url': 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.vocab'},
+    'bytebpe': {
+        'merges_file_url': 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.model',
+        'vocab_file_url': 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.vocab'},
+    'hf_wordpiece': {
+        'vocab_file_url': 'tokenizer_test_models/hf_wordpiece/test_hf_wordpiece.vocab'},
+}
+
+SYNTHETIC_WORDS = ['the', 'of', 'and', 'GluonNLP', 'toolkit', 'provides', 'state-of-the-art',
+                   'models', 'for', 'natural', 'language', 'processing', '.', ',', '!', '?',
+                   'Goethe', 'stammte', 'aus', 'einer', 'angesehenen', 'bürgerlichen', 'Familie',
+                   'Özil', "y'all", '1,234.5', '2020', 'NLP-Toolkit', '"quoted"', '(bracket)',
+                   'e-mail@example.com', 'https://nlp.gluon.ai', 'naïve', 'café', 'Ⅷ', '😁']
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the throughput of the tokenizers.')
+    parser.add_argument('--tokenizers', type=str, nargs='+', default=None,
+                        help='The tokenizers to benchmark. By default, all registered tokenizers '
+                             'will be benchmarked. Choices are {}.'.format(tokenizers.list_all()))
+    parser.add_argument('--tokenizer-config', type=str, default=None,
+                        help='Path to a json file that maps the name of the tokenizer to the '
+                             'keyword arguments used for construction. It overwrites the '
+                             'default test models.')
+    parser.add_argument('--corpus', type=str, nargs='+', default=None,
+                        help='User-provided corpora. Each line is treated as a sentence.')
+    parser.add_argument('--num-sentences', type=int, default=2000,
+                        help='The maximum number of sentences used in each corpus.')
+    parser.add_argument('--no-synthetic', action='store_true',
+                        help='Do not benchmark on the synthetic corpus.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Repeat each measurement and report the fastest one.')
+    parser.add_argument('--seed', type=int, default=100)
+    parser.add_argument('--out', type=str, default='tokenizer_benchmark.csv',
+                        help='The output csv file.')
+    return parser
+
+
+def get_synthetic_corpus(num_sentences, min_len=5, max_len=50, seed=100):
+    rng = random.Random(seed)
+    return [' '.join(rng.choice(SYNTHETIC_WORDS)
+                     for _ in range(rng.randint(min_len, max_len)))
+            for _ in range(num_sentences)]
+
+
+def load_corpus(path, num_sentences):
+    sentences = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                sentences.append(line)
+            if len(sentences) >= num_sentences:
+                break
+    return sentences
+
+
+def get_tokenizer_kwargs(name, config, model_dir):
+    kwargs = dict()
+    for key, value in config.get(name, TOKENIZER_TEST_MODELS.get(name, {})).items():
+        if key.endswith('_url'):
+            path = os.path.join(model_dir, name, os.path.basename(value))
+            download(url=get_repo_url() + value, path=path)
+            kwargs[key[:-len('_url')]] = path
+        else:
+            kwargs[key] = value
+    return kwargs
+
+
+def best_time(fn, repeat):
+    """Return the fastest latency (in seconds) of calling fn()"""
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+class TokenizerBenchmark:
+    """Benchmark the speed of the tokenizers on a list of corpora.
+
+    Parameters
+    ----------
+    tokenizer_names
+        The names of the tokenizers registered in `gluonnlp.data.tokenizers`.
+    tokenizer_kwargs
+        Map the name of the tokenizer to the keyword arguments for construction.
+    corpora
+        Map the name of the corpus to a list of sentences.
+    repeat
+        Repeat each measurement and keep the fastest one.
+    """
+    FIELDNAMES = ['tokenizer', 'corpus', 'operation', 'mode', 'num_sentences', 'num_tokens',
+                  'latency', 'sentences_per_sec', 'tokens_per_sec', 'size', 'error']
+
+    def __init__(self, tokenizer_names, tokenizer_kwargs, corpora, repeat=3):
+        self._tokenizer_names = tokenizer_names
+        self._tokenizer_kwargs = tokenizer_kwargs
+        self._corpora = corpora
+        self._repeat = repeat
+        self._results = []
+
+    @property
+    def results(self):
+        return self._results
+
+    def _add_result(self, tokenizer_name, corpus_name, operation, mode,
+                    num_sentences=np.nan, num_tokens=np.nan, latency=np.nan, size=np.nan,
+                    error=''):
+        self._results.append({
+            'tokenizer': tokenizer_name,
+            'corpus': corpus_name,
+            'operation': operation,
+            'mode': mode,
+            'num_sentences': num_sentences,
+            'num_tokens': num_tokens,
+            'latency': latency,
+            'sentences_per_sec': num_sentences / latency if latency > 0 else np.nan,
+            'tokens_per_sec': num_tokens / latency if latency > 0 else np.nan,
+            'size': size,
+            'error': error})
+
+    def _add_failure(self, tokenizer_name, corpus_name, operation, mode, err):
+        logging.warning('{}.{} failed on "{}", skip. Error: {!r}'
+                        .format(tokenizer_name, operation, corpus_name, err))
+        self._add_result(tokenizer_name, corpus_name, operation, mode,
+                         error='{}: {}'.format(type(err).__name__, err))
+
+    def _profile_startup(self, name, sentence):
+        def cold_start():
+            tokenizer = tokenizers.create(name, **self._tokenizer_kwargs[name])
+            tokenizer.encode(sentence)
+        try:
+            latency = best_time(cold_start, self._repeat)
+        except Exception as err:  # pylint: disable=broad-except
+            self._add_failure(name, '-', 'cold_start', 'single', err)
+            return
+        self._add_result(name, '-', 'cold_start', 'single', num_sentences=1, latency=latency)
+
+    def _profile_pickle(self, name, tokenizer):
+        try:
+            pickled = pickle.dumps(tokenizer)
+            latency = best_time(lambda: pickle.loads(pickle.dumps(tokenizer)), self._repeat)
+        except Exception as err:  # pylint: disable=broad-except
+            self._add_failure(name, '-', 'pickle', 'single', err)
+            return
+        self._add_result(name, '-', 'pickle', 'single', latency=latency, size=len(pickled))
+
+    def _profile_corpus(self, name, tokenizer, corpus_name, sentences):
+        try:
+            if tokenizer.vocab is None:
+                # Build a vocabulary from the corpus for the word-level tokenizers
+                counter = Counter(token for tokens in tokenizer.encode(sentences, str)
+                                  for token in tokens)
+                tokenizer.set_vocab(Vocab(counter))
+            token_ids = tokenizer.encode(sentences, int)
+        except Exception as err:  # pylint: disable=broad-except
+            self._add_failure(name, corpus_name, 'encode', 'batch', err)
+            return
+        num_sentences = len(sentences)
+        num_tokens = sum(len(ele) for ele in token_ids)
+        workloads = [
+            ('encode', 'single', lambda: [tokenizer.encode(ele, int) for ele in sentences]),
+            ('encode', 'batch', lambda: tokenizer.encode(sentences, int)),
+            ('encode_with_offsets', 'single',
+             lambda: [tokenizer.encode_with_offsets(ele, int) for ele in sentences]),
+            ('encode_with_offsets', 'batch',
+             lambda: tokenizer.encode_with_offsets(sentences, int)),
+            ('decode', 'single', lambda: [tokenizer.decode(ele) for ele in token_ids]),
+            ('decode', 'batch', lambda: tokenizer.decode(token_ids)),
+        ]
+        for operation, mode, fn in workloads:
+            try:
+                latency = best_time(fn, self._repeat)
+            except NotImplementedError:
+                logging.info('{}.{} is not supported, skip.'.format(name, operation))
+                latency = np.nan
+            except Exception as err:  # pylint: disable=broad-except
+                self._add_failure(name, corpus_name, operation, mode, err)
+                continue
+            self._add_result(name, corpus_name, operation, mode,
+                             num_sentences=num_sentences, num_tokens=num_tokens,
+                             latency=latency)
+
+    def run(self):
+        for name in self._tokenizer_names:
+            logging.info('Benchmark tokenizer "{}"'.format(name))
+            try:
+                tokenizer = tokenizers.create(name, **self._tokenizer_kwargs[name])
+            except Exception as err:  # pylint: disable=broad-except
+                logging.warning('Cannot construct tokenizer "{}", skip. Error: {}'
+                                .format(name, err))
+                continue
+            first_sentence = next(iter(self._corpora.values()))[0]
+            self._profile_startup(name, first_sentence)
+            self._profile_pickle(name, tokenizer)
+            for corpus_name, sentences in self._corpora.items():
+                self._profile_corpus(name, tokenizer, corpus_name, sentences)
+        return self._results
+
+    def print_results(self):
+        logging.info(110 * '-')
+        logging.info('Tokenizer'.center(15) + 'Corpus'.center(20) + 'Operation'.center(22)
+                     + 'Mode'.center(8) + 'Latency (ms)'.center(15)
+                     + 'Sentences/s'.center(15) + 'Tokens/s'.center(15))
+        logging.info(110 * '-')
+        for ele in self._results:
+            logging.info(ele['tokenizer'][:15].center(15)
+                         + os.path.basename(ele['corpus'])[:20].center(20)
+                         + ele['operation'].center(22) + ele['mode'].center(8)
+                         + '{:.2f}'.format(1000 * ele['latency']).center(15)
+                         + '{:.1f}'.format(ele['sentences_per_sec']).center(15)
+                         + '{:.1f}'.format(ele['tokens_per_sec']).center(15)
+                         + ('  FAILED: ' + ele['error'] if ele['error'] else ''))
+        logging.info(110 * '-')
+
+    def save_to_csv(self, filename):
+        logging.info('Saving results to csv {}.'.format(filename))
+        with open(filename, mode='w') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=self.FIELDNAMES)
+            writer.writeheader()
+            for ele in self._results:
+                writer.writerow({k: str(v) for k, v in ele.items()})
+
+
+def main(args):
+    logging_config(console=True)
+    tokenizer_names = args.tokenizers if args.tokenizers is not None else tokenizers.list_all()
+    config = dict()
+    if args.tokenizer_config is not None:
+        with open(args.tokenizer_config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    corpora = dict()
+    if not args.no_synthetic:
+        corpora['synthetic'] = get_synthetic_corpus(args.num_sentences, seed=args.seed)
+    if args.corpus is not None:
+        for path in args.corpus:
+            corpora[path] = load_corpus(path, args.num_sentences)
+    assert len(corpora) > 0, 'No corpus to benchmark.'
+    with tempfile.TemporaryDirectory() as model_dir:
+        tokenizer_kwargs = dict()
+        for name in tokenizer_names:
+            try:
+                tokenizer_kwargs[name] = get_tokenizer_kwargs(name, config, model_dir)
+            except Exception as err:  # pylint: disable=broad-except
+                logging.warning('Cannot prepare the model of "{}", skip. Error: {}'
+                                .format(name, err))
+        benchmark = TokenizerBenchmark([name for name in tokenizer_names
+                                        if name in tokenizer_kwargs],
+                                       tokenizer_kwargs, corpora, repeat=args.repeat)
+        benchmark.run()
+    benchmark.print_results()
+    benchmark.save_to_csv(args.out)
+
+
+if __name__ == '__main__':
+    main(get_parser().parse_args())
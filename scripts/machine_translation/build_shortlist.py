@@ -0,0 +1,158 @@
+"""Build the lexical shortlist of the target vocabulary from the parallel training corpus.
+
+The shortlist is used by `evaluate_transformer.py --shortlist_path` so that the output layer of
+the Transformer only computes the logits of the candidate target tokens of each batch.
+
+Usage:
+
+    python3 build_shortlist.py \
+        --src_corpus train.tok.yttm.en --tgt_corpus train.tok.yttm.de \
+        --src_tokenizer yttm --tgt_tokenizer yttm \
+        --src_subword_model_path yttm.model --tgt_subword_model_path yttm.model \
+        --num_candidates 100 --num_frequent 200 --out shortlist_en_de.npz
+
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+from gluonnlp.data import Vocab
+from gluonnlp.data import tokenizers
+from gluonnlp.data.shortlist import LexicalShortlist
+from gluonnlp.data.streaming import tokenize_files_to_ids
+from gluonnlp.utils.misc import logging_config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build the lexical shortlist of the target vocabulary for machine '
+                    'translation.')
+    parser.add_argument('--src_corpus', type=str, nargs='+', required=True,
+                        help='The source training corpus.')
+    parser.add_argument('--tgt_corpus', type=str, nargs='+', required=True,
+                        help='The target training corpus.')
+    parser.add_argument('--src_tokenizer', choices=['spm',
+                                                    'subword_nmt',
+                                                    'yttm',
+                                                    'hf_bytebpe',
+                                                    'hf_wordpiece',
+                                                    'hf_bpe',
+                                                    'whitespace'],
+                        default='whitespace', type=str,
+                        help='The source tokenizer.')
+    parser.add_argument('--tgt_tokenizer', choices=['spm',
+                                                    'subword_nmt',
+                                                    'yttm',
+                                                    'hf_bytebpe',
+                                                    'hf_wordpiece',
+                                                    'hf_bpe',
+                                                    'whitespace'],
+                        default='whitespace', type=str,
+                        help='The target tokenizer.')
+    parser.add_argument('--src_subword_model_path', type=str,
+                        help='Path to the source subword model.')
+    parser.add_argument('--src_vocab_path', type=str,
+                        help='Path to the source vocab.')
+    parser.add_argument('--tgt_subword_model_path', type=str,
+                        help='Path to the target subword model.')
+    parser.add_argument('--tgt_vocab_path', type=str,
+                        help='Path to the target vocab.')
+    parser.add_argument('--num_candidates', type=int, default=100,
+                        help='The number of the candidate target tokens of each source token.')
+    parser.add_argument('--num_frequent', type=int, default=200,
+                        help='The number of the most frequent target tokens, which are '
+                             'candidates of all the sentences.')
+    parser.add_argument('--max_num_sentences', type=int, default=None,
+                        help='Only use the first max_num_sentences sentence pairs. By default, '
+                             'all the sentence pairs are used.')
+    parser.add_argument('--num_process', type=int, default=8,
+                        help='Number of processes used to tokenize the corpus.')
+    parser.add_argument('--cache_dir', type=str, default=None,
+                        help='The directory to save the tokenized corpus. By default, a '
+                             'temporary directory is used.')
+    parser.add_argument('--out', type=str, default='shortlist.npz',
+                        help='The path to save the shortlist.')
+    return parser.parse_args()
+
+
+def create_tokenizer(tokenizer_type, model_path, vocab_path):
+    if tokenizer_type == 'whitespace':
+        return tokenizers.create(tokenizer_type, vocab=Vocab.load(vocab_path))
+    elif tokenizer_type == 'spm':
+        return tokenizers.create(tokenizer_type, model_path=model_path, vocab=vocab_path)
+    elif tokenizer_type == 'subword_nmt':
+        return tokenizers.create(tokenizer_type, codec_path=model_path, vocab_path=vocab_path)
+    elif tokenizer_type == 'yttm':
+        return tokenizers.create(tokenizer_type, model_path=model_path)
+    elif tokenizer_type == 'hf_bytebpe':
+        return tokenizers.create(tokenizer_type, merges_file=model_path, vocab_file=vocab_path)
+    elif tokenizer_type == 'hf_wordpiece':
+        return tokenizers.create(tokenizer_type, vocab_file=vocab_path)
+    elif tokenizer_type == 'hf_bpe':
+        return tokenizers.create(tokenizer_type, merges_file=model_path, vocab_file=vocab_path)
+    else:
+        raise NotImplementedError
+
+
+def build_shortlist(args, cache_dir):
+    src_tokenizer = create_tokenizer(args.src_tokenizer, args.src_subword_model_path,
+                                     args.src_vocab_path)
+    tgt_tokenizer = create_tokenizer(args.tgt_tokenizer, args.tgt_subword_model_path,
+                                     args.tgt_vocab_path)
+    start = time.time()
+    # The source sentences end with EOS and the target sentences begin with BOS, which are
+    # the same as the inputs of the model
+    src_data = tokenize_files_to_ids(args.src_corpus, src_tokenizer,
+                                     os.path.join(cache_dir, 'src'),
+                                     suffix_ids=[src_tokenizer.vocab.eos_id],
+                                     num_process=args.num_process)
+    tgt_data = tokenize_files_to_ids(args.tgt_corpus, tgt_tokenizer,
+                                     os.path.join(cache_dir, 'tgt'),
+                                     num_process=args.num_process)
+    if len(src_data) != len(tgt_data):
+        raise ValueError('The source corpus has {} sentences but the target corpus has {}.'
+                         .format(len(src_data), len(tgt_data)))
+    logging.info('Tokenized {} sentence pairs in {:.1f}s'
+                 .format(len(src_data), time.time() - start))
+    num_sentences = len(src_data)
+    if args.max_num_sentences is not None:
+        num_sentences = min(num_sentences, args.max_num_sentences)
+    start = time.time()
+    special_ids = [tgt_tokenizer.vocab.eos_id]
+    if tgt_tokenizer.vocab.unk_id is not None:
+        special_ids.append(tgt_tokenizer.vocab.unk_id)
+    shortlist = LexicalShortlist.from_corpus(
+        (src_data[i] for i in range(num_sentences)),
+        (tgt_data[i] for i in range(num_sentences)),
+        src_vocab_size=len(src_tokenizer.vocab),
+        tgt_vocab_size=len(tgt_tokenizer.vocab),
+        num_candidates=args.num_candidates,
+        num_frequent=args.num_frequent,
+        special_ids=special_ids)
+    logging.info('Built {} from {} sentence pairs in {:.1f}s'
+                 .format(shortlist, num_sentences, time.time() - start))
+    sizes = np.array([shortlist([src_data[i]])[1].sum()
+                      for i in range(0, num_sentences, max(num_sentences // 1000, 1))])
+    logging.info('Average number of the candidates of a sentence: {:.1f}, '
+                 'ratio to the target vocabulary: {:.3f}'
+                 .format(sizes.mean(), sizes.mean() / len(tgt_tokenizer.vocab)))
+    shortlist.save(args.out)
+    logging.info('Shortlist is saved to {}'.format(args.out))
+
+
+def main():
+    args = parse_args()
+    logging_config(console=True)
+    logging.info(args)
+    if args.cache_dir is not None:
+        build_shortlist(args, args.cache_dir)
+    else:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            build_shortlist(args, cache_dir)
+
+
+if __name__ == '__main__':
+    main()
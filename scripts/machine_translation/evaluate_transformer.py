@@ -8,13 +8,13 @@ import logging
 import time
 from gluonnlp.utils.misc import logging_config
 from gluonnlp.models.transformer import TransformerModel,\
-    TransformerNMTInference
+    TransformerNMTInference, TranslationEngine
 from gluonnlp.data.batchify import Tuple, Pad, Stack
 from gluonnlp.data.filtering import MosesNormalizer
+from gluonnlp.data.shortlist import LexicalShortlist
 from gluonnlp.data import tokenizers
 from gluonnlp.sequence_sampler import BeamSearchSampler, BeamSearchScorer
 import sacrebleu
-from tqdm import tqdm
 mx.npx.set_np()
 
 
@@ -65,6 +65,22 @@ def parse_args():
                         help='The a in the a * x + b formula of beam search')
     parser.add_argument('--max_length_b', type=int, default=50,
                         help='The b in the a * x + b formula of beam search')
+    parser.add_argument('--compact_interval', type=int, default=None,
+                        help='If set, drop the finished sentences from the batch every '
+                             'compact_interval steps of beam search.')
+    parser.add_argument('--max_num_tokens', type=int, default=2048,
+                        help='The maximal number of source tokens in a batch of translation. '
+                             'The sentences are sorted by length before batching.')
+    parser.add_argument('--max_num_sentences', type=int, default=128,
+                        help='The maximal number of sentences in a batch of translation.')
+    parser.add_argument('--inference_chunk_size', type=int, default=10000,
+                        help='The number of sentences translated and written at a time '
+                             'with --inference. The sentences are sorted by length within '
+                             'each chunk.')
+    parser.add_argument('--shortlist_path', type=str, default=None,
+                        help='The path to the lexical shortlist built by build_shortlist.py. '
+                             'If set, the output layer only computes the logits of the '
+                             'candidate target tokens of each batch.')
     parser.add_argument('--param_path', type=str, help='The path to the model parameters.')
     parser.add_argument('--gpus', type=str, default='0',
                         help='List of gpus to run, e.g. 0 or 0,2,5. empty means using cpu.'
@@ -78,6 +94,8 @@ def parse_args():
                         'when applying inference, tgt_corpus is not needed and will be set to None.')
     parser.add_argument('--fp16', action='store_true',
                         help='Whether to use dtype float16')
+    parser.add_argument('--num_process', type=int, default=1,
+                        help='Number of processes used to normalize and tokenize the corpus.')
     args = parser.parse_args()
     if args.save_dir is None:
         args.save_dir = os.path.splitext(args.param_path)[0] + '_evaluation'
@@ -91,22 +109,21 @@ def parse_args():
 
 def process_corpus(corpus_path, sentence_normalizer, bpe_tokenizer,
                    base_tokenizer=None, add_bos=True,
-                   add_eos=True):
-    processed_token_ids = []
-    raw_lines = []
+                   add_eos=True, num_process=1):
     with open(corpus_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            raw_lines.append(line)
-            line = sentence_normalizer(line)
-            if base_tokenizer is not None:
-                line = ' '.join(base_tokenizer.encode(line))
-            bpe_token_ids = bpe_tokenizer.encode(line, output_type=int)
-            if add_bos:
-                bpe_token_ids = [bpe_tokenizer.vocab.bos_id] + bpe_token_ids
-            if add_eos:
-                bpe_token_ids.append(bpe_tokenizer.vocab.eos_id)
-            processed_token_ids.append(bpe_token_ids)
+        raw_lines = [line.strip() for line in f]
+    lines = sentence_normalizer.batch_normalize(raw_lines, num_process=num_process)
+    if base_tokenizer is not None:
+        lines = [' '.join(tokens)
+                 for tokens in base_tokenizer.batch_encode(lines, num_process=num_process)]
+    processed_token_ids = []
+    for line in lines:
+        bpe_token_ids = bpe_tokenizer.encode(line, output_type=int)
+        if add_bos:
+            bpe_token_ids = [bpe_tokenizer.vocab.bos_id] + bpe_token_ids
+        if add_eos:
+            bpe_token_ids.append(bpe_tokenizer.vocab.eos_id)
+        processed_token_ids.append(bpe_token_ids)
     return processed_token_ids, raw_lines
 
 
@@ -156,7 +173,12 @@ def evaluate(args):
     model = TransformerModel.from_cfg(cfg)
     model.hybridize()
     model.load_parameters(args.param_path, ctx=ctx_l)
-    inference_model = TransformerNMTInference(model=model)
+    if args.shortlist_path is not None:
+        shortlist = LexicalShortlist.load(args.shortlist_path)
+        logging.info(shortlist)
+    else:
+        shortlist = None
+    inference_model = TransformerNMTInference(model=model, use_shortlist=shortlist is not None)
     inference_model.hybridize()
     # Construct the BeamSearchSampler
     if args.stochastic:
@@ -175,7 +197,8 @@ def evaluate(args):
                                             scorer=scorer,
                                             stochastic=args.stochastic,
                                             max_length_a=args.max_length_a,
-                                            max_length_b=args.max_length_b)   
+                                            max_length_b=args.max_length_b,
+                                            compact_interval=args.compact_interval)
 
     logging.info(beam_search_sampler)
     all_src_token_ids, all_src_lines = process_corpus(
@@ -184,7 +207,8 @@ def evaluate(args):
         base_tokenizer=base_src_tokenizer,
         bpe_tokenizer=src_tokenizer,
         add_bos=False,
-        add_eos=True
+        add_eos=True,
+        num_process=args.num_process
     )
     if args.tgt_corpus is not None:
         all_tgt_token_ids, all_tgt_lines = process_corpus(
@@ -193,24 +217,37 @@ def evaluate(args):
             base_tokenizer=base_tgt_tokenizer,
             bpe_tokenizer=tgt_tokenizer,
             add_bos=True,
-            add_eos=True
+            add_eos=True,
+            num_process=args.num_process
         )
     else: # when applying inference, populate the fake tgt tokens
         all_tgt_token_ids = all_tgt_lines = [[] for i in range(len(all_src_token_ids))]
-    test_dataloader = gluon.data.DataLoader(
-        list(zip(all_src_token_ids,
-                 [len(ele) for ele in all_src_token_ids],
-                 all_tgt_token_ids,
-                 [len(ele) for ele in all_tgt_token_ids])),
-        batch_size=32,
-        batchify_fn=Tuple(Pad(), Stack(), Pad(), Stack()),
-        shuffle=False)
-
     ctx = ctx_l[0]
-    pred_sentences = []
+
+    def detokenize(tgt_token_ids):
+        bpe_decode_line = tgt_tokenizer.decode(tgt_token_ids)
+        return base_tgt_tokenizer.decode(bpe_decode_line.split(' '))
+
+    translation_engine = TranslationEngine(inference_model, beam_search_sampler,
+                                           bos_id=tgt_vocab.bos_id,
+                                           eos_id=tgt_vocab.eos_id,
+                                           decode_fn=detokenize,
+                                           max_num_tokens=args.max_num_tokens,
+                                           max_num_sentences=args.max_num_sentences,
+                                           shortlist=shortlist,
+                                           ctx=ctx)
+    logging.info(translation_engine)
     start_eval_time = time.time()
     # evaluate
     if not args.inference:
+        test_dataloader = gluon.data.DataLoader(
+            list(zip(all_src_token_ids,
+                     [len(ele) for ele in all_src_token_ids],
+                     all_tgt_token_ids,
+                     [len(ele) for ele in all_tgt_token_ids])),
+            batch_size=32,
+            batchify_fn=Tuple(Pad(), Stack(), Pad(), Stack()),
+            shuffle=False)
         avg_nll_loss = 0
         ntokens = 0
         for i, (src_token_ids, src_valid_length, tgt_token_ids, tgt_valid_length)\
@@ -227,18 +264,12 @@ def evaluate(args):
                                                 sequence_length=tgt_valid_length - 1,
                                                 use_sequence_length=True, axis=1).sum().asnumpy()
             ntokens += int((tgt_valid_length - 1).sum().asnumpy())
-            init_input = mx.np.array([tgt_vocab.bos_id for _ in range(src_token_ids.shape[0])], ctx=ctx)
-            states = inference_model.init_states(src_token_ids, src_valid_length)
-            samples, scores, valid_length = beam_search_sampler(init_input, states, src_valid_length)
-            for j in range(samples.shape[0]):
-                pred_tok_ids = samples[j, 0, :valid_length[j, 0].asnumpy()].asnumpy().tolist()
-                bpe_decode_line = tgt_tokenizer.decode(pred_tok_ids[1:-1])
-                pred_sentence = base_tgt_tokenizer.decode(bpe_decode_line.split(' '))
-                pred_sentences.append(pred_sentence)
-                print(pred_sentence)
-            print('Processed {}/{}'.format(len(pred_sentences), len(all_tgt_lines)))
-        end_eval_time = time.time()
         avg_nll_loss = avg_nll_loss / ntokens
+        start_translate_time = time.time()
+        pred_sentences = translation_engine.translate_ids(all_src_token_ids, detokenize=True)
+        end_eval_time = time.time()
+        logging.info('Translated {} sentences in {:.2f}s'
+                     .format(len(pred_sentences), end_eval_time - start_translate_time))
 
         with open(os.path.join(args.save_dir, 'gt_sentences.txt'), 'w', encoding='utf-8') as of:
             of.write('\n'.join(all_tgt_lines))
@@ -260,26 +291,25 @@ def evaluate(args):
                              avg_nll_loss, np.exp(avg_nll_loss)))
     # inference only
     else:
+        # Translate the corpus chunk by chunk, so the translations are written as they are
+        # done and only a chunk of them is kept in memory
+        num_inferred = 0
         with open(os.path.join(args.save_dir, 'pred_sentences.txt'), 'w', encoding='utf-8') as of:
-            processed_sentences = 0
-            for src_token_ids, src_valid_length, _, _ in tqdm(test_dataloader):
-                src_token_ids = mx.np.array(src_token_ids, ctx=ctx, dtype=np.int32)
-                src_valid_length = mx.np.array(src_valid_length, ctx=ctx, dtype=np.int32)
-                init_input = mx.np.array([tgt_vocab.bos_id for _ in range(src_token_ids.shape[0])], ctx=ctx)
-                states = inference_model.init_states(src_token_ids, src_valid_length)
-                samples, scores, valid_length = beam_search_sampler(init_input, states, src_valid_length)
-                for j in range(samples.shape[0]):
-                    pred_tok_ids = samples[j, 0, :valid_length[j, 0].asnumpy()].asnumpy().tolist()
-                    bpe_decode_line = tgt_tokenizer.decode(pred_tok_ids[1:-1])
-                    pred_sentence = base_tgt_tokenizer.decode(bpe_decode_line.split(' '))
-                    pred_sentences.append(pred_sentence)
-                of.write('\n'.join(pred_sentences))
-                of.write('\n')
-                processed_sentences += len(pred_sentences)
-                pred_sentences = []
+            for chunk_begin in range(0, len(all_src_token_ids), args.inference_chunk_size):
+                pred_sentences = translation_engine.translate_ids(
+                    all_src_token_ids[chunk_begin:(chunk_begin + args.inference_chunk_size)],
+                    detokenize=True)
+                for sentence in pred_sentences:
+                    of.write(sentence)
+                    of.write('\n')
+                of.flush()
+                num_inferred += len(pred_sentences)
+                logging.info('Inferred {}/{} sentences, {:.2f}s'
+                             .format(num_inferred, len(all_src_token_ids),
+                                     time.time() - start_eval_time))
         end_eval_time = time.time()
         logging.info('Time Spent: {}, Inferred sentences: {}'
-                     .format(end_eval_time - start_eval_time, processed_sentences))
+                     .format(end_eval_time - start_eval_time, num_inferred))
 
 if __name__ == '__main__':
     os.environ['MXNET_GPU_MEM_POOL_TYPE'] = 'Round'
@@ -57,6 +57,7 @@ import gluonnlp.data.batchify as bf
 from gluonnlp.data import Vocab
 from gluonnlp.data import tokenizers
 from gluonnlp.data.tokenizers import BaseTokenizerWithVocab
+from gluonnlp.data.streaming import RaggedIdStore, tokenize_files_to_ids
 from gluonnlp.lr_scheduler import InverseSquareRootScheduler
 from gluonnlp.loss import LabelSmoothCrossEntropyLoss
 try:
@@ -229,47 +230,49 @@ def validation(model, data_loader, ctx_l):
     return avg_loss
 
 
+def barrier(comm_backend, ctx):
+    """Wait until all the workers reach the barrier"""
+    if comm_backend == 'horovod':
+        hvd.allreduce(mx.np.zeros((1,), ctx=ctx), name='barrier').asnumpy()
+
+
 def load_dataset_with_cache(src_corpus_path: str,
                             tgt_corpus_path: str,
                             src_tokenizer: BaseTokenizerWithVocab,
                             tgt_tokenizer: BaseTokenizerWithVocab,
                             overwrite_cache: bool,
-                            local_rank: int):
-    # TODO online h5py multi processing encode (Tao)
+                            local_rank: int,
+                            comm_backend: str,
+                            ctx):
     src_md5sum = md5sum(src_corpus_path)
     tgt_md5sum = md5sum(tgt_corpus_path)
-    cache_filepath = os.path.join(CACHE_PATH,
-                                  '{}_{}.cache.npz'.format(src_md5sum[:6], tgt_md5sum[:6]))
-    if os.path.exists(cache_filepath) and not overwrite_cache:
-        if local_rank == 0:
-            logging.info('Load cache from {}'.format(cache_filepath))
-        npz_data = np.load(cache_filepath, allow_pickle=True)
-        src_data, tgt_data = npz_data['src_data'][:], npz_data['tgt_data'][:]
-    else:
-        assert src_tokenizer.vocab.eos_id is not None,\
-            'You will need to add the EOS token to the vocabulary used in the tokenizer of ' \
-            'the source language.'
-        assert tgt_tokenizer.vocab.bos_id is not None and tgt_tokenizer.vocab.eos_id is not None, \
-            'You will need to add both the BOS token and the EOS tokens to the vocabulary used ' \
-            'in the tokenizer of the target language.'
-        src_data = []
-        tgt_data = []
-        # TODO(sxjscience) Optimize the speed of converting to cache
-        with open(src_corpus_path) as f:
-            for line in f:
-                sample = np.array(src_tokenizer.encode(line.strip(), output_type=int) +
-                                  [src_tokenizer.vocab.eos_id], dtype=np.int32)
-                src_data.append(sample)
-        with open(tgt_corpus_path) as f:
-            for line in f:
-                sample = np.array([tgt_tokenizer.vocab.bos_id] +
-                                  tgt_tokenizer.encode(line.strip(), output_type=int) +
-                                  [tgt_tokenizer.vocab.eos_id], dtype=np.int32)
-                tgt_data.append(sample)
-        src_data = np.array(src_data)
-        tgt_data = np.array(tgt_data)
-        np.savez(cache_filepath, src_data=src_data, tgt_data=tgt_data)
-    return src_data, tgt_data
+    cache_dir = os.path.join(CACHE_PATH,
+                             '{}_{}.cache'.format(src_md5sum[:6], tgt_md5sum[:6]))
+    src_cache_dir = os.path.join(cache_dir, 'src')
+    tgt_cache_dir = os.path.join(cache_dir, 'tgt')
+    # Only the first worker of each machine builds the cache, and the other workers wait for it,
+    # because the workers of a machine share cache_dir
+    if local_rank == 0:
+        if os.path.exists(os.path.join(src_cache_dir, 'meta.json')) and\
+                os.path.exists(os.path.join(tgt_cache_dir, 'meta.json')) and not overwrite_cache:
+            logging.info('Load cache from {}'.format(cache_dir))
+        else:
+            assert src_tokenizer.vocab.eos_id is not None,\
+                'You will need to add the EOS token to the vocabulary used in the tokenizer of ' \
+                'the source language.'
+            assert tgt_tokenizer.vocab.bos_id is not None\
+                and tgt_tokenizer.vocab.eos_id is not None, \
+                'You will need to add both the BOS token and the EOS tokens to the vocabulary ' \
+                'used in the tokenizer of the target language.'
+            tokenize_files_to_ids(src_corpus_path, src_tokenizer, src_cache_dir,
+                                  suffix_ids=[src_tokenizer.vocab.eos_id],
+                                  resume=not overwrite_cache)
+            tokenize_files_to_ids(tgt_corpus_path, tgt_tokenizer, tgt_cache_dir,
+                                  prefix_ids=[tgt_tokenizer.vocab.bos_id],
+                                  suffix_ids=[tgt_tokenizer.vocab.eos_id],
+                                  resume=not overwrite_cache)
+    barrier(comm_backend, ctx)
+    return RaggedIdStore(src_cache_dir), RaggedIdStore(tgt_cache_dir)
 
 
 def create_tokenizer(tokenizer_type, model_path, vocab_path):
@@ -307,13 +310,17 @@ def train(args):
                                                              src_tokenizer,
                                                              tgt_tokenizer,
                                                              args.overwrite_cache,
-                                                             local_rank)
+                                                             local_rank,
+                                                             args.comm_backend,
+                                                             ctx_l[0])
     dev_src_data, dev_tgt_data = load_dataset_with_cache(args.dev_src_corpus,
                                                          args.dev_tgt_corpus,
                                                          src_tokenizer,
                                                          tgt_tokenizer,
                                                          args.overwrite_cache,
-                                                         local_rank)
+                                                         local_rank,
+                                                         args.comm_backend,
+                                                         ctx_l[0])
     data_train = gluon.data.SimpleDataset(
         [(src_tokens, tgt_tokens, len(src_tokens), len(tgt_tokens), i)
          for i, (src_tokens, tgt_tokens) in enumerate(zip(train_src_data, train_tgt_data))])
@@ -48,7 +48,8 @@ python3 train_transformer.py \
 split -l 400000 ${datapath}/wmt2014_mono/train.tok.${TGT} ${datapath}/wmt2014_mono/train.tok.${TGT}.split -d -a 3
 
 # Infer the synthetic data
-# Notice that some batches are too large and GPU memory may be not enough
+# The sentences are sorted by length and batched by the number of tokens, so lower
+# --max_num_tokens if the GPU memory is not enough
 GPUS=(0 1 2 3)
 IDX=0
 for NUM in ` seq -f %03g 0 193 `; do
@@ -73,6 +74,8 @@ for NUM in ` seq -f %03g 0 193 `; do
             --src_corpus ${split_corpus} \
             --save_dir ${split_corpus/.${TGT}./.${SRC}.} \
             --beam-size 1 \
+            --max_num_tokens 8192 \
+            --max_num_sentences 512 \
             --inference \
             --gpus ${GPUS[IDX]}
     } &
@@ -5,12 +5,13 @@ from . import (
     clean_tok_para_corpus,
     clean_tok_mono_corpus,
     learn_subword,
-    apply_subword
+    apply_subword,
+    dedup_corpus
 )
 
 
 SUBCOMMANDS = ['clean_tok_para_corpus', 'clean_tok_mono_corpus',
-               'learn_subword', 'apply_subword', 'help']
+               'learn_subword', 'apply_subword', 'dedup_corpus', 'help']
 
 
 def cli_main():
@@ -39,6 +40,10 @@ def cli_main():
         parser = apply_subword.get_parser()
         sub_args = parser.parse_args(other_args)
         apply_subword.main(sub_args)
+    elif args.command == 'dedup_corpus':
+        parser = dedup_corpus.get_parser()
+        sub_args = parser.parse_args(other_args)
+        dedup_corpus.main(sub_args)
     elif args.command == 'help':
         parser.print_help()
     else:
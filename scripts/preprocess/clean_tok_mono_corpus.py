@@ -1,16 +1,18 @@
 import argparse
 import os
-import multiprocessing
 import time
-import numpy as np
 import warnings
 import re
-from gluonnlp.data.filtering import MosesNormalizer
+from gluonnlp.data.filtering import MosesNormalizer, LanguageIdentifier, FilterPipeline
 from gluonnlp.data.tokenizers import MosesTokenizer, BaseTokenizer,\
                                      WhitespaceTokenizer, JiebaTokenizer
 from typing import List, Union, Optional
 re._MAXCACHE = 1024
 
+# The tokenizers that never reduce the number of whitespace-separated words of a sentence
+# normalized by MosesNormalizer. It is tested in tests/test_data_filtering.py.
+_WORD_PRESERVING_TOKENIZERS = (MosesTokenizer, WhitespaceTokenizer, JiebaTokenizer)
+
 
 def get_tokenizer(tokenizer, lang=None):
     if isinstance(tokenizer, BaseTokenizer):
@@ -48,29 +50,6 @@ def check_latin1(sentence: str) -> bool:
         return True
 
 
-def get_line_byte_start(corpus_path: str) -> np.ndarray:
-    """Get the start position of each lines in terms of bytes so that we can use seek + read to
-     load an arbitrary line.
-
-    Parameters
-    ----------
-    corpus_path
-        The path of the corpus
-
-    Returns
-    -------
-    line_pos
-        Shape (#Lens + 1,)
-    """
-    line_pos = [0]
-    with open(corpus_path, 'rb') as in_f:
-        pos = 0
-        for line in in_f:
-            pos += len(line)
-            line_pos.append(pos)
-    return np.array(line_pos, dtype=np.int64)
-
-
 class MonoCorpusProcessor:
     """Process sentence of corpus.
 
@@ -83,58 +62,104 @@ class MonoCorpusProcessor:
 
     1. Normalize sentence
     2. Pre-filter
+        2.1 Remove sentences that cannot be encoded in latin1
+        2.2 Remove sentences whose language is not detected as lang
+        2.3 Remove sentences with more than max_num_words whitespace-separated words. After the
+            normalization removes the non-printable characters, the Moses, whitespace and Jieba
+            tokenizers never reduce the number of words, so these sentences would be removed
+            after tokenization anyway. It is skipped for the other tokenizers.
     3. Tokenize the sentence
     4. Filter the sentence based on different rules
-        3.1 Remove sentences where `max(len(lhs) / len(rhs), len(rhs) / len(lhs) > max_ratio`
-        3.2 Remove sentences where not `min_max_words <= len(lhs) <= max_num_words` and
-                                       `min_max_words <= len(rhs) <= max_num_words`
+        4.1 Remove sentences where not `min_max_words <= len(sentence) <= max_num_words`
+
+    The stages are fused into a :class:`~gluonnlp.data.filtering.FilterPipeline`, so the cheap
+    pre-filters are applied before the expensive tokenization.
     """
     def __init__(self, lang: str,
                  normalize: bool = True,
                  tokenizer: Union[str, BaseTokenizer] = 'whitespace',
                  min_num_words: Optional[int] = None,
                  max_num_words: Optional[int] = None,
-                 discard_non_latin1: bool = False):
+                 discard_non_latin1: bool = False,
+                 lang_id_algo: Optional[str] = None,
+                 min_lang_id_score: float = 0.0):
         self._lang = lang
+        self._normalize = normalize
         if normalize:
             self._normalizer = MosesNormalizer(lang=lang)
         self._tokenizer = get_tokenizer(tokenizer, lang)
         self._min_num_words = min_num_words
         self._max_num_words = max_num_words
         self._discard_non_latin1 = discard_non_latin1
+        if lang_id_algo is not None:
+            self._lang_id = LanguageIdentifier(algo=lang_id_algo)
+        else:
+            self._lang_id = None
+        self._min_lang_id_score = min_lang_id_score
+
+    def normalize(self, sample):
+        return self._normalizer(sample[0]),
+
+    def check_latin1(self, sample):
+        return check_latin1(sample[0])
 
-    def process_chunk(self, args):
-        path, chunk_start, chunk_size = args
-        processed_lines = []
-        with open(path, 'rb') as in_f:
-            # Read chunk
-            in_f.seek(chunk_start)
-            lines = in_f.read(chunk_size)
-            lines = lines.splitlines()
-            unfiltered_line_num = len(lines)
-            for line in lines:
-                line = line.decode('utf-8').strip()
-                # 1. Normalize
-                line = self._normalizer(line)
-                # 2. Filter after normalization.
-                if self._discard_non_latin1:
-                    if not check_latin1(line):
-                        continue
-                # 3. Tokenize the sentence
-                tokens = self._tokenizer.encode(line)
-                # 4. Filter after tokenization. Filter with multiple rules
-                if len(tokens) == 0:
-                    continue
-                if self._max_num_words is not None:
-                    if len(tokens) > self._max_num_words:
-                        continue
-                if self._min_num_words is not None:
-                    if len(tokens) < self._min_num_words:
-                        continue
-                processed_lines.append(' '.join(tokens))
-        return processed_lines, unfiltered_line_num
-
-    def process_mono_corpus(self, 
+    def check_lang_id(self, samples):
+        labels, scores = self._lang_id.predict_batch([ele[0] for ele in samples])
+        return (labels == self._lang) & (scores >= self._min_lang_id_score)
+
+    def check_max_num_whitespace_words(self, sample):
+        """Reject the sentence with more than max_num_words whitespace-separated words
+
+        It assumes that the tokenizer does not reduce the number of whitespace-separated words
+        of a normalized sentence. Thus, it is only used with the tokenizers in
+        `_WORD_PRESERVING_TOKENIZERS` and never rejects a sentence that `check_num_words` would
+        keep after the tokenization.
+        """
+        return len(sample[0].split()) <= self._max_num_words
+
+    def tokenize(self, sample):
+        return ' '.join(self._tokenizer.encode(sample[0])),
+
+    def check_not_empty(self, sample):
+        return len(sample[0]) > 0
+
+    def check_num_words(self, sample):
+        num_tokens = len(sample[0].split())
+        if self._max_num_words is not None and num_tokens > self._max_num_words:
+            return False
+        if self._min_num_words is not None and num_tokens < self._min_num_words:
+            return False
+        return True
+
+    def build_pipeline(self) -> FilterPipeline:
+        """Build the pipeline of the processing stages
+
+        Returns
+        -------
+        pipeline
+            The pipeline that processes the (sentence,) samples
+        """
+        pipeline = FilterPipeline()
+        # 1. Normalize
+        if self._normalize:
+            pipeline.add_map('normalize', self.normalize)
+        # 2. Filter after normalization with the cheap rules
+        if self._discard_non_latin1:
+            pipeline.add_filter('latin1', self.check_latin1)
+        if self._lang_id is not None:
+            pipeline.add_filter('lang_id', self.check_lang_id, batched=True)
+        if self._normalize and self._max_num_words is not None\
+                and isinstance(self._tokenizer, _WORD_PRESERVING_TOKENIZERS):
+            pipeline.add_filter('max_num_words_prefilter', self.check_max_num_whitespace_words)
+        # 3. Tokenize the sentence
+        pipeline.add_map('tokenize', self.tokenize)
+        # 4. Filter after tokenization. Filter with multiple rules
+        pipeline.add_filter('empty', self.check_not_empty)
+        if self._max_num_words is not None or self._min_num_words is not None:
+            pipeline.add_filter('num_words', self.check_num_words)
+        return pipeline
+
+    def process_mono_corpus(self,
                             corpus_paths: List[str],
                             out_path: str,
                             chunk_size: int = 1024 * 1024,
@@ -158,45 +183,15 @@ class MonoCorpusProcessor:
             The number of lines in the final filtered file
         """
         start = time.time()
-        total_line_count = 0
-        filtered_line_count = 0
-
-        def chunk_iterator(step=10):
-            for path in corpus_paths:
-                line_pos = get_line_byte_start(path)
-                line_size = line_pos[1:] - line_pos[:-1]
-                num_lines = line_pos.shape[0] - 1
-                budget = chunk_size
-                chunk_start = 0
-                cur_chunk_size = 0
-                for i in range(0, num_lines, step):
-                    line_batch_num = min(num_lines - i, step)
-                    batch_line_size = line_size[i:(i + line_batch_num)].sum()
-                    budget -= batch_line_size
-                    cur_chunk_size += batch_line_size
-                    if budget <= 0 or i + step >= num_lines:
-                        yield path, chunk_start, cur_chunk_size
-                        chunk_start += cur_chunk_size
-                        cur_chunk_size = 0
-                        budget = chunk_size
-
-        with open(out_path, 'w', encoding='utf-8', newline='\n') as out_f:
-            with multiprocessing.Pool(num_process) as pool:
-                for i, (processed_lines, unfiltered_line_num) in \
-                        enumerate(pool.imap(self.process_chunk, chunk_iterator())):
-                    out_f.write('\n'.join(processed_lines) + '\n')
-                    filtered_line_count += len(processed_lines)
-                    total_line_count += unfiltered_line_num
-                    if (i + 1) % 100 == 0:
-                        print('Chunk {}, #Lines Processed: {}, Filtered: {}, Remain: {}'
-                              .format(i + 1, total_line_count,
-                                      total_line_count - filtered_line_count,
-                                      filtered_line_count))
+        stats = self.build_pipeline().process_files([corpus_paths], [out_path],
+                                                    num_process=num_process,
+                                                    chunk_size=chunk_size)
         end = time.time()
-        print('Done, #Lines {}/{}, Time spent {}'.format(filtered_line_count,
-                                                         total_line_count,
+        print(stats)
+        print('Done, #Lines {}/{}, Time spent {}'.format(stats.num_outputs,
+                                                         stats.num_inputs,
                                                          end - start))
-        return filtered_line_count
+        return stats.num_outputs
 
 
 def get_parser():
@@ -213,6 +208,12 @@ def get_parser():
     parser.add_argument('--discard-non-latin1', action='store_true',
                         help='Whether to discard the sentence pair if both sentences cannot be '
                              'encoded into latin1.')
+    parser.add_argument('--lang-id-algo', type=str, default=None,
+                        choices=['fasttext', 'fasttext_compressed', 'langid'],
+                        help='If set, discard the sentence if the language detected by the '
+                             'algorithm is not --lang.')
+    parser.add_argument('--min-lang-id-score', type=float, default=0.0,
+                        help='The minimal score of the language identification.')
     parser.add_argument('--num-process', type=int, default=8,
                         help='number of process')
     parser.add_argument('--overwrite', action='store_true')
@@ -225,7 +226,9 @@ def main(args):
                                            tokenizer=args.tokenizer,
                                            min_num_words=args.min_num_words,
                                            max_num_words=args.max_num_words,
-                                           discard_non_latin1=args.discard_non_latin1)
+                                           discard_non_latin1=args.discard_non_latin1,
+                                           lang_id_algo=args.lang_id_algo,
+                                           min_lang_id_score=args.min_lang_id_score)
     print('Clean the mono corpus:')
     print('   {}: {}'.format(args.lang, args.corpus))
     if args.save_path is None:
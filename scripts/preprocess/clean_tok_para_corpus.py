@@ -1,16 +1,18 @@
 import argparse
 import os
-import multiprocessing
 import time
-import numpy as np
 import warnings
 import re
-from gluonnlp.data.filtering import MosesNormalizer
+from gluonnlp.data.filtering import MosesNormalizer, LanguageIdentifier, FilterPipeline
 from gluonnlp.data.tokenizers import MosesTokenizer, BaseTokenizer,\
                                      WhitespaceTokenizer, JiebaTokenizer
 from typing import List, Union, Optional
 re._MAXCACHE = 1024
 
+# The tokenizers that never reduce the number of whitespace-separated words of a sentence
+# normalized by MosesNormalizer. It is tested in tests/test_data_filtering.py.
+_WORD_PRESERVING_TOKENIZERS = (MosesTokenizer, WhitespaceTokenizer, JiebaTokenizer)
+
 
 def get_tokenizer(tokenizer, lang=None):
     if isinstance(tokenizer, BaseTokenizer):
@@ -49,29 +51,6 @@ def check_both_latin1(src_sentence: str, tgt_sentence: str) -> bool:
         return True
 
 
-def get_line_byte_start(corpus_path: str) -> np.ndarray:
-    """Get the start position of each lines in terms of bytes so that we can use seek + read to
-     load an arbitrary line.
-
-    Parameters
-    ----------
-    corpus_path
-        The path of the corpus
-
-    Returns
-    -------
-    line_pos
-        Shape (#Lens + 1,)
-    """
-    line_pos = [0]
-    with open(corpus_path, 'rb') as in_f:
-        pos = 0
-        for line in in_f:
-            pos += len(line)
-            line_pos.append(pos)
-    return np.array(line_pos, dtype=np.int64)
-
-
 class ParallelCorpusProcessor:
     """Process a pair of corpus.
 
@@ -84,11 +63,20 @@ class ParallelCorpusProcessor:
 
     1. Normalize sentence
     2. Pre-filter
+        2.1 Remove pairs that cannot be encoded in latin1
+        2.2 Remove pairs whose languages are not detected as src_lang and tgt_lang
+        2.3 Remove pairs with more than max_num_words whitespace-separated words. After the
+            normalization removes the non-printable characters, the Moses, whitespace and Jieba
+            tokenizers never reduce the number of words, so these pairs would be removed after
+            tokenization anyway. It is skipped for the other tokenizers.
     3. Tokenize the sentence
     4. Filter the sentence based on different rules
-        3.1 Remove pairs where `max(len(lhs) / len(rhs), len(rhs) / len(lhs) > max_ratio`
-        3.2 Remove pairs where not `min_max_words <= len(lhs) <= max_num_words` and
+        4.1 Remove pairs where `max(len(lhs) / len(rhs), len(rhs) / len(lhs) > max_ratio`
+        4.2 Remove pairs where not `min_max_words <= len(lhs) <= max_num_words` and
                                    `min_max_words <= len(rhs) <= max_num_words`
+
+    The stages are fused into a :class:`~gluonnlp.data.filtering.FilterPipeline`, so the cheap
+    pre-filters are applied before the expensive tokenization.
     """
     def __init__(self, src_lang: str, tgt_lang: str,
                  normalize: bool = True,
@@ -97,9 +85,12 @@ class ParallelCorpusProcessor:
                  max_ratio: Optional[float] = None,
                  min_num_words: Optional[int] = None,
                  max_num_words: Optional[int] = None,
-                 discard_non_latin1: bool = False):
+                 discard_non_latin1: bool = False,
+                 lang_id_algo: Optional[str] = None,
+                 min_lang_id_score: float = 0.0):
         self._src_lang = src_lang
         self._tgt_lang = tgt_lang
+        self._normalize = normalize
         if normalize:
             self._src_normalizer = MosesNormalizer(lang=src_lang)
             self._tgt_normalizer = MosesNormalizer(lang=tgt_lang)
@@ -109,52 +100,91 @@ class ParallelCorpusProcessor:
         self._min_num_words = min_num_words
         self._max_num_words = max_num_words
         self._discard_non_latin1 = discard_non_latin1
+        if lang_id_algo is not None:
+            self._lang_id = LanguageIdentifier(algo=lang_id_algo)
+        else:
+            self._lang_id = None
+        self._min_lang_id_score = min_lang_id_score
+
+    def normalize(self, sample):
+        src_line, tgt_line = sample
+        return self._src_normalizer(src_line), self._tgt_normalizer(tgt_line)
+
+    def check_latin1(self, sample):
+        return check_both_latin1(*sample)
+
+    def check_lang_id(self, samples):
+        src_labels, src_scores = self._lang_id.predict_batch([ele[0] for ele in samples])
+        tgt_labels, tgt_scores = self._lang_id.predict_batch([ele[1] for ele in samples])
+        return (src_labels == self._src_lang) & (tgt_labels == self._tgt_lang)\
+            & (src_scores >= self._min_lang_id_score) & (tgt_scores >= self._min_lang_id_score)
 
-    def process_chunk(self, args):
-        src_path, src_chunk_start, src_chunk_size, tgt_path, tgt_chunk_start, tgt_chunk_size = args
-        processed_src_lines = []
-        processed_tgt_lines = []
-        with open(src_path, 'rb') as src_in_f:
-            with open(tgt_path, 'rb') as tgt_in_f:
-                # Read chunk from source and target
-                src_in_f.seek(src_chunk_start)
-                src_lines = src_in_f.read(src_chunk_size)
-                tgt_in_f.seek(tgt_chunk_start)
-                tgt_lines = tgt_in_f.read(tgt_chunk_size)
-                src_lines = src_lines.splitlines()
-                tgt_lines = tgt_lines.splitlines()
-                unfiltered_line_num = len(src_lines)
-                for src_line, tgt_line in zip(src_lines, tgt_lines):
-                    src_line = src_line.decode('utf-8').strip()
-                    tgt_line = tgt_line.decode('utf-8').strip()
-                    # 1. Normalize
-                    src_line = self._src_normalizer(src_line)
-                    tgt_line = self._tgt_normalizer(tgt_line)
-                    # 2. Filter after normalization.
-                    if self._discard_non_latin1:
-                        if not check_both_latin1(src_line, tgt_line):
-                            continue
-                    # 3. Tokenize the sentence
-                    src_tokens = self._src_tokenizer.encode(src_line)
-                    tgt_tokens = self._tgt_tokenizer.encode(tgt_line)
-                    # 4. Filter after tokenization. Filter with multiple rules
-                    if len(src_tokens) == 0 or len(tgt_tokens) == 0:
-                        continue
-                    if self._max_ratio is not None:
-                        if max(len(src_tokens) / len(tgt_tokens),
-                               len(tgt_tokens) / len(src_tokens)) > self._max_ratio:
-                            continue
-                    if self._max_num_words is not None:
-                        if len(src_tokens) > self._max_num_words or\
-                                len(tgt_tokens) > self._max_num_words:
-                            continue
-                    if self._min_num_words is not None:
-                        if len(src_tokens) < self._min_num_words\
-                                or len(tgt_tokens) < self._min_num_words:
-                            continue
-                    processed_src_lines.append(' '.join(src_tokens))
-                    processed_tgt_lines.append(' '.join(tgt_tokens))
-        return processed_src_lines, processed_tgt_lines, unfiltered_line_num
+    def check_max_num_whitespace_words(self, sample):
+        """Reject the pair with more than max_num_words whitespace-separated words in a side
+
+        It assumes that the tokenizers do not reduce the number of whitespace-separated words
+        of a normalized sentence. Thus, it is only used with the tokenizers in
+        `_WORD_PRESERVING_TOKENIZERS` and never rejects a pair that `check_num_words` would
+        keep after the tokenization.
+        """
+        return len(sample[0].split()) <= self._max_num_words\
+            and len(sample[1].split()) <= self._max_num_words
+
+    def tokenize(self, sample):
+        src_line, tgt_line = sample
+        return ' '.join(self._src_tokenizer.encode(src_line)),\
+            ' '.join(self._tgt_tokenizer.encode(tgt_line))
+
+    def check_not_empty(self, sample):
+        return len(sample[0]) > 0 and len(sample[1]) > 0
+
+    def check_ratio(self, sample):
+        src_num_tokens = len(sample[0].split())
+        tgt_num_tokens = len(sample[1].split())
+        return max(src_num_tokens / tgt_num_tokens,
+                   tgt_num_tokens / src_num_tokens) <= self._max_ratio
+
+    def check_num_words(self, sample):
+        src_num_tokens = len(sample[0].split())
+        tgt_num_tokens = len(sample[1].split())
+        if self._max_num_words is not None:
+            if src_num_tokens > self._max_num_words or tgt_num_tokens > self._max_num_words:
+                return False
+        if self._min_num_words is not None:
+            if src_num_tokens < self._min_num_words or tgt_num_tokens < self._min_num_words:
+                return False
+        return True
+
+    def build_pipeline(self) -> FilterPipeline:
+        """Build the pipeline of the processing stages
+
+        Returns
+        -------
+        pipeline
+            The pipeline that processes the (src_sentence, tgt_sentence) pairs
+        """
+        pipeline = FilterPipeline()
+        # 1. Normalize
+        if self._normalize:
+            pipeline.add_map('normalize', self.normalize)
+        # 2. Filter after normalization with the cheap rules
+        if self._discard_non_latin1:
+            pipeline.add_filter('latin1', self.check_latin1)
+        if self._lang_id is not None:
+            pipeline.add_filter('lang_id', self.check_lang_id, batched=True)
+        if self._normalize and self._max_num_words is not None\
+                and isinstance(self._src_tokenizer, _WORD_PRESERVING_TOKENIZERS)\
+                and isinstance(self._tgt_tokenizer, _WORD_PRESERVING_TOKENIZERS):
+            pipeline.add_filter('max_num_words_prefilter', self.check_max_num_whitespace_words)
+        # 3. Tokenize the sentence
+        pipeline.add_map('tokenize', self.tokenize)
+        # 4. Filter after tokenization. Filter with multiple rules
+        pipeline.add_filter('empty', self.check_not_empty)
+        if self._max_ratio is not None:
+            pipeline.add_filter('ratio', self.check_ratio)
+        if self._max_num_words is not None or self._min_num_words is not None:
+            pipeline.add_filter('num_words', self.check_num_words)
+        return pipeline
 
     def process_parallel_corpus(self, src_corpus_paths: List[str],
                                 tgt_corpus_paths: List[str],
@@ -184,61 +214,16 @@ class ParallelCorpusProcessor:
             The number of lines in the final filtered file
         """
         start = time.time()
-        total_line_count = 0
-        filtered_line_count = 0
-
-        def chunk_iterator(step=10):
-            for src_path, tgt_path in zip(src_corpus_paths, tgt_corpus_paths):
-                src_line_pos = get_line_byte_start(src_path)
-                tgt_line_pos = get_line_byte_start(tgt_path)
-                src_line_size = src_line_pos[1:] - src_line_pos[:-1]
-                tgt_line_size = tgt_line_pos[1:] - tgt_line_pos[:-1]
-                num_src_lines = src_line_pos.shape[0] - 1
-                num_tgt_lines = tgt_line_pos.shape[0] - 1
-                assert num_src_lines == num_tgt_lines
-                src_budget = chunk_size
-                tgt_budget = chunk_size
-                src_chunk_start = 0
-                tgt_chunk_start = 0
-                src_chunk_size = 0
-                tgt_chunk_size = 0
-                for i in range(0, num_src_lines, step):
-                    line_batch_num = min(num_src_lines - i, step)
-                    src_batch_line_size = src_line_size[i:(i + line_batch_num)].sum()
-                    tgt_batch_line_size = tgt_line_size[i:(i + line_batch_num)].sum()
-                    src_budget -= src_batch_line_size
-                    tgt_budget -= tgt_batch_line_size
-                    src_chunk_size += src_batch_line_size
-                    tgt_chunk_size += tgt_batch_line_size
-                    if src_budget <= 0 or tgt_budget <= 0 or i + step >= num_src_lines:
-                        yield src_path, src_chunk_start, src_chunk_size,\
-                              tgt_path, tgt_chunk_start, tgt_chunk_size
-                        src_chunk_start += src_chunk_size
-                        tgt_chunk_start += tgt_chunk_size
-                        src_chunk_size = 0
-                        tgt_chunk_size = 0
-                        src_budget = chunk_size
-                        tgt_budget = chunk_size
-
-        with open(src_out_path, 'w', encoding='utf-8', newline='\n') as src_out_f:
-            with open(tgt_out_path, 'w', encoding='utf-8', newline='\n') as tgt_out_f:
-                with multiprocessing.Pool(num_process) as pool:
-                    for i, (processed_src_lines, processed_tgt_lines, unfiltered_line_num) in \
-                            enumerate(pool.imap(self.process_chunk, chunk_iterator())):
-                        src_out_f.write('\n'.join(processed_src_lines) + '\n')
-                        tgt_out_f.write('\n'.join(processed_tgt_lines) + '\n')
-                        filtered_line_count += len(processed_src_lines)
-                        total_line_count += unfiltered_line_num
-                        if (i + 1) % 100 == 0:
-                            print('Chunk {}, #Lines Processed: {}, Filtered: {}, Remain: {}'
-                                  .format(i + 1, total_line_count,
-                                          total_line_count - filtered_line_count,
-                                          filtered_line_count))
+        stats = self.build_pipeline().process_files([src_corpus_paths, tgt_corpus_paths],
+                                                    [src_out_path, tgt_out_path],
+                                                    num_process=num_process,
+                                                    chunk_size=chunk_size)
         end = time.time()
-        print('Done, #Lines {}/{}, Time spent {}'.format(filtered_line_count,
-                                                         total_line_count,
+        print(stats)
+        print('Done, #Lines {}/{}, Time spent {}'.format(stats.num_outputs,
+                                                         stats.num_inputs,
                                                          end - start))
-        return filtered_line_count
+        return stats.num_outputs
 
 
 def get_parser():
@@ -262,6 +247,12 @@ def get_parser():
     parser.add_argument('--discard-non-latin1', action='store_true',
                         help='Whether to discard the sentence pair if both sentences cannot be '
                              'encoded into latin1.')
+    parser.add_argument('--lang-id-algo', type=str, default=None,
+                        choices=['fasttext', 'fasttext_compressed', 'langid'],
+                        help='If set, discard the sentence pair if the languages detected by '
+                             'the algorithm are not --src-lang and --tgt-lang.')
+    parser.add_argument('--min-lang-id-score', type=float, default=0.0,
+                        help='The minimal score of the language identification.')
     parser.add_argument('--num-process', type=int, default=8,
                         help='number of process')
     parser.add_argument('--overwrite', action='store_true')
@@ -278,7 +269,9 @@ def main(args):
                                                max_ratio=args.max_ratio,
                                                min_num_words=args.min_num_words,
                                                max_num_words=args.max_num_words,
-                                               discard_non_latin1=args.discard_non_latin1)
+                                               discard_non_latin1=args.discard_non_latin1,
+                                               lang_id_algo=args.lang_id_algo,
+                                               min_lang_id_score=args.min_lang_id_score)
     print('Clean the corpus:')
     print('   Source {}: {}'.format(src_lang, args.src_corpus))
     print('   Target {}: {}'.format(tgt_lang, args.tgt_corpus))
@@ -0,0 +1,73 @@
+import argparse
+import os
+import time
+import warnings
+from gluonnlp.data.filtering import CorpusDeduplicator
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Remove the duplicated lines in a monolingual or a parallel corpus. '
+                    'For a parallel corpus, the i-th lines of all the files are kept or '
+                    'removed together.')
+    parser.add_argument('--corpus', type=str, nargs='+', required=True,
+                        help='The corpus files. Pass multiple files for a parallel corpus.')
+    parser.add_argument('--save-path', type=str, nargs='+', default=None,
+                        help='Paths to save the deduplicated corpus. If not set, the default is '
+                             '"{corpus}.dedup".')
+    parser.add_argument('--method', type=str, choices=['exact', 'minhash'], default='exact',
+                        help='"exact" removes the exact duplicates. "minhash" also removes the '
+                             'near-duplicates via MinHash LSH.')
+    parser.add_argument('--threshold', type=float, default=0.8,
+                        help='The Jaccard similarity threshold of the near-duplicates.')
+    parser.add_argument('--num-perm', type=int, default=128,
+                        help='The number of permutations in MinHash.')
+    parser.add_argument('--ngram', type=int, default=3,
+                        help='The number of words in a shingle of MinHash.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-run-size', type=int, default=64 * 1024 * 1024,
+                        help='The maximal number of hash keys that are sorted in memory. The '
+                             'sorted runs are stored in --tmp-dir and merged.')
+    parser.add_argument('--tmp-dir', type=str, default=None,
+                        help='The directory to store the sorted runs.')
+    parser.add_argument('--num-process', type=int, default=8,
+                        help='number of process')
+    parser.add_argument('--overwrite', action='store_true')
+    return parser
+
+
+def main(args):
+    if args.save_path is None:
+        save_paths = [path + '.dedup' for path in args.corpus]
+    else:
+        save_paths = args.save_path
+    assert len(save_paths) == len(args.corpus),\
+        'The number of --save-path must be the same as --corpus'
+    deduplicator = CorpusDeduplicator(method=args.method, num_perm=args.num_perm,
+                                      threshold=args.threshold, ngram=args.ngram,
+                                      seed=args.seed)
+    print('Deduplicate the corpus with {}:'.format(deduplicator))
+    for corpus_path, save_path in zip(args.corpus, save_paths):
+        print('   {} -> {}'.format(corpus_path, save_path))
+    if any(os.path.exists(path) for path in save_paths) and not args.overwrite:
+        warnings.warn('{} exists, skip. If you need to overwrite these files, '
+                      'rerun the script with --overwrite.'.format(save_paths))
+        return
+    start = time.time()
+    num_lines, num_removed = deduplicator.dedup_files(args.corpus, save_paths,
+                                                      num_process=args.num_process,
+                                                      max_run_size=args.max_run_size,
+                                                      tmp_dir=args.tmp_dir)
+    print('Done, #Lines {}, Removed {} ({:.2f}%), Remain {}, Time spent {:.2f}s'
+          .format(num_lines, num_removed, 100.0 * num_removed / max(num_lines, 1),
+                  num_lines - num_removed, time.time() - start))
+
+
+def cli_main():
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
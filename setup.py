@@ -105,7 +105,8 @@ setup(
         'console_scripts': [
             'nlp_data = gluonnlp.cli.data.__main__:cli_main',
             'nlp_preprocess = gluonnlp.cli.preprocess.__main__:cli_main',
-            'gluon_average_checkpoint = gluonnlp.cli.average_checkpoint:cli_main'
+            'gluon_average_checkpoint = gluonnlp.cli.average_checkpoint:cli_main',
+            'gluon_quantize_embedding = gluonnlp.cli.quantize_embedding:cli_main'
         ],
     },
 )
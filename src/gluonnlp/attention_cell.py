@@ -244,6 +244,196 @@ def gen_mem_attn_mask(F, mem, mem_valid_length, data, data_valid_length=None,
     return mask
 
 
+def init_kv_cache(batch_size: int, max_length: int, feature_shape, ctx,
+                  dtype=np.float32, layout: str = 'NT'):
+    """Preallocate the key/value cache used in the incremental decoding.
+
+    Instead of concatenating the key/value of every step to the previous states, the
+    key/value are written to a buffer with a fixed capacity. Without hybridization,
+    :func:`write_kv_cache` writes the buffer in place and the attention only covers the
+    written slots. In a hybridized graph, :func:`update_kv_cache` returns a new buffer and the
+    slots that have not been written are masked out by :func:`gen_kv_cache_attn_mask`.
+
+    Parameters
+    ----------
+    batch_size
+        The batch size
+    max_length
+        The capacity of the cache, i.e., the maximal number of decoding steps
+    feature_shape
+        The shape of the feature, e.g., (num_heads, C_key)
+    ctx
+        The context of the cache
+    dtype
+        Data type of the cache
+    layout
+        Layout of the cache
+
+    Returns
+    -------
+    key_cache
+        - layout = 'NT'
+            Shape (batch_size, max_length, *feature_shape)
+        - layout = 'TN'
+            Shape (max_length, batch_size, *feature_shape)
+    value_cache
+        Has the same shape as the key_cache
+    """
+    if layout == 'NT':
+        shape = (batch_size, max_length) + tuple(feature_shape)
+    elif layout == 'TN':
+        shape = (max_length, batch_size) + tuple(feature_shape)
+    else:
+        raise NotImplementedError('Unsupported layout={}'.format(layout))
+    return mx.np.zeros(shape, ctx=ctx, dtype=dtype), mx.np.zeros(shape, ctx=ctx, dtype=dtype)
+
+
+def update_kv_cache(F, cache, step_data, positions, layout: str = 'NT'):
+    """Write the key/value of the current steps to the preallocated cache.
+
+    The write is implemented with `npx.index_update`, which returns a new array, i.e., the whole
+    cache is copied in every call, and the attention covers all the max_length slots, in which
+    the unused slots are masked. It is slower than the concatenation of the key/value of the
+    current step, so it is only used in hybridized graphs, which cannot write in place. Use
+    :func:`write_kv_cache` without hybridization.
+
+    Parameters
+    ----------
+    F
+    cache
+        - layout = 'NT'
+            Shape (batch_size, max_length, ...)
+        - layout = 'TN'
+            Shape (max_length, batch_size, ...)
+    step_data
+        - layout = 'NT'
+            Shape (batch_size, step_length, ...)
+        - layout = 'TN'
+            Shape (step_length, batch_size, ...)
+    positions
+        The positions in the cache to write to. They must be smaller than max_length.
+        - layout = 'NT'
+            Shape (batch_size, step_length)
+        - layout = 'TN'
+            Shape (step_length, batch_size)
+    layout
+        Layout of the cache
+
+    Returns
+    -------
+    new_cache
+        The updated cache. Has the same shape as the cache.
+    """
+    positions = positions.astype(np.int32)
+    if layout == 'NT':
+        batch_idx = F.np.expand_dims(F.npx.arange_like(positions, axis=0),
+                                     axis=1).astype(np.int32)
+        batch_idx = batch_idx + F.np.zeros_like(positions)
+        indices = F.np.stack([batch_idx.reshape((-1,)), positions.reshape((-1,))])
+    elif layout == 'TN':
+        batch_idx = F.np.expand_dims(F.npx.arange_like(positions, axis=1),
+                                     axis=0).astype(np.int32)
+        batch_idx = batch_idx + F.np.zeros_like(positions)
+        indices = F.np.stack([positions.reshape((-1,)), batch_idx.reshape((-1,))])
+    else:
+        raise NotImplementedError('Unsupported layout={}'.format(layout))
+    return F.npx.index_update(cache, indices, F.npx.reshape(step_data, (-5, -4)))
+
+
+def write_kv_cache(cache, step_data, start: int, layout: str = 'NT'):
+    """Write the key/value of the current steps to the preallocated cache in place.
+
+    The key/value are assigned to the slots [start, start + step_length) of all the samples by
+    slice assignment, so the cache is not copied. It only works with ndarrays, i.e., without
+    hybridization. The returned key/value only include the slots that have been written, so the
+    attention does not cover the rest of the cache and no mask is needed for the unused slots.
+
+    Parameters
+    ----------
+    cache
+        - layout = 'NT'
+            Shape (batch_size, max_length, ...)
+        - layout = 'TN'
+            Shape (max_length, batch_size, ...)
+    step_data
+        - layout = 'NT'
+            Shape (batch_size, step_length, ...)
+        - layout = 'TN'
+            Shape (step_length, batch_size, ...)
+    start
+        The position of the first step, which is shared by all the samples
+    layout
+        Layout of the cache
+
+    Returns
+    -------
+    filled_cache
+        The first start + step_length slots of the cache
+        - layout = 'NT'
+            Shape (batch_size, start + step_length, ...)
+        - layout = 'TN'
+            Shape (start + step_length, batch_size, ...)
+    """
+    if layout == 'NT':
+        time_axis = 1
+    elif layout == 'TN':
+        time_axis = 0
+    else:
+        raise NotImplementedError('Unsupported layout={}'.format(layout))
+    end = start + step_data.shape[time_axis]
+    if end > cache.shape[time_axis]:
+        raise ValueError('The cache has {} slots but {} slots are needed.'
+                         .format(cache.shape[time_axis], end))
+    if layout == 'NT':
+        cache[:, start:end] = step_data
+        return cache[:, :end]
+    else:
+        cache[start:end] = step_data
+        return cache[:end]
+
+
+def gen_kv_cache_attn_mask(F, cache, positions, dtype=np.float32, layout: str = 'NT'):
+    """Generate the causal mask between the current steps and the preallocated cache.
+
+    The query at position p attends to the slots 0, 1, ..., p of the cache.
+
+    Parameters
+    ----------
+    F
+    cache
+        - layout = 'NT'
+            Shape (batch_size, max_length, ...)
+        - layout = 'TN'
+            Shape (max_length, batch_size, ...)
+    positions
+        The positions of the queries
+        - layout = 'NT'
+            Shape (batch_size, query_length)
+        - layout = 'TN'
+            Shape (query_length, batch_size)
+    dtype
+        Data type of the mask
+    layout
+        Layout of the cache
+
+    Returns
+    -------
+    mask
+        Shape (batch_size, query_length, max_length)
+    """
+    if layout == 'NT':
+        time_axis = 1
+    elif layout == 'TN':
+        time_axis = 0
+        positions = F.np.swapaxes(positions, 0, 1)
+    else:
+        raise NotImplementedError('Unsupported layout={}'.format(layout))
+    cache_steps = F.npx.arange_like(cache, axis=time_axis)  # (max_length,)
+    mask = F.npx.reshape(cache_steps, (1, 1, -1))\
+        <= F.np.expand_dims(positions.astype(np.float32), axis=-1)
+    return mask.astype(dtype)
+
+
 # TODO(sxjscience) Directly implement a kernel for masked softmax
 def masked_softmax(F, att_score, mask, dtype=np.float32, axis: int = -1):
     """Ignore the masked elements when calculating the softmax. The mask can be broadcastable.
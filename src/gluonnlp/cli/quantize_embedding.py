@@ -0,0 +1,44 @@
+import argparse
+import logging
+import mxnet as mx
+from gluonnlp.utils.quantization import quantize_embedding_params
+
+mx.npx.set_np()
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description='Convert the embedding weights in a checkpoint to int8/float16 with a scale '
+                    'per row. The converted checkpoint can be loaded by the models that are '
+                    'created with word_embed_storage_dtype=DTYPE.')
+    parser.add_argument('--params', type=str, required=True,
+                        help='Path of the input parameter file')
+    parser.add_argument('--save-path', type=str, required=True,
+                        help='Path of the output file')
+    parser.add_argument('--param-names', type=str, nargs='+', default=['word_embed.weight'],
+                        help='Names of the embedding weights. Use "word_embed.weight" for '
+                             'BERT/ALBERT/RoBERTa/XLM-R and "_embed.weight" for GPT-2.')
+    parser.add_argument('--dtype', type=str, default='int8', choices=['int8', 'float16'],
+                        help='Data type of the quantized weights')
+    return parser
+
+
+def main(args):
+    params = mx.npx.load(args.params)
+    new_params = quantize_embedding_params(params, args.param_names, args.dtype)
+    for name in args.param_names:
+        logging.info('Quantized {}: {} bytes --> {} bytes'.format(
+            name, params[name].size * params[name].dtype.itemsize,
+            new_params[name].size * new_params[name].dtype.itemsize))
+    mx.npx.save(args.save_path, new_params)
+
+
+def cli_main():
+    logging.basicConfig(level=logging.INFO)
+    parser = get_parser()
+    args = parser.parse_args()
+    main(args)
+
+
+if __name__ == '__main__':
+    cli_main()
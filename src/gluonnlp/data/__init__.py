@@ -1,6 +1,7 @@
 from . import vocab
 from . import tokenizers
 from . import batchify
+from . import streaming
 from .vocab import *
 from .tokenizers import *
 
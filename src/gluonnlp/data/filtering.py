@@ -1,16 +1,116 @@
 import re
 import regex
-import requests
 import unicodedata
 import os
 import warnings
+import hashlib
+import itertools
+import multiprocessing
+import tempfile
+import time
+import zlib
+import numpy as np
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    # Python < 3.11
+    import sre_parse as _sre_parse
 from typing import List, Pattern, Union, Tuple, Optional
+from collections import OrderedDict
 from sacremoses.normalize import MosesPunctNormalizer
 from ..utils.lazy_imports import try_import_fasttext, try_import_langid
-from ..utils.misc import download
+from ..utils.misc import download, parallel_map, _is_ascii
+from .streaming import get_chunk_byte_ranges
 from ..base import get_model_zoo_home_dir, get_repo_url
 
 non_printing_char_regex = regex.compile(r'\p{C}')
+# In the ASCII range, the \p{C} category only contains the control characters
+_ASCII_NON_PRINTING_CHAR_TABLE = str.maketrans({chr(i): ' ' for i in list(range(32)) + [127]})
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def _is_literal_substitution(pattern, repl) -> bool:
+    """Whether re.sub(pattern, repl, text) is equivalent to text.replace(pattern, repl)"""
+    return isinstance(pattern, str) and isinstance(repl, str) and len(pattern) > 0\
+        and not any(c in _REGEX_SPECIAL_CHARS for c in pattern) and '\\' not in repl
+
+
+def _requires_non_ascii(pattern: Pattern) -> bool:
+    """Whether all the matches of the pattern contain at least one non-ASCII character.
+
+    The check is conservative, i.e., it may return False for some patterns that can only
+    match non-ASCII characters, but it never returns True for a pattern that matches a
+    pure ASCII string.
+    """
+    if pattern.flags & re.IGNORECASE:
+        return False
+
+    def _check(parsed) -> bool:
+        for op, av in parsed:
+            if op == _sre_parse.LITERAL and av >= 128:
+                return True
+            elif op == _sre_parse.SUBPATTERN and _check(av[-1]):
+                return True
+            elif op in (_sre_parse.MAX_REPEAT, _sre_parse.MIN_REPEAT) \
+                    and av[0] >= 1 and _check(av[2]):
+                return True
+        return False
+    return _check(_sre_parse.parse(pattern.pattern, pattern.flags))
+
+
+def _compile_substitutions(substitutions: List[Tuple[str, str]]) -> list:
+    """Compile a sequence of regex substitutions into a list of stages.
+
+    Each stage is a tuple of (kind, arg0, arg1, ascii_noop, may_add_non_ascii):
+
+    - ('translate', table, None, ...) means text.translate(table)
+    - ('replace', old, new, ...) means text.replace(old, new)
+    - ('sub', pattern, repl, ...) means pattern.sub(repl, text)
+
+    Substitutions of literal strings do not need the regex engine. Moreover, consecutive
+    substitutions of single characters are fused into a single translate table as long as the
+    replacement of an earlier substitution will not be matched by a later substitution.
+    ascii_noop means that the stage will never change a pure ASCII input and may_add_non_ascii
+    means that the stage may turn a pure ASCII input into a non-ASCII one.
+
+    Parameters
+    ----------
+    substitutions
+        A list of (pattern, replacement) that are applied sequentially via re.sub.
+
+    Returns
+    -------
+    stages
+        The compiled stages
+    """
+    stages = []
+    table = OrderedDict()
+
+    def _flush_table():
+        if table:
+            stages.append(('translate', str.maketrans(dict(table)), None,
+                           all(not _is_ascii(k) for k in table),
+                           any(not _is_ascii(v) for v in table.values())))
+            table.clear()
+
+    for pattern, repl in substitutions:
+        if _is_literal_substitution(pattern, repl):
+            if len(pattern) == 1:
+                if any(pattern in v for v in table.values()):
+                    _flush_table()
+                if pattern not in table:
+                    # If the pattern is in the table, all the matches have already been replaced.
+                    table[pattern] = repl
+                continue
+            _flush_table()
+            stages.append(('replace', pattern, repl, not _is_ascii(pattern), not _is_ascii(repl)))
+        else:
+            _flush_table()
+            compiled = re.compile(pattern)
+            stages.append(('sub', compiled, repl, _requires_non_ascii(compiled),
+                           not isinstance(repl, str) or not _is_ascii(repl)))
+    _flush_table()
+    return stages
 
 
 class MosesNormalizer:
@@ -21,6 +121,10 @@ class MosesNormalizer:
 
     Also, we will normalize the
 
+    The regex substitutions of sacremoses are precompiled, and the literal ones are fused into
+    str.translate / str.replace. For pure ASCII sentences, we will skip the stages that can
+    only change non-ASCII characters. The outputs are the same as the original implementation.
+
     Parameters
     ----------
     lang
@@ -35,6 +139,7 @@ class MosesNormalizer:
                  unicode_norm_form: Optional[str] = None):
         self._remove_non_printable_char = remove_non_printable_char
         self._moses_normalizer = MosesPunctNormalizer(lang)
+        self._stages = _compile_substitutions(self._moses_normalizer.substitutions)
         self._unicode_norm_form = unicode_norm_form
         if unicode_norm_form is not None:
             assert unicode_norm_form in ['NFC', 'NFKC', 'NFD', 'NFKD'],\
@@ -47,37 +152,149 @@ class MosesNormalizer:
         self('hello world')
 
     def __call__(self, sentence: str) -> str:
-        if self._unicode_norm_form:
+        is_ascii = _is_ascii(sentence)
+        # The pure ASCII strings are not changed by any unicode normalization
+        if self._unicode_norm_form and not is_ascii:
             sentence = unicodedata.normalize(self._unicode_norm_form, sentence)
-        sentence = self._moses_normalizer.normalize(sentence)
+            is_ascii = _is_ascii(sentence)
+        for kind, arg0, arg1, ascii_noop, may_add_non_ascii in self._stages:
+            if is_ascii and ascii_noop:
+                continue
+            if kind == 'translate':
+                sentence = sentence.translate(arg0)
+            elif kind == 'replace':
+                sentence = sentence.replace(arg0, arg1)
+            else:
+                sentence = arg0.sub(arg1, sentence)
+            if is_ascii and may_add_non_ascii:
+                is_ascii = _is_ascii(sentence)
+        sentence = sentence.strip()
         if self._remove_non_printable_char:
+            if is_ascii:
+                return sentence.translate(_ASCII_NON_PRINTING_CHAR_TABLE)
             return non_printing_char_regex.sub(' ', sentence)
         else:
             return sentence
 
+    def batch_normalize(self, sentences: List[str], num_process: int = 1,
+                        chunksize: int = 1024) -> List[str]:
+        """Normalize a batch of sentences, optionally with multiple processes.
+
+        Parameters
+        ----------
+        sentences
+            The input sentences
+        num_process
+            The number of processes
+        chunksize
+            The number of sentences that are sent to a worker process at a time
+
+        Returns
+        -------
+        normalized_sentences
+            The normalized sentences. The order is the same as the input.
+        """
+        return parallel_map(self, sentences, num_process=num_process, chunksize=chunksize)
+
 
-def _words_match_regex(words: List[str], ignore_case=False, replace_white_space=False) -> Pattern:
-    """Obtain the regex that finds whether a given corpus contains any word in the input words
+# The whitespace characters are normalized to ' ', so that the words with spaces in the word
+# lists can match any kind of whitespace.
+_WHITE_SPACE_CHARS = ('\t\n\r\x0b\x0c\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005'
+                      '\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000')
+_WHITE_SPACE_NORMALIZE_TABLE = str.maketrans({c: ' ' for c in _WHITE_SPACE_CHARS})
+
+
+def _normalize_for_matching(text: str) -> str:
+    """Lower-case the text and map the whitespace characters to ' '.
+
+    The output has the same length as the input, so that the positions of the matches in the
+    normalized text are also the positions in the original text.
+    """
+    normalized = text.lower()
+    if len(normalized) != len(text):
+        # A few characters are lower-cased to multiple characters, e.g., 'İ'
+        normalized = ''.join([ch.lower()[0] for ch in text])
+    return normalized.translate(_WHITE_SPACE_NORMALIZE_TABLE)
+
+
+class _AhoCorasickAutomaton:
+    """Find all the occurrences of a set of words in a text in a single pass.
+
+    The time complexity is linear in the length of the text plus the number of the occurrences,
+    no matter how many words there are.
 
     Parameters
     ----------
     words
+        The words to search. They should be non-empty.
+    """
+    def __init__(self, words: List[str]):
+        self._words = list(words)
+        goto = [{}]
+        outputs = [[]]
+        for word_id, word in enumerate(self._words):
+            state = 0
+            for ch in word:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append([])
+                state = nxt
+            outputs[state].append(word_id)
+        # Build the failure links in the BFS order. The outputs of a state also include the
+        # outputs of its failure state, i.e., the words that are suffixes of the current prefix.
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                failure = fail[state]
+                while failure and ch not in goto[failure]:
+                    failure = fail[failure]
+                fail[nxt] = goto[failure].get(ch, 0)
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+                queue.append(nxt)
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(ele) for ele in outputs]
+        self._word_lengths = [len(word) for word in self._words]
 
-    Returns
-    -------
-    regex
+    @property
+    def words(self) -> List[str]:
+        return self._words
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """Find all the occurrences, including the overlapping ones.
+
+        Returns
+        -------
+        matches
+            A list of (start, end, word_id), in the order of the end position
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        word_lengths = self._word_lengths
+        root = goto[0]
+        matches = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            if state == 0:
+                # Fast path for the characters that do not start any word
+                state = root.get(ch, 0)
+            else:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+            if outputs[state]:
+                for word_id in outputs[state]:
+                    matches.append((end - word_lengths[word_id], end, word_id))
+        return matches
 
-    """
-    words = [ele for ele in words if ele]
-    if ignore_case:
-        flags = re.IGNORECASE
-    else:
-        flags = 0
-    if replace_white_space:
-        words = [ele.replace(' ', r'\s+') for ele in words]
-    regex = re.compile('[^a-z]({words})[^a-z]|^({words})$|^({words})[^a-z]|[^a-z]({words})$'
-                       .format(words='|'.join(words)), flags)
-    return regex
+
+def _is_ascii_lowercase(ch: str) -> bool:
+    return 'a' <= ch <= 'z'
 
 
 class ProfanityFilter:
@@ -85,29 +302,34 @@ class ProfanityFilter:
 
     We use the word list from https://github.com/LDNOOBW/List-of-Dirty-Naughty-Obscene-and-Otherwise-Bad-Words
 
+    The word lists are downloaded once and cached in `cache_dir`, so that the later
+    constructions work offline. All the words are compiled into an Aho-Corasick automaton, which
+    scans the lower-cased corpus in linear time. A word is matched when it is not adjacent to
+    the letters in a-z, so "anal" is found in "Anal." but not in "analysis".
+
+    Parameters
+    ----------
+    langs
+        The languages of the word lists. By default, the word lists of all the available
+        languages are used. Use [] if only `words` are used.
+    words
+        The additional words to detect
+    cache_dir
+        The directory of the cached word lists. By default, it is
+        `get_model_zoo_home_dir()/profanity_words`.
     """
-    def __init__(self, langs: Optional[Union[str, List, Tuple]] = None):
-        def _download(url, retries=5):
-            while retries + 1 > 0:
-                try:
-                    r = requests.get(url, stream=True, verify=True)
-                    if r.status_code != 200:
-                        raise RuntimeError('Failed downloading url {}'.format(url))
-                    return r.text
-                except Exception as e:
-                    retries -= 1
-                    if retries <= 0:
-                        raise e
-                    print('download failed due to {}, retrying, {} attempt{} left'
-                          .format(repr(e), retries, 's' if retries > 1 else ''))
+    def __init__(self, langs: Optional[Union[str, List, Tuple]] = None,
+                 words: Optional[List[str]] = None, cache_dir: Optional[str] = None):
         url_path =\
             'https://raw.githubusercontent.com/LDNOOBW/List-of-Dirty-Naughty-Obscene-and-Otherwise-Bad-Words/b36ce5c34c14cb7872dd4c2a4e55fe526138462d/{lang}'
         available_langs = {'ar', 'cs', 'da', 'de', 'en', 'eo', 'es', 'fa', 'fi', 'fr', 'hi', 'hu',
                            'it', 'ja', 'ko', 'nl', 'no', 'pl', 'pt', 'ru', 'sv', 'th', 'tlh', 'tr',
                            'zh'}
+        if cache_dir is None:
+            cache_dir = os.path.join(get_model_zoo_home_dir(), 'profanity_words')
         self._suspicious_words = []
         if langs is None:
-            filter_langs = available_langs
+            filter_langs = sorted(available_langs)
         elif isinstance(langs, str):
             filter_langs = [langs]
         elif isinstance(langs, (tuple, list)):
@@ -117,9 +339,53 @@ class ProfanityFilter:
         for lang in filter_langs:
             assert lang in available_langs, \
                 'lang={} is not supported. All supported languages={}'.format(lang, available_langs)
-            out = _download(url_path.format(lang=lang))
-            self._suspicious_words += [word.strip() for word in out.split('\n') if word.strip()]
-        self._regex = _words_match_regex(self._suspicious_words)
+            # The file is only downloaded if it does not exist in the cache
+            path = download(url_path.format(lang=lang), os.path.join(cache_dir, lang))
+            with open(path, 'r', encoding='utf-8') as f:
+                self._suspicious_words += [word.strip() for word in f if word.strip()]
+        if words is not None:
+            self._suspicious_words += [word.strip() for word in words if word.strip()]
+        normalized_words = list(OrderedDict.fromkeys(
+            [_normalize_for_matching(word) for word in self._suspicious_words]))
+        self._automaton = _AhoCorasickAutomaton(normalized_words)
+
+    def find(self, corpus: str) -> List[Tuple[int, int, str]]:
+        """Find all the occurrences of the suspicious words in the corpus.
+
+        Parameters
+        ----------
+        corpus
+            Input string
+
+        Returns
+        -------
+        matches
+            A list of (start, end, word), in which corpus[start:end] is the occurrence of the
+            lower-cased word. The list is sorted by the end position.
+        """
+        normalized = _normalize_for_matching(corpus)
+        words = self._automaton.words
+        matches = []
+        for start, end, word_id in self._automaton.find_all(normalized):
+            if (start == 0 or not _is_ascii_lowercase(normalized[start - 1])) and\
+                    (end == len(normalized) or not _is_ascii_lowercase(normalized[end])):
+                matches.append((start, end, words[word_id]))
+        return matches
+
+    def count(self, corpus: str) -> int:
+        """Count the occurrences of the suspicious words in the corpus.
+
+        Parameters
+        ----------
+        corpus
+            Input string
+
+        Returns
+        -------
+        ret
+            The number of occurrences
+        """
+        return len(self.find(corpus))
 
     def match(self, corpus: str) -> bool:
         """Search whether the input corpus contains the suspicious bad words.
@@ -134,7 +400,48 @@ class ProfanityFilter:
         ret
             Whether the input corpus contains profanity words.
         """
-        return self._regex.match(corpus) is not None
+        return len(self.find(corpus)) > 0
+
+    def batch_count(self, corpus: List[str], num_process: int = 1,
+                    chunksize: int = 1024) -> np.ndarray:
+        """Count the occurrences of the suspicious words in a batch of corpus.
+
+        Parameters
+        ----------
+        corpus
+            The list of input strings
+        num_process
+            The number of processes
+        chunksize
+            The number of strings that are sent to a worker process at a time
+
+        Returns
+        -------
+        counts
+            The number of occurrences in each corpus. Shape (len(corpus),)
+        """
+        return np.array(parallel_map(self.count, corpus, num_process=num_process,
+                                     chunksize=chunksize), dtype=np.int64)
+
+    def batch_match(self, corpus: List[str], num_process: int = 1,
+                    chunksize: int = 1024) -> np.ndarray:
+        """Search whether each corpus in the batch contains the suspicious bad words.
+
+        Parameters
+        ----------
+        corpus
+            The list of input strings
+        num_process
+            The number of processes
+        chunksize
+            The number of strings that are sent to a worker process at a time
+
+        Returns
+        -------
+        ret
+            Shape (len(corpus),). Whether each corpus contains profanity words.
+        """
+        return self.batch_count(corpus, num_process=num_process, chunksize=chunksize) > 0
 
 
 class LanguageIdentifier:
@@ -152,6 +459,21 @@ class LanguageIdentifier:
             Use the compressed fasttext model "lid.176.ftz"
             from  https://fasttext.cc/docs/en/language-identification.html
 
+    Use `predict_batch` and `predict_file` for the large corpus.
+
+    Parameters
+    ----------
+    algo
+        The algorithm
+    model_path
+        The path of the fasttext model. By default, the pretrained model will be downloaded.
+    cache_size
+        The maximal number of predictions that are cached. The cache is useful for the
+        repeated short corpus, e.g., the boilerplate lines in the web crawl.
+    max_cached_length
+        Only the predictions of the corpus that contain no more than max_cached_length
+        characters are cached.
+
     References:
 
         @article{joulin2016bag,
@@ -178,10 +500,14 @@ class LanguageIdentifier:
         }
 
     """
-    def __init__(self, algo='fasttext_compressed', model_path=None):
+    def __init__(self, algo='fasttext_compressed', model_path=None, cache_size: int = 65536,
+                 max_cached_length: int = 128):
         assert algo in ['langid', 'fasttext', 'fasttext_compressed']
         self._algo = algo
         self._use_fasttext = algo.startswith('fasttext')
+        self._cache_size = cache_size
+        self._max_cached_length = max_cached_length
+        self._cache = OrderedDict()
         if algo in ['fasttext', 'fasttext_compressed']:
             fasttext = try_import_fasttext()
             if model_path is None:
@@ -233,20 +559,129 @@ class LanguageIdentifier:
         score
             The score of the prediction
         """
+        labels, scores = self.predict_batch([corpus])
+        return str(labels[0]), float(scores[0])
+
+    def _predict_uncached(self, corpus: List[str]) -> Tuple[List[str], List[float]]:
         if self._use_fasttext:
-            labels, scores = self._model.predict(corpus)
-            label = labels[0].replace("__label__", "")
-            return label, scores[0]
+            # The native batch prediction of fasttext only accepts single lines
+            all_labels, all_scores = self._model.predict([ele.replace('\n', ' ')
+                                                          for ele in corpus])
+            # fasttext returns no label for the corpus without any word
+            labels = [ele[0].replace('__label__', '') if len(ele) > 0 else ''
+                      for ele in all_labels]
+            scores = [float(ele[0]) if len(ele) > 0 else 0.0 for ele in all_scores]
+            return labels, scores
         else:
-            return self._model.classify(corpus.lower())
+            # Same as `self._model.classify()` but the features of all the inputs are
+            # multiplied with the naive bayes parameters in one shot.
+            features = np.stack([self._model.instance2fv(ele.lower()) for ele in corpus])
+            all_probs = np.dot(features, self._model.nb_ptc) + self._model.nb_pc
+            labels = []
+            scores = []
+            for probs in all_probs:
+                probs = self._model.norm_probs(probs)
+                cls_id = np.argmax(probs)
+                labels.append(str(self._model.nb_classes[cls_id]))
+                scores.append(float(probs[cls_id]))
+            return labels, scores
+
+    def predict_batch(self, corpus: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Detect the languages of a batch of corpus
+
+        The corpus that are no longer than `max_cached_length` are looked up in a LRU cache of
+        `cache_size` entries first, and the duplicated corpus in the batch are only predicted
+        once.
+
+        Parameters
+        ----------
+        corpus
+            The list of input corpus
+
+        Returns
+        -------
+        lang_labels
+            The ISO-639 1 codes of the predicted languages. Shape (len(corpus),).
+            For fasttext, the label of the corpus that contains no word is ''.
+        scores
+            The scores of the predictions. Shape (len(corpus),)
+        """
+        results = [None] * len(corpus)
+        pending = OrderedDict()
+        for i, ele in enumerate(corpus):
+            cached = self._cache.get(ele) if len(ele) <= self._max_cached_length else None
+            if cached is not None:
+                self._cache.move_to_end(ele)
+                results[i] = cached
+            else:
+                pending.setdefault(ele, []).append(i)
+        if pending:
+            for ele, positions, result in zip(pending.keys(), pending.values(),
+                                              zip(*self._predict_uncached(list(pending.keys())))):
+                for i in positions:
+                    results[i] = result
+                if self._cache_size > 0 and len(ele) <= self._max_cached_length:
+                    self._cache[ele] = result
+                    if len(self._cache) > self._cache_size:
+                        self._cache.popitem(last=False)
+        return np.array([ele[0] for ele in results], dtype=str),\
+            np.array([ele[1] for ele in results], dtype=np.float64)
+
+    def _predict_file_shard(self, args):
+        path, start, end, batch_size = args
+        with open(path, 'rb') as f:
+            f.seek(start)
+            lines = f.read(end - start).decode('utf-8').split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        all_labels = [np.zeros((0,), dtype=str)]
+        all_scores = [np.zeros((0,), dtype=np.float64)]
+        for i in range(0, len(lines), batch_size):
+            labels, scores = self.predict_batch(lines[i:(i + batch_size)])
+            all_labels.append(labels)
+            all_scores.append(scores)
+        return np.concatenate(all_labels), np.concatenate(all_scores)
+
+    def predict_file(self, path: str, num_process: int = 1, batch_size: int = 4096,
+                     shard_size: int = 16 * 1024 * 1024) -> Tuple[np.ndarray, np.ndarray]:
+        """Detect the language of every line in a utf-8 text file
+
+        The file is split into shards at the line boundaries and the shards are processed by
+        a pool of processes. Each worker loads the model only once.
+
+        Parameters
+        ----------
+        path
+            The path of the text file. The lines are separated by '\\n'.
+        num_process
+            The number of processes
+        batch_size
+            The number of lines that are predicted together
+        shard_size
+            The approximate number of bytes in a shard
+
+        Returns
+        -------
+        lang_labels
+            The ISO-639 1 codes of the predicted languages. Shape (num_lines,)
+        scores
+            The scores of the predictions. Shape (num_lines,)
+        """
+        shards = [(path, start, end, batch_size)
+                  for start, end in get_chunk_byte_ranges(path, shard_size)]
+        outputs = parallel_map(self._predict_file_shard, shards, num_process=num_process,
+                               chunksize=1)
+        return np.concatenate([np.zeros((0,), dtype=str)] + [ele[0] for ele in outputs]),\
+            np.concatenate([np.zeros((0,), dtype=np.float64)] + [ele[1] for ele in outputs])
 
     def __getstate__(self):
-        d = {k: v for k, v in self.__dict__.items() if k != '_model'}
+        d = {k: v for k, v in self.__dict__.items() if k not in ['_model', '_cache']}
         return d
 
     def __setstate__(self, state):
         for k, v in state.items():
             setattr(self, k, v)
+        self._cache = OrderedDict()
         if self._use_fasttext:
             fasttext = try_import_fasttext()
             with warnings.catch_warnings():
@@ -257,3 +692,600 @@ class LanguageIdentifier:
         else:
             langid = try_import_langid()
             self._model = langid.langid.LanguageIdentifier.from_modelstring(self._model_str)
+
+
+def _hash_strings(strings: List[str]) -> np.ndarray:
+    """Get the 64-bit blake2b hashes of the strings"""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(ele.encode('utf-8'),
+                                                       digest_size=8).digest(), 'little')
+                        for ele in strings), dtype=np.uint64, count=len(strings))
+
+
+def _mark_duplicates(keys: np.ndarray, indices: np.ndarray, keep: np.ndarray):
+    """Set keep[index] = False for the records whose key also belongs to a smaller index"""
+    order = np.lexsort((indices, keys))
+    keys = keys[order]
+    indices = indices[order]
+    is_duplicate = np.zeros((len(keys),), dtype=bool)
+    is_duplicate[1:] = keys[1:] == keys[:-1]
+    keep[indices[is_duplicate]] = False
+
+
+def _write_sorted_run(keys: np.ndarray, indices: np.ndarray, path: str):
+    """Sort the (key, line index) records and save them as a run"""
+    order = np.lexsort((indices, keys))
+    np.save(path + '.keys.npy', keys[order])
+    np.save(path + '.indices.npy', indices[order])
+
+
+def _mark_duplicates_in_sorted_runs(run_paths: List[str], keep: np.ndarray,
+                                    block_size: int = 1024 * 1024):
+    """Merge the sorted runs and mark the duplicated lines.
+
+    The line whose key also belongs to an earlier line is a duplicate, i.e., keep[index] will be
+    set to False. The runs are memory-mapped and merged block by block: in each step, all the
+    records that are no larger than the smallest among the last keys of the next blocks are
+    consumed from every run, so the records with the same key are always processed together.
+
+    Parameters
+    ----------
+    run_paths
+        The runs saved by `_write_sorted_run`
+    keep
+        Shape (num_lines,). It will be updated inplace.
+    block_size
+        The number of records that are loaded from each run in a step
+    """
+    runs = [(np.load(path + '.keys.npy', mmap_mode='r'),
+             np.load(path + '.indices.npy', mmap_mode='r')) for path in run_paths]
+    positions = [0] * len(runs)
+    while True:
+        active = [i for i, (keys, _) in enumerate(runs) if positions[i] < len(keys)]
+        if not active:
+            break
+        pivot = min(runs[i][0][min(positions[i] + block_size, len(runs[i][0])) - 1]
+                    for i in active)
+        all_keys = []
+        all_indices = []
+        for i in active:
+            keys, indices = runs[i]
+            end = positions[i] + int(np.searchsorted(keys[positions[i]:], pivot, side='right'))
+            all_keys.append(np.asarray(keys[positions[i]:end]))
+            all_indices.append(np.asarray(indices[positions[i]:end]))
+            positions[i] = end
+        _mark_duplicates(np.concatenate(all_keys), np.concatenate(all_indices), keep)
+    del runs
+
+
+class CorpusDeduplicator:
+    """Remove the duplicated lines in a corpus. The first occurrence is kept.
+
+    We support two methods:
+
+        - method='exact'
+            Remove the lines that are exactly the same as an earlier line. The lines are
+            compared by their 64-bit hashes.
+        - method='minhash'
+            Remove the near-duplicated lines with MinHash and locality-sensitive hashing (LSH).
+            The MinHash signature of a line is computed from the set of its lower-cased word
+            n-grams (shingles). The signature is split into bands, and a line is removed if any
+            of its bands is the same as that of an earlier line. The number of bands is chosen so
+            that the pairs with Jaccard similarity above `threshold` are likely to be removed.
+
+    Every line is represented by one or more 64-bit keys and the duplicates are found by sorting
+    the keys. For the corpus on disk, the keys are computed by multiple processes, sorted in
+    runs of bounded size, written to a temporary directory and then merged. Thus, the memory
+    usage does not grow with the size of the corpus except for a boolean mask of the lines.
+
+    Parameters
+    ----------
+    method
+        'exact' or 'minhash'
+    num_perm
+        The number of permutations in MinHash
+    threshold
+        The Jaccard similarity threshold of the near-duplicates
+    ngram
+        The number of words in a shingle
+    seed
+        The random seed of the MinHash permutations
+
+    References:
+
+        @inproceedings{broder1997resemblance,
+          title={On the resemblance and containment of documents},
+          author={Broder, Andrei Z},
+          booktitle={Proceedings. Compression and Complexity of SEQUENCES 1997},
+          pages={21--29},
+          year={1997},
+          organization={IEEE}
+        }
+
+    """
+    def __init__(self, method: str = 'exact', num_perm: int = 128, threshold: float = 0.8,
+                 ngram: int = 3, seed: int = 0):
+        assert method in ['exact', 'minhash'], 'Unsupported method={}'.format(method)
+        self._method = method
+        self._num_perm = num_perm
+        self._threshold = threshold
+        self._ngram = ngram
+        self._seed = seed
+        if method == 'minhash':
+            # Choose the banding (num_bands * rows_per_band = num_perm) whose S-curve has the
+            # threshold (1 / num_bands) ** (1 / rows_per_band) closest to the given threshold.
+            candidates = [(abs((1.0 / (num_perm // rows)) ** (1.0 / rows) - threshold), rows)
+                          for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+            self._rows_per_band = min(candidates)[1]
+            self._num_bands = num_perm // self._rows_per_band
+            rng = np.random.RandomState(seed)
+            # Universal hashing by multiply-shift: h(x) = (a * x + b) >> 32 with an odd a
+            self._perm_a = rng.randint(0, 2 ** 62, size=(num_perm,), dtype=np.int64)\
+                .astype(np.uint64) * np.uint64(2) + np.uint64(1)
+            self._perm_b = rng.randint(0, 2 ** 62, size=(num_perm,), dtype=np.int64)\
+                .astype(np.uint64)
+
+    @property
+    def num_keys(self) -> int:
+        """The number of keys of each line"""
+        return 1 if self._method == 'exact' else self._num_bands
+
+    def __repr__(self):
+        if self._method == 'exact':
+            return '{}(method=exact)'.format(self.__class__.__name__)
+        return '{}(method=minhash, num_perm={}, threshold={}, ngram={}, num_bands={},' \
+               ' rows_per_band={})'.format(self.__class__.__name__, self._num_perm,
+                                           self._threshold, self._ngram, self._num_bands,
+                                           self._rows_per_band)
+
+    def minhash_signatures(self, lines: List[str]) -> np.ndarray:
+        """Compute the MinHash signatures
+
+        Parameters
+        ----------
+        lines
+            The input lines
+
+        Returns
+        -------
+        signatures
+            Shape (len(lines), num_perm). The dtype is uint32.
+        """
+        signatures = np.full((len(lines), self._num_perm), np.iinfo(np.uint32).max,
+                             dtype=np.uint32)
+        shingle_hashes = []
+        num_shingles = []
+        for line in lines:
+            words = line.lower().split()
+            shingles = {' '.join(words[i:(i + self._ngram)])
+                        for i in range(max(len(words) - self._ngram + 1, min(len(words), 1)))}
+            shingle_hashes.extend([zlib.crc32(ele.encode('utf-8')) for ele in shingles])
+            num_shingles.append(len(shingles))
+        shingle_hashes = np.array(shingle_hashes, dtype=np.uint64)
+        num_shingles = np.array(num_shingles, dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(num_shingles)])
+        # Process the lines in blocks to bound the size of the (num_shingles, num_perm) array
+        block_start = 0
+        while block_start < len(lines):
+            block_end = max(int(np.searchsorted(offsets, offsets[block_start] + 65536,
+                                                side='right')) - 1, block_start + 1)
+            block_end = min(block_end, len(lines))
+            non_empty = block_start + np.nonzero(num_shingles[block_start:block_end])[0]
+            if len(non_empty) > 0:
+                hashes = shingle_hashes[offsets[block_start]:offsets[block_end]]
+                # The layout of (num_perm, num_shingles) makes the segments contiguous in memory,
+                # which is much faster for reduceat.
+                permuted = ((self._perm_a[:, None] * hashes + self._perm_b[:, None])
+                            >> np.uint64(32)).astype(np.uint32)
+                signatures[non_empty] = np.minimum.reduceat(
+                    permuted, offsets[non_empty] - offsets[block_start], axis=1).T
+            block_start = block_end
+        return signatures
+
+    def compute_keys(self, lines: List[str]) -> np.ndarray:
+        """Compute the keys of the lines. Two lines are duplicates if they share a key.
+
+        Parameters
+        ----------
+        lines
+            The input lines
+
+        Returns
+        -------
+        keys
+            Shape (len(lines), num_keys). The dtype is uint64.
+        """
+        if self._method == 'exact':
+            return _hash_strings(lines)[:, None]
+        signatures = self.minhash_signatures(lines).astype(np.uint64)\
+            .reshape((len(lines), self._num_bands, self._rows_per_band))
+        # Hash the band index and the values of each band with FNV-1a on 32-bit words.
+        keys = np.broadcast_to(np.arange(self._num_bands, dtype=np.uint64)
+                               ^ np.uint64(14695981039346656037),
+                               (len(lines), self._num_bands)).copy()
+        for i in range(self._rows_per_band):
+            keys = (keys ^ signatures[:, :, i]) * np.uint64(1099511628211)
+        return keys
+
+    def _compute_keys_for_pairs(self, lines_l: List[Tuple[str, ...]]) -> np.ndarray:
+        # The lines never contain '\n', so the joined strings are unambiguous
+        return self.compute_keys(['\n'.join(ele) for ele in lines_l])
+
+    def __call__(self, lines: List[str]) -> np.ndarray:
+        """Find the lines to keep
+
+        Parameters
+        ----------
+        lines
+            The input lines
+
+        Returns
+        -------
+        keep
+            Shape (len(lines),). Whether each line is kept.
+        """
+        keep = np.ones((len(lines),), dtype=bool)
+        keys = self.compute_keys(lines)
+        _mark_duplicates(keys.reshape((-1,)),
+                         np.repeat(np.arange(len(lines), dtype=np.int64), keys.shape[1]), keep)
+        return keep
+
+    def dedup_files(self, corpus_paths: List[str], save_paths: List[str],
+                    num_process: int = 1, chunk_size: int = 16384,
+                    max_run_size: int = 64 * 1024 * 1024,
+                    tmp_dir: Optional[str] = None) -> Tuple[int, int]:
+        """Deduplicate the corpus on disk and save the kept lines
+
+        Parameters
+        ----------
+        corpus_paths
+            The paths of the corpus files. Multiple files are treated as a parallel corpus, i.e.,
+            the i-th lines of all the files form a sample and they are kept or removed together.
+        save_paths
+            The paths to save the deduplicated corpus, one for each corpus file
+        num_process
+            The number of processes that compute the keys
+        chunk_size
+            The number of lines that are sent to a worker process at a time
+        max_run_size
+            The maximal number of keys in a sorted run on disk
+        tmp_dir
+            The directory to store the sorted runs. By default, the system temporary directory
+            is used.
+
+        Returns
+        -------
+        num_lines
+            The number of lines in the corpus
+        num_removed
+            The number of removed lines
+        """
+        assert len(corpus_paths) == len(save_paths) and len(corpus_paths) > 0
+
+        def chunk_iterator():
+            files = [open(path, 'r', encoding='utf-8') for path in corpus_paths]
+            try:
+                chunk = []
+                for lines in itertools.zip_longest(*files):
+                    if any(ele is None for ele in lines):
+                        raise ValueError('The corpus files {} do not have the same number of'
+                                         ' lines.'.format(corpus_paths))
+                    chunk.append(tuple(ele.rstrip('\n') for ele in lines))
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+                if chunk:
+                    yield chunk
+            finally:
+                for f in files:
+                    f.close()
+
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as run_dir:
+            run_paths = []
+            buffer = []
+            buffer_size = 0
+            num_lines = 0
+
+            def flush():
+                keys = np.concatenate([ele[0] for ele in buffer]).reshape((-1,))
+                indices = np.concatenate([np.repeat(np.arange(start, start + len(ele),
+                                                              dtype=np.int64), ele.shape[1])
+                                          for ele, start in buffer])
+                run_path = os.path.join(run_dir, 'run{}'.format(len(run_paths)))
+                _write_sorted_run(keys, indices, run_path)
+                run_paths.append(run_path)
+                buffer.clear()
+
+            if num_process > 1:
+                pool = multiprocessing.Pool(num_process)
+                keys_iter = pool.imap(self._compute_keys_for_pairs, chunk_iterator())
+            else:
+                pool = None
+                keys_iter = map(self._compute_keys_for_pairs, chunk_iterator())
+            try:
+                for keys in keys_iter:
+                    buffer.append((keys, num_lines))
+                    num_lines += len(keys)
+                    buffer_size += keys.size
+                    if buffer_size >= max_run_size:
+                        flush()
+                        buffer_size = 0
+            finally:
+                if pool is not None:
+                    # All the results have been consumed unless an exception is raised, in
+                    # which case close() + join() would wait for the workers to hash the rest
+                    # of the corpus before the exception propagates.
+                    pool.terminate()
+            if buffer:
+                flush()
+            keep = np.lib.format.open_memmap(os.path.join(run_dir, 'keep.npy'), mode='w+',
+                                             dtype=bool, shape=(num_lines,))
+            keep[:] = True
+            _mark_duplicates_in_sorted_runs(run_paths, keep)
+            num_kept = 0
+            out_files = [open(path, 'w', encoding='utf-8', newline='\n') for path in save_paths]
+            try:
+                line_id = 0
+                for chunk in chunk_iterator():
+                    chunk_keep = keep[line_id:(line_id + len(chunk))]
+                    line_id += len(chunk)
+                    kept_lines = [ele for ele, flag in zip(chunk, chunk_keep) if flag]
+                    num_kept += len(kept_lines)
+                    for i, f in enumerate(out_files):
+                        f.write(''.join([ele[i] + '\n' for ele in kept_lines]))
+            finally:
+                for f in out_files:
+                    f.close()
+            del keep
+        return num_lines, num_lines - num_kept
+
+
+class FilterPipelineStats:
+    """The statistics of a :class:`FilterPipeline`
+
+    Parameters
+    ----------
+    stage_names
+        The names of the stages
+    """
+    def __init__(self, stage_names: List[str]):
+        self.stage_names = list(stage_names)
+        self.num_inputs = 0
+        self.num_outputs = 0
+        self.stage_num_inputs = np.zeros((len(stage_names),), dtype=np.int64)
+        self.stage_num_rejected = np.zeros((len(stage_names),), dtype=np.int64)
+        self.stage_time = np.zeros((len(stage_names),), dtype=np.float64)
+
+    def update(self, other: 'FilterPipelineStats'):
+        """Accumulate the statistics of another run of the same pipeline"""
+        assert self.stage_names == other.stage_names
+        self.num_inputs += other.num_inputs
+        self.num_outputs += other.num_outputs
+        self.stage_num_inputs += other.stage_num_inputs
+        self.stage_num_rejected += other.stage_num_rejected
+        self.stage_time += other.stage_time
+
+    def __str__(self):
+        name_width = max([len('Stage')] + [len(ele) for ele in self.stage_names])
+        lines = ['{:<{w}}  {:>12}  {:>12}  {:>9}'
+                 .format('Stage', '#Inputs', '#Rejected', 'Time(s)', w=name_width)]
+        for name, num_inputs, num_rejected, spent in zip(self.stage_names,
+                                                         self.stage_num_inputs,
+                                                         self.stage_num_rejected,
+                                                         self.stage_time):
+            lines.append('{:<{w}}  {:>12}  {:>12}  {:>9.2f}'
+                         .format(name, num_inputs, num_rejected, spent, w=name_width))
+        lines.append('#Inputs: {}, #Outputs: {}, #Rejected: {}'
+                     .format(self.num_inputs, self.num_outputs,
+                             self.num_inputs - self.num_outputs))
+        return '\n'.join(lines)
+
+
+_pipeline_worker = None
+
+
+def _initialize_pipeline_worker(pipeline):
+    global _pipeline_worker
+    _pipeline_worker = pipeline
+
+
+def _run_pipeline_worker(chunk):
+    return _pipeline_worker._process_raw_chunk(chunk)
+
+
+class FilterPipeline:
+    """A pipeline that cleans a monolingual or a parallel corpus.
+
+    A sample is a tuple of strings, e.g., (src_sentence, tgt_sentence) for a parallel corpus.
+    The pipeline consists of the "map" stages, which transform the samples, and the "filter"
+    stages, which reject the samples. The stages are declared once and applied chunk by chunk:
+    each stage processes the surviving samples of the whole chunk before the next stage, so the
+    rejected samples never reach the later stages. Thus, the cheap filters, e.g., the length,
+    latin1 and language filters, should be declared before the expensive stages like the Moses
+    tokenization. A stage can also be batched, i.e., it receives the list of the surviving
+    samples, which is useful for :meth:`LanguageIdentifier.predict_batch`.
+
+    The number of inputs, the number of rejected samples and the time spent of every stage are
+    reported in :class:`FilterPipelineStats`.
+
+    Examples
+    --------
+    >>> normalizer = MosesNormalizer('en')
+    >>> pipeline = FilterPipeline()
+    >>> pipeline.add_map('normalize', lambda sample: tuple(normalizer(ele) for ele in sample))\\
+    ...         .add_filter('max_num_chars', lambda sample: max(map(len, sample)) <= 1024)
+    >>> outputs, stats = pipeline([('Hello  World!', 'Hallo Welt!')])
+    """
+    def __init__(self):
+        self._stages = []
+
+    @property
+    def stage_names(self) -> List[str]:
+        return [ele[0] for ele in self._stages]
+
+    def _add_stage(self, name, kind, func, batched):
+        if name in self.stage_names:
+            raise ValueError('The stage "{}" already exists. All the stages: {}'
+                             .format(name, self.stage_names))
+        self._stages.append((name, kind, func, batched))
+        return self
+
+    def add_map(self, name: str, func, batched: bool = False) -> 'FilterPipeline':
+        """Add a stage that transforms the samples
+
+        Parameters
+        ----------
+        name
+            The name of the stage
+        func
+            If batched is False, func(sample) returns the transformed sample. Otherwise,
+            func(samples) returns the list of the transformed samples.
+        batched
+            Whether func is applied to the list of samples
+
+        Returns
+        -------
+        pipeline
+            The pipeline itself
+        """
+        return self._add_stage(name, 'map', func, batched)
+
+    def add_filter(self, name: str, func, batched: bool = False) -> 'FilterPipeline':
+        """Add a stage that rejects the samples
+
+        Parameters
+        ----------
+        name
+            The name of the stage
+        func
+            If batched is False, func(sample) returns whether to keep the sample. Otherwise,
+            func(samples) returns a list or an array of booleans.
+        batched
+            Whether func is applied to the list of samples
+
+        Returns
+        -------
+        pipeline
+            The pipeline itself
+        """
+        return self._add_stage(name, 'filter', func, batched)
+
+    def __repr__(self):
+        return '{}(stages=[{}])'.format(self.__class__.__name__, ', '.join(
+            '{}:{}'.format(name, kind) for name, kind, _, _ in self._stages))
+
+    def __call__(self, samples: List[Tuple[str, ...]])\
+            -> Tuple[List[Tuple[str, ...]], FilterPipelineStats]:
+        """Process a chunk of samples
+
+        Parameters
+        ----------
+        samples
+            The input samples
+
+        Returns
+        -------
+        outputs
+            The samples that pass all the filters, in the same order as the inputs
+        stats
+            The statistics
+        """
+        stats = FilterPipelineStats(self.stage_names)
+        stats.num_inputs = len(samples)
+        for i, (name, kind, func, batched) in enumerate(self._stages):
+            if not samples:
+                break
+            start = time.perf_counter()
+            stats.stage_num_inputs[i] = len(samples)
+            if kind == 'map':
+                samples = func(samples) if batched else [func(ele) for ele in samples]
+            else:
+                if batched:
+                    samples = [ele for ele, keep in zip(samples, func(samples)) if keep]
+                else:
+                    samples = [ele for ele in samples if func(ele)]
+                stats.stage_num_rejected[i] = stats.stage_num_inputs[i] - len(samples)
+            stats.stage_time[i] = time.perf_counter() - start
+        stats.num_outputs = len(samples)
+        return samples, stats
+
+    def _process_raw_chunk(self, chunk: List[Tuple[bytes, ...]]):
+        samples = [tuple(ele.decode('utf-8').strip() for ele in raw_sample)
+                   for raw_sample in chunk]
+        return self(samples)
+
+    def process_files(self, corpus_paths: List[List[str]], save_paths: List[str],
+                      num_process: int = 1,
+                      chunk_size: int = 1024 * 1024) -> FilterPipelineStats:
+        """Process the corpus files and save the results
+
+        The files are streamed: the main process reads the lines chunk by chunk and the chunks
+        are processed by a pool of processes. The pipeline is sent to every worker only once.
+
+        Parameters
+        ----------
+        corpus_paths
+            corpus_paths[i] is the list of files of the i-th field of the samples, which are
+            processed one after another. For example, [['train.de'], ['train.en']] for a parallel
+            corpus and [['part1.en', 'part2.en']] for a monolingual corpus.
+        save_paths
+            save_paths[i] is the output path of the i-th field
+        num_process
+            The number of processes
+        chunk_size
+            The approximate number of bytes in a chunk
+
+        Returns
+        -------
+        stats
+            The statistics of the whole corpus
+        """
+        assert len(corpus_paths) == len(save_paths) and len(corpus_paths) > 0
+        assert all(len(ele) == len(corpus_paths[0]) for ele in corpus_paths),\
+            'All the fields should have the same number of files.'
+
+        def chunk_iterator():
+            for paths in zip(*corpus_paths):
+                files = [open(path, 'rb') for path in paths]
+                try:
+                    chunk = []
+                    budget = chunk_size
+                    for raw_sample in itertools.zip_longest(*files):
+                        if any(ele is None for ele in raw_sample):
+                            raise ValueError('The files {} do not have the same number of'
+                                             ' lines.'.format(paths))
+                        chunk.append(raw_sample)
+                        budget -= len(raw_sample[0])
+                        if budget <= 0:
+                            yield chunk
+                            chunk = []
+                            budget = chunk_size
+                    if chunk:
+                        yield chunk
+                finally:
+                    for f in files:
+                        f.close()
+
+        stats = FilterPipelineStats(self.stage_names)
+        out_files = [open(path, 'w', encoding='utf-8', newline='\n') for path in save_paths]
+        try:
+            if num_process > 1:
+                pool = multiprocessing.Pool(num_process,
+                                            initializer=_initialize_pipeline_worker,
+                                            initargs=(self,))
+                results = pool.imap(_run_pipeline_worker, chunk_iterator())
+            else:
+                pool = None
+                results = map(self._process_raw_chunk, chunk_iterator())
+            try:
+                for outputs, chunk_stats in results:
+                    for i, f in enumerate(out_files):
+                        f.write(''.join([ele[i] + '\n' for ele in outputs]))
+                    stats.update(chunk_stats)
+            finally:
+                if pool is not None:
+                    # All the results have been consumed unless an exception is raised
+                    pool.terminate()
+        finally:
+            for f in out_files:
+                f.close()
+        return stats
@@ -0,0 +1,236 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Lexical shortlists of the target vocabulary for machine translation.
+
+The output layer of a translation model scores every token of the target vocabulary in each
+decoding step, although only a small part of the vocabulary is plausible for a given source
+sentence. A lexical shortlist restricts the output layer to
+
+    - the most frequent target tokens, which are always included, and
+    - the target tokens that co-occur most often with each token of the source sentence.
+
+The co-occurrence table is built once from the parallel training corpus.
+"""
+__all__ = ['LexicalShortlist']
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def _merge_counts(keys: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sum the counts of the same keys"""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int64)
+
+
+class LexicalShortlist:
+    """The candidate target tokens of the source sentences.
+
+    Parameters
+    ----------
+    table
+        The candidate target tokens of each source token, padded with -1.
+        Shape (src_vocab_size, num_candidates)
+    frequent_ids
+        The target tokens that are candidates of all the sentences, e.g., the special tokens and
+        the most frequent tokens.
+    tgt_vocab_size
+        The size of the target vocabulary
+    """
+    def __init__(self, table: np.ndarray, frequent_ids: Sequence[int], tgt_vocab_size: int):
+        self._table = np.asarray(table, dtype=np.int32)
+        assert self._table.ndim == 2
+        self._frequent_ids = np.unique(np.asarray(frequent_ids, dtype=np.int32))
+        self._tgt_vocab_size = tgt_vocab_size
+        if self._table.max(initial=-1) >= tgt_vocab_size\
+                or self._frequent_ids.max(initial=-1) >= tgt_vocab_size:
+            raise ValueError('The target tokens must be smaller than tgt_vocab_size={}.'
+                             .format(tgt_vocab_size))
+
+    @property
+    def table(self) -> np.ndarray:
+        return self._table
+
+    @property
+    def frequent_ids(self) -> np.ndarray:
+        return self._frequent_ids
+
+    @property
+    def src_vocab_size(self) -> int:
+        return self._table.shape[0]
+
+    @property
+    def tgt_vocab_size(self) -> int:
+        return self._tgt_vocab_size
+
+    @classmethod
+    def from_corpus(cls, src_corpus: Iterable[Sequence[int]],
+                    tgt_corpus: Iterable[Sequence[int]],
+                    src_vocab_size: int,
+                    tgt_vocab_size: int,
+                    num_candidates: int = 50,
+                    num_frequent: int = 100,
+                    special_ids: Optional[List[int]] = None,
+                    buffer_size: int = 1 << 24) -> 'LexicalShortlist':
+        """Build the shortlist from a parallel corpus.
+
+        The target tokens are ranked for each source token by the Dice coefficient of the
+        sentences that contain them, i.e., 2 * c(s, t) / (c(s) + c(t)), which does not favor the
+        frequent target tokens as much as the raw co-occurrence count. The frequent target
+        tokens are always candidates, so they are not stored in the table.
+
+        Parameters
+        ----------
+        src_corpus
+            The token ids of the source sentences, e.g., a
+            :class:`~gluonnlp.data.streaming.RaggedIdStore`
+        tgt_corpus
+            The token ids of the target sentences
+        src_vocab_size
+            The size of the source vocabulary
+        tgt_vocab_size
+            The size of the target vocabulary
+        num_candidates
+            The number of the candidates of each source token
+        num_frequent
+            The number of the most frequent target tokens that are always candidates
+        special_ids
+            The target tokens that are always candidates, e.g., the EOS token
+        buffer_size
+            The number of the (source, target) pairs that are buffered before they are merged
+            into the counts
+
+        Returns
+        -------
+        shortlist
+        """
+        src_counts = np.zeros((src_vocab_size,), dtype=np.int64)
+        tgt_counts = np.zeros((tgt_vocab_size,), dtype=np.int64)
+        pair_keys = np.zeros((0,), dtype=np.int64)
+        pair_counts = np.zeros((0,), dtype=np.int64)
+        buffer = []
+        buffered = 0
+        num_pairs = 0
+        for src_ids, tgt_ids in zip(src_corpus, tgt_corpus):
+            src_ids = np.unique(np.asarray(src_ids, dtype=np.int64))
+            tgt_ids = np.unique(np.asarray(tgt_ids, dtype=np.int64))
+            if src_ids.size > 0 and (src_ids[0] < 0 or src_ids[-1] >= src_vocab_size):
+                raise ValueError('The source tokens must be in [0, {}).'.format(src_vocab_size))
+            if tgt_ids.size > 0 and (tgt_ids[0] < 0 or tgt_ids[-1] >= tgt_vocab_size):
+                raise ValueError('The target tokens must be in [0, {}).'.format(tgt_vocab_size))
+            num_pairs += 1
+            src_counts[src_ids] += 1
+            tgt_counts[tgt_ids] += 1
+            keys = (src_ids[:, None] * tgt_vocab_size + tgt_ids[None, :]).reshape((-1,))
+            buffer.append(keys)
+            buffered += keys.size
+            if buffered >= buffer_size:
+                pair_keys, pair_counts = _merge_counts(
+                    np.concatenate([pair_keys] + buffer),
+                    np.concatenate([pair_counts, np.ones((buffered,), dtype=np.int64)]))
+                buffer = []
+                buffered = 0
+        if buffered > 0:
+            pair_keys, pair_counts = _merge_counts(
+                np.concatenate([pair_keys] + buffer),
+                np.concatenate([pair_counts, np.ones((buffered,), dtype=np.int64)]))
+        if num_pairs == 0:
+            raise ValueError('The corpus is empty.')
+        frequent_ids = np.argsort(-tgt_counts, kind='stable')[:num_frequent]
+        frequent_ids = frequent_ids[tgt_counts[frequent_ids] > 0]
+        if special_ids is not None:
+            frequent_ids = np.union1d(frequent_ids, special_ids)
+        is_frequent = np.zeros((tgt_vocab_size,), dtype=np.bool_)
+        is_frequent[frequent_ids] = True
+        src_ids = pair_keys // tgt_vocab_size
+        tgt_ids = pair_keys % tgt_vocab_size
+        keep = ~is_frequent[tgt_ids]
+        src_ids, tgt_ids, pair_counts = src_ids[keep], tgt_ids[keep], pair_counts[keep]
+        dice = 2 * pair_counts / (src_counts[src_ids] + tgt_counts[tgt_ids])
+        # Sort by the source token and then by the descending score
+        order = np.lexsort((tgt_ids, -dice, src_ids))
+        src_ids, tgt_ids = src_ids[order], tgt_ids[order]
+        rank = np.arange(src_ids.size) - np.searchsorted(src_ids, src_ids, side='left')
+        keep = rank < num_candidates
+        table = np.full((src_vocab_size, num_candidates), -1, dtype=np.int32)
+        table[src_ids[keep], rank[keep]] = tgt_ids[keep]
+        return cls(table, frequent_ids, tgt_vocab_size)
+
+    def save(self, path: str):
+        """Save the shortlist to a .npz file"""
+        np.savez(path, table=self._table, frequent_ids=self._frequent_ids,
+                 tgt_vocab_size=np.array(self._tgt_vocab_size))
+
+    @classmethod
+    def load(cls, path: str) -> 'LexicalShortlist':
+        """Load the shortlist saved by :meth:`save`"""
+        with np.load(path) as data:
+            return cls(data['table'], data['frequent_ids'], int(data['tgt_vocab_size']))
+
+    def __call__(self, src_ids, valid_length=None, size_multiple: int = 8)\
+            -> Tuple[np.ndarray, np.ndarray]:
+        """Get the candidate target tokens of a batch of source sentences.
+
+        The candidates are the union of the candidates of all the sentences, so the output layer
+        only gathers the weights once for the whole batch, and the mask keeps the candidates of
+        each sentence.
+
+        Parameters
+        ----------
+        src_ids
+            The token ids of the source sentences. A list of sequences or an array with shape
+            (batch_size, src_length)
+        valid_length
+            The valid length of each sentence. Shape (batch_size,)
+        size_multiple
+            The number of the candidates is padded to a multiple of size_multiple with the
+            tokens that are not candidates of any sentence. It reduces the number of different
+            shapes seen by the hybridized model.
+
+        Returns
+        -------
+        candidate_ids
+            The sorted candidate tokens of the batch. Shape (num_candidates,)
+        candidate_mask
+            Whether each candidate is a candidate of each sentence.
+            Shape (batch_size, num_candidates)
+        """
+        sentence_candidates = []
+        for i, ele in enumerate(src_ids):
+            ele = np.asarray(ele, dtype=np.int64)
+            if valid_length is not None:
+                ele = ele[:int(valid_length[i])]
+            ele = ele[(ele >= 0) & (ele < self.src_vocab_size)]
+            candidates = self._table[ele].reshape((-1,))
+            sentence_candidates.append(np.union1d(candidates[candidates >= 0],
+                                                  self._frequent_ids))
+        candidate_ids = np.unique(np.concatenate(sentence_candidates + [self._frequent_ids]))
+        num_pad = min(-candidate_ids.size % size_multiple,
+                      self._tgt_vocab_size - candidate_ids.size)
+        if num_pad > 0:
+            pad_ids = np.setdiff1d(np.arange(self._tgt_vocab_size), candidate_ids,
+                                   assume_unique=True)[:num_pad]
+            candidate_ids = np.sort(np.concatenate([candidate_ids, pad_ids]))
+        candidate_mask = np.stack([np.isin(candidate_ids, ele, assume_unique=True)
+                                   for ele in sentence_candidates])
+        return candidate_ids.astype(np.int32), candidate_mask
+
+    def __repr__(self):
+        return '{}(src_vocab_size={}, tgt_vocab_size={}, num_candidates={}, num_frequent={})'\
+            .format(self.__class__.__name__, self.src_vocab_size, self._tgt_vocab_size,
+                    self._table.shape[1], self._frequent_ids.size)
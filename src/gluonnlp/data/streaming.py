@@ -0,0 +1,376 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Streaming tokenization of large text corpora into a memory-mappable id store.
+
+The corpus is split into byte ranges that are aligned to line boundaries. Each range is
+tokenized by a worker process and written to a temporary shard on disk. The shards are
+then concatenated, in the original line order, into a ragged store that consists of
+
+    - ids.npy
+        The flattened token ids of all lines. Shape (#Tokens,)
+    - offsets.npy
+        The start position of each line in ids.npy. Shape (#Lines + 1,)
+    - meta.json
+        The source files and the number of lines taken from each of them.
+
+Since only a single chunk is held in memory by every worker, the memory cost is bounded by
+`num_process * chunk_size` regardless of the size of the corpus.
+"""
+__all__ = ['RaggedIdStore', 'get_chunk_byte_ranges', 'tokenize_files_to_ids']
+
+import os
+import json
+import shutil
+import itertools
+import multiprocessing
+from typing import List, Tuple, Union, Optional, Iterator
+
+import numpy as np
+
+_IDS_FNAME = 'ids.npy'
+_OFFSETS_FNAME = 'offsets.npy'
+_META_FNAME = 'meta.json'
+_PROGRESS_FNAME = 'progress.json'
+
+# The tokenizer used in the worker processes
+_tokenizer = None
+
+
+class RaggedIdStore:
+    """A read-only store of variable-length token id sequences.
+
+    The flattened ids are opened with `np.load(..., mmap_mode='r')` so that the store can be
+    shared by multiple processes without copying the data into each of them.
+
+    Parameters
+    ----------
+    path
+        The directory generated by :func:`tokenize_files_to_ids`.
+    mmap
+        Whether to memory-map the ids. If False, all ids will be loaded into memory.
+    """
+    def __init__(self, path: str, mmap: bool = True):
+        self._path = path
+        with open(os.path.join(path, _META_FNAME), 'r', encoding='utf-8') as f:
+            self._meta = json.load(f)
+        self._offsets = np.load(os.path.join(path, _OFFSETS_FNAME))
+        if mmap and self._offsets[-1] > 0:
+            self._ids = np.load(os.path.join(path, _IDS_FNAME), mmap_mode='r')
+        else:
+            # Empty files cannot be memory-mapped
+            self._ids = np.load(os.path.join(path, _IDS_FNAME))
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def ids(self) -> np.ndarray:
+        """The flattened token ids. Shape (#Tokens,)"""
+        return self._ids
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """The start position of each sequence in `ids`. Shape (#Lines + 1,)"""
+        return self._offsets
+
+    @property
+    def lengths(self) -> np.ndarray:
+        """The length of each sequence. Shape (#Lines,)"""
+        return self._offsets[1:] - self._offsets[:-1]
+
+    @property
+    def num_tokens(self) -> int:
+        return int(self._offsets[-1])
+
+    @property
+    def files(self) -> List[str]:
+        """The source files of the store"""
+        return self._meta['files']
+
+    def file_line_range(self, file_idx: int) -> Tuple[int, int]:
+        """Get the range of sequences that are tokenized from the given source file.
+
+        Parameters
+        ----------
+        file_idx
+            The index of the file in `files`
+
+        Returns
+        -------
+        begin
+            The index of the first sequence
+        end
+            One past the index of the last sequence
+        """
+        line_starts = np.cumsum([0] + self._meta['num_lines'])
+        return int(line_starts[file_idx]), int(line_starts[file_idx + 1])
+
+    def __len__(self):
+        return self._offsets.shape[0] - 1
+
+    def __getitem__(self, idx: int) -> np.ndarray:
+        if idx < 0:
+            idx += len(self)
+        if idx < 0 or idx >= len(self):
+            raise IndexError('Index {} is out of range. The store has {} sequences.'
+                             .format(idx, len(self)))
+        return self._ids[self._offsets[idx]:self._offsets[idx + 1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return '{}(path={}, num_sequences={}, num_tokens={})'.format(
+            self.__class__.__name__, self._path, len(self), self.num_tokens)
+
+
+def get_chunk_byte_ranges(path: str, chunk_size: int) -> List[Tuple[int, int]]:
+    """Split a file into byte ranges of roughly `chunk_size` bytes.
+
+    Each range starts at the beginning of a line and ends right after a newline character (or at
+    the end of the file). Only the bytes around the boundaries are read, so the cost does not
+    depend on the number of lines.
+
+    Parameters
+    ----------
+    path
+        The path of the text file
+    chunk_size
+        The approximate number of bytes in each chunk
+
+    Returns
+    -------
+    ranges
+        A list of (start, end) pairs.
+    """
+    assert chunk_size > 0
+    file_size = os.path.getsize(path)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = 0
+        while start < file_size:
+            end = start + chunk_size
+            if end >= file_size:
+                end = file_size
+            else:
+                # Move the end to the next line boundary. If the byte before "end" is
+                # already a newline character, readline() will not move the position.
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _read_lines(path: str, start: int, end: int, strip: bool) -> List[str]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    lines = data.split(b'\n')
+    if data.endswith(b'\n'):
+        lines.pop()
+    if strip:
+        return [line.decode('utf-8').strip() for line in lines]
+    else:
+        return [line.decode('utf-8').rstrip('\r') for line in lines]
+
+
+def _initialize_tokenize_worker(tokenizer):
+    global _tokenizer
+    _tokenizer = tokenizer
+
+
+def _tokenize_chunk_worker(args):
+    """Tokenize a single chunk and save the result to a shard.
+
+    Returns
+    -------
+    chunk_id
+        The id of the chunk
+    num_lines
+        The number of lines in the chunk
+    num_tokens
+        The total number of tokens in the chunk
+    """
+    chunk_id, path, start, end, shard_prefix, strip, prefix_ids, suffix_ids, dtype = args
+    lines = _read_lines(path, start, end, strip)
+    if len(lines) > 0:
+        all_token_ids = _tokenizer.encode(lines, int)
+    else:
+        all_token_ids = []
+    extra_len = len(prefix_ids) + len(suffix_ids)
+    lengths = np.array([len(ele) + extra_len for ele in all_token_ids], dtype=np.int64)
+    num_tokens = int(lengths.sum())
+    flat_ids = np.fromiter(itertools.chain.from_iterable(
+        itertools.chain(prefix_ids, ele, suffix_ids) for ele in all_token_ids),
+        dtype=dtype, count=num_tokens)
+    # Write to a temporary file first so that a killed job never leaves a broken shard
+    for suffix, arr in [('.ids.npy', flat_ids), ('.lengths.npy', lengths)]:
+        tmp_path = shard_prefix + suffix + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp_path, shard_prefix + suffix)
+    return chunk_id, len(lines), num_tokens
+
+
+def _save_json(obj, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def tokenize_files_to_ids(paths: Union[str, List[str]],
+                          tokenizer,
+                          output_dir: str,
+                          prefix_ids: Optional[List[int]] = None,
+                          suffix_ids: Optional[List[int]] = None,
+                          strip: bool = True,
+                          chunk_size: int = 16 * 1024 * 1024,
+                          num_process: int = 8,
+                          dtype=np.int32,
+                          resume: bool = True) -> RaggedIdStore:
+    """Tokenize text files line by line and save the token ids to a :class:`RaggedIdStore`.
+
+    Every line, including the empty ones, is mapped to one sequence in the store and the
+    order of the lines is preserved.
+
+    The progress is checkpointed after every chunk. If the job is interrupted and rerun with the
+    same arguments and `resume=True`, only the chunks that have not been finished will be
+    tokenized.
+
+    The output directory must not be written by several processes at the same time. In
+    distributed training, build the store in one worker of each machine, wait for it, and then
+    open the store with :class:`RaggedIdStore` in every worker.
+
+    Parameters
+    ----------
+    paths
+        The path or a list of paths of the text files. Must be encoded in utf-8.
+    tokenizer
+        The tokenizer. It must support `encode(lines, int)` and be picklable if
+        `num_process > 1`.
+    output_dir
+        The directory to save the store
+    prefix_ids
+        The ids to add before each sequence, e.g., [vocab.bos_id]
+    suffix_ids
+        The ids to add after each sequence, e.g., [vocab.eos_id]
+    strip
+        Whether to strip the leading and trailing whitespaces of each line
+    chunk_size
+        The approximate number of bytes that will be processed by a worker each time
+    num_process
+        The number of worker processes. If it is smaller than 2, the files will be tokenized in
+        the current process.
+    dtype
+        The data type of the token ids
+    resume
+        Whether to reuse the finished chunks of a previous run
+
+    Returns
+    -------
+    store
+        The store of the token ids
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    prefix_ids = list(prefix_ids) if prefix_ids is not None else []
+    suffix_ids = list(suffix_ids) if suffix_ids is not None else []
+    dtype = np.dtype(dtype).name
+    os.makedirs(output_dir, exist_ok=True)
+    shard_dir = os.path.join(output_dir, 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    tasks = []
+    chunk_file_ids = []
+    for file_idx, path in enumerate(paths):
+        for start, end in get_chunk_byte_ranges(path, chunk_size):
+            chunk_id = len(tasks)
+            tasks.append((chunk_id, path, start, end,
+                          os.path.join(shard_dir, '{:08d}'.format(chunk_id)),
+                          strip, prefix_ids, suffix_ids, dtype))
+            chunk_file_ids.append(file_idx)
+    # The plan is used to verify that a checkpoint belongs to the same job
+    plan = {'files': [os.path.realpath(path) for path in paths],
+            'file_sizes': [os.path.getsize(path) for path in paths],
+            'chunk_size': chunk_size,
+            'prefix_ids': prefix_ids,
+            'suffix_ids': suffix_ids,
+            'strip': strip,
+            'dtype': dtype}
+    progress_path = os.path.join(output_dir, _PROGRESS_FNAME)
+    finished = dict()
+    if resume and os.path.exists(progress_path):
+        with open(progress_path, 'r', encoding='utf-8') as f:
+            progress = json.load(f)
+        if progress['plan'] == plan:
+            finished = {int(k): tuple(v) for k, v in progress['finished'].items()}
+    remaining_tasks = [task for task in tasks if task[0] not in finished]
+
+    def _update_progress(result):
+        chunk_id, num_lines, num_tokens = result
+        finished[chunk_id] = (num_lines, num_tokens)
+        _save_json({'plan': plan, 'finished': finished}, progress_path)
+
+    if num_process < 2:
+        _initialize_tokenize_worker(tokenizer)
+        for task in remaining_tasks:
+            _update_progress(_tokenize_chunk_worker(task))
+    else:
+        with multiprocessing.Pool(num_process, initializer=_initialize_tokenize_worker,
+                                  initargs=(tokenizer,)) as pool:
+            for result in pool.imap_unordered(_tokenize_chunk_worker, remaining_tasks):
+                _update_progress(result)
+    # Concatenate the shards in order
+    num_lines = sum(finished[i][0] for i in range(len(tasks)))
+    num_tokens = sum(finished[i][1] for i in range(len(tasks)))
+    offsets = np.zeros((num_lines + 1,), dtype=np.int64)
+    ids_path = os.path.join(output_dir, _IDS_FNAME)
+    if num_tokens > 0:
+        ids = np.lib.format.open_memmap(ids_path, mode='w+', dtype=dtype, shape=(num_tokens,))
+    else:
+        ids = np.zeros((0,), dtype=dtype)
+    line_begin = 0
+    token_begin = 0
+    file_num_lines = [0 for _ in paths]
+    for task in tasks:
+        chunk_id, shard_prefix = task[0], task[4]
+        chunk_ids = np.load(shard_prefix + '.ids.npy')
+        chunk_lengths = np.load(shard_prefix + '.lengths.npy')
+        ids[token_begin:(token_begin + chunk_ids.shape[0])] = chunk_ids
+        offsets[(line_begin + 1):(line_begin + 1 + chunk_lengths.shape[0])] =\
+            token_begin + np.cumsum(chunk_lengths)
+        line_begin += chunk_lengths.shape[0]
+        token_begin += chunk_ids.shape[0]
+        file_num_lines[chunk_file_ids[chunk_id]] += chunk_lengths.shape[0]
+    if num_tokens > 0:
+        ids.flush()
+        del ids
+    else:
+        np.save(ids_path, ids)
+    np.save(os.path.join(output_dir, _OFFSETS_FNAME), offsets)
+    _save_json({'files': plan['files'], 'num_lines': file_num_lines,
+                'prefix_ids': prefix_ids, 'suffix_ids': suffix_ids, 'dtype': dtype},
+               os.path.join(output_dir, _META_FNAME))
+    # Clean up the shards and the checkpoint
+    shutil.rmtree(shard_dir)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    return RaggedIdStore(output_dir)
@@ -18,18 +18,25 @@
 __all__ = ['WhitespaceTokenizer', 'SpacyTokenizer', 'JiebaTokenizer', 'MosesTokenizer',
            'SubwordNMTTokenizer', 'YTTMTokenizer', 'SentencepieceTokenizer',
            'HuggingFaceBPETokenizer', 'HuggingFaceByteBPETokenizer',
-           'HuggingFaceWordPieceTokenizer',
+           'HuggingFaceWordPieceTokenizer', 'ByteBPETokenizer',
+           'IncrementalDecoder', 'ByteLevelIncrementalDecoder',
            'create', 'create_with_json', 'list_all']
 
 import os
+import re
 import abc
+import copy
 import json
+import codecs
+import random
+import unicodedata
 import warnings
 import itertools
 from uuid import uuid4
 from typing import List, Tuple, Union, NewType, Optional
 from collections import OrderedDict
 
+import regex
 import sacremoses
 
 from .vocab import Vocab
@@ -40,6 +47,7 @@ from ..utils.lazy_imports import try_import_subword_nmt,\
                                  try_import_yttm,\
                                  try_import_spacy,\
                                  try_import_jieba
+from ..utils.misc import parallel_map, _is_ascii
 
 
 SentencesType = NewType('SentencesType', Union[str, List[str]])
@@ -231,6 +239,20 @@ class BaseTokenizer(abc.ABC):
         """
         raise NotImplementedError
 
+    def incremental_decoder(self) -> 'IncrementalDecoder':
+        """Get a stateful decoder that detokenizes the tokens one at a time.
+
+        It is useful in streaming generation, in which we should emit the text as soon as
+        a new token is sampled. Calling `decode` with all the generated tokens at every step will
+        take O(n^2) time.
+
+        Returns
+        -------
+        decoder
+            The incremental decoder
+        """
+        return IncrementalDecoder(self)
+
 
 class BaseTokenizerWithVocab(BaseTokenizer):
     @property
@@ -250,6 +272,122 @@ class BaseTokenizerWithVocab(BaseTokenizer):
         pass
 
 
+class IncrementalDecoder:
+    """Decode the tokens one at a time and only emit the newly finalized text.
+
+    The generic implementation works with any tokenizer by calling `tokenizer.decode` on a
+    small sliding window of the latest tokens. The window always keeps the tokens that have
+    produced the last piece of emitted text as the context, so that the whitespaces that
+    depend on the previous token, e.g., the '▁' boundaries in SentencePiece, are recovered
+    correctly. The text will not be emitted if it ends with an incomplete character, i.e., the
+    replacement character '\\ufffd'.
+
+    The concatenation of all the emitted text and the output of `flush` equals to
+    `tokenizer.decode(tokens)` as long as the decode function of the tokenizer does not rely
+    on the tokens that are far away.
+
+    Parameters
+    ----------
+    tokenizer
+        The tokenizer
+
+    Examples
+    --------
+    >>> decoder = tokenizer.incremental_decoder()
+    >>> for token_id in token_ids:
+    ...     print(decoder.step(token_id), end='')
+    >>> print(decoder.flush())
+    """
+    def __init__(self, tokenizer: BaseTokenizer):
+        self._tokenizer = tokenizer
+        self.reset()
+
+    def reset(self):
+        """Reset the decoder to decode a new sequence"""
+        self._tokens = []
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def _decode(self, tokens) -> str:
+        if len(tokens) == 0:
+            return ''
+        return self._tokenizer.decode(tokens)
+
+    def step(self, token: Union[str, int]) -> str:
+        """Feed a new token to the decoder
+
+        Parameters
+        ----------
+        token
+            The token or the token id
+
+        Returns
+        -------
+        text
+            The newly finalized text. It can be an empty string.
+        """
+        self._tokens.append(token)
+        prefix_text = self._decode(self._tokens[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self._tokens[self._prefix_offset:])
+        if len(new_text) > len(prefix_text) and not new_text.endswith('\ufffd'):
+            text = new_text[len(prefix_text):]
+            # Some tokenizers, e.g., SentencePiece, strip the leading whitespaces when decoding.
+            # Thus, a window that starts with pure whitespaces cannot be used as the context.
+            if not text.isspace():
+                self._prefix_offset = self._read_offset
+            self._read_offset = len(self._tokens)
+            return text
+        return ''
+
+    def flush(self) -> str:
+        """Finish decoding the sequence and emit the remaining text
+
+        Returns
+        -------
+        text
+            The remaining text, which may contain the replacement characters if the sequence
+            ends with an incomplete character.
+        """
+        prefix_text = self._decode(self._tokens[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self._tokens[self._prefix_offset:])
+        self.reset()
+        return new_text[len(prefix_text):]
+
+
+class ByteLevelIncrementalDecoder(IncrementalDecoder):
+    """Incremental decoder of the byte-level BPE tokenizers.
+
+    Every token is converted to raw bytes, which are fed to an incremental UTF-8 decoder. Thus,
+    a character split across several tokens is emitted once all of its bytes arrive. Each step
+    takes O(1) time.
+
+    Parameters
+    ----------
+    vocab
+        The vocabulary of the byte-level BPE tokenizer
+    """
+    def __init__(self, vocab: Vocab):
+        self._vocab = vocab
+        self._token_bytes_cache = dict()
+        super().__init__(None)
+
+    def reset(self):
+        self._utf8_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def step(self, token: Union[str, int]) -> str:
+        token_bytes = self._token_bytes_cache.get(token)
+        if token_bytes is None:
+            token_str = self._vocab.to_tokens(token) if isinstance(token, int) else token
+            token_bytes = bytes([_BYTE_DECODER[c] for c in token_str])
+            self._token_bytes_cache[token] = token_bytes
+        return self._utf8_decoder.decode(token_bytes)
+
+    def flush(self) -> str:
+        text = self._utf8_decoder.decode(b'', final=True)
+        self.reset()
+        return text
+
+
 def load_tokenizer(method, **kwargs):
     if method == 'whitespace':
         return WhitespaceTokenizer()
@@ -462,6 +600,68 @@ class SpacyTokenizer(BaseTokenizerWithVocab):
         self._vocab = vocab
 
 
+_RE_PATTERN_TYPE = type(re.compile(''))
+_MOSES_CHAR_CLASS_NAMES = ['IsAlnum', 'IsAlpha', 'IsLower', 'IsN', 'IsSc', 'IsSo']
+
+
+def _get_ascii_moses_tokenizer(tokenizer: sacremoses.MosesTokenizer) -> sacremoses.MosesTokenizer:
+    """Get a shallow copy of the sacremoses tokenizer that only works for pure ASCII sentences.
+
+    The regexes in sacremoses embed the unicode character classes, e.g., IsAlnum, which contain
+    thousands of characters. We replace them with their ASCII subsets, which will not change
+    the tokenization result of any pure ASCII sentence but make the regex matching much faster.
+
+    Parameters
+    ----------
+    tokenizer
+        The sacremoses tokenizer
+
+    Returns
+    -------
+    ascii_tokenizer
+        The tokenizer that should only be used for pure ASCII sentences.
+    """
+    replacements = []
+    for name in _MOSES_CHAR_CLASS_NAMES:
+        chars = getattr(tokenizer, name, None)
+        if isinstance(chars, str):
+            replacements.append((chars, ''.join([c for c in chars if ord(c) < 128])))
+    # Replace the longer character classes first, e.g., IsAlnum contains IsAlpha
+    replacements.sort(key=lambda ele: len(ele[0]), reverse=True)
+
+    def _convert_pattern(pattern):
+        if isinstance(pattern, str):
+            for chars, ascii_chars in replacements:
+                pattern = pattern.replace(chars, ascii_chars)
+            return pattern
+        elif not isinstance(pattern, _RE_PATTERN_TYPE) or not isinstance(pattern.pattern, str):
+            return pattern
+        new_pattern = _convert_pattern(pattern.pattern)
+        if new_pattern == pattern.pattern:
+            return pattern
+        return re.compile(new_pattern, pattern.flags)
+
+    def _is_substitution(ele):
+        return isinstance(ele, tuple) and len(ele) == 2 and isinstance(ele[1], str)
+
+    ascii_tokenizer = copy.copy(tokenizer)
+    for name in dir(tokenizer):
+        if name.startswith('__'):
+            continue
+        value = getattr(tokenizer, name)
+        if _is_substitution(value):
+            setattr(ascii_tokenizer, name, (_convert_pattern(value[0]), value[1]))
+        elif isinstance(value, list) and len(value) > 0\
+                and all(_is_substitution(ele) for ele in value):
+            setattr(ascii_tokenizer, name,
+                    [(_convert_pattern(pattern), repl) for pattern, repl in value])
+    for chars, ascii_chars in replacements:
+        for name in _MOSES_CHAR_CLASS_NAMES:
+            if getattr(tokenizer, name, None) == chars:
+                setattr(ascii_tokenizer, name, ascii_chars)
+    return ascii_tokenizer
+
+
 @TOKENIZER_REGISTRY.register('moses')
 class MosesTokenizer(BaseTokenizerWithVocab):
     r"""Apply the Moses Tokenizer/Detokenizer implemented in
@@ -470,6 +670,10 @@ class MosesTokenizer(BaseTokenizerWithVocab):
     .. note::
         sacremoses carries an LGPL 2.1+ license.
 
+    Pure ASCII sentences are tokenized with a copy of the sacremoses tokenizer in which the
+    unicode character classes of the regexes are replaced by their ASCII subsets. The results
+    are the same but it runs much faster.
+
     Parameters
     ----------
     lang
@@ -484,6 +688,7 @@ class MosesTokenizer(BaseTokenizerWithVocab):
                           'not accurate. Try to use JiebaTokenizer. You may also tokenize the '
                           'chinese sentence to characters and learn a BPE.')
         self._tokenizer = sacremoses.MosesTokenizer(lang=lang)
+        self._ascii_tokenizer = _get_ascii_moses_tokenizer(self._tokenizer)
         self._detokenizer = sacremoses.MosesDetokenizer(lang=lang)
 
         # Here, we need to warm-up the tokenizer to compile the regex
@@ -496,13 +701,17 @@ class MosesTokenizer(BaseTokenizerWithVocab):
         _ = self.encode('hello world')
         _ = self.decode(['hello', 'world'])
 
+    def _tokenize(self, sentence: str) -> List[str]:
+        if _is_ascii(sentence):
+            return self._ascii_tokenizer.tokenize(sentence, return_str=False)
+        return self._tokenizer.tokenize(sentence, return_str=False)
+
     def encode(self, sentences, output_type=str):
         if output_type is str:
             if isinstance(sentences, list):
-                return [self._tokenizer.tokenize(sentence, return_str=False)
-                        for sentence in sentences]
+                return [self._tokenize(sentence) for sentence in sentences]
             else:
-                return self._tokenizer.tokenize(sentences, return_str=False)
+                return self._tokenize(sentences)
         elif output_type is int:
             if self._vocab is None:
                 raise ValueError(_encode_no_vocab_err_msg())
@@ -514,6 +723,36 @@ class MosesTokenizer(BaseTokenizerWithVocab):
         else:
             raise NotImplementedError
 
+    def batch_encode(self, sentences: List[str], output_type=str, num_process: int = 1,
+                     chunksize: int = 1024):
+        """Encode a batch of sentences, optionally with multiple processes.
+
+        Parameters
+        ----------
+        sentences
+            The input sentences
+        output_type
+            The type of the output tokens, can be str or int
+        num_process
+            The number of processes
+        chunksize
+            The number of sentences that are sent to a worker process at a time
+
+        Returns
+        -------
+        tokens
+            The encoded tokens of each sentence. The order is the same as the input.
+        """
+        if output_type is int and self._vocab is None:
+            raise ValueError(_encode_no_vocab_err_msg())
+        elif output_type is not str and output_type is not int:
+            raise NotImplementedError
+        tokens = parallel_map(self._tokenize, sentences,
+                              num_process=num_process, chunksize=chunksize)
+        if output_type is int:
+            return [self._vocab[ele_tokens] for ele_tokens in tokens]
+        return tokens
+
     def encode_with_offsets(self, sentences, output_type=str):
         raise NotImplementedError('We cannot obtain the original offsets for MosesTokenizer.')
 
@@ -998,6 +1237,9 @@ class HuggingFaceByteBPETokenizer(HuggingFaceTokenizer):
         self._trim_offsets = trim_offsets
         self.__rebuild_tokenizer()
 
+    def incremental_decoder(self) -> ByteLevelIncrementalDecoder:
+        return ByteLevelIncrementalDecoder(self._vocab)
+
     def set_bpe_dropout(self, bpe_dropout: float):
         self._dropout = bpe_dropout
         self.__rebuild_tokenizer()
@@ -1699,6 +1941,318 @@ class YTTMTokenizer(BaseTokenizerWithVocab):
         self._bpe = yttm.BPE(self._model_path)
 
 
+def _bytes_to_unicode() -> 'OrderedDict[int, str]':
+    """Get the reversible mapping from utf-8 bytes to printable unicode characters used in GPT-2.
+
+    The printable bytes are mapped to themselves and the others (whitespaces and control
+    characters) are shifted to the code points after 255.
+    """
+    bs = list(range(ord('!'), ord('~') + 1)) + list(range(ord('¡'), ord('¬') + 1)) \
+        + list(range(ord('®'), ord('ÿ') + 1))
+    cs = bs[:]
+    n = 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return OrderedDict(sorted(zip(bs, [chr(c) for c in cs])))
+
+
+_BYTE_ENCODER = _bytes_to_unicode()
+_BYTE_DECODER = {v: k for k, v in _BYTE_ENCODER.items()}
+# The pre-tokenization pattern of GPT-2
+_GPT2_PRETOKENIZE_REGEX = regex.compile(
+    r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""")
+
+
+@TOKENIZER_REGISTRY.register('bytebpe')
+class ByteBPETokenizer(BaseTokenizerWithVocab):
+    r"""The byte-level BPE tokenizer used in GPT-2 and RoBERTa, implemented in GluonNLP.
+
+    It loads the same merges and vocabulary files as :class:`HuggingFaceByteBPETokenizer`
+    and has no dependency on the HuggingFace tokenizers library.
+
+    The merges are converted to integer pair keys of the vocabulary ids so that the inner loop
+    of BPE only works with integers. The segmentation of every pre-tokenized word is cached.
+
+    Parameters
+    ----------
+    merges_file
+        Path to the merges file.
+    vocab_file
+        Path to the vocabulary. Can be the vocabulary of GluonNLP or the json vocabulary
+        file of HuggingFace. A :class:`Vocab` object is also accepted.
+    add_prefix_space
+        Whether to add a space before the sentence if it does not start with a space.
+    lowercase
+        Whether to convert the input string to lower-case strings
+    dropout
+        The dropout probability in BPE-Dropout.
+    unicode_normalizer
+        The unicode normalization form. Can be 'nfc', 'nfd', 'nfkc' or 'nfkd'.
+    cache_size
+        The maximal number of words in the cache. The cache will be cleared if it is full.
+
+    Examples
+    --------
+    >>> tokenizer = gluonnlp.data.ByteBPETokenizer('gpt2.merges', 'gpt2.vocab')
+    -etc-
+    >>> tokenizer.encode("Hello, y'all!")
+    ['Hello', ',', 'Ġy', "'", 'all', '!']
+    """
+    def __init__(self, merges_file: str, vocab_file: Union[str, Vocab],
+                 add_prefix_space: bool = False, lowercase: bool = False,
+                 dropout: Optional[float] = None,
+                 unicode_normalizer: Optional[str] = None,
+                 cache_size: int = 100000):
+        self._merges_file = merges_file
+        self._vocab_file = vocab_file
+        self._add_prefix_space = add_prefix_space
+        self._lowercase = lowercase
+        self._dropout = dropout
+        if unicode_normalizer is not None:
+            assert unicode_normalizer.upper() in ['NFC', 'NFKC', 'NFD', 'NFKD'],\
+                'Unsupported unicode normalization format "{}".'.format(unicode_normalizer)
+        self._unicode_normalizer = unicode_normalizer
+        self._cache_size = cache_size
+        if isinstance(vocab_file, Vocab):
+            self._vocab = vocab_file
+        else:
+            try:
+                # using Vocab obj file
+                self._vocab = _get_vocab(vocab_file)
+            except TypeError:
+                # using hf_bytebpe vocab file
+                with open(vocab_file, 'r', encoding='utf-8') as fv:
+                    hf_vocab = json.load(fv)
+                hf_vocab = sorted(list(hf_vocab.items()), key=lambda x: x[1])
+                self._vocab = Vocab([x[0] for x in hf_vocab])
+        token_to_idx = self._vocab.token_to_idx
+        self._all_tokens = self._vocab.all_tokens
+        # Map each byte to the id of its single-character token. -1 means that it is missing.
+        self._byte_ids = [token_to_idx.get(_BYTE_ENCODER[b], -1) for b in range(256)]
+        # Map (left_id, right_id) --> (rank, merged_id). The pair is encoded as one integer.
+        self._num_ids = len(self._vocab)
+        self._merges = dict()
+        with open(merges_file, 'r', encoding='utf-8') as f:
+            rank = 0
+            for line in f:
+                if line.startswith('#version'):
+                    continue
+                pair = line.split()
+                if len(pair) != 2:
+                    continue
+                left_id = token_to_idx.get(pair[0])
+                right_id = token_to_idx.get(pair[1])
+                merged_id = token_to_idx.get(pair[0] + pair[1])
+                if left_id is not None and right_id is not None and merged_id is not None:
+                    key = left_id * self._num_ids + right_id
+                    if key not in self._merges:
+                        self._merges[key] = (rank, merged_id)
+                rank += 1
+        self._cache = dict()
+
+    def _bpe(self, word: str) -> Tuple[int, ...]:
+        """Segment a single word, which has been converted to bytes, into token ids"""
+        use_cache = not self._dropout
+        if use_cache:
+            ret = self._cache.get(word)
+            if ret is not None:
+                return ret
+        byte_ids = self._byte_ids
+        ids = [byte_ids[b] for b in word]
+        if -1 in ids:
+            raise ValueError('The byte "{}" is not in the vocabulary.'
+                             .format(word[ids.index(-1)]))
+        merges = self._merges
+        num_ids = self._num_ids
+        dropout = self._dropout
+        while len(ids) > 1:
+            best_rank = None
+            best_key = None
+            for i in range(len(ids) - 1):
+                key = ids[i] * num_ids + ids[i + 1]
+                merge = merges.get(key)
+                if merge is not None and (best_rank is None or merge[0] < best_rank):
+                    if dropout and random.random() < dropout:
+                        continue
+                    best_rank = merge[0]
+                    best_key = key
+            if best_key is None:
+                break
+            merged_id = merges[best_key][1]
+            new_ids = []
+            i = 0
+            while i < len(ids):
+                if i < len(ids) - 1 and ids[i] * num_ids + ids[i + 1] == best_key:
+                    new_ids.append(merged_id)
+                    i += 2
+                else:
+                    new_ids.append(ids[i])
+                    i += 1
+            ids = new_ids
+        ret = tuple(ids)
+        if use_cache:
+            if len(self._cache) >= self._cache_size:
+                self._cache.clear()
+            self._cache[word] = ret
+        return ret
+
+    def _preprocess(self, sentence: str) -> Tuple[str, int]:
+        if self._unicode_normalizer is not None:
+            sentence = unicodedata.normalize(self._unicode_normalizer.upper(), sentence)
+        if self._lowercase:
+            sentence = sentence.lower()
+        shift = 0
+        if self._add_prefix_space and sentence and not sentence.startswith(' '):
+            sentence = ' ' + sentence
+            shift = 1
+        return sentence, shift
+
+    def _encode_ids_with_offsets(self, sentence: str) -> Tuple[List[int], List[Tuple[int, int]]]:
+        sentence, shift = self._preprocess(sentence)
+        all_tokens = self._all_tokens
+        ids = []
+        offsets = []
+        for match in _GPT2_PRETOKENIZE_REGEX.finditer(sentence):
+            word = match.group()
+            word_bytes = word.encode('utf-8')
+            word_ids = self._bpe(word_bytes)
+            ids.extend(word_ids)
+            # Map the byte positions inside the word to character positions
+            if len(word_bytes) == len(word):
+                byte_to_char = None
+            else:
+                byte_to_char = []
+                for i, ch in enumerate(word):
+                    byte_to_char.extend([i] * len(ch.encode('utf-8')))
+            byte_begin = 0
+            for token_id in word_ids:
+                # Each character in the token represents one byte
+                byte_end = byte_begin + len(all_tokens[token_id])
+                if byte_to_char is None:
+                    char_begin, char_end = byte_begin, byte_end
+                else:
+                    char_begin = byte_to_char[byte_begin]
+                    char_end = byte_to_char[byte_end - 1] + 1
+                # The added prefix space is aligned with the first character
+                offsets.append((max(match.start() + char_begin - shift, 0),
+                                max(match.start() + char_end - shift, shift)))
+                byte_begin = byte_end
+        return ids, offsets
+
+    def _encode_ids(self, sentence: str) -> List[int]:
+        sentence, _ = self._preprocess(sentence)
+        ids = []
+        for word in _GPT2_PRETOKENIZE_REGEX.findall(sentence):
+            ids.extend(self._bpe(word.encode('utf-8')))
+        return ids
+
+    def encode(self, sentences, output_type=str):
+        is_multi_sentences = isinstance(sentences, list)
+        if not is_multi_sentences:
+            sentences = [sentences]
+        if output_type is str:
+            all_tokens = self._all_tokens
+            ret = [[all_tokens[ele] for ele in self._encode_ids(sentence)]
+                   for sentence in sentences]
+        elif output_type is int:
+            ret = [self._encode_ids(sentence) for sentence in sentences]
+        else:
+            raise ValueError(_token_type_unsupported_err_msg(output_type))
+        if is_multi_sentences:
+            return ret
+        else:
+            return ret[0]
+
+    def encode_with_offsets(self, sentences, output_type=str):
+        is_multi_sentences = isinstance(sentences, list)
+        if not is_multi_sentences:
+            sentences = [sentences]
+        ret = []
+        offsets = []
+        for sentence in sentences:
+            ids, sentence_offsets = self._encode_ids_with_offsets(sentence)
+            if output_type is str:
+                ret.append([self._all_tokens[ele] for ele in ids])
+            elif output_type is int:
+                ret.append(ids)
+            else:
+                raise ValueError(_token_type_unsupported_err_msg(output_type))
+            offsets.append(sentence_offsets)
+        if is_multi_sentences:
+            return ret, offsets
+        else:
+            return ret[0], offsets[0]
+
+    def _decode_bytes(self, tokens: List[str]) -> bytes:
+        return bytes([_BYTE_DECODER[c] for token in tokens for c in token])
+
+    def decode(self, tokens):
+        is_multiple_sentences = _is_tokens_from_multiple_sentences(tokens)
+        if not is_multiple_sentences:
+            tokens = [tokens]
+        token_type = _get_token_type(tokens)
+        if token_type is str:
+            ret = [self._decode_bytes(ele_tokens).decode('utf-8', errors='replace')
+                   for ele_tokens in tokens]
+        elif token_type is int:
+            ret = [self._decode_bytes(self._vocab.to_tokens(ele_tokens))
+                       .decode('utf-8', errors='replace')
+                   for ele_tokens in tokens]
+        else:
+            raise ValueError(_token_type_unsupported_err_msg(token_type))
+        if is_multiple_sentences:
+            return ret
+        else:
+            return ret[0]
+
+    @property
+    def vocab(self):
+        return self._vocab
+
+    def set_vocab(self, vocab):
+        raise NotImplementedError('Cannot set vocabulary for the ByteBPETokenizer.')
+
+    def incremental_decoder(self) -> ByteLevelIncrementalDecoder:
+        return ByteLevelIncrementalDecoder(self._vocab)
+
+    def set_bpe_dropout(self, bpe_dropout: float):
+        self._dropout = bpe_dropout
+
+    def set_lowercase(self, lowercase: bool):
+        self._lowercase = lowercase
+
+    @property
+    def lowercase(self):
+        return self._lowercase
+
+    def __repr__(self):
+        ret = '{}(\n' \
+              '   merges_file = {}\n' \
+              '   vocab_file = {}\n' \
+              '   add_prefix_space = {}, lowercase = {}, dropout = {}\n' \
+              '   unicode_normalizer = {}\n' \
+              '   vocab = {}\n' \
+              ')'.format(self.__class__.__name__,
+                         os.path.realpath(self._merges_file),
+                         self._vocab_file if isinstance(self._vocab_file, Vocab)
+                         else os.path.realpath(self._vocab_file),
+                         self._add_prefix_space, self._lowercase, self._dropout,
+                         self._unicode_normalizer,
+                         self._vocab)
+        return ret
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = dict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+
+
 def create(name: str, *args, **kwargs) -> BaseTokenizer:
     """
 
@@ -19,6 +19,10 @@
 """Word embeddings."""
 
 from . import embed_loader
+from . import embed_index
+from . import fasttext_subword
 from .embed_loader import *
+from .embed_index import *
+from .fasttext_subword import *
 
-__all__ = (embed_loader.__all__ )
+__all__ = (embed_loader.__all__ + embed_index.__all__ + fasttext_subword.__all__)
@@ -0,0 +1,461 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Nearest-neighbor search over embedding matrices.
+
+The indices are built from the matrices returned by
+:func:`~gluonnlp.embedding.load_embeddings`. The vectors can be stored in float32, or in
+float16/int8 with a scale per row as in :func:`~gluonnlp.utils.quantize_rows`. The scores
+are always computed in float32, one block of rows at a time, so the temporary memory only
+depends on `block_size` and the number of queries.
+
+An index can be saved to a directory that contains
+
+    - meta.json
+        The type and the hyper-parameters of the index
+    - data.npy, scales.npy, ...
+        The arrays of the index, which are memory-mapped when the index is loaded.
+
+Examples
+--------
+>>> matrix, vocab = load_embeddings(pretrained_name_or_dir='glove.6B.50d')
+>>> index = ExactEmbeddingIndex(matrix, dtype='float16')
+>>> scores, indices = index.search(matrix[vocab[['king', 'queen']]], k=5)
+>>> [vocab.to_tokens(ele) for ele in indices.tolist()]
+"""
+__all__ = ['BaseEmbeddingIndex', 'ExactEmbeddingIndex', 'IVFEmbeddingIndex',
+           'load_embedding_index']
+
+import os
+import json
+from typing import Optional, Tuple, Dict
+
+import numpy as np
+from ..utils.quantization import quantize_rows
+
+_META_FNAME = 'meta.json'
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.maximum(norms, 1E-12)
+
+
+def _topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Get the largest k scores and their column indices in each row, in descending order."""
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(k), scores.shape).copy()
+    values = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    return np.take_along_axis(values, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+def _quantize_rows(matrix: np.ndarray, dtype: str, normalize: bool,
+                   rows: Optional[np.ndarray] = None,
+                   block_size: int = 65536) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Convert the rows of the matrix to the storage data type.
+
+    Parameters
+    ----------
+    matrix
+        The embedding matrix, which can be memory-mapped
+    dtype
+        The storage data type
+    normalize
+        Whether to normalize the rows
+    rows
+        If given, the rows will be stored in this order.
+    block_size
+        The number of rows to convert together
+
+    Returns
+    -------
+    data
+        The stored rows in `dtype`
+    scales
+        The scale of each row if dtype is 'int8' or 'float16', i.e., row = data * scale.
+        Otherwise, None.
+    """
+    num_rows = matrix.shape[0] if rows is None else len(rows)
+    data = np.empty((num_rows, matrix.shape[1]), dtype=dtype)
+    scales = np.empty((num_rows,), dtype=np.float32) if dtype != 'float32' else None
+    for start in range(0, num_rows, block_size):
+        end = min(start + block_size, num_rows)
+        block = matrix[start:end] if rows is None else matrix[rows[start:end]]
+        block = np.asarray(block, dtype=np.float32)
+        if normalize:
+            block = _normalize_rows(block)
+        if dtype == 'float32':
+            data[start:end] = block
+        else:
+            data[start:end], scales[start:end] = quantize_rows(block, dtype)
+    return data, scales
+
+
+class BaseEmbeddingIndex:
+    """The base class of the embedding indices.
+
+    Parameters
+    ----------
+    metric
+        'cosine' or 'dot'. For 'cosine', the stored vectors and the queries are normalized.
+    dtype
+        The data type to store the vectors. Can be 'float32', 'float16' or 'int8'.
+    block_size
+        The number of stored vectors that are scored together.
+    """
+    def __init__(self, metric: str = 'cosine', dtype: str = 'float32', block_size: int = 16384):
+        assert metric in ['cosine', 'dot'], 'Unsupported metric={}'.format(metric)
+        assert dtype in ['float32', 'float16', 'int8'], 'Unsupported dtype={}'.format(dtype)
+        assert block_size > 0
+        self._metric = metric
+        self._dtype = dtype
+        self.block_size = block_size
+        self._data = None
+        self._scales = None
+
+    @property
+    def metric(self) -> str:
+        return self._metric
+
+    @property
+    def dtype(self) -> str:
+        return self._dtype
+
+    @property
+    def dim(self) -> int:
+        return self._data.shape[1]
+
+    def __len__(self):
+        return self._data.shape[0]
+
+    def _prepare_queries(self, queries: np.ndarray) -> np.ndarray:
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != self.dim:
+            raise ValueError('Expect the queries to have shape (batch_size, {}), but received '
+                             '{}.'.format(self.dim, queries.shape))
+        if self._metric == 'cosine':
+            queries = _normalize_rows(queries)
+        return queries
+
+    def _scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Compute the scores between the queries and the stored rows in [start, end)"""
+        block = self._data[start:end]
+        if block.dtype != np.float32:
+            block = block.astype(np.float32)
+        scores = queries @ block.T
+        if self._scales is not None:
+            scores *= self._scales[start:end]
+        return scores
+
+    def _blocked_topk(self, queries: np.ndarray, k: int, start: int, end: int)\
+            -> Tuple[np.ndarray, np.ndarray]:
+        """Get the top-k stored rows in [start, end) for each query.
+
+        The returned indices are the positions in the stored rows.
+        """
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        best_indices = np.zeros((len(queries), 0), dtype=np.int64)
+        for block_start in range(start, end, self.block_size):
+            block_end = min(block_start + self.block_size, end)
+            scores, indices = _topk(self._scores(queries, block_start, block_end), k)
+            scores = np.concatenate([best_scores, scores], axis=1)
+            indices = np.concatenate([best_indices, indices + block_start], axis=1)
+            best_scores, pos = _topk(scores, k)
+            best_indices = np.take_along_axis(indices, pos, axis=1)
+        return best_scores, best_indices
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the k nearest neighbors of a batch of queries.
+
+        Parameters
+        ----------
+        queries
+            Shape (batch_size, dim)
+        k
+            The number of neighbors
+
+        Returns
+        -------
+        scores
+            The similarity scores in descending order. Shape (batch_size, k)
+        indices
+            The rows of the neighbors in the indexed matrix. Shape (batch_size, k)
+        """
+        raise NotImplementedError
+
+    def _get_config(self) -> Dict:
+        return {'metric': self._metric, 'dtype': self._dtype, 'block_size': self.block_size}
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {'data': self._data}
+        if self._scales is not None:
+            arrays['scales'] = self._scales
+        return arrays
+
+    def _set_arrays(self, arrays: Dict[str, np.ndarray]):
+        self._data = arrays['data']
+        self._scales = arrays.get('scales')
+
+    def save(self, path: str):
+        """Save the index to a directory
+
+        Parameters
+        ----------
+        path
+            The directory to save the index
+        """
+        os.makedirs(path, exist_ok=True)
+        arrays = self._get_arrays()
+        for name, arr in arrays.items():
+            np.save(os.path.join(path, name + '.npy'), arr)
+        with open(os.path.join(path, _META_FNAME), 'w', encoding='utf-8') as f:
+            json.dump({'index_type': self.__class__.__name__,
+                       'config': self._get_config(),
+                       'arrays': sorted(arrays.keys())}, f)
+
+    def __repr__(self):
+        return '{}(num_vectors={}, dim={}, {})'.format(
+            self.__class__.__name__, len(self), self.dim,
+            ', '.join('{}={}'.format(k, v) for k, v in self._get_config().items()))
+
+
+class ExactEmbeddingIndex(BaseEmbeddingIndex):
+    """Exact top-k search by scoring all the stored vectors block by block.
+
+    Parameters
+    ----------
+    matrix
+        The embedding matrix. Shape (num_vectors, dim)
+    metric
+        'cosine' or 'dot'. For 'cosine', the stored vectors and the queries are normalized.
+    dtype
+        The data type to store the vectors. Can be 'float32', 'float16' or 'int8'.
+        'float16' halves and 'int8' quarters the memory, at the cost of slightly less
+        accurate scores.
+    block_size
+        The number of stored vectors that are scored together.
+    """
+    def __init__(self, matrix: Optional[np.ndarray], metric: str = 'cosine',
+                 dtype: str = 'float32', block_size: int = 16384):
+        super().__init__(metric=metric, dtype=dtype, block_size=block_size)
+        if matrix is not None:
+            self._data, self._scales = _quantize_rows(matrix, dtype,
+                                                      normalize=metric == 'cosine')
+
+    def search(self, queries: np.ndarray, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        queries = self._prepare_queries(queries)
+        return self._blocked_topk(queries, k, 0, len(self))
+
+
+class IVFEmbeddingIndex(BaseEmbeddingIndex):
+    """Approximate top-k search with an inverted file index.
+
+    The vectors are clustered by k-means into `nlist` lists. A query only scores the vectors
+    in the `nprobe` lists whose centroids are the most similar to it. Increasing `nprobe`
+    improves the recall and increases the latency. With `nprobe == nlist`, the search is exact.
+
+    The stored vectors are sorted by their lists, so each probed list is scored as a
+    contiguous block for all the queries in the batch that probe it.
+
+    Parameters
+    ----------
+    matrix
+        The embedding matrix. Shape (num_vectors, dim)
+    nlist
+        The number of lists. By default, it is sqrt(num_vectors).
+    nprobe
+        The default number of lists to probe for each query.
+    metric
+        'cosine' or 'dot'. For 'cosine', the stored vectors and the queries are normalized.
+    dtype
+        The data type to store the vectors. Can be 'float32', 'float16' or 'int8'.
+    num_iters
+        The number of k-means iterations
+    train_size
+        The number of vectors sampled to train the k-means. By default, it is 64 * nlist.
+    seed
+        The random seed of the k-means
+    block_size
+        The number of stored vectors that are scored together.
+    """
+    def __init__(self, matrix: Optional[np.ndarray], nlist: Optional[int] = None,
+                 nprobe: int = 8, metric: str = 'cosine', dtype: str = 'float32',
+                 num_iters: int = 10, train_size: Optional[int] = None, seed: int = 0,
+                 block_size: int = 16384):
+        super().__init__(metric=metric, dtype=dtype, block_size=block_size)
+        assert nprobe > 0
+        self.nprobe = nprobe
+        if matrix is None:
+            return
+        num_vectors = matrix.shape[0]
+        assert num_vectors > 0, 'Cannot build the index of an empty matrix.'
+        if nlist is None:
+            nlist = int(np.sqrt(num_vectors))
+        nlist = max(1, min(nlist, num_vectors))
+        if train_size is None:
+            train_size = 64 * nlist
+        rng = np.random.RandomState(seed)
+        train_rows = np.sort(rng.choice(num_vectors, min(train_size, num_vectors),
+                                        replace=False))
+        train_data = np.asarray(matrix[train_rows], dtype=np.float32)
+        nlist = min(nlist, len(train_data))
+        if metric == 'cosine':
+            train_data = _normalize_rows(train_data)
+        self._centroids = self._train_centroids(train_data, nlist, num_iters, rng)
+        # Assign all the vectors to the lists
+        assignments = self._assign(matrix, normalize=metric == 'cosine')
+        self._list_ids = np.argsort(assignments, kind='stable')
+        self._list_offsets = np.zeros((nlist + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=self._list_offsets[1:])
+        self._data, self._scales = _quantize_rows(matrix, dtype, normalize=metric == 'cosine',
+                                                  rows=self._list_ids)
+
+    @property
+    def nlist(self) -> int:
+        return self._centroids.shape[0]
+
+    def _assign(self, vectors: np.ndarray, normalize: bool = False) -> np.ndarray:
+        """Find the most similar centroid of each vector"""
+        assignments = np.empty((vectors.shape[0],), dtype=np.int64)
+        for start in range(0, vectors.shape[0], self.block_size):
+            end = min(start + self.block_size, vectors.shape[0])
+            block = np.asarray(vectors[start:end], dtype=np.float32)
+            if normalize:
+                block = _normalize_rows(block)
+            assignments[start:end] = np.argmax(block @ self._centroids.T, axis=1)
+        return assignments
+
+    def _train_centroids(self, train_data, nlist, num_iters, rng):
+        self._centroids = train_data[rng.choice(len(train_data), nlist, replace=False)]
+        for _ in range(num_iters):
+            assignments = self._assign(train_data)
+            order = np.argsort(assignments, kind='stable')
+            counts = np.bincount(assignments, minlength=nlist)
+            non_empty = np.nonzero(counts)[0]
+            sums = np.add.reduceat(train_data[order],
+                                   np.cumsum(counts)[non_empty] - counts[non_empty], axis=0)
+            centroids = train_data[rng.choice(len(train_data), nlist)]
+            centroids[non_empty] = sums / counts[non_empty, None]
+            if self._metric == 'cosine':
+                centroids = _normalize_rows(centroids)
+            self._centroids = centroids.astype(np.float32)
+        return self._centroids
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None)\
+            -> Tuple[np.ndarray, np.ndarray]:
+        """Search the approximate k nearest neighbors of a batch of queries.
+
+        Parameters
+        ----------
+        queries
+            Shape (batch_size, dim)
+        k
+            The number of neighbors
+        nprobe
+            The number of lists to probe. Use the `nprobe` of the index by default.
+
+        Returns
+        -------
+        scores
+            The similarity scores in descending order. Shape (batch_size, k)
+            If less than k vectors are found, the remaining scores will be -inf.
+        indices
+            The rows of the neighbors in the indexed matrix. Shape (batch_size, k)
+            If less than k vectors are found, the remaining indices will be -1.
+        """
+        queries = self._prepare_queries(queries)
+        nprobe = min(self.nprobe if nprobe is None else nprobe, self.nlist)
+        batch_size = len(queries)
+        _, probes = _topk(queries @ self._centroids.T, nprobe)
+        cand_scores = np.full((batch_size, nprobe, k), -np.inf, dtype=np.float32)
+        cand_indices = np.full((batch_size, nprobe, k), -1, dtype=np.int64)
+        # Group the (query, probe) pairs by the lists
+        flat_probes = probes.ravel()
+        order = np.argsort(flat_probes, kind='stable')
+        sorted_probes = flat_probes[order]
+        group_starts = np.nonzero(np.diff(sorted_probes, prepend=-1))[0]
+        group_ends = np.append(group_starts[1:], len(order))
+        for group_start, group_end in zip(group_starts.tolist(), group_ends.tolist()):
+            list_idx = sorted_probes[group_start]
+            start, end = self._list_offsets[list_idx], self._list_offsets[list_idx + 1]
+            if start == end:
+                continue
+            pairs = order[group_start:group_end]
+            query_ids, probe_ids = pairs // nprobe, pairs % nprobe
+            scores, positions = self._blocked_topk(queries[query_ids], k, start, end)
+            cand_scores[query_ids, probe_ids, :scores.shape[1]] = scores
+            cand_indices[query_ids, probe_ids, :scores.shape[1]] = self._list_ids[positions]
+        scores, pos = _topk(cand_scores.reshape((batch_size, nprobe * k)), k)
+        indices = np.take_along_axis(cand_indices.reshape((batch_size, nprobe * k)), pos, axis=1)
+        return scores, indices
+
+    def _get_config(self) -> Dict:
+        config = super()._get_config()
+        config['nprobe'] = self.nprobe
+        return config
+
+    def _get_arrays(self) -> Dict[str, np.ndarray]:
+        arrays = super()._get_arrays()
+        arrays['centroids'] = self._centroids
+        arrays['list_ids'] = self._list_ids
+        arrays['list_offsets'] = self._list_offsets
+        return arrays
+
+    def _set_arrays(self, arrays: Dict[str, np.ndarray]):
+        super()._set_arrays(arrays)
+        self._centroids = np.asarray(arrays['centroids'])
+        self._list_ids = arrays['list_ids']
+        self._list_offsets = np.asarray(arrays['list_offsets'])
+
+
+_INDEX_TYPES = {cls.__name__: cls for cls in [ExactEmbeddingIndex, IVFEmbeddingIndex]}
+
+
+def load_embedding_index(path: str, mmap: bool = True) -> BaseEmbeddingIndex:
+    """Load the index saved by `index.save(path)`
+
+    Parameters
+    ----------
+    path
+        The directory of the index
+    mmap
+        Whether to memory-map the arrays of the index, which are then shared by all the
+        processes that load the same index.
+
+    Returns
+    -------
+    index
+        The loaded index
+    """
+    with open(os.path.join(path, _META_FNAME), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['index_type'] not in _INDEX_TYPES:
+        raise ValueError('Unknown index type "{}"'.format(meta['index_type']))
+    index = _INDEX_TYPES[meta['index_type']](None, **meta['config'])
+    arrays = dict()
+    for name in meta['arrays']:
+        file_path = os.path.join(path, name + '.npy')
+        try:
+            arrays[name] = np.load(file_path, mmap_mode='r' if mmap else None)
+        except ValueError:
+            # Empty arrays cannot be memory-mapped
+            arrays[name] = np.load(file_path)
+    index._set_arrays(arrays)
+    return index
@@ -23,9 +23,16 @@ __all__ = [
 ]
 
 import io
+import json
+import shutil
+import hashlib
 import logging
 import os
+import tempfile
 import warnings
+import itertools
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import fasttext
 
 import numpy as np
@@ -35,6 +42,13 @@ from . import _constants as C
 from ..base import get_home_dir
 from ..data import Vocab
 
+_CACHE_MATRIX_FNAME = 'matrix.npy'
+_CACHE_TOKENS_FNAME = 'tokens.bin'
+_CACHE_TOKEN_OFFSETS_FNAME = 'token_offsets.npy'
+_CACHE_TOKEN_HASHES_FNAME = 'token_hashes.npy'
+_CACHE_TOKEN_HASH_ORDER_FNAME = 'token_hash_order.npy'
+_CACHE_META_FNAME = 'meta.json'
+
 text_embedding_reg = {
     'glove' : C.GLOVE_NPZ_SHA1,
     'word2vec' : C.WORD2VEC_NPZ_SHA1,
@@ -74,58 +88,217 @@ def _append_unk_vecs(matrix, vocab_size):
     assert append_dim in [0, 1], "Error occurs in the embedding file."
     if append_dim == 1:
         # there is no unknown_token in the embedding file
-        mean = np.mean(found_vectors, axis=0, keepdims=True)
-        std = np.std(found_vectors, axis=0, keepdims=True)
-        vecs = np.random.randn(append_dim, dim).astype('float32') * std + mean
+        mean = np.mean(matrix, axis=0, keepdims=True)
+        std = np.std(matrix, axis=0, keepdims=True)
+        vecs = np.random.randn(append_dim, matrix.shape[1]).astype('float32') * std + mean
         return np.concatenate([matrix, vecs], axis=0)
     return matrix
 
-def _load_embedding_txt(file_path, vocab, unknown_token):
-    if vocab is not None:
-        result = np.zeros(len(vocab), dtype=bool)
-    else:
-        result = []
-    with open(file_path, 'r', encoding='utf-8') as f:
-        line = f.readline().strip()
-        parts = line.split()
-        start_idx = 0
+def _read_line_aligned_blocks(f, block_size):
+    """Read the binary file in blocks that end with complete lines."""
+    while True:
+        block = f.read(block_size)
+        if not block:
+            return
+        if not block.endswith(b'\n'):
+            block += f.readline()
+        yield block
+
+class _EmbeddingParseError(ValueError):
+    def __init__(self, msg, line):
+        super().__init__(msg)
+        self.line = line
+
+def _parse_floats(data):
+    try:
+        return np.fromstring(data, sep=' ', dtype='float32')
+    except ValueError:
+        # Raised by numpy>=2.0 if the data contains invalid numbers
+        return None
+
+def _parse_embedding_block(block, dim, vocab=None, unknown_token=None):
+    """Parse a block of lines in the GloVe/word2vec text format.
+
+    The words are split from the numbers with cheap bytes operations and all the numbers in the
+    block are parsed by a single call of `np.fromstring` instead of one call per line.
+    If vocab is given, the numbers of the words that are not in the vocabulary will be skipped.
+
+    Returns
+    -------
+    words
+        The parsed words. If vocab is given, only the words in the vocabulary are returned and
+        the unknown_token is replaced by vocab.unk_token.
+    vecs
+        The vectors of the words. Shape (len(words), dim)
+    rows
+        The row index of each word in the block, i.e., the line index without counting
+        the empty lines.
+    num_lines
+        The number of lines in the block
+    num_rows
+        The number of non-empty lines in the block
+    """
+    words = []
+    nums_l = []
+    rows = []
+    line_indices = []
+    lines = block.split(b'\n')
+    if not lines[-1]:
+        lines.pop()
+    num_rows = 0
+    for idx, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        num_rows += 1
+        if line.count(b' ') == dim:
+            word, _, nums = line.partition(b' ')
+            word = word.decode('utf-8')
+        else:
+            # The word may contain whitespaces or the numbers are separated by multiple spaces
+            parts = line.decode('utf-8').split()
+            if len(parts) <= dim:
+                raise _EmbeddingParseError('Expect a word followed by {} numbers, but found {} '
+                                           'fields.'.format(dim, len(parts)), idx)
+            word = ''.join(parts[:-dim])
+            nums = ' '.join(parts[-dim:]).encode('utf-8')
+        if vocab is not None:
+            if vocab.has_unk and unknown_token is not None:
+                # Only the unknown_token of the file is matched with vocab.unk_token
+                if word == unknown_token:
+                    word = vocab.unk_token
+                elif word == vocab.unk_token:
+                    continue
+            if word not in vocab:
+                continue
+        words.append(word)
+        nums_l.append(nums)
+        rows.append(num_rows - 1)
+        line_indices.append(idx)
+    vecs = _parse_floats(b' '.join(nums_l))
+    if vecs is None or vecs.size != len(words) * dim:
+        # Locate the line that contains invalid numbers
+        for word, nums, idx in zip(words, nums_l, line_indices):
+            line_vec = _parse_floats(nums)
+            if line_vec is None or line_vec.size != dim:
+                raise _EmbeddingParseError('Cannot parse the vector of "{}".'.format(word), idx)
+    return words, vecs.reshape((len(words), dim)), rows, len(lines), num_rows
+
+def _last_occurrence(indices):
+    """Get the positions of the last occurrence of each distinct value in indices."""
+    _, rev_pos = np.unique(indices[::-1], return_index=True)
+    return len(indices) - 1 - rev_pos
+
+def _parse_embedding_txt(file_path, vocab, unknown_token, num_threads=None,
+                         block_size=1024 * 1024):
+    """Parse the embedding in the GloVe/word2vec text format.
+
+    The file is read in large blocks, which are parsed by a pool of threads so that reading the
+    file overlaps with parsing. The parsed vectors are directly copied to the embedding matrix.
+
+    Parameters
+    ----------
+    file_path
+        Path of the embedding file
+    vocab
+        The vocabulary. If it is given, only the vectors of the words in the vocabulary will be
+        parsed.
+    unknown_token
+        The unknown token in the embedding file
+    num_threads
+        Number of threads for parsing. Use os.cpu_count() by default.
+    block_size
+        Number of bytes in each block
+
+    Returns
+    -------
+    matrix
+        The embedding matrix
+    result
+        If vocab is None, it will be the list of words in the embedding file.
+        Otherwise, it will be an int64 array with shape (len(vocab),) that stores the row of
+        each word of the vocab in the embedding file, or -1 if the word is not found.
+        The rows that are not found are filled with zeros in the matrix.
+    """
+    if num_threads is None:
+        num_threads = os.cpu_count() or 1
+    with open(file_path, 'rb') as f:
+        parts = f.readline().decode('utf-8').strip().split()
+        line_idx = 0
+        row_idx = 0
+        num_rows = None
         if len(parts) == 2:
-            dim = int(parts[1])
-            start_idx += 1
+            num_rows, dim = int(parts[0]), int(parts[1])
+            line_idx += 1
         else:
             dim = len(parts) - 1
             f.seek(0)
         if vocab is None:
-            matrix = []
-        else: matrix = np.random.randn(len(vocab), dim).astype('float32')
-        for idx, line in enumerate(f, start_idx):
-            try:
-                parts = line.strip().split()
-                word = ''.join(parts[:-dim])
-                nums = parts[-dim:]
+            words = []
+            if num_rows is not None:
+                matrix = np.empty((num_rows, dim), dtype='float32')
+            else:
+                matrix = []
+            num_filled = 0
+        else:
+            result = np.full(len(vocab), -1, dtype=np.int64)
+            matrix = np.zeros((len(vocab), dim), dtype='float32')
+        with ThreadPoolExecutor(num_threads) as executor:
+            pending = collections.deque()
+            blocks = _read_line_aligned_blocks(f, block_size)
+            while True:
+                # Keep a bounded number of blocks in memory
+                while len(pending) < 2 * num_threads:
+                    block = next(blocks, None)
+                    if block is None:
+                        break
+                    pending.append(executor.submit(_parse_embedding_block, block, dim,
+                                                   vocab, unknown_token))
+                if not pending:
+                    break
+                try:
+                    block_words, vecs, block_rows, num_lines, num_block_rows =\
+                        pending.popleft().result()
+                except _EmbeddingParseError as e:
+                    logging.error("Error occurred at the {} line.".format(line_idx + e.line))
+                    raise e
+                line_idx += num_lines
                 if vocab is None:
-                    result.append(word)
-                    matrix.append(np.fromstring(' '.join(nums), sep=' ', dtype='float32', count=dim))
-                else:
-                    if word == unknown_token and vocab.unk_token is not None:
-                        word = vocab.unk_token
-                    if word in vocab:
-                        index = vocab[word]
-                        matrix[index] = np.fromstring(' '.join(nums), sep=' ', dtype='float32', count=dim)
-                        result[index] = True
-            except Exception as e:
-                logging.error("Error occurred at the {} line.".format(idx))
-                raise e
+                    words.extend(block_words)
+                    if isinstance(matrix, list):
+                        matrix.append(vecs)
+                    else:
+                        if num_filled + len(vecs) > len(matrix):
+                            matrix = np.concatenate([matrix[:num_filled], vecs], axis=0)
+                        else:
+                            matrix[num_filled:(num_filled + len(vecs))] = vecs
+                        num_filled += len(vecs)
+                elif len(block_words) > 0:
+                    indices = np.array(vocab[block_words], dtype=np.int64)
+                    # The later rows overwrite the earlier rows of the same word
+                    pos = _last_occurrence(indices)
+                    matrix[indices[pos]] = vecs[pos]
+                    result[indices[pos]] = np.array(block_rows, dtype=np.int64)[pos] + row_idx
+                row_idx += num_block_rows
+    if vocab is None:
+        if isinstance(matrix, list):
+            matrix = np.concatenate(matrix, axis=0) if matrix\
+                else np.zeros((0, dim), dtype='float32')
+        else:
+            matrix = matrix[:num_filled]
+        return matrix, words
+    return matrix, result
+
+def _load_embedding_txt(file_path, vocab, unknown_token, num_threads=None,
+                        block_size=1024 * 1024):
+    matrix, result = _parse_embedding_txt(file_path, vocab, unknown_token,
+                                          num_threads=num_threads, block_size=block_size)
     if vocab is None:
         result = Vocab(result, unk_token=unknown_token)
-        matrix = _append_unk_vecs(np.array(matrix), len(result))
+        matrix = _append_unk_vecs(matrix, len(result))
     return matrix, result
 
-def _load_embedding_npz(file_path, vocab, unknown):
-    if vocab is not None:
-        result = np.zeros(len(vocab), dtype=bool)
-    else:
-        result = []
+def _read_embedding_npz(file_path, unknown):
     npz_dict = np.load(file_path, allow_pickle=True)
     unknown_token = npz_dict['unknown_token']
     if not unknown_token:
@@ -139,26 +312,228 @@ def _load_embedding_npz(file_path, vocab, unknown):
     if unknown != unknown_token:
         warnings.warn("You may not assign correct unknown token in the pretrained file"
                       "Use {} as the unknown mark.".format(unknown_token))
+    return npz_dict['idx_to_token'].tolist(), npz_dict['idx_to_vec'], unknown_token
+
+def _align_vocab(vocab, idx_to_token, unknown_token):
+    """Find the row of each token of the vocabulary in the pretrained token table.
+
+    Instead of building a dictionary over the (usually much larger) pretrained token table, the
+    tokens are looked up in `vocab.token_to_idx` by the C-level `map` and the rows are scattered
+    to the vocabulary with numpy. The unk_token of the vocabulary is matched with the
+    unknown_token of the pretrained file. If a token appears multiple times in the pretrained
+    file, the last row is used.
+
+    Returns
+    -------
+    indices
+        Shape (len(vocab),). The row of each token in idx_to_token, or -1 if it is not found.
+    """
+    indices = np.full(len(vocab), -1, dtype=np.int64)
+    vocab_pos = np.fromiter(map(vocab.token_to_idx.get, idx_to_token,
+                                itertools.repeat(-1, len(idx_to_token))),
+                            dtype=np.int64, count=len(idx_to_token))
+    rows = np.nonzero(vocab_pos >= 0)[0]
+    if len(rows) > 0:
+        vocab_pos = vocab_pos[rows]
+        pos = _last_occurrence(vocab_pos)
+        indices[vocab_pos[pos]] = rows[pos]
+    if vocab.has_unk and unknown_token is not None:
+        try:
+            indices[vocab.unk_id] = len(idx_to_token) - 1 - idx_to_token[::-1].index(unknown_token)
+        except ValueError:
+            indices[vocab.unk_id] = -1
+    return indices
+
+def _hash_tokens(tokens):
+    """Get the 64-bit hashes of the tokens, which are stable across processes."""
+    return np.fromiter((int.from_bytes(hashlib.blake2b(token.encode('utf-8'),
+                                                       digest_size=8).digest(), 'little')
+                        for token in tokens), dtype=np.uint64, count=len(tokens))
+
+def _gather_embedding_matrix(idx_to_vec, indices):
+    """Gather the rows of the pretrained matrix into a preallocated float32 matrix.
+
+    The rows with index -1 are filled with zeros.
+    """
+    matrix = np.zeros((len(indices), idx_to_vec.shape[-1]), dtype='float32')
+    hits = np.nonzero(indices >= 0)[0]
+    if len(hits) > 0:
+        matrix[hits] = idx_to_vec[indices[hits]]
+    return matrix
 
-    idx_to_token = npz_dict['idx_to_token'].tolist()
-    token2idx = {x : i for i, x in enumerate(idx_to_token)}
-    idx_to_vec = npz_dict['idx_to_vec']
+def _build_embedding_matrix(idx_to_token, idx_to_vec, unknown_token, vocab):
+    """Build the embedding matrix from the token table and the vectors of a pretrained file
+
+    Returns
+    -------
+    matrix
+        The embedding matrix
+    result
+        If vocab is None, it will be the vocabulary of the pretrained file.
+        Otherwise, it will be an int64 array with shape (len(vocab),) that stores the row of
+        each word of the vocab in the pretrained file, or -1 if the word is not found.
+    """
     if vocab is None:
         result = Vocab(idx_to_token, unk_token=unknown_token)
         idx_to_vec = _append_unk_vecs(idx_to_vec, len(result))
         return idx_to_vec, result
     else:
-        matrix = np.random.randn(len(vocab), idx_to_vec.shape[-1]).astype('float32')
-        for i, token in enumerate(vocab.all_tokens):
-            if token == vocab.unk_token and unknown_token is not None:
-                word = unknown_token
-            else:
-                word = token
-            if word in token2idx:
-                index = token2idx[word]
-                matrix[i] = idx_to_vec[index]
-                result[i] = True
-        return matrix, result
+        indices = _align_vocab(vocab, idx_to_token, unknown_token)
+        return _gather_embedding_matrix(idx_to_vec, indices), indices
+
+def _load_embedding_npz(file_path, vocab, unknown):
+    idx_to_token, idx_to_vec, unknown_token = _read_embedding_npz(file_path, unknown)
+    return _build_embedding_matrix(idx_to_token, idx_to_vec, unknown_token, vocab)
+
+def _get_embedding_cache_dir(file_path, cache_dtype):
+    """Get the cache directory of an embedding file.
+
+    The directory name contains the hash of the path, size and modification time of the
+    source file so that the cache will be rebuilt once the file is changed.
+    """
+    file_path = os.path.realpath(file_path)
+    stat = os.stat(file_path)
+    key = hashlib.sha1('{}|{}|{}|{}'.format(file_path, stat.st_size, stat.st_mtime_ns,
+                                             cache_dtype).encode('utf-8')).hexdigest()[:16]
+    root_path = os.path.expanduser(os.path.join(get_home_dir(), 'embedding', 'cache'))
+    return os.path.join(root_path, '{}-{}'.format(os.path.basename(file_path), key))
+
+def _save_embedding_cache(cache_dir, idx_to_token, idx_to_vec, unknown_token, cache_dtype,
+                          source):
+    """Save the embedding to the cache directory.
+
+    The cache contains
+
+    - matrix.npy: the embedding matrix stored in cache_dtype
+    - tokens.bin: the utf-8 encoded tokens concatenated together
+    - token_offsets.npy: the byte offsets of the tokens in tokens.bin, shape (num_tokens + 1,)
+    - token_hashes.npy: the sorted 64-bit hashes of the tokens
+    - token_hash_order.npy: the rows of the sorted hashes, i.e., the stable argsort of the hashes
+    - meta.json: the unknown token of the pretrained file and other meta information
+
+    The files are written to a temporary directory, which is renamed to cache_dir at the end.
+    Thus, concurrent processes will never see an incomplete cache.
+    """
+    parent_dir = os.path.dirname(cache_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix='.tmp-')
+    try:
+        np.save(os.path.join(tmp_dir, _CACHE_MATRIX_FNAME),
+                np.ascontiguousarray(idx_to_vec, dtype=cache_dtype))
+        encoded_tokens = [token.encode('utf-8') for token in idx_to_token]
+        offsets = np.zeros(len(encoded_tokens) + 1, dtype=np.int64)
+        np.cumsum([len(ele) for ele in encoded_tokens], out=offsets[1:])
+        with open(os.path.join(tmp_dir, _CACHE_TOKENS_FNAME), 'wb') as f:
+            f.write(b''.join(encoded_tokens))
+        np.save(os.path.join(tmp_dir, _CACHE_TOKEN_OFFSETS_FNAME), offsets)
+        hashes = _hash_tokens(idx_to_token)
+        order = np.argsort(hashes, kind='stable')
+        np.save(os.path.join(tmp_dir, _CACHE_TOKEN_HASHES_FNAME), hashes[order])
+        np.save(os.path.join(tmp_dir, _CACHE_TOKEN_HASH_ORDER_FNAME), order.astype(np.int64))
+        with open(os.path.join(tmp_dir, _CACHE_META_FNAME), 'w', encoding='utf-8') as f:
+            json.dump({'source': source,
+                       'unknown_token': unknown_token,
+                       'num_tokens': len(idx_to_token),
+                       'dim': int(idx_to_vec.shape[1]),
+                       'dtype': np.dtype(cache_dtype).name}, f, ensure_ascii=False)
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # Another process may have created the cache
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.exists(os.path.join(cache_dir, _CACHE_META_FNAME)):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+def _read_embedding_cache_meta(cache_dir):
+    with open(os.path.join(cache_dir, _CACHE_META_FNAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _read_embedding_cache(cache_dir):
+    """Read the token table and the memory-mapped matrix in the cache directory."""
+    meta = _read_embedding_cache_meta(cache_dir)
+    idx_to_vec = np.load(os.path.join(cache_dir, _CACHE_MATRIX_FNAME), mmap_mode='r')
+    offsets = np.load(os.path.join(cache_dir, _CACHE_TOKEN_OFFSETS_FNAME))
+    with open(os.path.join(cache_dir, _CACHE_TOKENS_FNAME), 'rb') as f:
+        data = f.read()
+    offsets = offsets.tolist()
+    idx_to_token = [data[offsets[i]:offsets[i + 1]].decode('utf-8')
+                    for i in range(len(offsets) - 1)]
+    return idx_to_token, idx_to_vec, meta['unknown_token']
+
+def _align_vocab_with_cache(cache_dir, vocab, unknown_token):
+    """Find the rows of the tokens of the vocabulary with the hash index in the cache.
+
+    The hashes of the vocabulary are searched in the sorted hashes of the pretrained tokens
+    and only the candidate rows are compared with the actual tokens. Thus, the cost only
+    depends on the size of the vocabulary. It has the same result as `_align_vocab`.
+
+    Returns
+    -------
+    indices
+        Shape (len(vocab),). The row of each token in the cache, or -1 if it is not found.
+        None if the cache does not contain the hash index.
+    """
+    hashes_path = os.path.join(cache_dir, _CACHE_TOKEN_HASHES_FNAME)
+    order_path = os.path.join(cache_dir, _CACHE_TOKEN_HASH_ORDER_FNAME)
+    if not os.path.exists(hashes_path) or not os.path.exists(order_path):
+        return None
+    sorted_hashes = np.load(hashes_path, mmap_mode='r')
+    order = np.load(order_path, mmap_mode='r')
+    offsets = np.load(os.path.join(cache_dir, _CACHE_TOKEN_OFFSETS_FNAME), mmap_mode='r')
+    with open(os.path.join(cache_dir, _CACHE_TOKENS_FNAME), 'rb') as f:
+        data = f.read()
+    query_tokens = list(vocab.all_tokens)
+    if vocab.has_unk and unknown_token is not None:
+        query_tokens[vocab.unk_id] = unknown_token
+    query_hashes = _hash_tokens(query_tokens)
+    lefts = np.searchsorted(sorted_hashes, query_hashes, side='left')
+    rights = np.searchsorted(sorted_hashes, query_hashes, side='right')
+    indices = np.full(len(vocab), -1, dtype=np.int64)
+    candidates = np.nonzero(rights > lefts)[0]
+    # The rows with the same hash are sorted, so the last row of each token is checked first
+    rows = np.asarray(order[rights[candidates] - 1], dtype=np.int64)
+    for i, row, start, end in zip(candidates.tolist(), rows.tolist(),
+                                  offsets[rows].tolist(), offsets[rows + 1].tolist()):
+        target = query_tokens[i].encode('utf-8')
+        if data[start:end] == target:
+            indices[i] = row
+            continue
+        # Hash collision
+        for j in range(rights[i] - 2, lefts[i] - 1, -1):
+            row = int(order[j])
+            if data[offsets[row]:offsets[row + 1]] == target:
+                indices[i] = row
+                break
+    return indices
+
+def _load_embedding_with_cache(file_path, vocab, unknown, cache_dtype):
+    cache_dir = _get_embedding_cache_dir(file_path, cache_dtype)
+    if not os.path.exists(os.path.join(cache_dir, _CACHE_META_FNAME)):
+        logging.info('Converting {} to the binary cache in {}. This only happens once.'
+                     .format(file_path, cache_dir))
+        if file_path.endswith('.npz'):
+            idx_to_token, idx_to_vec, unknown_token = _read_embedding_npz(file_path, unknown)
+        else:
+            idx_to_vec, idx_to_token = _parse_embedding_txt(file_path, None, unknown)
+            # The unknown token of the text file is specified by the caller
+            unknown_token = None
+        _save_embedding_cache(cache_dir, idx_to_token, idx_to_vec, unknown_token,
+                              cache_dtype, os.path.realpath(file_path))
+    unknown_token = _read_embedding_cache_meta(cache_dir)['unknown_token']
+    if unknown_token is None:
+        unknown_token = unknown
+    elif unknown != unknown_token:
+        warnings.warn("You may not assign correct unknown token in the pretrained file"
+                      "Use {} as the unknown mark.".format(unknown_token))
+    if vocab is not None:
+        indices = _align_vocab_with_cache(cache_dir, vocab, unknown_token)
+        if indices is not None:
+            idx_to_vec = np.load(os.path.join(cache_dir, _CACHE_MATRIX_FNAME), mmap_mode='r')
+            return _gather_embedding_matrix(idx_to_vec, indices), indices
+    idx_to_token, idx_to_vec, _ = _read_embedding_cache(cache_dir)
+    return _build_embedding_matrix(idx_to_token, idx_to_vec, unknown_token, vocab)
 
 def _get_file_url(cls_name, file_name):
     namespace = 'gluon/embeddings/{}'.format(cls_name)
@@ -187,7 +562,8 @@ def _check_and_get_path(pretrained_name_or_dir):
     return None
 
 def load_embeddings(vocab=None, pretrained_name_or_dir='glove.6B.50d', unknown='<unk>',
-                    unk_method=None):
+                    unk_method=None, cache=False, cache_dtype='float32',
+                    return_hit_indices=False):
     """Load pretrained word embeddings for building an embedding matrix for a given Vocab.
 
     This function supports loading GloVe, Word2Vec and FastText word embeddings from remote sources.
@@ -245,7 +621,23 @@ def load_embeddings(vocab=None, pretrained_name_or_dir='glove.6B.50d', unknown='
         And the function is aimed to return an embedding matrix for these words.
         If `unk_method` is None, we generate vectors for these words,
         by sampling from normal distribution with the same std and mean of the embedding matrix.
+        A :class:`FastTextSubwordEmbedding` can be used to compute the vectors of all these words
+        from the character n-grams in a single call.
         It is only useful when `vocab` is not `None`.
+    cache : bool, default False
+        Whether to convert the pretrained file to a binary cache in
+        `get_home_dir()/embedding/cache` and load from the cache. The conversion only happens
+        once and the later calls will memory-map the cached matrix, which is much faster and
+        shares the physical memory between processes.
+        When `vocab` is `None`, the returned matrix is a read-only memory-mapped array.
+        Otherwise, the returned matrix is always a writable array.
+    cache_dtype : str, default 'float32'
+        The data type of the cached matrix. Can be 'float32' or 'float16'.
+    return_hit_indices : bool, default False
+        Whether to also return the row of each token of `vocab` in the pretrained file.
+        It is only useful when `vocab` is not `None`. The rows can be reused to gather the
+        vectors from the matrix returned by `load_embeddings(None, pretrained_name_or_dir)`
+        without looking up the tokens again.
 
     Returns
     -------
@@ -257,13 +649,21 @@ def load_embeddings(vocab=None, pretrained_name_or_dir='glove.6B.50d', unknown='
     Otherwise,
         numpy.ndarray:
             An embedding matrix for the given vocabulary.
+        numpy.ndarray:
+            Only returned if `return_hit_indices` is True. An int64 array with shape
+            (len(vocab),) that stores the row of each token in the pretrained file,
+            or -1 if the token is not found.
     """
     assert isinstance(vocab, (Vocab, type(None))), "Only gluonnlp.data.Vocab is supported."
     file_path = _check_and_get_path(pretrained_name_or_dir)
     if file_path is None:
         raise ValueError("Cannot recognize `{}`".format(pretrained_name_or_dir))
+    assert cache_dtype in ['float32', 'float16'], \
+        'Unsupported cache_dtype={}'.format(cache_dtype)
 
-    if file_path.endswith('.npz'):
+    if cache:
+        matrix, result = _load_embedding_with_cache(file_path, vocab, unknown, cache_dtype)
+    elif file_path.endswith('.npz'):
         matrix, result = _load_embedding_npz(file_path, vocab, unknown)
     else:
         matrix, result = _load_embedding_txt(file_path, vocab, unknown)
@@ -272,23 +672,34 @@ def load_embeddings(vocab=None, pretrained_name_or_dir='glove.6B.50d', unknown='
     if vocab is None:
         return matrix, result
     else:
-        hit_flags = result
-        total_hits = sum(hit_flags)
+        hit_indices = result
+        hit_flags = hit_indices >= 0
+        total_hits = int(hit_flags.sum())
         logging.info("Found {} out of {} words in the pretrained embedding.".format(total_hits, len(vocab)))
         if total_hits != len(vocab):
+            unk_idxs = np.nonzero(~hit_flags)[0]
             if unk_method is None:
                 found_vectors = matrix[hit_flags]
                 mean = np.mean(found_vectors, axis=0, keepdims=True)
                 std = np.std(found_vectors, axis=0, keepdims=True)
-                unfound_vec_num = len(vocab) - total_hits
-                r_vecs = np.random.randn(unfound_vec_num, dim).astype('float32') * std + mean
-                matrix[hit_flags == False] = r_vecs
+                r_vecs = np.random.randn(len(unk_idxs), dim).astype('float32') * std + mean
+                matrix[unk_idxs] = r_vecs
             else:
-                unk_idxs = (hit_flags == False).nonzero()[0]
-                matrix[hit_flags == False] = unk_method(vocab.to_tokens(unk_idxs))
-
+                matrix[unk_idxs] = unk_method(vocab.to_tokens(unk_idxs))
+        if return_hit_indices:
+            return matrix, hit_indices
         return matrix
 
+def _get_fasttext_bin_path(model_name_or_dir):
+    if os.path.exists(model_name_or_dir):
+        return model_name_or_dir
+    source = model_name_or_dir
+    if source not in C.FAST_TEXT_BIN_SHA1:
+        raise ValueError('Cannot recognize {} for the bin file'.format(source))
+    file_name, file_hash = C.FAST_TEXT_BIN_SHA1[source]
+    return _get_file_path('fasttext', file_name, file_hash)
+
+
 def get_fasttext_model(model_name_or_dir='cc.en.300'):
     """ Load fasttext model from the binaray file
 
@@ -312,15 +723,5 @@ def get_fasttext_model(model_name_or_dir='cc.en.300'):
     fasttext.FastText._FastText:
         A FastText model based on `fasttext` package.
     """
-    if os.path.exists(model_name_or_dir):
-        file_path = model_name_or_dir
-    else:
-        source = model_name_or_dir
-        root_path = os.path.expanduser(os.path.join(get_home_dir(), 'embedding'))
-        embedding_dir = os.path.join(root_path, 'fasttext')
-        if source not in C.FAST_TEXT_BIN_SHA1:
-            raise ValueError('Cannot recognize {} for the bin file'.format(source))
-        file_name, file_hash = C.FAST_TEXT_BIN_SHA1[source]
-        file_path = _get_file_path('fasttext', file_name, file_hash)
-    return fasttext.load_model(file_path)
+    return fasttext.load_model(_get_fasttext_bin_path(model_name_or_dir))
 
@@ -0,0 +1,304 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Batched computation of the FastText word vectors from the character n-grams.
+
+The input matrix, the vocabulary and the n-gram hyper-parameters are read from the FastText
+binary file once. The input matrix is memory-mapped. For a batch of words, the hashed n-gram
+ids of all the words are computed with vectorized numpy operations and the word vectors are
+obtained by a single gather followed by a segmented mean. The results are the same as
+`fasttext_model.get_word_vector(word)`.
+
+Examples
+--------
+>>> ft_embed = load_fasttext_subword_embedding('cc.en.300')
+>>> vectors = ft_embed(['hello', 'gluonnlp'])
+>>> # Fill the words that are not in GloVe with the FastText vectors
+>>> matrix = load_embeddings(vocab, 'glove.840B.300d', unk_method=ft_embed)
+"""
+__all__ = ['FastTextSubwordEmbedding', 'load_fasttext_subword_embedding']
+
+import mmap
+import struct
+from typing import List, Tuple
+
+import numpy as np
+
+from .embed_loader import _get_fasttext_bin_path
+
+_FASTTEXT_FILEFORMAT_MAGIC_INT32 = 793712314
+_FASTTEXT_VERSION = 12
+_FASTTEXT_SUPERVISED_MODEL = 3
+_EOS = '</s>'
+_BOW = '<'
+_EOW = '>'
+_FNV_OFFSET_BASIS = 2166136261
+_FNV_PRIME = 16777619
+
+
+def _fnv1a_hash(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Compute the 32-bit FNV-1a hashes of the byte strings buf[starts[i]:ends[i]].
+
+    As in FastText, each byte is sign-extended before the xor.
+    """
+    signed_buf = buf.view(np.int8).astype(np.int32).view(np.uint32)
+    hashes = np.full(starts.shape, _FNV_OFFSET_BASIS, dtype=np.uint32)
+    lengths = ends - starts
+    for pos in range(int(lengths.max()) if len(lengths) > 0 else 0):
+        active = np.nonzero(lengths > pos)[0]
+        hashes[active] = (hashes[active] ^ signed_buf[starts[active] + pos])\
+            * np.uint32(_FNV_PRIME)
+    return hashes
+
+
+class FastTextSubwordEmbedding:
+    """Compute the FastText word vectors of a batch of words
+
+    The vector of a word is the mean of the rows of its subwords in the input matrix. The
+    subwords are the word itself, if it is in the vocabulary, and the character n-grams of
+    "<word>" with minn <= n <= maxn, which are hashed to `bucket` rows.
+
+    Parameters
+    ----------
+    input_matrix
+        The input matrix of the FastText model. Shape (num_words + bucket, dim)
+    words
+        The words in the vocabulary of the FastText model
+    minn
+        The minimal number of characters in the n-grams
+    maxn
+        The maximal number of characters in the n-grams
+    bucket
+        The number of buckets of the n-grams
+    """
+    def __init__(self, input_matrix: np.ndarray, words: List[str], minn: int, maxn: int,
+                 bucket: int):
+        self._matrix = input_matrix
+        self._words = words
+        self._word_to_idx = {word: i for i, word in enumerate(words)}
+        self._minn = minn
+        self._maxn = maxn
+        self._bucket = bucket
+
+    @property
+    def dim(self) -> int:
+        return self._matrix.shape[1]
+
+    @property
+    def words(self) -> List[str]:
+        return self._words
+
+    @property
+    def minn(self) -> int:
+        return self._minn
+
+    @property
+    def maxn(self) -> int:
+        return self._maxn
+
+    @property
+    def bucket(self) -> int:
+        return self._bucket
+
+    def _get_ngram_ids(self, words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the rows of the character n-grams
+
+        Returns
+        -------
+        word_indices
+            The index of the word that each n-gram belongs to. It is sorted.
+        rows
+            The rows of the n-grams in the input matrix
+        """
+        empty = np.zeros((0,), dtype=np.int64)
+        if self._maxn <= 0 or self._bucket <= 0 or len(words) == 0:
+            return empty, empty
+        encoded = [(_BOW + word + _EOW).encode('utf-8', 'surrogateescape') for word in words]
+        buf = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        word_ends = np.cumsum([len(ele) for ele in encoded])
+        # The bytes that do not start with 0b10 are the first bytes of the utf-8 characters
+        char_starts = np.nonzero((buf & 0xC0) != 0x80)[0]
+        # The words are concatenated, so the end of a character is the start of the next one
+        char_ends = np.append(char_starts[1:], len(buf))
+        char_words = np.searchsorted(word_ends, char_starts, side='right')
+        word_num_chars = np.bincount(char_words, minlength=len(words))
+        char_positions = np.arange(len(char_starts))\
+            - np.repeat(np.cumsum(word_num_chars) - word_num_chars, word_num_chars)
+        all_word_indices = []
+        all_first_chars = []
+        all_starts = []
+        all_ends = []
+        for n in range(max(self._minn, 1), self._maxn + 1):
+            first_chars = np.nonzero(char_positions + n <= word_num_chars[char_words])[0]
+            if n == 1:
+                # Skip the single BOW and EOW characters
+                first_chars = first_chars[
+                    (char_positions[first_chars] != 0)
+                    & (char_positions[first_chars] != word_num_chars[char_words[first_chars]] - 1)]
+            all_word_indices.append(char_words[first_chars])
+            all_first_chars.append(first_chars)
+            all_starts.append(char_starts[first_chars])
+            all_ends.append(char_ends[first_chars + n - 1])
+        if not all_starts:
+            return empty, empty
+        word_indices = np.concatenate(all_word_indices)
+        first_chars = np.concatenate(all_first_chars)
+        starts = np.concatenate(all_starts)
+        ends = np.concatenate(all_ends)
+        # Follow the order of FastText, i.e., by the first character and then by the length
+        order = np.lexsort((ends - starts, first_chars))
+        word_indices, starts, ends = word_indices[order], starts[order], ends[order]
+        buckets = (_fnv1a_hash(buf, starts, ends) % np.uint32(self._bucket)).astype(np.int64)
+        return word_indices, buckets + len(self._words)
+
+    def get_subword_ids(self, words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the rows of the subwords of each word in the input matrix
+
+        Parameters
+        ----------
+        words
+            The words
+
+        Returns
+        -------
+        ids
+            The flattened rows of the subwords. The row of the word itself comes first if the
+            word is in the vocabulary.
+        offsets
+            The subwords of words[i] are ids[offsets[i]:offsets[i + 1]].
+            Shape (len(words) + 1,)
+        """
+        word_ids = np.array([self._word_to_idx.get(word, -1) for word in words],
+                            dtype=np.int64)
+        # The n-grams of EOS are not used
+        ngram_words = [i for i, word in enumerate(words) if word != _EOS]
+        ngram_word_indices, ngram_ids = self._get_ngram_ids([words[i] for i in ngram_words])
+        ngram_word_indices = np.array(ngram_words, dtype=np.int64)[ngram_word_indices]
+        in_vocab = np.nonzero(word_ids >= 0)[0]
+        # The word itself is placed before the n-grams of the same word by the stable sort
+        word_indices = np.concatenate([in_vocab, ngram_word_indices])
+        ids = np.concatenate([word_ids[in_vocab], ngram_ids])
+        order = np.argsort(word_indices, kind='stable')
+        offsets = np.zeros((len(words) + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(word_indices, minlength=len(words)), out=offsets[1:])
+        return ids[order], offsets
+
+    def get_vectors(self, words: List[str], batch_size: int = 1024) -> np.ndarray:
+        """Compute the vectors of the words
+
+        Parameters
+        ----------
+        words
+            The words
+        batch_size
+            The number of words that are processed together. The temporary memory is about
+            batch_size * max_num_subwords * dim floats.
+
+        Returns
+        -------
+        vectors
+            Shape (len(words), dim). The vectors of the words that have no subword are zeros.
+        """
+        vectors = np.zeros((len(words), self.dim), dtype=np.float32)
+        for start in range(0, len(words), batch_size):
+            batch_words = words[start:(start + batch_size)]
+            ids, offsets = self.get_subword_ids(batch_words)
+            counts = offsets[1:] - offsets[:-1]
+            if len(ids) == 0:
+                continue
+            # Scatter the gathered rows to a zero-padded (batch_size, max_num_subwords, dim)
+            # array, whose sum is faster than the segmented sum by np.add.reduceat.
+            positions = np.arange(len(ids)) - np.repeat(offsets[:-1], counts)
+            padded = np.zeros((len(batch_words), counts.max(), self.dim), dtype=np.float32)
+            padded[np.repeat(np.arange(len(batch_words)), counts), positions] = self._matrix[ids]
+            non_empty = np.nonzero(counts)[0]
+            vectors[start + non_empty] = padded[non_empty].sum(axis=1) / counts[non_empty, None]
+        return vectors
+
+    def __call__(self, words: List[str]) -> np.ndarray:
+        """Same as `get_vectors`, so that it can be used as the `unk_method` of
+        `load_embeddings`."""
+        return self.get_vectors(words)
+
+    def __repr__(self):
+        return '{}(num_words={}, dim={}, minn={}, maxn={}, bucket={})'.format(
+            self.__class__.__name__, len(self._words), self.dim, self._minn, self._maxn,
+            self._bucket)
+
+
+def _read_fasttext_bin(file_path: str, mmap_matrix: bool = True) -> FastTextSubwordEmbedding:
+    """Read the FastText binary file that is saved by `model.save_model()`."""
+    with open(file_path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        magic, version = struct.unpack_from('<ii', data, 0)
+        if magic != _FASTTEXT_FILEFORMAT_MAGIC_INT32:
+            raise ValueError('{} is not a FastText binary file.'.format(file_path))
+        if version > _FASTTEXT_VERSION:
+            raise ValueError('The version {} of {} is not supported. The latest supported '
+                             'version is {}.'.format(version, file_path, _FASTTEXT_VERSION))
+        # The args are dim, ws, epoch, minCount, neg, wordNgrams, loss, model, bucket,
+        # minn, maxn, lrUpdateRate and then a double t
+        args = struct.unpack_from('<12i', data, 8)
+        model, bucket, minn, maxn = args[7:11]
+        if version == 11 and model == _FASTTEXT_SUPERVISED_MODEL:
+            maxn = 0
+        pos = 8 + 12 * 4 + 8
+        size, num_words, _, _, pruneidx_size = struct.unpack_from('<iiiqq', data, pos)
+        pos += 28
+        words = []
+        for i in range(size):
+            end = data.find(b'\0', pos)
+            if i < num_words:
+                words.append(data[pos:end].decode('utf-8', 'surrogateescape'))
+            # Skip the \0, the int64 count and the int8 entry type
+            pos = end + 10
+        # The pruned models are always quantized, which are not supported
+        pos += 8 * max(pruneidx_size, 0)
+        if data[pos]:
+            raise ValueError('The quantized FastText model {} is not supported.'
+                             .format(file_path))
+        pos += 1
+        num_rows, dim = struct.unpack_from('<qq', data, pos)
+        pos += 16
+    finally:
+        data.close()
+    if mmap_matrix:
+        matrix = np.memmap(file_path, dtype='<f4', mode='r', offset=pos, shape=(num_rows, dim))
+    else:
+        matrix = np.fromfile(file_path, dtype='<f4', count=num_rows * dim,
+                             offset=pos).reshape((num_rows, dim))
+    return FastTextSubwordEmbedding(matrix, words, minn=minn, maxn=maxn, bucket=bucket)
+
+
+def load_fasttext_subword_embedding(model_name_or_dir: str = 'cc.en.300',
+                                    mmap: bool = True) -> FastTextSubwordEmbedding:
+    """Load the FastText subword embedding from the binary file
+
+    Parameters
+    ----------
+    model_name_or_dir
+        A file path for a FastText binary file or the name of the FastText model.
+        See `get_fasttext_model` for the available models.
+    mmap
+        Whether to memory-map the input matrix
+
+    Returns
+    -------
+    embedding
+        The FastTextSubwordEmbedding
+    """
+    return _read_fasttext_bin(_get_fasttext_bin_path(model_name_or_dir), mmap_matrix=mmap)
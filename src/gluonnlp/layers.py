@@ -17,7 +17,7 @@
 """Layers."""
 __all__ = ['MultiHeadDense', 'PositionalEmbedding', 'SinusoidalPositionalEmbedding',
            'LearnedPositionalEmbedding', 'BucketPositionalEmbedding', 'AdaptiveEmbedding',
-           'PositionwiseFFN', 'ProjectedAdaptiveLogSoftmaxWithLoss']
+           'PositionwiseFFN', 'ProjectedAdaptiveLogSoftmaxWithLoss', 'QuantizedEmbedding']
 
 import math
 import numpy as np
@@ -27,6 +27,7 @@ from mxnet import use_np
 from mxnet.gluon import nn, HybridBlock, Parameter, Constant
 from typing import Union, Optional, List
 from .op import relative_position_bucket
+from .utils.quantization import quantize_rows
 
 
 InitializerType = Optional[Union[mx.init.Initializer, str]]
@@ -662,6 +663,96 @@ class PositionwiseFFN(HybridBlock):
         return _gen_repr_with_kwargs(self._kwargs, self.__class__.__name__)
 
 
+@use_np
+class QuantizedEmbedding(HybridBlock):
+    """Embedding layer with the weight stored in int8 or float16 with a scale per row.
+
+    Only the gathered rows are converted back to `dtype`, i.e.,
+
+        out = weight[inputs].astype(dtype) * scale[inputs, None]
+
+    Compared with `nn.Embedding`, the memory of the weight is 4x smaller with int8 and 2x
+    smaller with float16. The layer is used for inference and its parameters are not trained.
+    Use :func:`~gluonnlp.utils.quantize_embedding_params` to convert the checkpoints of
+    `nn.Embedding`, or :meth:`set_float_weight` to load a float matrix.
+
+    From input = (..., ) --> embedding (..., output_dim)
+    """
+    def __init__(self, input_dim: int, output_dim: int,
+                 storage_dtype: str = 'int8', dtype='float32'):
+        """
+
+        Parameters
+        ----------
+        input_dim
+            The size of the vocabulary
+        output_dim
+            The dimension of the embedding vectors
+        storage_dtype
+            The data type of the stored weight. Can be 'int8' or 'float16'.
+        dtype
+            The data type of the output
+        """
+        super().__init__()
+        assert storage_dtype in ['int8', 'float16'],\
+            'Unsupported storage_dtype={}'.format(storage_dtype)
+        self._input_dim = input_dim
+        self._output_dim = output_dim
+        self._storage_dtype = storage_dtype
+        self._dtype = dtype
+        self.weight = Parameter('weight', shape=(input_dim, output_dim),
+                                init='zeros', dtype=storage_dtype, grad_req='null',
+                                allow_deferred_init=True)
+        self.scale = Parameter('scale', shape=(input_dim,),
+                               init='ones', dtype='float32', grad_req='null',
+                               allow_deferred_init=True)
+
+    def set_float_weight(self, weight: np.ndarray):
+        """Quantize the float weight and set it to the parameters of the layer
+
+        Parameters
+        ----------
+        weight
+            Shape (input_dim, output_dim)
+        """
+        assert weight.shape == (self._input_dim, self._output_dim),\
+            'Expect the shape of the weight to be {}, but received {}.'.format(
+                (self._input_dim, self._output_dim), weight.shape)
+        data, scale = quantize_rows(weight, self._storage_dtype)
+        self.weight.set_data(mx.np.array(data, dtype=self._storage_dtype))
+        self.scale.set_data(mx.np.array(scale, dtype=np.float32))
+
+    def hybrid_forward(self, F, inputs, weight, scale):  # pylint: disable=arguments-differ
+        """
+
+        Parameters
+        ----------
+        F
+        inputs
+            Shape (...,)
+        weight
+            Shape (input_dim, output_dim)
+        scale
+            Shape (input_dim,)
+
+        Returns
+        -------
+        out
+            Shape (..., output_dim)
+        """
+        emb = F.np.take(weight, inputs, axis=0, mode='clip').astype(self._dtype)
+        row_scale = F.np.take(scale, inputs, axis=0, mode='clip').astype(self._dtype)
+        return emb * F.np.expand_dims(row_scale, axis=-1)
+
+    def __repr__(self):
+        s = '{name}({input_dim} -> {output_dim}, storage_dtype={storage_dtype}, dtype={dtype})'
+        return s.format(name=self.__class__.__name__,
+                        input_dim=self._input_dim,
+                        output_dim=self._output_dim,
+                        storage_dtype=self._storage_dtype,
+                        dtype=self._dtype)
+
+
 @use_np
 class AdaptiveEmbedding(HybridBlock):
     """Adaptive Embedding.
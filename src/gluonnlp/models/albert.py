@@ -42,7 +42,7 @@ from ..utils.misc import load_checksum_stats, download
 from ..utils.registry import Registry
 from ..initializer import TruncNorm
 from ..attention_cell import gen_self_attn_mask
-from ..layers import get_activation, PositionalEmbedding
+from ..layers import get_activation, PositionalEmbedding, QuantizedEmbedding
 from ..op import select_vectors_by_position
 from ..data.tokenizers import SentencepieceTokenizer
 
@@ -290,7 +290,8 @@ class AlbertModel(HybridBlock):
                  dtype='float32',
                  use_pooler=True,
                  layout='NT',
-                 compute_layout='auto'):
+                 compute_layout='auto',
+                 word_embed_storage_dtype=None):
         super().__init__()
         self._dtype = dtype
         self.use_pooler = use_pooler
@@ -330,10 +331,16 @@ class AlbertModel(HybridBlock):
         )
         self.encoder.hybridize()
         # Construct word embedding
-        self.word_embed = nn.Embedding(input_dim=vocab_size,
-                                       output_dim=embed_size,
-                                       weight_initializer=embed_initializer,
-                                       dtype=dtype)
+        if word_embed_storage_dtype is None:
+            self.word_embed = nn.Embedding(input_dim=vocab_size,
+                                           output_dim=embed_size,
+                                           weight_initializer=embed_initializer,
+                                           dtype=dtype)
+        else:
+            self.word_embed = QuantizedEmbedding(input_dim=vocab_size,
+                                                 output_dim=embed_size,
+                                                 storage_dtype=word_embed_storage_dtype,
+                                                 dtype=dtype)
         if embed_size != units:
             self.embed_factorized_proj = nn.Dense(units=units,
                                                   flatten=False,
@@ -494,7 +501,8 @@ class AlbertModel(HybridBlock):
             return google_albert_base()
 
     @classmethod
-    def from_cfg(cls, cfg, use_pooler=True, dtype=None) -> 'AlbertModel':
+    def from_cfg(cls, cfg, use_pooler=True, dtype=None,
+                 word_embed_storage_dtype=None) -> 'AlbertModel':
         """
 
         Parameters
@@ -504,6 +512,9 @@ class AlbertModel(HybridBlock):
             Whether to use pooler
         dtype
             The dtype of the backbone model
+        word_embed_storage_dtype
+            If it is 'int8' or 'float16', the word embedding will be a QuantizedEmbedding
+            that stores the weight in this data type.
 
         Returns
         -------
@@ -536,7 +547,8 @@ class AlbertModel(HybridBlock):
                    embed_initializer=embed_initializer,
                    weight_initializer=weight_initializer,
                    bias_initializer=bias_initializer,
-                   use_pooler=use_pooler)
+                   use_pooler=use_pooler,
+                   word_embed_storage_dtype=word_embed_storage_dtype)
 
 
 @use_np
@@ -42,7 +42,8 @@ from ..utils.misc import load_checksum_stats, download
 from ..utils.registry import Registry
 from ..initializer import TruncNorm
 from ..attention_cell import MultiHeadAttentionCell, gen_self_attn_mask
-from ..layers import get_activation, PositionalEmbedding, PositionwiseFFN, InitializerType
+from ..layers import get_activation, PositionalEmbedding, PositionwiseFFN, InitializerType,\
+    QuantizedEmbedding
 from ..op import select_vectors_by_position
 from ..data.tokenizers import HuggingFaceWordPieceTokenizer
 
@@ -328,7 +329,8 @@ class BertModel(HybridBlock):
                  dtype='float32',
                  use_pooler=True,
                  layout='NT',
-                 compute_layout='auto'):
+                 compute_layout='auto',
+                 word_embed_storage_dtype=None):
         super().__init__()
         self._dtype = dtype
         self.use_pooler = use_pooler
@@ -366,10 +368,16 @@ class BertModel(HybridBlock):
         )
         self.encoder.hybridize()
         # Construct word embedding
-        self.word_embed = nn.Embedding(input_dim=vocab_size,
-                                       output_dim=units,
-                                       weight_initializer=embed_initializer,
-                                       dtype=dtype)
+        if word_embed_storage_dtype is None:
+            self.word_embed = nn.Embedding(input_dim=vocab_size,
+                                           output_dim=units,
+                                           weight_initializer=embed_initializer,
+                                           dtype=dtype)
+        else:
+            self.word_embed = QuantizedEmbedding(input_dim=vocab_size,
+                                                 output_dim=units,
+                                                 storage_dtype=word_embed_storage_dtype,
+                                                 dtype=dtype)
         self.embed_layer_norm = nn.LayerNorm(epsilon=self.layer_norm_eps)
         self.embed_dropout = nn.Dropout(hidden_dropout_prob)
         # Construct token type embedding
@@ -518,7 +526,8 @@ class BertModel(HybridBlock):
             return google_en_uncased_bert_base()
 
     @classmethod
-    def from_cfg(cls, cfg, use_pooler=True, dtype=None) -> 'BertModel':
+    def from_cfg(cls, cfg, use_pooler=True, dtype=None,
+                 word_embed_storage_dtype=None) -> 'BertModel':
         """
 
         Parameters
@@ -529,6 +538,10 @@ class BertModel(HybridBlock):
             Whether to output the pooled feature
         dtype
             data type of the model
+        word_embed_storage_dtype
+            If it is 'int8' or 'float16', the word embedding will be a QuantizedEmbedding
+            that stores the weight in this data type. It is used for inference with the
+            parameters converted by `gluonnlp.utils.quantize_embedding_params`.
 
         Returns
         -------
@@ -560,7 +573,8 @@ class BertModel(HybridBlock):
                    bias_initializer=bias_initializer,
                    use_pooler=use_pooler,
                    layout=cfg.MODEL.layout,
-                   compute_layout=cfg.MODEL.compute_layout)
+                   compute_layout=cfg.MODEL.compute_layout,
+                   word_embed_storage_dtype=word_embed_storage_dtype)
 
 
 @use_np
@@ -27,7 +27,7 @@ GPT-2 Model
 __all__ = ['GPT2Model', 'GPT2ForLM', 'list_pretrained_gpt2', 'get_pretrained_gpt2']
 
 import os
-from typing import Tuple
+from typing import Tuple, Optional
 
 import mxnet as mx
 from mxnet import use_np
@@ -38,8 +38,9 @@ from ..utils.config import CfgNode as CN
 from ..utils.misc import load_checksum_stats, download
 from ..utils.registry import Registry
 from ..initializer import TruncNorm
-from ..attention_cell import MultiHeadAttentionCell
-from ..layers import get_activation, PositionalEmbedding
+from ..attention_cell import MultiHeadAttentionCell, init_kv_cache, update_kv_cache,\
+    write_kv_cache, gen_kv_cache_attn_mask
+from ..layers import get_activation, PositionalEmbedding, QuantizedEmbedding
 from ..data.tokenizers import HuggingFaceByteBPETokenizer
 
 
@@ -132,7 +133,8 @@ class GPT2SelfAttentionLayer(HybridBlock):
                  weight_initializer=None,
                  bias_initializer='zeros',
                  dtype='float32',
-                 layout='NT'):
+                 layout='NT',
+                 preallocated_kv_cache: bool = False):
         super().__init__()
         self._units = units
         self._num_heads = num_heads
@@ -144,6 +146,7 @@ class GPT2SelfAttentionLayer(HybridBlock):
         self._bias_initializer = bias_initializer
         self._dtype = dtype
         self._layout = layout
+        self._preallocated_kv_cache = preallocated_kv_cache
         assert layout in ['TN', 'NT'], 'Invalid layout received = {}. ' \
                                        'Only "TN" and "NT" are accepted!'.format(layout)
         self._attention_layout = 'NTK' if self._layout == 'NT' else 'TNK'
@@ -180,6 +183,30 @@ class GPT2SelfAttentionLayer(HybridBlock):
         )
         self.hidden_dropout = nn.Dropout(self._hidden_dropout_prob)
 
+    def _gen_causal_mask(self, F, query, key, query_pos):
+        """Generate the mask between the queries and all the keys before them
+
+        Returns
+        -------
+        mask
+            Shape (batch_size, query_len, key_len)
+        """
+        if self._layout == 'NT':
+            batch_axis, time_axis = 0, 1
+        else:
+            batch_axis, time_axis = 1, 0
+        key_pos = F.npx.arange_like(key, axis=time_axis)
+        # (query_len, key_len)
+        mask = (F.npx.reshape(key_pos, (1, -1)) <=
+                F.npx.reshape(query_pos, (-1, 1))).astype(self._dtype)
+        # broadcast to (batch_size, query_len, key_len)
+        return F.npx.broadcast_like(
+            F.np.expand_dims(mask, axis=0),
+            query,
+            lhs_axes=0,
+            rhs_axes=batch_axis
+        )
+
     def hybrid_forward(self, F, x, layer_states, prev_len):
         """
 
@@ -193,8 +220,10 @@ class GPT2SelfAttentionLayer(HybridBlock):
         layer_states :
             - layout = 'NT'
                 Shape (2, batch_size, prev_len, C_in)
+                or (2, batch_size, max_cache_length, C_in) if the cache is preallocated
             - layout = 'TN'
                 Shape (2, prev_len, batch_size, C_in)
+                or (2, max_cache_length, batch_size, C_in) if the cache is preallocated
         prev_len
         """
         x = self.ln(x)
@@ -204,27 +233,38 @@ class GPT2SelfAttentionLayer(HybridBlock):
             batch_axis, time_axis = 1, 0
 
         query, key, value = F.np.split(self.qkv(x), 3, axis=-1)
-        if layer_states is not None:
-            prev_key, prev_value = layer_states[0], layer_states[1]
-            key = F.np.concatenate([prev_key, key], axis=time_axis)
-            value = F.np.concatenate([prev_value, value], axis=time_axis)
-        new_states = F.np.stack([key, value], axis=0)
-        
-        # gen mask
         query_pos = F.npx.arange_like(query, axis=time_axis)
         if prev_len is not None:
             query_pos = query_pos + prev_len
-        key_pos = F.npx.arange_like(key, axis=time_axis)
-        # (query_len, key_len)
-        mask = (F.npx.reshape(key_pos, (1, -1)) <= 
-                F.npx.reshape(query_pos, (-1, 1))).astype(self._dtype)
-        # broadcast to (batch_size, query_len, key_len)
-        mask = F.npx.broadcast_like(
-            F.np.expand_dims(mask, axis=0),
-            query,
-            lhs_axes=0,
-            rhs_axes=batch_axis
-        )
+        if self._preallocated_kv_cache and isinstance(x, mx.np.ndarray):
+            # Without hybridization, the key/value are written to the slots
+            # [prev_len, prev_len + seq_length) of the cache in place and the attention only
+            # covers the written slots
+            start = 0 if prev_len is None else int(prev_len)
+            key = write_kv_cache(layer_states[0], key, start, layout=self._layout)
+            value = write_kv_cache(layer_states[1], value, start, layout=self._layout)
+            mask = self._gen_causal_mask(F, query, key, query_pos)
+            new_states = layer_states
+        elif self._preallocated_kv_cache:
+            # Shape (batch_size, seq_length) or (seq_length, batch_size)
+            positions = F.npx.broadcast_like(
+                F.np.expand_dims(query_pos, axis=batch_axis),
+                query,
+                lhs_axes=batch_axis,
+                rhs_axes=batch_axis
+            )
+            key = update_kv_cache(F, layer_states[0], key, positions, layout=self._layout)
+            value = update_kv_cache(F, layer_states[1], value, positions, layout=self._layout)
+            mask = gen_kv_cache_attn_mask(F, key, positions, dtype=self._dtype,
+                                          layout=self._layout)
+            new_states = F.np.stack([key, value], axis=0)
+        else:
+            if layer_states is not None:
+                prev_key, prev_value = layer_states[0], layer_states[1]
+                key = F.np.concatenate([prev_key, key], axis=time_axis)
+                value = F.np.concatenate([prev_value, value], axis=time_axis)
+            mask = self._gen_causal_mask(F, query, key, query_pos)
+            new_states = F.np.stack([key, value], axis=0)
 
         query = F.npx.reshape(query, (-2, -2, self._num_heads, -1))
         key = F.npx.reshape(key, (-2, -2, self._num_heads, -1))
@@ -297,7 +337,8 @@ class GPT2Layer(HybridBlock):
                  bias_initializer='zeros',
                  activation: str = 'gelu(tanh)',
                  dtype='float32',
-                 layout='NT'):
+                 layout='NT',
+                 preallocated_kv_cache: bool = False):
         super().__init__()
         self._units = units
         self._hidden_size = 4 * units
@@ -320,7 +361,8 @@ class GPT2Layer(HybridBlock):
             weight_initializer=self._weight_initializer,
             bias_initializer=self._bias_initializer,
             dtype=self._dtype,
-            layout=self._layout
+            layout=self._layout,
+            preallocated_kv_cache=preallocated_kv_cache
         )
         self.ffn = GPT2FFN(
             units=self._units,
@@ -375,7 +417,9 @@ class GPT2Model(HybridBlock):
                  dtype='float32',
                  output_all_encodings=False,
                  layout='NT',
-                 compute_layout='auto'):
+                 compute_layout='auto',
+                 word_embed_storage_dtype=None,
+                 max_cache_length: Optional[int] = None):
         super().__init__()
         self._vocab_size = vocab_size
         self._units= units
@@ -393,16 +437,25 @@ class GPT2Model(HybridBlock):
         self._bias_initializer = bias_initializer
         self._dtype = dtype
         self._layout = layout
+        self._max_cache_length = max_cache_length
         if compute_layout == 'auto' or compute_layout is None:
             self._compute_layout = layout
         else:
             self._compute_layout = compute_layout
-        self._embed= nn.Embedding(
-            input_dim=self._vocab_size,
-            output_dim=self._units,
-            weight_initializer=embed_initializer,
-            dtype=self._dtype
-        )
+        if word_embed_storage_dtype is None:
+            self._embed = nn.Embedding(
+                input_dim=self._vocab_size,
+                output_dim=self._units,
+                weight_initializer=embed_initializer,
+                dtype=self._dtype
+            )
+        else:
+            self._embed = QuantizedEmbedding(
+                input_dim=self._vocab_size,
+                output_dim=self._units,
+                storage_dtype=word_embed_storage_dtype,
+                dtype=self._dtype
+            )
         self._embed_dropout = nn.Dropout(self._embed_dropout_prob)
         self._pos_embed = PositionalEmbedding(
             units=self._units,
@@ -424,7 +477,8 @@ class GPT2Model(HybridBlock):
                     bias_initializer=self._bias_initializer,
                     activation=self._activation,
                     dtype=self._dtype,
-                    layout=self._compute_layout
+                    layout=self._compute_layout,
+                    preallocated_kv_cache=max_cache_length is not None
                 )
             )
         self._final_ln = nn.LayerNorm(epsilon=layer_norm_eps,
@@ -434,6 +488,11 @@ class GPT2Model(HybridBlock):
     def layout(self):
         return self._layout
 
+    @property
+    def state_batch_axis(self):
+        """The batch axis of the states"""
+        return 2 if self.layout == 'NT' else 3
+
     def hybrid_forward(self, F, x, states, prev_len):
         """
 
@@ -445,6 +504,9 @@ class GPT2Model(HybridBlock):
                 Shape (num_layers, 2, batch_size, prev_len, C_in)]
             - layout = 'TN'
                 Shape (num_layers, 2, prev_len, batch_size, C_in)]
+            If max_cache_length is set, the states are preallocated and the prev_len axis
+            has the size of max_cache_length. Without hybridization, they are updated in place
+            and returned as the new states.
         prev_len
         """
         x = self.get_initial_embedding(F, x, prev_len)
@@ -458,7 +520,12 @@ class GPT2Model(HybridBlock):
             layer_states = None if states is None else states[layer_idx]
             x, new_layer_states = self._layers[layer_idx](x, layer_states, prev_len)
             new_states.append(new_layer_states)
-        new_states = F.np.stack(new_states, axis=0)
+        if self._max_cache_length is not None and isinstance(x, mx.np.ndarray)\
+                and self._layout == self._compute_layout:
+            # The layers have written to the cache in place
+            new_states = states
+        else:
+            new_states = F.np.stack(new_states, axis=0)
         
         x = self._final_ln(x)
         if self._layout != self._compute_layout:
@@ -505,14 +572,30 @@ class GPT2Model(HybridBlock):
     def init_states(self, batch_size, ctx):
         """Initialize the states required for incremental decoding
 
+        If max_cache_length is set, the key/value cache is preallocated and each step writes
+        its key/value to its positions. Without hybridization, the cache is written in place,
+        i.e., the states given to the model are modified and returned, and the attention only
+        covers the written positions. A hybridized model copies the whole cache in each step.
+        In both cases, the decoding is not faster than the hybridized model with the
+        concatenated states (see `scripts/benchmarks/README.md`), so only preallocate the cache
+        if the states should have a fixed shape. Otherwise, the states grow by concatenation
+        in each step.
+
         Returns
         -------
         init_states
             - layout = 'NT'
                 Shape (num_layers, 2, batch_size, 0, C_in)
+                or (num_layers, 2, batch_size, max_cache_length, C_in)
             - layout = 'TN'
                 Shape (num_layers, 2, 0, batch_size, C_in)
+                or (num_layers, 2, max_cache_length, batch_size, C_in)
         """
+        if self._max_cache_length is not None:
+            key_cache, value_cache = init_kv_cache(batch_size, self._max_cache_length,
+                                                   (self._units,), ctx=ctx, dtype=self._dtype,
+                                                   layout=self.layout)
+            return mx.np.stack([mx.np.stack([key_cache, value_cache])] * self._num_layers)
         return mx.np.zeros(shape=(self._num_layers, 2, batch_size, 0,
                                   self._units), ctx=ctx, dtype=self._dtype) if self.layout == 'NT' else \
                mx.np.zeros(shape=(self._num_layers, 2, 0, batch_size,
@@ -529,7 +612,9 @@ class GPT2Model(HybridBlock):
     def from_cfg(cls,
                  cfg,
                  dtype=None,
-                 output_all_encodings=False) -> 'GPT2Model':
+                 output_all_encodings=False,
+                 word_embed_storage_dtype=None,
+                 max_cache_length=None) -> 'GPT2Model':
         cfg = GPT2Model.get_cfg().clone_merge(cfg)
         embed_initializer = mx.init.create(*cfg.INITIALIZER.embed)
         weight_initializer = mx.init.create(*cfg.INITIALIZER.weight)
@@ -553,13 +638,16 @@ class GPT2Model(HybridBlock):
                    dtype=dtype,
                    output_all_encodings=output_all_encodings,
                    layout=cfg.MODEL.layout,
-                   compute_layout=cfg.MODEL.compute_layout)
+                   compute_layout=cfg.MODEL.compute_layout,
+                   word_embed_storage_dtype=word_embed_storage_dtype,
+                   max_cache_length=max_cache_length)
 
 @use_np
 class GPT2ForLM(HybridBlock):
-    def __init__(self, backbone_cfg=None):
+    def __init__(self, backbone_cfg=None, max_cache_length=None):
         super().__init__()
-        self._backbone_model = GPT2Model.from_cfg(backbone_cfg)
+        self._backbone_model = GPT2Model.from_cfg(backbone_cfg,
+                                                  max_cache_length=max_cache_length)
         self._lm_head = nn.Dense(
             units=backbone_cfg.MODEL.vocab_size,
             in_units=backbone_cfg.MODEL.units,
@@ -568,6 +656,10 @@ class GPT2ForLM(HybridBlock):
         )
         self._lm_head.weight = self._backbone_model._embed.weight
 
+    @property
+    def layout(self):
+        return self._backbone_model.layout
+
     def hybrid_forward(self, F, inputs, states, prev_len):
         """Getting the logits
 
@@ -595,6 +687,10 @@ class GPT2ForLM(HybridBlock):
         logits = self._lm_head(contextual_embeddings)
         return logits, new_states
 
+    @property
+    def state_batch_axis(self):
+        return self._backbone_model.state_batch_axis
+
     def init_states(self, batch_size, ctx):
         return self._backbone_model.init_states(batch_size, ctx)
 
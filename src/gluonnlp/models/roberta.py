@@ -39,7 +39,7 @@ from mxnet.gluon import HybridBlock, nn
 from ..op import select_vectors_by_position
 from ..base import get_model_zoo_home_dir, get_repo_model_zoo_url, \
                    get_model_zoo_checksum_dir
-from ..layers import PositionalEmbedding, get_activation
+from ..layers import PositionalEmbedding, get_activation, QuantizedEmbedding
 from ..registry import BACKBONE_REGISTRY
 from ..utils.misc import download, load_checksum_stats
 from ..utils.registry import Registry
@@ -212,7 +212,8 @@ class RobertaModel(HybridBlock):
                  encoder_normalize_before=True,
                  output_all_encodings=False,
                  layout='NT',
-                 compute_layout='auto'):
+                 compute_layout='auto',
+                 word_embed_storage_dtype=None):
         """
 
         Parameters
@@ -245,6 +246,10 @@ class RobertaModel(HybridBlock):
             The layout
         compute_layout
             The computation layout
+        word_embed_storage_dtype
+            If it is 'int8' or 'float16', the word embedding will be a QuantizedEmbedding
+            that stores the weight in this data type. It is used for inference with the
+            parameters converted by `gluonnlp.utils.quantize_embedding_params`.
         """
         super().__init__()
         self._dtype = dtype
@@ -271,12 +276,20 @@ class RobertaModel(HybridBlock):
             self._compute_layout = layout
         else:
             self._compute_layout = compute_layout
-        self.word_embed = nn.Embedding(
-            input_dim=self.vocab_size,
-            output_dim=self.units,
-            weight_initializer=embed_initializer,
-            dtype=self._dtype
-        )
+        if word_embed_storage_dtype is None:
+            self.word_embed = nn.Embedding(
+                input_dim=self.vocab_size,
+                output_dim=self.units,
+                weight_initializer=embed_initializer,
+                dtype=self._dtype
+            )
+        else:
+            self.word_embed = QuantizedEmbedding(
+                input_dim=self.vocab_size,
+                output_dim=self.units,
+                storage_dtype=word_embed_storage_dtype,
+                dtype=self._dtype
+            )
         if self.encoder_normalize_before:
             self.embed_ln = nn.LayerNorm(
                 epsilon=self.layer_norm_eps,
@@ -413,7 +426,8 @@ class RobertaModel(HybridBlock):
                  cfg,
                  use_pooler=True,
                  dtype=None,
-                 output_all_encodings=False) -> 'RobertaModel':
+                 output_all_encodings=False,
+                 word_embed_storage_dtype=None) -> 'RobertaModel':
         cfg = RobertaModel.get_cfg().clone_merge(cfg)
         embed_initializer = mx.init.create(*cfg.INITIALIZER.embed)
         weight_initializer = mx.init.create(*cfg.INITIALIZER.weight)
@@ -439,7 +453,8 @@ class RobertaModel(HybridBlock):
                    use_pooler=use_pooler,
                    output_all_encodings=output_all_encodings,
                    layout=cfg.MODEL.layout,
-                   compute_layout=cfg.MODEL.compute_layout)
+                   compute_layout=cfg.MODEL.compute_layout,
+                   word_embed_storage_dtype=word_embed_storage_dtype)
 
 
 @use_np
@@ -1,18 +1,22 @@
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import mxnet as mx
 from mxnet import use_np
 from mxnet.gluon import nn, HybridBlock
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Callable, Sequence
 from ..utils.registry import Registry
-from ..attention_cell import MultiHeadAttentionCell, gen_self_attn_mask, gen_mem_attn_mask
+from ..attention_cell import MultiHeadAttentionCell, gen_self_attn_mask, gen_mem_attn_mask,\
+    init_kv_cache, update_kv_cache, write_kv_cache, gen_kv_cache_attn_mask
 from ..layers import PositionalEmbedding, PositionwiseFFN, InitializerType
+from ..op import update_vectors_by_position
+from ..data.sampler import BoundedBudgetSampler
 from ..utils.config import CfgNode as CN
-from ..sequence_sampler import BaseStepDecoder
+from ..sequence_sampler import BaseStepDecoder, IndirectBatchAxis
 __all__ = ['TransformerEncoderLayer', 'TransformerDecoderLayer',
            'TransformerEncoder', 'TransformerDecoder',
-           'TransformerModel', 'TransformerNMTInference']
+           'TransformerModel', 'TransformerNMTInference', 'TranslationEngine']
 
 transformer_cfg_reg = Registry('transformer_cfg')
 
@@ -376,6 +380,16 @@ class TransformerEncoder(HybridBlock):
         return out
 
 
+def _get_shared_position(position):
+    """Get the position shared by all the samples, or None if the samples are at different
+    positions. The position should be an ndarray, i.e., without hybridization.
+    """
+    position = position.asnumpy()
+    if position.size > 0 and (position == position[0]).all():
+        return int(position[0])
+    return None
+
+
 @use_np
 class TransformerDecoderLayer(HybridBlock):
     def __init__(self, units: int = 512,
@@ -587,22 +601,36 @@ class TransformerDecoderLayer(HybridBlock):
         else:
             return 1, 1
 
-    def init_states(self, batch_size, ctx, dtype='float32'):
+    def init_states(self, batch_size, ctx, dtype='float32', max_length=None):
         """Initialize the states required for incremental decoding
 
+        Parameters
+        ----------
+        batch_size
+        ctx
+        dtype
+        max_length
+            If it is not None, preallocate the key/value cache with the capacity of max_length.
+            The preallocated states should be decoded with the position argument of
+            :meth:`incremental_decode`. Otherwise, the states grow in each step.
+
         Returns
         -------
         init_key
             - layout = 'NT'
-                Shape (batch_size, 0, N, C_key)
+                Shape (batch_size, 0, N, C_key) or (batch_size, max_length, N, C_key)
             - layout = 'TN'
-                Shape (0, batch_size, N, C_key)
+                Shape (0, batch_size, N, C_key) or (max_length, batch_size, N, C_key)
         init_value :
             - layout = 'NT'
-                Shape (batch_size, 0, N, C_value)
+                Shape (batch_size, 0, N, C_value) or (batch_size, max_length, N, C_value)
             - layout = 'TN'
-                Shape (0, batch_size, N, C_value)
+                Shape (0, batch_size, N, C_value) or (max_length, batch_size, N, C_value)
         """
+        if max_length is not None:
+            return init_kv_cache(batch_size, max_length,
+                                 (self._num_heads, self._units // self._num_heads),
+                                 ctx=ctx, dtype=dtype, layout=self.layout)
         if self.layout == 'NT':
             init_key = mx.np.zeros(shape=(batch_size, 0, self._num_heads,
                                           self._units // self._num_heads), ctx=ctx, dtype=dtype)
@@ -615,7 +643,8 @@ class TransformerDecoderLayer(HybridBlock):
                                             self._units // self._num_heads), ctx=ctx, dtype=dtype)
         return init_key, init_value
 
-    def incremental_decode(self, F, data, states, mem, mem_valid_length, mem_attn_mask=None):
+    def incremental_decode(self, F, data, states, mem, mem_valid_length, mem_attn_mask=None,
+                           position=None):
         """Incrementally generate the output given the decoder input.
 
         Parameters
@@ -647,6 +676,11 @@ class TransformerDecoderLayer(HybridBlock):
         mem_attn_mask
             The attention mask between data and the memory
             Has shape (batch_size, 1, mem_length)
+        position
+            The position of the current step. Shape (batch_size,)
+            If it is not None, the states are the preallocated cache returned by
+            `init_states(..., max_length=max_length)` and the key/value of the current step
+            are written to the slot at the position.
 
         Returns
         -------
@@ -655,8 +689,10 @@ class TransformerDecoderLayer(HybridBlock):
         updated_states
             - new_key
                 Shape (batch_size, prev_seq_length + 1, num_heads, C_key)
+                or (batch_size, max_length, num_heads, C_key) if position is given
             - new_value
                 Shape (batch_size, prev_seq_length + 1, num_heads, C_value)
+                or (batch_size, max_length, num_heads, C_value) if position is given
         """
         if self._pre_norm:
             data = self.ln_in(data)
@@ -680,9 +716,32 @@ class TransformerDecoderLayer(HybridBlock):
         step_query = F.npx.reshape(step_query, (-2, -2, self._num_heads, -1))
         step_key = F.npx.reshape(step_key, (-2, -2, self._num_heads, -1))
         step_value = F.npx.reshape(step_value, (-2, -2, self._num_heads, -1))
-        new_key = F.np.concatenate([prev_key, step_key], axis=time_axis)
-        new_value = F.np.concatenate([prev_value, step_value], axis=time_axis)
-        out, [_, attn_weight] = self.self_attention(step_query, new_key, new_value, None)
+        start = None
+        if position is not None and isinstance(data, mx.np.ndarray):
+            start = _get_shared_position(position)
+        if position is None:
+            new_key = F.np.concatenate([prev_key, step_key], axis=time_axis)
+            new_value = F.np.concatenate([prev_value, step_value], axis=time_axis)
+            self_attn_mask = None
+            new_states = (new_key, new_value)
+        elif start is not None:
+            # Without hybridization, the cache is written in place by slice assignment if all the
+            # samples are at the same position. The slots up to the position have all been
+            # written, so the attention covers them without a mask.
+            new_key = write_kv_cache(prev_key, step_key, start, layout=self.layout)
+            new_value = write_kv_cache(prev_value, step_value, start, layout=self.layout)
+            self_attn_mask = None
+            new_states = (prev_key, prev_value)
+        else:
+            # Shape (B, 1) or (1, B)
+            positions = F.np.expand_dims(position, axis=time_axis)
+            new_key = update_kv_cache(F, prev_key, step_key, positions, layout=self.layout)
+            new_value = update_kv_cache(F, prev_value, step_value, positions, layout=self.layout)
+            self_attn_mask = gen_kv_cache_attn_mask(F, new_key, positions,
+                                                    dtype=self._dtype, layout=self.layout)
+            new_states = (new_key, new_value)
+        out, [_, attn_weight] = self.self_attention(step_query, new_key, new_value,
+                                                    self_attn_mask)
         out = self.proj_in(out)
         out = self.dropout_layer(out)
         out = out + data
@@ -707,7 +766,7 @@ class TransformerDecoderLayer(HybridBlock):
         # 3. Encode the output via an FFN layer
         out = self.ffn(out)
         out = F.npx.reshape(out, (-5, -1))
-        return out, (new_key, new_value)
+        return out, new_states
 
 
 @use_np
@@ -823,9 +882,18 @@ class TransformerDecoder(HybridBlock):
             ret.append(layer.state_batch_axis)
         return ret
 
-    def init_states(self, batch_size, ctx, dtype='float32'):
+    def init_states(self, batch_size, ctx, dtype='float32', max_length=None):
         """Initialize the states required for incremental decoding
 
+        Parameters
+        ----------
+        batch_size
+        ctx
+        dtype
+        max_length
+            If it is not None, preallocate the key/value cache of every layer with the
+            capacity of max_length. See :meth:`TransformerDecoderLayer.init_states`.
+
         Returns
         -------
         states
@@ -845,10 +913,11 @@ class TransformerDecoder(HybridBlock):
                 layer = self.layers[i]
             states.append(layer.init_states(batch_size=batch_size,
                                             ctx=ctx,
-                                            dtype=dtype))
+                                            dtype=dtype,
+                                            max_length=max_length))
         return states
 
-    def incremental_decode(self, F, data, states, mem, mem_valid_length):
+    def incremental_decode(self, F, data, states, mem, mem_valid_length, position=None):
         """Incrementally generate the output given the decoder input.
 
         Parameters
@@ -877,6 +946,10 @@ class TransformerDecoder(HybridBlock):
         mem_valid_length
             Valid length of the memory
             Shape (batch_size,)
+        position
+            The position of the current step. Shape (batch_size,)
+            It should be given if the states are preallocated with
+            `init_states(..., max_length=max_length)`.
 
         Returns
         -------
@@ -909,7 +982,8 @@ class TransformerDecoder(HybridBlock):
             else:
                 layer = self.layers[i]
             out, new_state = layer.incremental_decode(F, out, states[i],
-                                                      mem, mem_valid_length, mem_attn_mask)
+                                                      mem, mem_valid_length, mem_attn_mask,
+                                                      position=position)
             new_states.append(new_state)
         if self._pre_norm:
             out = self.ln_final(out)
@@ -1304,15 +1378,36 @@ class TransformerModel(HybridBlock):
 
 @use_np
 class TransformerNMTInference(HybridBlock, BaseStepDecoder):
-    def __init__(self, model):
+    def __init__(self, model, max_cache_length: Optional[int] = None,
+                 use_shortlist: bool = False):
         """
 
         Parameters
         ----------
         model
+        max_cache_length
+            If it is not None, the key/value states of the decoder are preallocated with the
+            capacity of max_cache_length and each step writes its key/value to its position,
+            which keeps the shapes of the states fixed during decoding. Without hybridization,
+            the states are written in place and the attention only covers the written
+            positions. A hybridized model copies the states in each write and the attention
+            covers all the max_cache_length slots. It keeps the shapes fixed but does not make
+            the decoding faster than the hybridized model with the concatenated states. It
+            should be no smaller than the maximal number of decoding steps. Otherwise, the states
+            grow by concatenation in each step.
+        use_shortlist
+            If True, :meth:`init_states` takes a shortlist of the target tokens, e.g., generated
+            by :class:`~gluonnlp.data.shortlist.LexicalShortlist`, and the output layer only
+            computes the logits of the candidates in the shortlist. The other tokens get a
+            large negative logit, so the outputs still cover the whole target vocabulary and
+            can be used by the samplers without any change.
         """
         super().__init__()
         self.model = model
+        self._max_cache_length = max_cache_length
+        self._use_shortlist = use_shortlist
+        if use_shortlist:
+            self.shortlist_weight = model.tgt_final_layer.weight
 
     def initialize(self, **kwargs):
         # Manually disable the initialize
@@ -1332,13 +1427,21 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
         src_valid_length_batch_axis : int
         position_batch_axis : int
         dec_layer_batch_axis : list
+        shortlist_ids_batch_axis : IndirectBatchAxis
+            Only exists if use_shortlist is True
+        shortlist_mask_batch_axis : IndirectBatchAxis
+            Only exists if use_shortlist is True
         """
         if self.model.layout == 'NT':
-            return 0, 0, 0, self.model.decoder.state_batch_axis
+            batch_axis = (0, 0, 0, self.model.decoder.state_batch_axis)
         else:
-            return 1, 0, 0, self.model.decoder.state_batch_axis
+            batch_axis = (1, 0, 0, self.model.decoder.state_batch_axis)
+        if self._use_shortlist:
+            # The shortlist is the same for the beams of a sample
+            batch_axis = batch_axis + (IndirectBatchAxis(0), IndirectBatchAxis(0))
+        return batch_axis
 
-    def init_states(self, src_data, src_valid_length):  # TODO(sxjscience) Revisit here, support auxiliary states?
+    def init_states(self, src_data, src_valid_length, shortlist=None):  # TODO(sxjscience) Revisit here, support auxiliary states?
         """Initialize the states required for sequence sampling
 
         Parameters
@@ -1350,6 +1453,14 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
                 Shape (src_length, batch_size)
         src_valid_length
             Shape (batch_size,)
+        shortlist
+            Only used if use_shortlist is True. A tuple of
+
+            - candidate_ids
+                The candidate tokens of the batch. Shape (num_candidates,)
+            - candidate_mask
+                Whether each candidate is allowed for each sample.
+                Shape (batch_size, num_candidates)
 
         Returns
         -------
@@ -1364,6 +1475,11 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
             Shape (batch_size,)
         dec_states: list
             The states of the decoder
+        shortlist_ids
+            The candidate_ids repeated for each sample. Shape (batch_size, num_candidates).
+            Only exists if use_shortlist is True
+        shortlist_mask
+            Shape (batch_size, num_candidates). Only exists if use_shortlist is True
         """
         if self.model.layout == 'NT':
             batch_size = src_data.shape[0]
@@ -1373,10 +1489,58 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
         enc_out = self.model.encode(mx, src_data, src_valid_length)
         position = mx.np.zeros((batch_size,), dtype=np.int32, ctx=ctx)
         dtype = enc_out.dtype
-        dec_states = self.model.decoder.init_states(batch_size, ctx, dtype)
-        return enc_out, src_valid_length, position, dec_states
+        dec_states = self.model.decoder.init_states(batch_size, ctx, dtype,
+                                                    max_length=self._max_cache_length)
+        states = (enc_out, src_valid_length, position, dec_states)
+        if self._use_shortlist:
+            if shortlist is None:
+                raise ValueError('The shortlist must be given if use_shortlist is True.')
+            candidate_ids, candidate_mask = shortlist
+            candidate_ids = mx.np.array(candidate_ids, dtype=np.int32, ctx=ctx)
+            candidate_mask = mx.np.array(candidate_mask, dtype=np.int32, ctx=ctx)
+            if candidate_mask.shape != (batch_size, candidate_ids.shape[0]):
+                raise ValueError('The shape of candidate_mask must be {}. Received {}'
+                                 .format((batch_size, candidate_ids.shape[0]),
+                                         candidate_mask.shape))
+            shortlist_ids = mx.np.broadcast_to(mx.np.expand_dims(candidate_ids, axis=0),
+                                               candidate_mask.shape)
+            states = states + (shortlist_ids, candidate_mask)
+        elif shortlist is not None:
+            raise ValueError('The shortlist is given but use_shortlist is False.')
+        return states
+
+    def _shortlist_project(self, F, data, weight, shortlist_ids, shortlist_mask):
+        """Compute the logits of the candidates in the shortlist and scatter them to the
+        target vocabulary.
+
+        Parameters
+        ----------
+        F
+        data
+            Shape (batch_size, C)
+        weight
+            The weight of the output layer. Shape (V, C)
+        shortlist_ids
+            Shape (batch_size, num_candidates)
+        shortlist_mask
+            Shape (batch_size, num_candidates)
 
-    def hybrid_forward(self, F, step_data, states):
+        Returns
+        -------
+        out
+            Shape (batch_size, V)
+        """
+        neg = -1e4 if np.dtype(self.model.tgt_final_layer.weight.dtype) == np.float16\
+            else -1e18
+        # All rows share the same candidates, so the weight is only gathered once
+        candidate_weight = F.np.take(weight, shortlist_ids[0], axis=0)
+        logits = F.np.dot(data, F.np.transpose(candidate_weight))
+        logits = F.np.where(shortlist_mask, logits, neg)
+        out = F.np.zeros_like(F.np.expand_dims(F.npx.arange_like(data, axis=0), axis=1)
+                              + F.np.expand_dims(F.npx.arange_like(weight, axis=0), axis=0))
+        return update_vectors_by_position(F, out + neg, logits, shortlist_ids)
+
+    def hybrid_forward(self, F, step_data, states, shortlist_weight=None):
         """
 
         Parameters
@@ -1395,6 +1559,13 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
                     mem_valid_length : (batch_size,)
                     position : (batch_size,)
                     dec_states : list
+                - shortlist_ids : (batch_size, num_candidates)
+                    Only exists if use_shortlist is True
+                - shortlist_mask : (batch_size, num_candidates)
+                    Only exists if use_shortlist is True
+        shortlist_weight
+            The weight of tgt_final_layer. Only exists if use_shortlist is True
+
         Returns
         -------
         out
@@ -1402,6 +1573,9 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
         new_states
             Has the same structure as the states
         """
+        if self._use_shortlist:
+            shortlist_ids, shortlist_mask = states[-2:]
+            states = states[:-2]
         mem_data, mem_valid_length, position, dec_states = states
         # 1. Get the embedding
         step_data = self.model.tgt_embed_layer(step_data)
@@ -1410,7 +1584,172 @@ class TransformerNMTInference(HybridBlock, BaseStepDecoder):
         if self.model.pos_embed_type is not None:
             step_data = step_data + self.model.tgt_pos_embed_layer(position)
         out, new_states =\
-            self.model.decoder.incremental_decode(F, step_data, dec_states,
-                                                  mem_data, mem_valid_length)
-        out = self.model.tgt_final_layer(out)
-        return out, (mem_data, mem_valid_length, position + 1, new_states)
+            self.model.decoder.incremental_decode(
+                F, step_data, dec_states, mem_data, mem_valid_length,
+                position=None if self._max_cache_length is None else position)
+        if self._use_shortlist:
+            out = self._shortlist_project(F, out, shortlist_weight, shortlist_ids,
+                                          shortlist_mask)
+        else:
+            out = self.model.tgt_final_layer(out)
+        new_states = (mem_data, mem_valid_length, position + 1, new_states)
+        if self._use_shortlist:
+            new_states = new_states + (shortlist_ids, shortlist_mask)
+        return out, new_states
+
+
+class TranslationEngine:
+    """Translate a large number of sentences with the beam search.
+
+    The sentences are sorted by length and grouped into batches with a bounded number of
+    tokens by :class:`~gluonnlp.data.sampler.BoundedBudgetSampler`, so that little computation
+    is spent on the padding. The best translation of each batch is copied to the host in a
+    single transfer and then detokenized in a background thread while the next batch is being
+    decoded. The translations are returned in the original order of the sentences.
+
+    Parameters
+    ----------
+    inference_model
+        The inference model
+    sampler
+        The sampler, e.g., :class:`~gluonnlp.sequence_sampler.BeamSearchSampler`, whose
+        decoder is inference_model
+    bos_id
+        The id of the BOS token of the target language
+    eos_id
+        The id of the EOS token of the target language, which is removed from the translations
+    encode_fn
+        Encode a list of sentences to the lists of the source token ids, including the EOS
+        token. Required by :meth:`translate`.
+    decode_fn
+        Decode a list of the target token ids to a sentence. Required by :meth:`translate`.
+    max_num_tokens
+        The maximal number of the source tokens in a batch, including the padding
+    max_num_sentences
+        The maximal number of the sentences in a batch. Not bounded if it is negative.
+    shortlist
+        The lexical shortlist, e.g., :class:`~gluonnlp.data.shortlist.LexicalShortlist`, which
+        is required if inference_model uses the shortlist
+    ctx
+        The context of the inputs. By default, the current context is used.
+    num_workers
+        The number of the threads that detokenize the translations
+    """
+    def __init__(self, inference_model: TransformerNMTInference, sampler,
+                 bos_id: int, eos_id: int,
+                 encode_fn: Optional[Callable[[List[str]], List[List[int]]]] = None,
+                 decode_fn: Optional[Callable[[List[int]], str]] = None,
+                 max_num_tokens: int = 4096, max_num_sentences: int = -1,
+                 shortlist=None, ctx=None, num_workers: int = 1):
+        self._inference_model = inference_model
+        self._sampler = sampler
+        self._bos_id = bos_id
+        self._eos_id = eos_id
+        self._encode_fn = encode_fn
+        self._decode_fn = decode_fn
+        self._max_num_tokens = max_num_tokens
+        self._max_num_sentences = max_num_sentences
+        self._shortlist = shortlist
+        self._ctx = mx.context.current_context() if ctx is None else ctx
+        self._num_workers = num_workers
+
+    def _decode_batch(self, src_ids: np.ndarray, src_valid_length: np.ndarray) -> np.ndarray:
+        """Decode a batch and copy the best translations to the host
+
+        Returns
+        -------
+        outputs
+            The best translation of each sentence, followed by its valid length.
+            Shape (batch_size, max_length + 1)
+        """
+        batch_size = src_ids.shape[0]
+        src_data = mx.np.array(src_ids, dtype=np.int32, ctx=self._ctx)
+        if self._inference_model.model.layout == 'TN':
+            src_data = src_data.T
+        src_valid_length_nd = mx.np.array(src_valid_length, dtype=np.int32, ctx=self._ctx)
+        shortlist = None if self._shortlist is None\
+            else self._shortlist(src_ids, src_valid_length)
+        states = self._inference_model.init_states(src_data, src_valid_length_nd,
+                                                   shortlist=shortlist)
+        init_input = mx.np.full((batch_size,), self._bos_id, dtype=np.int32, ctx=self._ctx)
+        samples, _, valid_length = self._sampler(init_input, states, src_valid_length_nd)
+        outputs = mx.np.concatenate([samples[:, 0, :].astype(np.int32),
+                                     mx.np.expand_dims(valid_length[:, 0], axis=1)
+                                     .astype(np.int32)], axis=1)
+        return outputs.asnumpy()
+
+    def _postprocess(self, outputs: np.ndarray, indices: np.ndarray, results: list,
+                     detokenize: bool):
+        for idx, row in zip(indices, outputs):
+            # Remove the BOS token and the EOS token
+            tgt_ids = row[1:row[-1]].tolist()
+            if len(tgt_ids) > 0 and tgt_ids[-1] == self._eos_id:
+                tgt_ids = tgt_ids[:-1]
+            results[idx] = self._decode_fn(tgt_ids) if detokenize else tgt_ids
+
+    def translate_ids(self, src_ids: Sequence[Sequence[int]], detokenize: bool = False)\
+            -> list:
+        """Translate the sentences given by the token ids
+
+        Parameters
+        ----------
+        src_ids
+            The source token ids of each sentence, including the EOS token
+        detokenize
+            Whether to decode the translations with decode_fn
+
+        Returns
+        -------
+        translations
+            The target token ids of each sentence, without the BOS and EOS tokens, or the
+            translated sentences if detokenize is True
+        """
+        if detokenize and self._decode_fn is None:
+            raise ValueError('decode_fn must be given to detokenize the translations.')
+        if len(src_ids) == 0:
+            return []
+        lengths = np.array([len(ele) for ele in src_ids])
+        batch_sampler = BoundedBudgetSampler(lengths, max_num_tokens=self._max_num_tokens,
+                                             max_num_sentences=self._max_num_sentences,
+                                             shuffle=False)
+        results = [None] * len(src_ids)
+        with ThreadPoolExecutor(max_workers=self._num_workers) as executor:
+            futures = []
+            for indices in batch_sampler:
+                # The sampler gives an empty batch before a sentence that exceeds
+                # max_num_tokens, which is then translated in a batch of its own
+                if len(indices) == 0:
+                    continue
+                batch_lengths = lengths[indices]
+                batch_src_ids = np.zeros((len(indices), batch_lengths.max()), dtype=np.int32)
+                for i, idx in enumerate(indices):
+                    batch_src_ids[i, :batch_lengths[i]] = src_ids[idx]
+                outputs = self._decode_batch(batch_src_ids, batch_lengths)
+                futures.append(executor.submit(self._postprocess, outputs, indices, results,
+                                               detokenize))
+            for future in futures:
+                # Raise the exceptions in the workers
+                future.result()
+        return results
+
+    def translate(self, sentences: List[str]) -> List[str]:
+        """Translate the sentences
+
+        Parameters
+        ----------
+        sentences
+            The source sentences
+
+        Returns
+        -------
+        translations
+            The translated sentences in the same order as the source sentences
+        """
+        if self._encode_fn is None or self._decode_fn is None:
+            raise ValueError('encode_fn and decode_fn must be given to translate the sentences.')
+        return self.translate_ids(self._encode_fn(sentences), detokenize=True)
+
+    def __repr__(self):
+        return '{}(max_num_tokens={}, max_num_sentences={}, shortlist={}, num_workers={})'\
+            .format(self.__class__.__name__, self._max_num_tokens, self._max_num_sentences,
+                    self._shortlist, self._num_workers)
@@ -15,11 +15,16 @@
 # specific language governing permissions and limitations
 # under the License.
 """Implements the beam search sampler."""
+import asyncio
+import collections
+import itertools
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import mxnet as mx
 import abc
 from mxnet.gluon import HybridBlock
-from typing import Callable, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from .layers import get_activation
 
 
@@ -28,6 +33,22 @@ LARGE_POSITIVE_FLOAT = 1e18
 LARGE_NEGATIVE_FLOAT = -LARGE_POSITIVE_FLOAT
 
 
+class IndirectBatchAxis(int):
+    """The batch axis of a state that is not reordered in beam search.
+
+    The state is tiled to the beam size like the other states, but the sampler does not gather
+    it when the beams are reordered, e.g., because it is the same for all the beams of a sample
+    like the shortlist of the target tokens. If the state differs among the beams, the decoder
+    is responsible for tracking the reordering.
+
+    Examples
+    --------
+    >>> state_batch_axis = (0, [(IndirectBatchAxis(0), IndirectBatchAxis(0))])
+    """
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, int(self))
+
+
 class BaseStepDecoder(abc.ABC):
     """Base class of a step decoder
 
@@ -149,6 +170,379 @@ class BeamSearchScorer(HybridBlock):
                         from_logits=self._from_logits)
 
 
+def _gen_token_mask(token_ids, outputs):
+    """Mark the tokens in each row of the outputs.
+
+    Parameters
+    ----------
+    token_ids : mx.np.ndarray
+        The tokens to mark. The negative ids are ignored. Shape (N, M)
+    outputs : mx.np.ndarray
+        Shape (N, V)
+
+    Returns
+    -------
+    mask : mx.np.ndarray
+        Whether the token is in token_ids. Shape (N, V)
+    """
+    rows = mx.npx.broadcast_like(
+        mx.np.expand_dims(mx.npx.arange_like(token_ids, axis=0), axis=1), token_ids)
+    indices = mx.np.stack([rows.reshape((-1,)).astype(mx.np.int32),
+                           mx.npx.relu(token_ids).reshape((-1,)).astype(mx.np.int32)])
+    counts = mx.npx.index_add(mx.np.zeros_like(outputs), indices,
+                              (token_ids >= 0).astype(outputs.dtype).reshape((-1,)))
+    return counts > 0
+
+
+def _mask_outputs(outputs, mask):
+    """Set the outputs to LARGE_NEGATIVE_FLOAT where mask is True"""
+    return mx.np.where(mask, mx.np.full_like(outputs, LARGE_NEGATIVE_FLOAT), outputs)
+
+
+class BaseLogitsProcessor(abc.ABC):
+    """Base class of the processors that modify the outputs of the decoder in each step of
+    :class:`BeamSearchSampler`, e.g., to forbid some tokens.
+
+    The processors run inside the step update of the sampler, which may be hybridized, so they
+    only use the operators in mx.np and mx.npx and never synchronize with the host. The
+    processors are applied in order, and each of them keeps its own states, e.g., the n-grams
+    generated by each beam. The states are created by :meth:`init_states` and have
+    batch_size * beam_size on the batch axis given by :attr:`state_batch_axis`. The sampler
+    reorders the states along with the beams and then calls :meth:`update_states` with the
+    chosen tokens.
+    """
+    @property
+    def state_batch_axis(self) -> list:
+        """Batch axis of each state. Use :class:`IndirectBatchAxis` for the states that are
+        the same for the beams of a sample, e.g., the tables given by the user, so they are not
+        copied when the beams are reordered.
+        """
+        return []
+
+    def init_states(self, batch_size: int, beam_size: int, ctx, **kwargs) -> list:
+        """Initialize the states
+
+        Parameters
+        ----------
+        batch_size
+            The number of samples
+        beam_size
+            The number of beams of each sample
+        ctx
+            The context of the states
+        **kwargs
+            The inputs of the processor in a call of the sampler, which are given by
+            `processor_inputs` of :meth:`BeamSearchSampler.forward`. Their batch size is
+            batch_size.
+
+        Returns
+        -------
+        states
+            A list of mx.np.ndarray with batch_size * beam_size on the batch axis
+        """
+        return []
+
+    @abc.abstractmethod
+    def __call__(self, outputs, step, states):
+        """Process the outputs of the decoder
+
+        Parameters
+        ----------
+        outputs : mx.np.ndarray
+            The logits or the log-probabilities of the next token.
+            Shape (batch_size * beam_size, V)
+        step : mx.np.ndarray
+            The current step, which begins from 1. Shape ()
+        states : list
+
+        Returns
+        -------
+        new_outputs : mx.np.ndarray
+            Shape (batch_size * beam_size, V)
+        """
+        raise NotImplementedError
+
+    def update_states(self, states, word_ids, step):
+        """Update the states with the chosen tokens of the step
+
+        Parameters
+        ----------
+        states : list
+            The states after the beams are reordered
+        word_ids : mx.np.ndarray
+            The chosen tokens of the step, which are negative for the finished beams.
+            Shape (batch_size * beam_size,)
+        step : mx.np.ndarray
+            The current step, which begins from 1. Shape ()
+
+        Returns
+        -------
+        new_states : list
+        """
+        return states
+
+
+class ForcedPrefixLogitsProcessor(BaseLogitsProcessor):
+    """Force the samples to begin with the given prefixes, e.g., a partial translation given by
+    the user.
+
+    Inputs of each call:
+
+    - prefix : mx.np.ndarray
+        The tokens of the prefix of each sample, padded with -1. Shape (batch_size, P)
+    """
+    @property
+    def state_batch_axis(self):
+        return [IndirectBatchAxis(0)]
+
+    def init_states(self, batch_size, beam_size, ctx, prefix=None):
+        if prefix is None:
+            raise ValueError('The prefix must be given in processor_inputs.')
+        prefix = mx.np.array(prefix, dtype=mx.np.int32, ctx=ctx)
+        # Pad with an empty position, which is chosen after the end of the prefix
+        prefix = mx.np.concatenate([prefix, mx.np.full((batch_size, 1), -1, dtype=mx.np.int32,
+                                                       ctx=ctx)], axis=1)
+        return [_expand_to_beam_size(prefix, beam_size=beam_size, batch_size=batch_size)]
+
+    def __call__(self, outputs, step, states):
+        prefix = states[0]
+        positions = mx.np.zeros_like(prefix[:, 0]).astype(mx.np.float32) + step - 1
+        forced_ids = mx.npx.pick(prefix, positions, axis=1, mode='clip')
+        forced_mask = mx.npx.one_hot(forced_ids, outputs.shape[-1]) > 0
+        return _mask_outputs(outputs, mx.np.logical_and(
+            mx.np.expand_dims(forced_ids >= 0, axis=1), mx.np.logical_not(forced_mask)))
+
+
+class BannedTokensLogitsProcessor(BaseLogitsProcessor):
+    """Forbid the samples to generate some tokens.
+
+    The tokens are converted to a boolean table with shape (batch_size * beam_size, V) when the
+    sampler starts, so each step only applies the table.
+
+    Parameters
+    ----------
+    vocab_size
+        The size of the vocabulary
+    banned_ids
+        The tokens that are forbidden for all the samples
+
+    Inputs of each call:
+
+    - banned_ids : mx.np.ndarray, optional
+        The tokens that are forbidden for each sample, padded with -1. It overrides the
+        banned_ids of the processor. Shape (batch_size, M)
+    """
+    def __init__(self, vocab_size: int, banned_ids: Optional[List[int]] = None):
+        self._vocab_size = vocab_size
+        self._banned_ids = banned_ids
+
+    @property
+    def state_batch_axis(self):
+        return [IndirectBatchAxis(0)]
+
+    def init_states(self, batch_size, beam_size, ctx, banned_ids=None):
+        if banned_ids is None:
+            if self._banned_ids is None:
+                raise ValueError('banned_ids must be given to the processor or in '
+                                 'processor_inputs.')
+            banned_ids = mx.np.array([self._banned_ids] * batch_size, dtype=mx.np.int32,
+                                     ctx=ctx)
+        banned_ids = mx.np.array(banned_ids, dtype=mx.np.int32, ctx=ctx)
+        table = _gen_token_mask(banned_ids, mx.np.zeros((batch_size, self._vocab_size), ctx=ctx))
+        return [_expand_to_beam_size(table, beam_size=beam_size, batch_size=batch_size)]
+
+    def __call__(self, outputs, step, states):
+        return _mask_outputs(outputs, states[0])
+
+
+class NGramBlockingLogitsProcessor(BaseLogitsProcessor):
+    """Forbid the samples to repeat any n-gram.
+
+    Each beam keeps the hash of its last n - 1 tokens, which is updated incrementally in each
+    step, and the (hash of the first n - 1 tokens, the last token) of the n-gram that it
+    generates in each step. The n-grams are written by the step into buffers with max_length
+    columns, which are allocated when the sampler starts, so the shapes of the states do not
+    change across the steps. In each step, the last tokens of the n-grams whose hashes match the
+    last n - 1 tokens of the beam are forbidden. The hash encodes the n - 1 tokens exactly as
+    a number in base vocab_size + 1. The initial input of the sampler is not included in the
+    n-grams.
+
+    Parameters
+    ----------
+    ngram_size
+        The size of the n-grams that cannot be repeated
+    vocab_size
+        The size of the vocabulary
+    max_length
+        The number of the n-grams kept by each beam. It must be at least the number of the steps
+        of the sampler, otherwise the n-grams of the later steps are not blocked.
+    """
+    def __init__(self, ngram_size: int, vocab_size: int, max_length: int = 200):
+        assert ngram_size > 0, 'ngram_size must be positive. Received {}'.format(ngram_size)
+        assert max_length > 0, 'max_length must be positive. Received {}'.format(max_length)
+        self._ngram_size = ngram_size
+        self._max_length = max_length
+        self._base = vocab_size + 1
+        if self._base ** (ngram_size - 1) >= 2 ** 62:
+            raise ValueError('The hash of {} tokens in a vocabulary of size {} does not fit in '
+                             'int64.'.format(ngram_size - 1, vocab_size))
+        # The hash of the last n - 2 tokens is the residual of the modulus
+        self._modulus = self._base ** max(ngram_size - 2, 0)
+
+    @property
+    def state_batch_axis(self):
+        return [0, 0, 0]
+
+    def init_states(self, batch_size, beam_size, ctx):
+        num_beams = batch_size * beam_size
+        # The empty positions have the hash of -1, which never matches
+        return [mx.np.zeros((num_beams,), dtype=mx.np.int64, ctx=ctx),
+                mx.np.full((num_beams, self._max_length), -1, dtype=mx.np.int64, ctx=ctx),
+                mx.np.full((num_beams, self._max_length), -1, dtype=mx.np.int32, ctx=ctx)]
+
+    def __call__(self, outputs, step, states):
+        last_hash, ngram_hashes, ngram_last_ids = states
+        matched = ngram_hashes == mx.np.expand_dims(last_hash, axis=1)
+        banned_ids = mx.np.where(matched, ngram_last_ids, mx.np.full_like(ngram_last_ids, -1))
+        return _mask_outputs(outputs, _gen_token_mask(banned_ids, outputs))
+
+    def update_states(self, states, word_ids, step):
+        last_hash, ngram_hashes, ngram_last_ids = states
+        word_ids = word_ids.astype(mx.np.int32)
+        valid = word_ids >= 0
+        # The last hash covers n - 1 tokens after n - 1 steps
+        complete = mx.np.logical_and(
+            valid, mx.np.zeros_like(word_ids).astype(mx.np.float32) + step >= self._ngram_size)
+        # Write the n-gram of the step into its position. Shape (1, max_length)
+        position = mx.np.expand_dims(mx.npx.one_hot(step - 1, self._max_length) > 0, axis=0)
+        ngram_hashes = mx.np.where(position, mx.np.expand_dims(last_hash, axis=1), ngram_hashes)
+        ngram_last_ids = mx.np.where(
+            position,
+            mx.np.expand_dims(mx.np.where(complete, word_ids, mx.np.full_like(word_ids, -1)),
+                              axis=1),
+            ngram_last_ids)
+        if self._ngram_size > 1:
+            new_hash = mx.np.mod(last_hash, self._modulus) * self._base\
+                + (word_ids + 1).astype(mx.np.int64)
+            last_hash = mx.np.where(valid, new_hash, last_hash)
+        return [last_hash, ngram_hashes, ngram_last_ids]
+
+
+class LexicalConstraintLogitsProcessor(BaseLogitsProcessor):
+    """Make the samples include the given phrases, e.g., the translations of the terminology.
+
+    - A beam cannot generate the EOS token until it includes all of its constraints.
+    - Once a beam generates the first token of a constraint that it does not include yet, the
+      remaining tokens of the constraint are forced, so the multi-token phrases are kept intact.
+    - The first tokens of the unmet constraints get a bonus in the outputs.
+
+    Parameters
+    ----------
+    eos_id
+        The id of the EOS token
+    bonus
+        The bonus added to the outputs of the first tokens of the unmet constraints
+
+    Inputs of each call:
+
+    - constraints : mx.np.ndarray
+        The tokens of the constraints of each sample, padded with -1.
+        Shape (batch_size, num_constraints, max_constraint_length)
+    """
+    def __init__(self, eos_id: Optional[int] = None, bonus: float = 0.0):
+        self._eos_id = eos_id
+        self._bonus = bonus
+
+    @property
+    def state_batch_axis(self):
+        # constraints, constraint_lengths, met, current, position
+        return [IndirectBatchAxis(0), IndirectBatchAxis(0), 0, 0, 0]
+
+    def init_states(self, batch_size, beam_size, ctx, constraints=None):
+        if constraints is None:
+            raise ValueError('The constraints must be given in processor_inputs.')
+        constraints = mx.np.array(constraints, dtype=mx.np.int32, ctx=ctx)
+        lengths = mx.np.sum((constraints >= 0).astype(mx.np.float32), axis=2)
+        num_beams = batch_size * beam_size
+        num_constraints = constraints.shape[1]
+        return [_expand_to_beam_size(constraints, beam_size=beam_size, batch_size=batch_size),
+                _expand_to_beam_size(lengths, beam_size=beam_size, batch_size=batch_size),
+                mx.np.zeros((num_beams, num_constraints), dtype=mx.np.float32, ctx=ctx),
+                mx.np.full((num_beams,), -1, dtype=mx.np.float32, ctx=ctx),
+                mx.np.zeros((num_beams,), dtype=mx.np.float32, ctx=ctx)]
+
+    def _unmet(self, lengths, met):
+        return mx.np.logical_and(met == 0, lengths > 0)
+
+    def __call__(self, outputs, step, states):
+        constraints, lengths, met, current, position = states
+        num_constraints = lengths.shape[1]
+        in_progress = mx.np.expand_dims(current >= 0, axis=1)
+        # The forced token of the constraint in progress
+        current_constraint = mx.np.sum(
+            mx.np.expand_dims(mx.npx.one_hot(current, num_constraints), axis=2)
+            * constraints.astype(mx.np.float32), axis=1)
+        forced_ids = mx.npx.pick(current_constraint, position, axis=1, mode='clip')
+        forced_outputs = _mask_outputs(
+            outputs, mx.npx.one_hot(forced_ids, outputs.shape[-1]) == 0)
+        # Encourage the unmet constraints and forbid EOS
+        unmet = self._unmet(lengths, met)
+        free_outputs = outputs
+        if self._bonus != 0.0:
+            first_ids = mx.np.where(unmet, constraints[:, :, 0],
+                                    mx.np.full_like(constraints[:, :, 0], -1))
+            free_outputs = free_outputs\
+                + self._bonus * _gen_token_mask(first_ids, outputs).astype(outputs.dtype)
+        if self._eos_id is not None:
+            is_eos = mx.npx.arange_like(outputs, axis=1) == self._eos_id
+            free_outputs = _mask_outputs(free_outputs, mx.np.logical_and(
+                mx.np.expand_dims(mx.np.sum(unmet.astype(mx.np.float32), axis=1) > 0, axis=1),
+                mx.np.expand_dims(is_eos, axis=0)))
+        return mx.np.where(in_progress, forced_outputs, free_outputs)
+
+    def update_states(self, states, word_ids, step):
+        constraints, lengths, met, current, position = states
+        num_constraints = lengths.shape[1]
+        word_ids = word_ids.astype(mx.np.float32)
+        valid = word_ids >= 0
+        in_progress = mx.np.logical_and(current >= 0, valid)
+        # Advance the constraint in progress
+        current_onehot = mx.npx.one_hot(current, num_constraints)
+        current_length = mx.np.sum(current_onehot * lengths, axis=1)
+        finished = mx.np.logical_and(in_progress, position + 1 >= current_length)
+        # Start an unmet constraint if its first token is chosen
+        matched = mx.np.logical_and(
+            mx.np.logical_and(self._unmet(lengths, met),
+                              constraints[:, :, 0].astype(mx.np.float32)
+                              == mx.np.expand_dims(word_ids, axis=1)),
+            mx.np.expand_dims(mx.np.logical_and(current < 0, valid), axis=1))
+        has_matched = mx.np.sum(matched.astype(mx.np.float32), axis=1) > 0
+        matched_id = mx.np.argmax(matched.astype(mx.np.float32), axis=1).astype(mx.np.float32)
+        matched_onehot = mx.npx.one_hot(matched_id, num_constraints)
+        matched_length = mx.np.sum(matched_onehot * lengths, axis=1)
+        start_single = mx.np.logical_and(has_matched, matched_length == 1)
+        start_multi = mx.np.logical_and(has_matched, matched_length > 1)
+        met = mx.np.maximum(met, mx.np.maximum(
+            current_onehot * mx.np.expand_dims(finished, axis=1),
+            matched_onehot * mx.np.expand_dims(start_single, axis=1)))
+        position = mx.np.where(in_progress, position + 1,
+                               mx.np.where(start_multi, mx.np.ones_like(position), position))
+        current = mx.np.where(finished, mx.np.full_like(current, -1),
+                              mx.np.where(start_multi, matched_id, current))
+        return [constraints, lengths, met, current, position]
+
+
+def _apply_logits_processors(processors, outputs, step, processor_states):
+    for processor, states in zip(processors, processor_states):
+        outputs = processor(outputs, step, states)
+    return outputs
+
+
+def _update_logits_processors(processors, processor_states, word_ids, step):
+    return [processor.update_states(states, word_ids, step)
+            for processor, states in zip(processors, processor_states)]
+
+
 def _expand_to_beam_size(data, beam_size, batch_size, state_batch_axis=None):
     """Tile all the states to have batch_size * beam_size on the batch axis.
 
@@ -202,7 +596,7 @@ def _expand_to_beam_size(data, beam_size, batch_size, state_batch_axis=None):
         raise NotImplementedError
 
 
-def _choose_states(states, indices, state_batch_axis=None):
+def _choose_states(states, indices, state_batch_axis=None, include_indirect=False):
     """
 
     Parameters
@@ -213,6 +607,10 @@ def _choose_states(states, indices, state_batch_axis=None):
     state_batch_axis
         Descriptors for states, it is generated from decoder's ``state_batch_axis``.
         When None, this method assumes that the batch axis is the first dimension.
+        The states with :class:`IndirectBatchAxis` are returned as is.
+    include_indirect
+        Whether to also take the states with :class:`IndirectBatchAxis`, e.g., when the
+        batch rows are dropped instead of the beams being reordered.
 
     Returns
     -------
@@ -221,16 +619,20 @@ def _choose_states(states, indices, state_batch_axis=None):
     """
     if isinstance(states, (list, tuple)):
         if state_batch_axis is not None:
-            return [_choose_states(d, indices, b_axis)
+            return [_choose_states(d, indices, b_axis, include_indirect)
                     for d, b_axis in zip(states, state_batch_axis)]
         else:
-            return [_choose_states(d, indices, None) for d in states]
+            return [_choose_states(d, indices, None, include_indirect) for d in states]
     elif isinstance(states, dict):
         if state_batch_axis is not None:
-            return {k: _choose_states(v, indices, state_batch_axis[k]) for k, v in states.items()}
+            return {k: _choose_states(v, indices, state_batch_axis[k], include_indirect)
+                    for k, v in states.items()}
         else:
-            return {k: _choose_states(v, indices, None) for k, v in states.items()}
+            return {k: _choose_states(v, indices, None, include_indirect)
+                    for k, v in states.items()}
     elif isinstance(states, mx.np.ndarray):
+        if isinstance(state_batch_axis, IndirectBatchAxis) and not include_indirect:
+            return states
         if state_batch_axis is None:
             batch_axis = 0
         else:
@@ -241,9 +643,112 @@ def _choose_states(states, indices, state_batch_axis=None):
         raise TypeError('The type of the states is not supported, type(states) = {}'.format(type(states)))
 
 
+def _alloc_state_pool(states, num_slots, state_batch_axis=None):
+    """Allocate the zero states that have num_slots on the batch axis.
+
+    Parameters
+    ----------
+    states : Object contains mx.np.ndarray
+        The states of a single sample, i.e., the size of the batch axis is 1.
+    num_slots : int
+        The number of slots in the pool
+    state_batch_axis
+        Descriptors for states, it is generated from decoder's ``state_batch_axis``.
+        When None, this method assumes that the batch axis is the first dimension.
+
+    Returns
+    -------
+    pool : Object contains mx.np.ndarray
+        Each mx.np.ndarray has shape num_slots on the batch axis.
+    """
+    if isinstance(states, (list, tuple)):
+        if state_batch_axis is not None:
+            return [_alloc_state_pool(d, num_slots, b_axis)
+                    for d, b_axis in zip(states, state_batch_axis)]
+        else:
+            return [_alloc_state_pool(d, num_slots, None) for d in states]
+    elif isinstance(states, dict):
+        if state_batch_axis is not None:
+            return {k: _alloc_state_pool(v, num_slots, state_batch_axis[k])
+                    for k, v in states.items()}
+        else:
+            return {k: _alloc_state_pool(v, num_slots, None) for k, v in states.items()}
+    elif isinstance(states, mx.np.ndarray):
+        batch_axis = 0 if state_batch_axis is None else state_batch_axis
+        shape = states.shape[:batch_axis] + (num_slots,) + states.shape[(batch_axis + 1):]
+        return mx.np.zeros(shape, dtype=states.dtype, ctx=states.ctx)
+    elif states is None:
+        return None
+    else:
+        raise TypeError('The type of the states is not supported, type(states) = {}'
+                        .format(type(states)))
+
+
+def _insert_states(pool, states, slot, state_batch_axis=None):
+    """Write the states of a single sample to a slot of the pool in-place.
+
+    Parameters
+    ----------
+    pool : Object contains mx.np.ndarray
+        The pool of the states, which is generated by :func:`_alloc_state_pool` or the decoder.
+    states : Object contains mx.np.ndarray
+        The states of a single sample, i.e., the size of the batch axis is 1.
+    slot : int
+        The slot to write
+    state_batch_axis
+        Descriptors for states, it is generated from decoder's ``state_batch_axis``.
+        When None, this method assumes that the batch axis is the first dimension.
+    """
+    if isinstance(states, (list, tuple)):
+        if state_batch_axis is not None:
+            for p, d, b_axis in zip(pool, states, state_batch_axis):
+                _insert_states(p, d, slot, b_axis)
+        else:
+            for p, d in zip(pool, states):
+                _insert_states(p, d, slot, None)
+    elif isinstance(states, dict):
+        for k, v in states.items():
+            _insert_states(pool[k], v, slot,
+                           None if state_batch_axis is None else state_batch_axis[k])
+    elif isinstance(states, mx.np.ndarray):
+        batch_axis = 0 if state_batch_axis is None else state_batch_axis
+        if states.shape[batch_axis] != 1 or\
+                states.shape[:batch_axis] != pool.shape[:batch_axis] or\
+                states.shape[(batch_axis + 1):] != pool.shape[(batch_axis + 1):]:
+            raise ValueError('The states of a sample must have the same shape as a slot of the '
+                             'pool, i.e., the shape should be {} except for the batch axis {}, '
+                             'which has size 1. Received shape={}. The states of all samples need '
+                             'to have the same shape, e.g., by padding the inputs to a fixed '
+                             'length and preallocating the caches of the decoder.'
+                             .format(pool.shape, batch_axis, states.shape))
+        pool[(slice(None),) * batch_axis + (slice(slot, slot + 1),)] = states
+    elif states is None:
+        return
+    else:
+        raise TypeError('The type of the states is not supported, type(states) = {}'
+                        .format(type(states)))
+
+
+def _get_states_ctx(states):
+    """Get the context of the first mx.np.ndarray in the states"""
+    if isinstance(states, (list, tuple)):
+        leaves = states
+    elif isinstance(states, dict):
+        leaves = states.values()
+    elif isinstance(states, mx.np.ndarray):
+        return states.ctx
+    else:
+        leaves = []
+    for ele in leaves:
+        ctx = _get_states_ctx(ele)
+        if ctx is not None:
+            return ctx
+    return None
+
+
 class _BeamSearchStepUpdate(HybridBlock):
     def __init__(self, beam_size, vocab_size, eos_id, scorer, state_batch_axis,
-                 stochastic=False):
+                 stochastic=False, logits_processors=None):
         """
 
         Parameters
@@ -254,6 +759,7 @@ class _BeamSearchStepUpdate(HybridBlock):
         scorer : BeamSearchScorer
         state_batch_axis :
         stochastic: bool
+        logits_processors : list of BaseLogitsProcessor or None
         prefix : None
         params : None
         """
@@ -264,6 +770,9 @@ class _BeamSearchStepUpdate(HybridBlock):
         self._scorer = scorer
         self._state_batch_axis = state_batch_axis
         self.stochastic = stochastic
+        self._logits_processors = [] if logits_processors is None else logits_processors
+        self._processor_state_batch_axis = [ele.state_batch_axis
+                                            for ele in self._logits_processors]
         self.activation = get_activation('relu')
         assert eos_id is None or eos_id >= 0, 'eos_id cannot be negative! Received eos_id={}'.format(eos_id)
 
@@ -300,7 +809,7 @@ class _BeamSearchStepUpdate(HybridBlock):
         return T_ - self.activation(u) - mx.np.log1p(mx.np.exp(-mx.np.abs(u)))
 
     def forward(self, samples, valid_length, outputs, scores, step, beam_alive_mask,   # pylint: disable=arguments-differ
-                states, batch_shift):
+                states, batch_shift, processor_states=None):
         """
 
         Parameters
@@ -328,6 +837,9 @@ class _BeamSearchStepUpdate(HybridBlock):
         batch_shift : mx.np.ndarray
             Contains [0, beam_size, 2 * beam_size, ..., (batch_size - 1) * beam_size].
             Shape (batch_size,)
+        processor_states : list or None
+            The states of the logits processors. It is only given if there are logits
+            processors.
 
         Returns
         -------
@@ -345,9 +857,14 @@ class _BeamSearchStepUpdate(HybridBlock):
             Shape (batch_size, beam_size)
         new_states : nested structure of mx.np.ndarray
             Inner mx.np.ndarrays have shape (batch_size * beam_size, ...)
+        new_processor_states : list
+            Only returned if processor_states is given
         """
         beam_size = self._beam_size
         vocab_size = self._vocab_size
+        if processor_states is not None:
+            outputs = _apply_logits_processors(self._logits_processors, outputs, step,
+                                               processor_states)
         beam_alive_mask_bcast = mx.np.expand_dims(beam_alive_mask, axis=2)
         candidate_scores = self._scorer(mx.npx.reshape(outputs, (-6, -1, beam_size, -2)),
                                         scores, step)
@@ -405,10 +922,122 @@ class _BeamSearchStepUpdate(HybridBlock):
                               .reshape((-1, beam_size))
         if self._eos_id is not None:
             beam_alive_mask = beam_alive_mask * (chosen_word_ids != self._eos_id).astype(mx.np.float32)
+        if processor_states is not None:
+            processor_states = _choose_states(processor_states, batch_beam_indices.reshape((-1,)),
+                                              self._processor_state_batch_axis)
+            processor_states = _update_logits_processors(self._logits_processors,
+                                                         processor_states,
+                                                         chosen_word_ids.reshape((-1,)), step)
+            return new_samples, new_valid_length, new_scores, chosen_word_ids,\
+                beam_alive_mask, new_states, processor_states
         return new_samples, new_valid_length, new_scores, chosen_word_ids,\
                beam_alive_mask, new_states
 
 
+class _BeamSearchStep(HybridBlock):
+    def __init__(self, decoder, updater):
+        """One step of the beam search, i.e., the decoder + the step update, as a single block
+
+        Parameters
+        ----------
+        decoder
+            The step decoder
+        updater
+            _BeamSearchStepUpdate or _MultinomialStepUpdate
+        """
+        super().__init__()
+        self._decoder = decoder
+        self._updater = updater
+
+    def forward(self, step_input, states, samples,  # pylint: disable=arguments-differ
+                valid_length, scores, step, beam_alive_mask, batch_shift,
+                processor_states=None):
+        """
+
+        Parameters
+        ----------
+        step_input
+            Shape (batch_size * beam_size,)
+        states
+            The states of the decoder
+        samples
+            Shape (batch_size, beam_size, L)
+        valid_length
+            Shape (batch_size, beam_size)
+        scores
+            Shape (batch_size, beam_size)
+        step
+            The previous step. Shape ()
+        beam_alive_mask
+            Shape (batch_size, beam_size)
+        batch_shift
+            Shape (batch_size,)
+        processor_states
+            The states of the logits processors, if there are any
+
+        Returns
+        -------
+        new_step_input
+            Shape (batch_size * beam_size,)
+        new_states
+        new_samples
+            Shape (batch_size, beam_size, L + 1)
+        new_valid_length
+            Shape (batch_size, beam_size)
+        new_scores
+            Shape (batch_size, beam_size)
+        new_step
+            Shape ()
+        beam_alive_mask
+            Shape (batch_size, beam_size)
+        new_processor_states
+            Only returned if processor_states is given
+        """
+        log_probs, new_states = self._decoder(step_input, states)
+        step = step + 1
+        if processor_states is not None:
+            samples, valid_length, scores, chosen_word_ids, beam_alive_mask, new_states,\
+                processor_states = self._updater(samples, valid_length, log_probs, scores, step,
+                                                 beam_alive_mask, new_states, batch_shift,
+                                                 processor_states)
+            step_input = mx.npx.relu(chosen_word_ids).reshape((-1,))
+            return step_input, new_states, samples, valid_length, scores, step,\
+                beam_alive_mask, processor_states
+        samples, valid_length, scores, chosen_word_ids, beam_alive_mask, new_states = \
+            self._updater(samples, valid_length, log_probs, scores, step, beam_alive_mask,
+                          new_states, batch_shift)
+        step_input = mx.npx.relu(chosen_word_ids).reshape((-1,))
+        return step_input, new_states, samples, valid_length, scores, step, beam_alive_mask
+
+
+def _merge_finished_rows(finished_rows, length):
+    """Merge the rows that are dropped from the batch at different steps.
+
+    Parameters
+    ----------
+    finished_rows : list
+        Each element contains the original indices of the rows and their samples, scores and
+        valid_length.
+    length : int
+        The samples are padded with -1 to the length.
+
+    Returns
+    -------
+    samples, scores, valid_length in the original order of the rows
+    """
+    ctx = finished_rows[0][1].ctx
+    row_indices = np.concatenate([ele[0] for ele in finished_rows])
+    samples = mx.np.concatenate(
+        [mx.np.concatenate([ele[1], mx.np.full(ele[1].shape[:2] + (length - ele[1].shape[2],),
+                                               -1, ctx=ctx, dtype=mx.np.int32)], axis=2)
+         for ele in finished_rows], axis=0)
+    scores = mx.np.concatenate([ele[2] for ele in finished_rows], axis=0)
+    valid_length = mx.np.concatenate([ele[3] for ele in finished_rows], axis=0)
+    order = mx.np.array(np.argsort(row_indices), ctx=ctx, dtype=mx.np.int32)
+    return mx.np.take(samples, order, axis=0), mx.np.take(scores, order, axis=0),\
+        mx.np.take(valid_length, order, axis=0)
+
+
 class BeamSearchSampler(HybridBlock):
     r"""Draw samples from the decoder by beam search.
 
@@ -460,6 +1089,25 @@ class BeamSearchSampler(HybridBlock):
         Whether to return when all beams are dead.
         Without early_return, the sequences will be generated until the
         maximum length is reached.
+    early_return_interval
+        Check whether all beams are dead every `early_return_interval` steps. Each check
+        synchronizes the device with the host, so a larger interval lets the device run the
+        steps back to back, at the cost of at most `early_return_interval - 1` extra steps, whose
+        samples are padded with -1 and are excluded by the valid length.
+    fuse_step
+        Whether to hybridize the decoder and the step update as a single graph. The decoder
+        should be hybridizable. It is not supported by the stochastic beam search.
+    compact_interval
+        If it is not None, drop the rows of the batch whose beams are all dead from the states
+        every `compact_interval` steps, so the cost of the decoder scales with the number of
+        the live rows. The results are returned in the original order. Each compaction
+        synchronizes the device with the host.
+    logits_processors
+        The processors that modify the outputs of the decoder in each step, which are applied
+        in order, e.g., :class:`ForcedPrefixLogitsProcessor`,
+        :class:`BannedTokensLogitsProcessor`, :class:`NGramBlockingLogitsProcessor` and
+        :class:`LexicalConstraintLogitsProcessor`. The inputs of the processors in each call
+        are given by `processor_inputs`.
     """
     def __init__(self, beam_size: int,
                  decoder: BaseStepDecoder,
@@ -474,7 +1122,11 @@ class BeamSearchSampler(HybridBlock):
                  sampling: bool = False,
                  sampling_topp: float = -1.0,
                  sampling_topk: int = -1,
-                 early_return: bool = True):
+                 early_return: bool = True,
+                 early_return_interval: int = 1,
+                 fuse_step: bool = False,
+                 compact_interval: Optional[int] = None,
+                 logits_processors: Optional[List[BaseLogitsProcessor]] = None):
         super().__init__()
         self._beam_size = beam_size
         self._vocab_size = vocab_size
@@ -498,6 +1150,18 @@ class BeamSearchSampler(HybridBlock):
         self._sampling_topp = sampling_topp
         self._sampling_topk = sampling_topk
         self._early_return = early_return
+        assert early_return_interval > 0,\
+            'early_return_interval must be positive. Received {}'.format(early_return_interval)
+        self._early_return_interval = early_return_interval
+        self._fuse_step = fuse_step
+        assert compact_interval is None or compact_interval > 0,\
+            'compact_interval must be positive. Received {}'.format(compact_interval)
+        self._compact_interval = compact_interval
+        if fuse_step and stochastic:
+            raise ValueError('fuse_step is not supported by the stochastic beam search.')
+        self._logits_processors = [] if logits_processors is None else list(logits_processors)
+        self._processor_state_batch_axis = [ele.state_batch_axis
+                                            for ele in self._logits_processors]
         if sampling:
             self._updater = _MultinomialStepUpdate(
                 beam_size=beam_size,
@@ -506,7 +1170,8 @@ class BeamSearchSampler(HybridBlock):
                 state_batch_axis=decoder.state_batch_axis,
                 sampling_topp=sampling_topp,
                 sampling_topk=sampling_topk,
-                temperature=temperature
+                temperature=temperature,
+                logits_processors=self._logits_processors
             )
         else:
             self._updater = _BeamSearchStepUpdate(
@@ -515,10 +1180,14 @@ class BeamSearchSampler(HybridBlock):
                 eos_id=eos_id,
                 scorer=scorer,
                 state_batch_axis=decoder.state_batch_axis,
-                stochastic=stochastic
+                stochastic=stochastic,
+                logits_processors=self._logits_processors
             )
 
-        if not stochastic:
+        if fuse_step:
+            self._step = _BeamSearchStep(decoder, self._updater)
+            self._step.hybridize()
+        elif not stochastic:
             self._updater.hybridize()
         else:
             if isinstance(scorer, BeamSearchScorer):
@@ -526,7 +1195,7 @@ class BeamSearchSampler(HybridBlock):
                     warnings.warn(
                         'To use stochastic beam search, we need to set the alpha as 0.0')
 
-    def forward(self, inputs, states, src_seq_lengths=None):
+    def forward(self, inputs, states, src_seq_lengths=None, processor_inputs=None):
         """Sample by beam search.
 
         Parameters
@@ -537,6 +1206,9 @@ class BeamSearchSampler(HybridBlock):
             The initial states of the decoder.
         src_seq_lengths : mx.np.ndarray
             The source sequence lengths. Shape is (batch_size,).
+        processor_inputs : list of dict
+            The keyword arguments of `init_states` of each logits processor, e.g., the prefixes
+            of the samples for :class:`ForcedPrefixLogitsProcessor`.
 
         Returns
         -------
@@ -568,6 +1240,7 @@ class BeamSearchSampler(HybridBlock):
                                       state_batch_axis=self._state_batch_axis)
         step_input = _expand_to_beam_size(inputs, beam_size=beam_size,
                                           batch_size=batch_size).astype(mx.np.int32)
+        processor_args = self._init_processor_args(batch_size, ctx, processor_inputs)
         # All beams are initialized to alive
         # Generated samples are initialized to be the inputs
         # Except the first beam where the scores are set to be zero, all beams have -inf scores.
@@ -580,29 +1253,134 @@ class BeamSearchSampler(HybridBlock):
         samples = step_input.reshape((batch_size, beam_size, 1))
         batch_shift = mx.np.arange(0, batch_size * beam_size, beam_size, ctx=ctx, dtype=mx.np.int32)
         step = mx.np.array(0, ctx=ctx, dtype=mx.np.float32)
+        # The original indices of the rows in the current batch, and the rows that are dropped
+        # from the batch by the compaction
+        batch_indices = np.arange(batch_size)
+        finished_rows = []
+        all_dead = False
+        # Whether all the rows have been moved to finished_rows by the compaction
+        all_compacted = False
         for i in range(max_length):
-            log_probs, new_states = self._decoder(step_input, states)
-            assert log_probs.shape[1] == self._vocab_size
-            step = step + 1
-            samples, valid_length, scores, chosen_word_ids, beam_alive_mask, states = \
-                self._updater(samples, valid_length, log_probs, scores, step, beam_alive_mask,
-                              new_states, batch_shift)
-            step_input = mx.npx.relu(chosen_word_ids).reshape((-1,))
-            if self._early_return:
+            if self._fuse_step:
+                step_outputs = self._step(step_input, states, samples, valid_length, scores,
+                                          step, beam_alive_mask, batch_shift, *processor_args)
+                step_input, states, samples, valid_length, scores, step, beam_alive_mask = \
+                    step_outputs[:7]
+                processor_args = tuple(step_outputs[7:])
+            else:
+                log_probs, new_states = self._decoder(step_input, states)
+                assert log_probs.shape[1] == self._vocab_size
+                step = step + 1
+                step_outputs = self._updater(samples, valid_length, log_probs, scores, step,
+                                             beam_alive_mask, new_states, batch_shift,
+                                             *processor_args)
+                samples, valid_length, scores, chosen_word_ids, beam_alive_mask, states = \
+                    step_outputs[:6]
+                processor_args = tuple(step_outputs[6:])
+                step_input = mx.npx.relu(chosen_word_ids).reshape((-1,))
+            if self._compact_interval is not None and (i + 1) % self._compact_interval == 0\
+                    and i + 1 < max_length:
+                # Drop the rows whose beams are all dead
+                row_alive = (mx.np.sum(beam_alive_mask, axis=1) > 0).asnumpy()
+                if not row_alive.all():
+                    dead_rows = mx.np.array(np.nonzero(~row_alive)[0], ctx=ctx,
+                                            dtype=mx.np.int32)
+                    finished_rows.append((batch_indices[~row_alive],
+                                          mx.np.take(samples, dead_rows, axis=0),
+                                          mx.np.take(scores, dead_rows, axis=0),
+                                          mx.np.take(valid_length, dead_rows, axis=0)))
+                    if not row_alive.any():
+                        all_dead = True
+                        all_compacted = True
+                        break
+                    batch_indices, samples, scores, valid_length, beam_alive_mask, step_input,\
+                        states, processor_args = self._keep_rows(
+                            row_alive, batch_indices, samples, scores, valid_length,
+                            beam_alive_mask, step_input, states, processor_args)
+                    batch_shift = mx.np.arange(0, len(batch_indices) * beam_size, beam_size,
+                                               ctx=ctx, dtype=mx.np.int32)
+            if self._early_return and (i + 1) % self._early_return_interval == 0:
                 if mx.np.sum(beam_alive_mask).asnumpy() == 0:
-                    return samples, scores, valid_length
-        beam_alive_mask = beam_alive_mask.astype(mx.np.int32)
-        if self._eos_id is not None:
-            final_word = mx.np.where(beam_alive_mask,
-                                     mx.np.full((batch_size, beam_size), self._eos_id,
-                                                ctx=ctx, dtype=mx.np.int32),
-                                     mx.np.full((batch_size, beam_size), -1, ctx=ctx, dtype=mx.np.int32))
-            samples = mx.np.concatenate([samples,
-                                         final_word.reshape((final_word.shape[0],
-                                                             final_word.shape[1], 1))],
-                                        axis=2)
-            valid_length = valid_length + beam_alive_mask
-        return samples, scores, valid_length
+                    all_dead = True
+                    break
+        if not all_dead:
+            beam_alive_mask = beam_alive_mask.astype(mx.np.int32)
+            if self._eos_id is not None:
+                final_word = mx.np.where(beam_alive_mask,
+                                         mx.np.full(beam_alive_mask.shape, self._eos_id,
+                                                    ctx=ctx, dtype=mx.np.int32),
+                                         mx.np.full(beam_alive_mask.shape, -1, ctx=ctx,
+                                                    dtype=mx.np.int32))
+                samples = mx.np.concatenate([samples,
+                                             final_word.reshape((final_word.shape[0],
+                                                                 final_word.shape[1], 1))],
+                                            axis=2)
+                valid_length = valid_length + beam_alive_mask
+        if not finished_rows:
+            return samples, scores, valid_length
+        # Restore the original order of the rows
+        if not all_compacted:
+            finished_rows.append((batch_indices, samples, scores, valid_length))
+        if all_dead and self._early_return:
+            length = max(ele[1].shape[2] for ele in finished_rows)
+        else:
+            length = max_length + 1 + (self._eos_id is not None)
+        return _merge_finished_rows(finished_rows, length)
+
+    def _init_processor_args(self, batch_size, ctx, processor_inputs):
+        """Initialize the states of the logits processors, which are passed to the step update
+        as the extra arguments. They are empty if there are no logits processors.
+        """
+        if not self._logits_processors:
+            if processor_inputs is not None:
+                raise ValueError('processor_inputs is given but there are no logits_processors.')
+            return ()
+        if processor_inputs is None:
+            processor_inputs = [dict() for _ in self._logits_processors]
+        if len(processor_inputs) != len(self._logits_processors):
+            raise ValueError('The number of processor_inputs must be the same as the number '
+                             'of logits_processors, {}. Received {}'
+                             .format(len(self._logits_processors), len(processor_inputs)))
+        processor_states = [processor.init_states(batch_size, self._beam_size, ctx, **kwargs)
+                            for processor, kwargs in zip(self._logits_processors,
+                                                         processor_inputs)]
+        return (processor_states,)
+
+    def _keep_rows(self, row_alive, batch_indices, samples, scores, valid_length,
+                   beam_alive_mask, step_input, states, processor_args):
+        """Keep the rows of the batch that have alive beams, i.e., compact the batch.
+
+        Parameters
+        ----------
+        row_alive : np.ndarray
+            Whether each row has alive beams. Shape (batch_size,)
+
+        Returns
+        -------
+        The alive rows of batch_indices, samples, scores, valid_length, beam_alive_mask,
+        step_input, states and processor_args
+        """
+        ctx = samples.ctx
+        beam_size = self._beam_size
+        alive_rows = np.nonzero(row_alive)[0]
+        batch_indices = batch_indices[alive_rows]
+        alive_beams = mx.np.array((alive_rows[:, None] * beam_size
+                                   + np.arange(beam_size)).reshape((-1,)),
+                                  ctx=ctx, dtype=mx.np.int32)
+        alive_rows = mx.np.array(alive_rows, ctx=ctx, dtype=mx.np.int32)
+        samples = mx.np.take(samples, alive_rows, axis=0)
+        scores = mx.np.take(scores, alive_rows, axis=0)
+        valid_length = mx.np.take(valid_length, alive_rows, axis=0)
+        beam_alive_mask = mx.np.take(beam_alive_mask, alive_rows, axis=0)
+        step_input = mx.np.take(step_input, alive_beams, axis=0)
+        states = _choose_states(states, alive_beams, self._state_batch_axis,
+                                include_indirect=True)
+        processor_args = tuple(_choose_states(ele, alive_beams,
+                                              self._processor_state_batch_axis,
+                                              include_indirect=True)
+                               for ele in processor_args)
+        return batch_indices, samples, scores, valid_length, beam_alive_mask, step_input,\
+            states, processor_args
 
     def __repr__(self):
         ret = '{name}:(\n' \
@@ -615,6 +1393,10 @@ class BeamSearchSampler(HybridBlock):
               '  sampling={sampling}\n' \
               '  sampling_topp={sampling_topp}\n' \
               '  sampling_topk={sampling_topk}\n' \
+              '  early_return_interval={early_return_interval}\n' \
+              '  fuse_step={fuse_step}\n' \
+              '  compact_interval={compact_interval}\n' \
+              '  logits_processors={logits_processors}\n' \
               ')' \
             .format(name=self.__class__.__name__,
                     beam_size=self._beam_size,
@@ -625,13 +1407,65 @@ class BeamSearchSampler(HybridBlock):
                     scorer=self._scorer,
                     sampling=self._sampling,
                     sampling_topp=self._sampling_topp,
-                    sampling_topk=self._sampling_topk)
+                    sampling_topk=self._sampling_topk,
+                    early_return_interval=self._early_return_interval,
+                    fuse_step=self._fuse_step,
+                    compact_interval=self._compact_interval,
+                    logits_processors=[processor.__class__.__name__
+                                       for processor in self._logits_processors])
         return ret
 
+
+def _get_sampling_candidates(probs, sampling_topp=-1.0, sampling_topk=-1):
+    """Select the candidates of the top-p or top-k sampling and renormalize their probabilities.
+
+    Instead of masking the whole vocabulary, only the candidates are selected with a partial
+    top-k, so that the sampling and the normalization run over the candidates.
+
+    - sampling_topk > 0: The k tokens with the largest probabilities.
+    - sampling_topp > 0: The tokens whose probabilities are larger than sampling_topp. There are
+      fewer than 1 / sampling_topp such tokens, so they are always included in the
+      ceil(1 / sampling_topp) tokens with the largest probabilities.
+
+    Parameters
+    ----------
+    probs : mx.np.ndarray
+        Shape (..., vocab_size)
+    sampling_topp
+        The probability threshold of the candidates. It is disabled if it is not positive.
+    sampling_topk
+        The number of the candidates. It is disabled if it is not positive.
+
+    Returns
+    -------
+    candidate_probs : mx.np.ndarray
+        The renormalized probabilities of the candidates. Shape (..., num_candidates)
+    candidate_ids : mx.np.ndarray or None
+        The token ids of the candidates, or None if all tokens are the candidates.
+        Shape (..., num_candidates)
+    """
+    vocab_size = probs.shape[-1]
+    if sampling_topp > 0:
+        num_candidates = min(vocab_size, int(np.ceil(1.0 / sampling_topp)))
+    elif sampling_topk > 0:
+        num_candidates = min(vocab_size, sampling_topk)
+    else:
+        return probs, None
+    candidate_probs, candidate_ids = mx.npx.topk(probs, axis=-1, k=num_candidates,
+                                                 ret_typ='both', dtype=np.int32)
+    if sampling_topp > 0:
+        candidate_probs = mx.np.where(candidate_probs > sampling_topp, candidate_probs,
+                                      mx.np.zeros_like(candidate_probs))
+    candidate_probs = candidate_probs / mx.np.sum(candidate_probs, axis=-1, keepdims=True)
+    return candidate_probs, candidate_ids
+
+
 class _MultinomialStepUpdate(HybridBlock):
     def __init__(self, beam_size, vocab_size, eos_id, state_batch_axis,
-                 sampling_topp=-1.0, sampling_topk=-1, temperature=1.0):
+                 sampling_topp=-1.0, sampling_topk=-1, temperature=1.0,
+                 logits_processors=None):
         super().__init__()
+        self._logits_processors = [] if logits_processors is None else logits_processors
         self._beam_size = beam_size
         self._vocab_size = vocab_size
         self._eos_id = eos_id
@@ -644,7 +1478,7 @@ class _MultinomialStepUpdate(HybridBlock):
         assert sampling_topp <= 0 or sampling_topk <= 0, 'sampling_topp conflicts with sampling_topk'
 
     def forward(self, samples, valid_length, outputs, scores, step, beam_alive_mask,
-                states, batch_shift):
+                states, batch_shift, processor_states=None):
         """
 
         Parameters
@@ -672,6 +1506,9 @@ class _MultinomialStepUpdate(HybridBlock):
         batch_shift : mx.np.ndarray
             Contains [0, beam_size, 2 * beam_size, ..., (batch_size - 1) * beam_size].
             Shape (batch_size,)
+        processor_states : list or None
+            The states of the logits processors. It is only given if there are logits
+            processors.
 
         Returns
         -------
@@ -690,34 +1527,22 @@ class _MultinomialStepUpdate(HybridBlock):
         new_states : nested structure of mx.np.ndarray
             Inner mx.np.ndarrays have shape (batch_size * beam_size, ...)
         """
+        if processor_states is not None:
+            outputs = _apply_logits_processors(self._logits_processors, outputs, step,
+                                               processor_states)
         # bsz * beam_size * vocab_size
         outputs = outputs.reshape((-1, self._beam_size, self._vocab_size))
         probs = mx.npx.softmax(outputs / self._temperature)
-
-        if self._sampling_topp > 0:
-            probs = mx.np.where(
-                probs > self._sampling_topp,
-                probs,
-                mx.np.zeros_like(probs)
-            )
-        elif self._sampling_topk > 0:
-            topk_probs = mx.npx.topk(probs, axis=2, k=self._sampling_topk, ret_typ='value')
-            # choose the k max prob
-            k_prob = topk_probs[:,:,-1]
-            k_prob = mx.np.expand_dims(k_prob, axis=-1)
-            probs = mx.np.where(
-                probs >= k_prob,
-                probs,
-                mx.np.zeros_like(probs)
-            )
-
-        # renormalize
-        probs_sum = mx.np.sum(probs, axis=2, keepdims=True)
-        probs = probs / probs_sum
+        # bsz * beam_size * num_candidates
+        probs, candidate_ids = _get_sampling_candidates(probs, self._sampling_topp,
+                                                        self._sampling_topk)
 
         # bsz * beam_size
         chosen_word_ids, chosen_word_log_probs = \
             mx.npx.random.categorical(probs, get_prob=True)
+        if candidate_ids is not None:
+            chosen_word_ids = mx.npx.pick(candidate_ids, chosen_word_ids, axis=2)
+        chosen_word_ids = chosen_word_ids.astype(mx.np.int32)
 
         new_scores = scores + mx.np.where(
             beam_alive_mask,
@@ -741,5 +1566,555 @@ class _MultinomialStepUpdate(HybridBlock):
         if self._eos_id is not None:
             beam_alive_mask = beam_alive_mask * (chosen_word_ids != self._eos_id).astype(mx.np.int32)
 
+        if processor_states is not None:
+            # The beams are not reordered
+            processor_states = _update_logits_processors(self._logits_processors,
+                                                         processor_states,
+                                                         chosen_word_ids.reshape((-1,)), step)
+            return new_samples, new_valid_length, new_scores, chosen_word_ids,\
+                beam_alive_mask, new_states, processor_states
         return new_samples, new_valid_length, new_scores, chosen_word_ids,\
                beam_alive_mask, new_states
+
+
+class ContinuousBatchingScheduler:
+    """Generate the sequences of many requests with continuous batching.
+
+    Unlike :class:`BeamSearchSampler`, which decodes a fixed batch until all samples finish, the
+    scheduler keeps a pool of `num_slots` states and runs the decoder on the whole pool in every
+    step. The new requests are inserted into the free slots before a step and the finished
+    requests are evicted after it, so a request never waits for the other requests in the batch.
+
+    The scheduler only relies on the :class:`BaseStepDecoder` interface.
+    `decoder.init_states(**init_kwargs)` is called with the inputs of a single request and the
+    states are written to a slot of the pool along `decoder.state_batch_axis`. Thus, the states
+    of all requests must have the same shape. For example, pad the source sentences to a fixed
+    length and preallocate the key/value caches with `max_cache_length` in
+    :class:`~gluonnlp.models.transformer.TransformerNMTInference`. The free slots are reset to
+    the initial states every `max_length` steps, so a slot never runs more than `max_length`
+    steps from its initial states.
+
+    Each step transfers the chosen tokens to the host once to detect the finished requests.
+
+    Parameters
+    ----------
+    decoder
+        The step decoder. It maps (step_input, states) to (outputs, new_states), where outputs
+        are the logits or the log-probabilities with shape (num_slots, vocab_size).
+    num_slots
+        The number of requests that are decoded together
+    eos_id
+        The id of the EOS token. If it is None, the requests always run `max_length` steps.
+    max_length
+        The maximal number of decoding steps of a request
+    sampling
+        Whether to sample the tokens from the softmax of the outputs. Otherwise, the tokens with
+        the largest outputs are chosen.
+    temperature
+        The temperature of the sampling
+
+    Examples
+    --------
+    >>> scheduler = ContinuousBatchingScheduler(inference_model, num_slots=32, eos_id=eos_id,
+    ...                                         max_length=200)
+    >>> async def translate(src_data, src_valid_length):
+    ...     return await scheduler.submit(bos_id, src_data=src_data,
+    ...                                   src_valid_length=src_valid_length)
+    >>> # Run `scheduler.serve()` as a task of the event loop
+    """
+    def __init__(self, decoder, num_slots: int,
+                 eos_id: Optional[int] = None,
+                 max_length: int = 200,
+                 sampling: bool = False,
+                 temperature: float = 1.0):
+        assert num_slots > 0, 'num_slots must be positive. Received {}'.format(num_slots)
+        assert max_length > 0, 'max_length must be positive. Received {}'.format(max_length)
+        assert eos_id is None or eos_id >= 0,\
+            'eos_id cannot be negative! Received eos_id={}'.format(eos_id)
+        self._decoder = decoder
+        self._num_slots = num_slots
+        self._eos_id = eos_id
+        self._max_length = max_length
+        self._sampling = sampling
+        self._temperature = temperature
+        self._state_batch_axis = decoder.state_batch_axis
+        self._request_ids = itertools.count()
+        # Each pending request is (request_id, step_input, max_length, init_kwargs)
+        self._pending = collections.deque()
+        # The request of each slot, which is None if the slot is free
+        self._slot_requests = [None] * num_slots
+        # The number of steps since the states of each slot are initialized
+        self._slot_steps = np.zeros((num_slots,), dtype=np.int64)
+        self._step_input = np.zeros((num_slots,), dtype=np.int32)
+        self._states = None
+        self._blank_states = None
+        self._ctx = None
+        # All the mxnet operators run in a single thread when serving with asyncio
+        self._executor = None
+        self._futures = dict()
+        self._has_work = None
+        self._stopped = False
+
+    @property
+    def num_slots(self) -> int:
+        return self._num_slots
+
+    @property
+    def num_active(self) -> int:
+        """The number of requests that are being decoded"""
+        return sum(ele is not None for ele in self._slot_requests)
+
+    @property
+    def num_pending(self) -> int:
+        """The number of requests that are waiting for a free slot"""
+        return len(self._pending)
+
+    def add_request(self, step_input: int, max_length: Optional[int] = None,
+                    **init_kwargs) -> int:
+        """Add a request to the queue. It is inserted into the pool in a later call of
+        :meth:`step`.
+
+        Parameters
+        ----------
+        step_input
+            The first token of the request, e.g., the BOS token
+        max_length
+            The maximal number of decoding steps of the request. It cannot be larger than the
+            max_length of the scheduler. By default, it is the max_length of the scheduler.
+        **init_kwargs
+            The arguments of `decoder.init_states`, whose batch size is 1
+
+        Returns
+        -------
+        request_id
+            The id of the request
+        """
+        if max_length is None:
+            max_length = self._max_length
+        elif not 0 < max_length <= self._max_length:
+            raise ValueError('max_length of the request must be in [1, {}]. Received {}'
+                             .format(self._max_length, max_length))
+        request_id = next(self._request_ids)
+        self._pending.append((request_id, int(step_input), max_length, init_kwargs))
+        return request_id
+
+    def _admit(self) -> List[Tuple[int, Exception]]:
+        """Insert the pending requests into the free slots and reset the idle slots
+
+        Returns
+        -------
+        failed
+            The requests whose states cannot be initialized, i.e., (request_id, error)
+        """
+        failed = []
+        for slot in range(self._num_slots):
+            if self._slot_requests[slot] is not None:
+                continue
+            while self._pending:
+                request_id, step_input, max_length, init_kwargs = self._pending.popleft()
+                try:
+                    states = self._decoder.init_states(**init_kwargs)
+                    if self._states is None:
+                        self._states = _alloc_state_pool(states, self._num_slots,
+                                                         self._state_batch_axis)
+                        self._blank_states = states
+                        self._ctx = _get_states_ctx(states)
+                    _insert_states(self._states, states, slot, self._state_batch_axis)
+                except Exception as err:  # pylint: disable=broad-except
+                    failed.append((request_id, err))
+                    continue
+                self._slot_requests[slot] = (request_id, max_length, [step_input])
+                self._step_input[slot] = step_input
+                self._slot_steps[slot] = 0
+                break
+            else:
+                # The free slot keeps running with the others, reset it before its states
+                # exceed the capacity of the preallocated caches.
+                if self._states is not None and self._slot_steps[slot] >= self._max_length:
+                    _insert_states(self._states, self._blank_states, slot,
+                                   self._state_batch_axis)
+                    self._slot_steps[slot] = 0
+        return failed
+
+    def _step(self) -> Tuple[List[Tuple[int, np.ndarray]], List[Tuple[int, Exception]]]:
+        failed = self._admit()
+        finished = []
+        if self.num_active == 0:
+            return finished, failed
+        step_input = mx.np.array(self._step_input, ctx=self._ctx, dtype=np.int32)
+        outputs, self._states = self._decoder(step_input, self._states)
+        if self._sampling:
+            tokens = mx.npx.random.categorical(mx.npx.softmax(outputs / self._temperature))
+        else:
+            tokens = mx.np.argmax(outputs, axis=-1)
+        tokens = tokens.astype(np.int32).asnumpy()
+        self._slot_steps += 1
+        self._step_input[:] = tokens
+        for slot, request in enumerate(self._slot_requests):
+            if request is None:
+                continue
+            request_id, max_length, samples = request
+            samples.append(int(tokens[slot]))
+            if (self._eos_id is not None and tokens[slot] == self._eos_id)\
+                    or len(samples) > max_length:
+                finished.append((request_id, np.array(samples, dtype=np.int32)))
+                self._slot_requests[slot] = None
+                self._step_input[slot] = 0
+        return finished, failed
+
+    def step(self) -> List[Tuple[int, np.ndarray]]:
+        """Insert the pending requests into the free slots and run a decoding step
+
+        Returns
+        -------
+        finished
+            The requests that are finished in the step, i.e., (request_id, samples).
+            The samples start with the step_input of the request and end with the EOS token
+            if it is generated. Shape (L,), where L <= max_length + 1.
+        """
+        finished, failed = self._step()
+        if failed:
+            raise failed[0][1]
+        return finished
+
+    def run(self) -> Dict[int, np.ndarray]:
+        """Decode until all the requests are finished
+
+        Returns
+        -------
+        results
+            Mapping from the request_id to the samples
+        """
+        results = dict()
+        while self._pending or self.num_active > 0:
+            results.update(self.step())
+        return results
+
+    async def submit(self, step_input: int, max_length: Optional[int] = None,
+                     **init_kwargs) -> np.ndarray:
+        """Submit a request and wait for its result. :meth:`serve` must be running in the same
+        event loop.
+
+        Parameters
+        ----------
+        step_input
+            The first token of the request
+        max_length
+            The maximal number of decoding steps of the request
+        **init_kwargs
+            The arguments of `decoder.init_states`, whose batch size is 1
+
+        Returns
+        -------
+        samples
+            Shape (L,)
+        """
+        if self._has_work is None:
+            raise RuntimeError('The scheduler is not serving. Run `serve()` in the event loop '
+                               'before submitting the requests.')
+        future = asyncio.get_running_loop().create_future()
+        request_id = self.add_request(step_input, max_length, **init_kwargs)
+        self._futures[request_id] = future
+        self._has_work.set()
+        return await future
+
+    async def serve(self):
+        """Run the decoding loop in the event loop until :meth:`stop` is called.
+
+        The decoding steps run in a worker thread, so the event loop keeps accepting the new
+        requests while the decoder is running.
+        """
+        loop = asyncio.get_running_loop()
+        self._has_work = asyncio.Event()
+        self._stopped = False
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            while not self._stopped:
+                if not self._pending and self.num_active == 0:
+                    self._has_work.clear()
+                    await self._has_work.wait()
+                    continue
+                finished, failed = await loop.run_in_executor(self._executor, self._step)
+                for request_id, samples in finished:
+                    future = self._futures.pop(request_id, None)
+                    if future is not None and not future.done():
+                        future.set_result(samples)
+                for request_id, err in failed:
+                    future = self._futures.pop(request_id, None)
+                    if future is not None and not future.done():
+                        future.set_exception(err)
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._has_work = None
+            # Drop the requests that are waiting for the results
+            for slot, request in enumerate(self._slot_requests):
+                if request is not None and request[0] in self._futures:
+                    self._slot_requests[slot] = None
+            self._pending = collections.deque(ele for ele in self._pending
+                                              if ele[0] not in self._futures)
+            for future in self._futures.values():
+                if not future.done():
+                    future.cancel()
+            self._futures.clear()
+
+    def stop(self):
+        """Stop :meth:`serve` after the current step"""
+        self._stopped = True
+        if self._has_work is not None:
+            self._has_work.set()
+
+    def __repr__(self):
+        ret = '{name}:(\n' \
+              '  num_slots={num_slots}\n' \
+              '  eos_id={eos_id}\n' \
+              '  max_length={max_length}\n' \
+              '  sampling={sampling}\n' \
+              '  temperature={temperature}\n' \
+              ')'.format(name=self.__class__.__name__,
+                         num_slots=self._num_slots,
+                         eos_id=self._eos_id,
+                         max_length=self._max_length,
+                         sampling=self._sampling,
+                         temperature=self._temperature)
+        return ret
+
+
+class SpeculativeSampler:
+    r"""Sample from a large language model with the tokens proposed by a small draft model.
+
+    In each round, the draft model proposes `num_draft_tokens` tokens autoregressively and the
+    target model scores all of them in a single forward pass. A proposed token :math:`x` is
+    accepted with probability :math:`\min(1, p(x) / q(x))`, where :math:`p` and :math:`q` are
+    the distributions of the target and the draft model. At the first rejected position, the
+    token is resampled from :math:`\text{norm}(\max(p - q, 0))`. If all tokens are accepted,
+    another token is sampled from the target model. The samples follow the distribution of the
+    target model exactly, while the target model runs once for up to `num_draft_tokens + 1`
+    tokens. With `sampling=False`, the proposed tokens are accepted if they are the greedy
+    choices of the target model, which gives the same results as the greedy decoding of the
+    target model.
+
+    See Also
+
+    "Fast Inference from Transformers via Speculative Decoding
+    (https://arxiv.org/pdf/2211.17192.pdf)"
+
+    "Accelerating Large Language Model Decoding with Speculative Sampling
+    (https://arxiv.org/pdf/2302.01318.pdf)"
+
+    Both models follow the interface of :class:`~gluonnlp.models.gpt2.GPT2ForLM` with the 'NT'
+    layout, i.e., `model(inputs, states, prev_len)` returns the logits of all the input tokens
+    and the new states, and `model.init_states(batch_size, ctx)` returns the initial states.
+    The states may be preallocated with `max_cache_length`, which should be no smaller than
+    `prompt_length + max_length + num_draft_tokens`.
+
+    Because `prev_len` is shared by the samples in a batch, every sample in a round keeps the
+    smallest number of the accepted tokens in the batch, followed by its own accepted or
+    resampled token at the next position. Each kept token still follows the distribution of the
+    target model.
+
+    Parameters
+    ----------
+    target_model
+        The model to sample from
+    draft_model
+        The small model that proposes the tokens. It must share the vocabulary with the target.
+    num_draft_tokens
+        The number of tokens proposed in each round
+    eos_id
+        The id of the EOS token. If it is None, the sampler always generates max_length tokens.
+    max_length
+        The maximal number of the generated tokens
+    sampling
+        Whether to sample the tokens. Otherwise, use the greedy decoding.
+    temperature
+        The temperature of the distributions of both models
+    """
+    def __init__(self, target_model, draft_model,
+                 num_draft_tokens: int = 4,
+                 eos_id: Optional[int] = None,
+                 max_length: int = 100,
+                 sampling: bool = True,
+                 temperature: float = 1.0):
+        assert num_draft_tokens > 0,\
+            'num_draft_tokens must be positive. Received {}'.format(num_draft_tokens)
+        assert eos_id is None or eos_id >= 0,\
+            'eos_id cannot be negative! Received eos_id={}'.format(eos_id)
+        for model in [target_model, draft_model]:
+            if model.layout != 'NT':
+                raise NotImplementedError('SpeculativeSampler only supports the "NT" layout. '
+                                          'Received layout={}'.format(model.layout))
+        self._target_model = target_model
+        self._draft_model = draft_model
+        self._num_draft_tokens = num_draft_tokens
+        self._eos_id = eos_id
+        self._max_length = max_length
+        self._sampling = sampling
+        self._temperature = temperature
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset the statistics of the proposed and accepted tokens"""
+        self._num_proposed = 0
+        self._num_accepted = 0
+        self._num_target_calls = 0
+
+    @property
+    def acceptance_rate(self) -> float:
+        """The ratio of the proposed tokens that are accepted by the target model"""
+        return self._num_accepted / max(self._num_proposed, 1)
+
+    @property
+    def num_target_calls(self) -> int:
+        """The number of the forward passes of the target model, excluding the prompt"""
+        return self._num_target_calls
+
+    def _get_probs(self, logits):
+        return mx.npx.softmax(logits / self._temperature)
+
+    def _choose(self, probs_or_logits):
+        if self._sampling:
+            return mx.npx.random.categorical(probs_or_logits).astype(np.int32)
+        else:
+            return mx.np.argmax(probs_or_logits, axis=-1).astype(np.int32)
+
+    def _prepare_states(self, model, batch_size, prompt_length, ctx):
+        states = model.init_states(batch_size, ctx)
+        time_axis = model.state_batch_axis + 1
+        capacity = states.shape[time_axis]
+        if capacity > 0 and capacity < prompt_length + self._max_length + self._num_draft_tokens:
+            raise ValueError('The preallocated states have the capacity of {}, which is smaller '
+                             'than prompt_length + max_length + num_draft_tokens = {}.'
+                             .format(capacity, prompt_length + self._max_length
+                                     + self._num_draft_tokens))
+        return states, time_axis, capacity > 0
+
+    def __call__(self, inputs):
+        """Sample the continuations of the prompts
+
+        Parameters
+        ----------
+        inputs
+            The prompts, which have the same length. Shape (batch_size, prompt_length)
+
+        Returns
+        -------
+        samples
+            The prompts and the generated tokens. The tokens after the EOS token are set to -1.
+            Shape (batch_size, prompt_length + L), where L <= max_length
+        valid_length
+            The valid lengths of the samples, which include the EOS token. Shape (batch_size,)
+        """
+        ctx = inputs.ctx
+        batch_size, prompt_length = inputs.shape
+        k = self._num_draft_tokens
+        target_states, target_time_axis, target_preallocated =\
+            self._prepare_states(self._target_model, batch_size, prompt_length, ctx)
+        draft_states, draft_time_axis, draft_preallocated =\
+            self._prepare_states(self._draft_model, batch_size, prompt_length, ctx)
+        # The tokens are kept on the host. Both models have processed all the tokens except for
+        # the last one, which is the input of the next round.
+        tokens = inputs.asnumpy().astype(np.int32)
+        target_len = draft_len = 0
+        if prompt_length > 1:
+            prev_len = mx.np.array(0, dtype=np.int32, ctx=ctx)
+            _, target_states = self._target_model(inputs[:, :-1], target_states, prev_len)
+            _, draft_states = self._draft_model(inputs[:, :-1], draft_states, prev_len)
+            target_len = draft_len = prompt_length - 1
+        valid_length = np.full((batch_size,), prompt_length + self._max_length, dtype=np.int32)
+        finished = np.zeros((batch_size,), dtype=np.bool_)
+        while tokens.shape[1] < prompt_length + self._max_length and not finished.all():
+            # 1. The draft model proposes k tokens. It lags behind by one token if all the
+            #    tokens of the previous round are accepted.
+            step_inputs = mx.np.array(tokens[:, draft_len:], dtype=np.int32, ctx=ctx)
+            draft_probs_l = []
+            draft_tokens_l = []
+            for _ in range(k):
+                logits, draft_states = self._draft_model(
+                    step_inputs, draft_states, mx.np.array(draft_len, dtype=np.int32, ctx=ctx))
+                draft_len += step_inputs.shape[1]
+                if self._sampling:
+                    probs = self._get_probs(logits[:, -1])
+                    draft_probs_l.append(probs)
+                    step_inputs = self._choose(probs)
+                else:
+                    step_inputs = self._choose(logits[:, -1])
+                draft_tokens_l.append(step_inputs)
+                step_inputs = mx.np.expand_dims(step_inputs, axis=1)
+            draft_tokens = mx.np.stack(draft_tokens_l, axis=1)
+            # 2. The target model scores the last token and the proposed tokens at once
+            target_inputs = mx.np.concatenate(
+                [mx.np.array(tokens[:, target_len:], dtype=np.int32, ctx=ctx), draft_tokens],
+                axis=1)
+            logits, target_states = self._target_model(
+                target_inputs, target_states, mx.np.array(target_len, dtype=np.int32, ctx=ctx))
+            self._num_target_calls += 1
+            # 3. Accept or reject the proposed tokens
+            if self._sampling:
+                target_probs = self._get_probs(logits)
+                draft_probs = mx.np.stack(draft_probs_l, axis=1)
+                p = mx.npx.pick(target_probs[:, :k], draft_tokens, axis=2)
+                q = mx.npx.pick(draft_probs, draft_tokens, axis=2)
+                accepted = mx.np.random.uniform(0, 1, (batch_size, k), ctx=ctx) * q < p
+            else:
+                accepted = draft_tokens == mx.np.argmax(logits[:, :k], axis=-1).astype(np.int32)
+            accepted = accepted.asnumpy()
+            draft_tokens = draft_tokens.asnumpy()
+            num_accepted = np.cumprod(accepted, axis=1).sum(axis=1)
+            self._num_proposed += k * int((~finished).sum())
+            self._num_accepted += int(num_accepted[~finished].sum())
+            m = int(num_accepted[~finished].min())
+            # 4. Choose the token after the accepted ones
+            if m == k:
+                next_tokens = self._choose(target_probs[:, k] if self._sampling
+                                           else logits[:, k]).asnumpy()
+            else:
+                if self._sampling:
+                    residual = mx.npx.relu(target_probs[:, m] - draft_probs[:, m])
+                    residual_sum = mx.np.sum(residual, axis=-1, keepdims=True)
+                    # The residual is all zero only if the distributions are the same, in which
+                    # case the token is never rejected.
+                    residual = mx.np.where(residual_sum > 0,
+                                           residual / mx.np.maximum(residual_sum, 1E-30),
+                                           target_probs[:, m])
+                    next_tokens = self._choose(residual).asnumpy()
+                else:
+                    next_tokens = self._choose(logits[:, m]).asnumpy()
+                next_tokens = np.where(num_accepted > m, draft_tokens[:, m], next_tokens)
+            new_tokens = np.concatenate([draft_tokens[:, :m], next_tokens[:, None]], axis=1)
+            if self._eos_id is not None:
+                for i in np.nonzero(~finished)[0]:
+                    eos_positions = np.nonzero(new_tokens[i] == self._eos_id)[0]
+                    if len(eos_positions) > 0:
+                        valid_length[i] = tokens.shape[1] + eos_positions[0] + 1
+                        finished[i] = True
+            tokens = np.concatenate([tokens, new_tokens], axis=1)
+            # 5. Roll back the states of the rejected tokens
+            draft_len = min(draft_len, target_len + m + 1)
+            target_len = target_len + m + 1
+            if not target_preallocated:
+                target_states = target_states[(slice(None),) * target_time_axis
+                                              + (slice(0, target_len),)]
+            if not draft_preallocated:
+                draft_states = draft_states[(slice(None),) * draft_time_axis
+                                            + (slice(0, draft_len),)]
+        valid_length = np.minimum(valid_length, prompt_length + self._max_length)
+        tokens = tokens[:, :valid_length.max()]
+        tokens[np.arange(tokens.shape[1]) >= valid_length[:, None]] = -1
+        return mx.np.array(tokens, dtype=np.int32, ctx=ctx),\
+            mx.np.array(valid_length, dtype=np.int32, ctx=ctx)
+
+    def __repr__(self):
+        ret = '{name}:(\n' \
+              '  num_draft_tokens={num_draft_tokens}\n' \
+              '  eos_id={eos_id}\n' \
+              '  max_length={max_length}\n' \
+              '  sampling={sampling}\n' \
+              '  temperature={temperature}\n' \
+              ')'.format(name=self.__class__.__name__,
+                         num_draft_tokens=self._num_draft_tokens,
+                         eos_id=self._eos_id,
+                         max_length=self._max_length,
+                         sampling=self._sampling,
+                         temperature=self._temperature)
+        return ret
@@ -5,3 +5,4 @@ from . import registry
 from . import testing
 from .parameter import *
 from .misc import *
+from .quantization import *
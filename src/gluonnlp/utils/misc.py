@@ -12,6 +12,7 @@ import hashlib
 import requests
 import itertools
 import random
+import multiprocessing
 try:
     import tqdm
 except ImportError:
@@ -332,6 +333,67 @@ def repeat(iterable, count=None):
             for sample in iterable:
                 yield sample
 
+
+if hasattr(str, 'isascii'):
+    _is_ascii = str.isascii
+else:
+    def _is_ascii(text: str) -> bool:
+        try:
+            text.encode('ascii')
+            return True
+        except UnicodeEncodeError:
+            return False
+
+
+_parallel_map_func = None
+
+
+def _initialize_parallel_map_worker(func):
+    global _parallel_map_func
+    _parallel_map_func = func
+
+
+def _parallel_map_chunk(chunk):
+    return [_parallel_map_func(ele) for ele in chunk]
+
+
+def parallel_map(func, inputs, num_process: int = 1, chunksize: int = 1024) -> list:
+    """Apply func to every element of inputs with a pool of processes and keep the order.
+
+    The func is sent to every worker only once, when the worker starts. Afterwards, the
+    inputs are dispatched in chunks so that the inter-process communication is amortized.
+    Thus, func can be a heavy object, e.g., a tokenizer with precompiled regexes.
+
+    Parameters
+    ----------
+    func
+        The picklable callable
+    inputs
+        The inputs
+    num_process
+        The number of processes. If it is smaller than or equal to 1, we will directly
+        apply func in the current process.
+    chunksize
+        The number of inputs to be sent to a worker at a time.
+
+    Returns
+    -------
+    outputs
+        The list of func(ele) for ele in inputs, in the same order as the inputs.
+    """
+    if num_process <= 1:
+        return [func(ele) for ele in inputs]
+    inputs = list(inputs)
+    chunks = [inputs[i:i + chunksize] for i in range(0, len(inputs), chunksize)]
+    outputs = []
+    with multiprocessing.Pool(min(num_process, max(len(chunks), 1)),
+                              initializer=_initialize_parallel_map_worker,
+                              initargs=(func,)) as pool:
+        for chunk_outputs in pool.imap(_parallel_map_chunk, chunks):
+            outputs.extend(chunk_outputs)
+    return outputs
+
+
 def parse_ctx(data_str):
     import mxnet as mx
     if data_str == '-1' or data_str == '':
@@ -0,0 +1,136 @@
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+"""Row-wise quantization of embedding matrices.
+
+Each row of the matrix is stored as `data[i] * scale[i]`, in which `data` is int8 or float16
+and `scale` is float32. For int8, the scale is max(abs(row)) / 127. For float16, the scale is
+max(abs(row)), so the stored values are in [-1, 1] and never overflow.
+"""
+__all__ = ['quantize_rows', 'dequantize_rows', 'quantize_embedding_params']
+
+from typing import Tuple, Dict, List, Optional
+
+import numpy as np
+import mxnet as mx
+
+_QUANTIZED_MAX_VALUE = {'int8': 127.0, 'float16': 1.0}
+
+
+def quantize_rows(matrix: np.ndarray, dtype: str = 'int8',
+                  block_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Quantize a matrix with a scale per row
+
+    Parameters
+    ----------
+    matrix
+        Shape (num_rows, dim). It can be a memory-mapped array, which is converted block by
+        block.
+    dtype
+        The data type of the quantized matrix. Can be 'int8' or 'float16'.
+    block_size
+        The number of rows to convert together
+
+    Returns
+    -------
+    data
+        The quantized matrix. Shape (num_rows, dim)
+    scale
+        The float32 scale of each row. Shape (num_rows,)
+    """
+    if dtype not in _QUANTIZED_MAX_VALUE:
+        raise ValueError('Unsupported dtype={}. Only {} are supported.'
+                         .format(dtype, list(_QUANTIZED_MAX_VALUE.keys())))
+    max_value = _QUANTIZED_MAX_VALUE[dtype]
+    num_rows = matrix.shape[0]
+    data = np.empty(matrix.shape, dtype=dtype)
+    scale = np.empty((num_rows,), dtype=np.float32)
+    for start in range(0, num_rows, block_size):
+        end = min(start + block_size, num_rows)
+        block = np.asarray(matrix[start:end], dtype=np.float32)
+        block_scale = np.abs(block).max(axis=1) / max_value if block.shape[1] > 0\
+            else np.zeros((end - start,), dtype=np.float32)
+        block_scale[block_scale == 0] = 1
+        block = block / block_scale[:, None]
+        if dtype == 'int8':
+            block = np.clip(np.round(block), -max_value, max_value)
+        data[start:end] = block
+        scale[start:end] = block_scale
+    return data, scale
+
+
+def dequantize_rows(data: np.ndarray, scale: np.ndarray,
+                    dtype: str = 'float32') -> np.ndarray:
+    """Recover the matrix from the output of :func:`quantize_rows`
+
+    Parameters
+    ----------
+    data
+        The quantized rows. Shape (num_rows, dim)
+    scale
+        The scale of each row. Shape (num_rows,)
+    dtype
+        The data type of the output
+
+    Returns
+    -------
+    matrix
+        Shape (num_rows, dim)
+    """
+    return (np.asarray(data, dtype=np.float32) * np.asarray(scale)[:, None]).astype(dtype)
+
+
+def quantize_embedding_params(params: Dict, param_names: Optional[List[str]] = None,
+                              dtype: str = 'int8') -> Dict:
+    """Convert the embedding weights in a checkpoint to the format of
+    :class:`~gluonnlp.layers.QuantizedEmbedding`.
+
+    Every "{prefix}weight" in `param_names` is replaced by the quantized matrix and a new
+    parameter "{prefix}scale" is added. The model that loads the converted parameters should be
+    constructed with `word_embed_storage_dtype=dtype`.
+
+    Parameters
+    ----------
+    params
+        The dictionary of the parameters, e.g., returned by `mx.npx.load`
+    param_names
+        The names of the embedding weights. By default, it is ['word_embed.weight'], which is the
+        word embedding of BertModel, AlbertModel and RobertaModel. For GPT2Model, use
+        ['_embed.weight'].
+    dtype
+        The data type of the quantized weights. Can be 'int8' or 'float16'.
+
+    Returns
+    -------
+    new_params
+        The converted parameters
+    """
+    if param_names is None:
+        param_names = ['word_embed.weight']
+    new_params = dict(params)
+    for name in param_names:
+        if name not in params:
+            raise KeyError('Cannot find "{}" in the parameters.'.format(name))
+        if not name.endswith('weight'):
+            raise ValueError('Expect the name of an embedding weight, which ends with "weight".'
+                             ' Received "{}".'.format(name))
+        weight = params[name]
+        if not isinstance(weight, np.ndarray):
+            weight = weight.asnumpy()
+        data, scale = quantize_rows(weight, dtype)
+        new_params[name] = mx.np.array(data, dtype=dtype)
+        new_params[name[:-len('weight')] + 'scale'] = mx.np.array(scale, dtype=np.float32)
+    return new_params
@@ -5,6 +5,7 @@ import mxnet as mx
 from mxnet.gluon import HybridBlock
 from gluonnlp.attention_cell import\
     multi_head_dot_attn, gen_self_attn_mask, gen_mem_attn_mask,\
+    init_kv_cache, update_kv_cache, write_kv_cache, gen_kv_cache_attn_mask,\
     MultiHeadAttentionCell,\
     RelAttentionScoreCell
 from gluonnlp.utils.parameter import grad_global_norm
@@ -173,6 +174,75 @@ def test_dot_product_attention(scaled, normalized, ctx):
 
 
 @pytest.mark.seed(123)
+@pytest.mark.parametrize('layout', ['NT', 'TN'])
+@pytest.mark.parametrize('hybridize', [False, True])
+def test_kv_cache(layout, hybridize, ctx):
+    class UpdateKVCache(HybridBlock):
+        def hybrid_forward(self, F, cache, step_data, positions):
+            new_cache = update_kv_cache(F, cache, step_data, positions, layout=layout)
+            mask = gen_kv_cache_attn_mask(F, new_cache, positions, layout=layout)
+            return new_cache, mask
+
+    with ctx:
+        batch_size, max_length, step_length = 3, 7, 2
+        key_cache, value_cache = init_kv_cache(batch_size, max_length, (2, 4), ctx=ctx,
+                                               layout=layout)
+        if layout == 'NT':
+            assert key_cache.shape == value_cache.shape == (batch_size, max_length, 2, 4)
+        else:
+            assert key_cache.shape == value_cache.shape == (max_length, batch_size, 2, 4)
+        update = UpdateKVCache()
+        if hybridize:
+            update.hybridize()
+        gt_cache = key_cache.asnumpy()
+        cache = key_cache
+        for start in [0, 2, 4]:
+            np_positions = start + np.arange(step_length)[None, :] + np.zeros((batch_size, 1))
+            step_data = np.random.normal(0, 1, (batch_size, step_length, 2, 4))
+            for i in range(batch_size):
+                gt_cache_view = gt_cache[i] if layout == 'NT' else gt_cache[:, i]
+                gt_cache_view[start:(start + step_length)] = step_data[i]
+            if layout == 'TN':
+                np_positions = np_positions.T
+                step_data = step_data.swapaxes(0, 1)
+            cache, mask = update(cache, mx.np.array(step_data, dtype=np.float32),
+                                 mx.np.array(np_positions, dtype=np.int32))
+            assert_allclose(cache.asnumpy(), gt_cache, 1E-5, 1E-5)
+            gt_mask = np.arange(max_length)[None, None, :]\
+                <= start + np.arange(step_length)[None, :, None]
+            assert_allclose(mask.asnumpy(),
+                            np.broadcast_to(gt_mask, (batch_size, step_length, max_length)))
+
+
+@pytest.mark.seed(123)
+@pytest.mark.parametrize('layout', ['NT', 'TN'])
+def test_write_kv_cache(layout, ctx):
+    with ctx:
+        batch_size, max_length = 3, 7
+        cache, _ = init_kv_cache(batch_size, max_length, (2, 4), ctx=ctx, layout=layout)
+        gt_cache = np.zeros((batch_size, max_length, 2, 4))
+        for start, step_length in [(0, 3), (3, 1), (4, 2)]:
+            step_data = np.random.normal(0, 1, (batch_size, step_length, 2, 4))
+            gt_cache[:, start:(start + step_length)] = step_data
+            if layout == 'TN':
+                step_data = step_data.swapaxes(0, 1)
+            filled_cache = write_kv_cache(cache, mx.np.array(step_data, dtype=np.float32),
+                                          start, layout=layout)
+            # The cache is written in place
+            if layout == 'NT':
+                assert_allclose(cache.asnumpy(), gt_cache, 1E-5, 1E-5)
+                assert_allclose(filled_cache.asnumpy(), gt_cache[:, :(start + step_length)],
+                                1E-5, 1E-5)
+            else:
+                assert_allclose(cache.asnumpy(), gt_cache.swapaxes(0, 1), 1E-5, 1E-5)
+                assert_allclose(filled_cache.asnumpy(),
+                                gt_cache[:, :(start + step_length)].swapaxes(0, 1),
+                                1E-5, 1E-5)
+        with pytest.raises(ValueError):
+            write_kv_cache(cache, mx.np.array(step_data, dtype=np.float32), max_length - 1,
+                           layout=layout)
+
+
 def test_gen_attn_mask(ctx):
     class GenSelfAttnMask(HybridBlock):
         def __init__(self, dtype, layout, attn_type):
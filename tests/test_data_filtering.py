@@ -1,5 +1,14 @@
+import os
+import tempfile
 import pytest
-from gluonnlp.data.filtering import ProfanityFilter, MosesNormalizer, LanguageIdentifier
+import random
+import numpy as np
+import unicodedata
+from sacremoses.normalize import MosesPunctNormalizer
+from collections import OrderedDict
+from gluonnlp.data.filtering import ProfanityFilter, MosesNormalizer, LanguageIdentifier,\
+    CorpusDeduplicator, FilterPipeline, non_printing_char_regex
+from gluonnlp.data.tokenizers import MosesTokenizer, WhitespaceTokenizer, JiebaTokenizer
 import multiprocessing
 
 
@@ -12,6 +21,28 @@ def test_profanity_filter():
         assert profanity_filter.match(text) is True
     for text in [' ' + unfilter_word, unfilter_word, unfilter_word + ' ']:
         assert profanity_filter.match(text) is False
+    # The word lists have been cached
+    assert ProfanityFilter('en').count('Hello anal, ANAL!') == 2
+
+
+def test_profanity_filter_words():
+    with tempfile.TemporaryDirectory() as root:
+        profanity_filter = ProfanityFilter(langs=[], words=['anal', 'two girls', 'ass', 'sass'],
+                                           cache_dir=root)
+        assert os.listdir(root) == []
+    assert profanity_filter.match('hello anal') is True
+    assert profanity_filter.match('Hello ANAL!') is True
+    assert profanity_filter.match('analysis pass') is False
+    assert profanity_filter.find('Two\tGirls, sass') == [(0, 9, 'two girls'), (11, 15, 'sass')]
+    assert profanity_filter.find('ass-sass') == [(0, 3, 'ass'), (4, 8, 'sass')]
+    assert profanity_filter.count('anal anal ass') == 3
+    corpus = ['anal anal', 'analysis', '', 'ass.'] * 10
+    counts = [profanity_filter.count(ele) for ele in corpus]
+    for num_process in [1, 2]:
+        assert profanity_filter.batch_count(corpus, num_process=num_process,
+                                            chunksize=4).tolist() == counts
+        assert profanity_filter.batch_match(corpus, num_process=num_process,
+                                            chunksize=4).tolist() == [ele > 0 for ele in counts]
 
 
 def test_sentence_normalizer():
@@ -26,6 +57,54 @@ def test_sentence_normalizer():
     assert normalizer('    hello  world!!"⁵.\t\t\r') == ' hello world!!"5.\t\t'
 
 
+@pytest.mark.parametrize('lang', ['en', 'de', 'fr'])
+@pytest.mark.parametrize('remove_non_printable_char', [False, True])
+@pytest.mark.parametrize('unicode_norm_form', [None, 'NFKC'])
+def test_sentence_normalizer_same_as_sacremoses(lang, remove_non_printable_char,
+                                                unicode_norm_form):
+    moses_normalizer = MosesPunctNormalizer(lang)
+    normalizer = MosesNormalizer(lang, remove_non_printable_char=remove_non_printable_char,
+                                 unicode_norm_form=unicode_norm_form)
+    rng = random.Random(123)
+    chars = list(' \t\r"\'`,.;:!?()[]-%0123456789aZ\x07\x7f«»„“”‘’–—…\u00a0\u200bé€ºª´⁵')
+    sentences = [''.join(rng.choice(chars) for _ in range(rng.randint(0, 30)))
+                 for _ in range(2000)]
+    sentences.append('    hello  world!!".\t\t\r')
+    for sentence in sentences:
+        gt = sentence
+        if unicode_norm_form is not None:
+            gt = unicodedata.normalize(unicode_norm_form, gt)
+        gt = moses_normalizer.normalize(gt)
+        if remove_non_printable_char:
+            gt = non_printing_char_regex.sub(' ', gt)
+        assert normalizer(sentence) == gt
+    gt_outputs = [normalizer(sentence) for sentence in sentences]
+    assert normalizer.batch_normalize(sentences) == gt_outputs
+    assert normalizer.batch_normalize(sentences, num_process=2, chunksize=128) == gt_outputs
+
+
+@pytest.mark.parametrize('lang,tokenizer', [('en', 'moses'), ('de', 'moses'),
+                                            ('en', 'whitespace'), ('zh', 'jieba')])
+def test_tokenizer_not_reduce_num_whitespace_words(lang, tokenizer):
+    # The max_num_words pre-filter of scripts/preprocess/clean_tok_*_corpus.py assumes that
+    # tokenizing a normalized sentence never reduces the number of whitespace-separated words
+    if tokenizer == 'moses':
+        tokenizer = MosesTokenizer(lang)
+    elif tokenizer == 'whitespace':
+        tokenizer = WhitespaceTokenizer()
+    else:
+        tokenizer = JiebaTokenizer()
+    normalizer = MosesNormalizer(lang)
+    rng = random.Random(123)
+    chars = list(' \t"\'`,.;:!?()[]-%&|<>@#0123456789aZé€«»„“”‘’–—…\u00a0\u200b\x07你好')
+    sentences = [''.join(rng.choice(chars) for _ in range(rng.randint(0, 30)))
+                 for _ in range(2000)]
+    for sentence in sentences:
+        sentence = normalizer(sentence)
+        tokenized = ' '.join(tokenizer.encode(sentence))
+        assert len(tokenized.split()) >= len(sentence.split())
+
+
 @pytest.mark.parametrize('algo', ['fasttext', 'fasttext_compressed', 'langid'])
 def test_language_identifier(algo):
     lang_id_model = LanguageIdentifier(algo=algo)
@@ -35,3 +114,144 @@ def test_language_identifier(algo):
         out = pool.map(lang_id_model, ['你好，世界', 'Hello World'])
     assert out[0][0] == 'zh'
     assert out[1][0] == 'en'
+    corpus = ['你好，世界', 'Hello World', '你好，世界', 'Bonjour le monde', 'Hello World']
+    labels, scores = lang_id_model.predict_batch(corpus)
+    assert labels.shape == scores.shape == (len(corpus),)
+    for ele, label, score in zip(corpus, labels, scores):
+        # Compare with the raw prediction of the underlying model
+        if algo == 'langid':
+            gt_label, gt_score = lang_id_model._model.classify(ele.lower())
+        else:
+            gt_labels, gt_scores = lang_id_model._model.predict(ele)
+            gt_label, gt_score = gt_labels[0].replace('__label__', ''), gt_scores[0]
+        assert label == gt_label
+        assert score == pytest.approx(gt_score)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'corpus.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(100):
+                f.write(corpus[i % len(corpus)] + '\n')
+        for num_process, shard_size in [(1, 1024 * 1024), (2, 64)]:
+            file_labels, file_scores = lang_id_model.predict_file(path, num_process=num_process,
+                                                                  batch_size=16,
+                                                                  shard_size=shard_size)
+            assert file_labels.tolist() == [labels[i % len(corpus)] for i in range(100)]
+            np.testing.assert_allclose(file_scores,
+                                       [scores[i % len(corpus)] for i in range(100)])
+
+
+def test_corpus_deduplicator_exact():
+    rng = random.Random(123)
+    base_lines = [' '.join(rng.choice('abcdef') for _ in range(rng.randint(0, 5)))
+                  for _ in range(100)]
+    lines = [rng.choice(base_lines) for _ in range(1000)]
+    tgt_lines = [ele.upper() if i % 3 else '' for i, ele in enumerate(lines)]
+    deduplicator = CorpusDeduplicator('exact')
+    gt_keep = []
+    seen = set()
+    for ele in lines:
+        gt_keep.append(ele not in seen)
+        seen.add(ele)
+    assert deduplicator(lines).tolist() == gt_keep
+    gt_pairs = list(OrderedDict.fromkeys(zip(lines, tgt_lines)).keys())
+    with tempfile.TemporaryDirectory() as root:
+        src_path = os.path.join(root, 'corpus.src')
+        tgt_path = os.path.join(root, 'corpus.tgt')
+        with open(src_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(ele + '\n' for ele in lines))
+        with open(tgt_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(ele + '\n' for ele in tgt_lines))
+        # A small max_run_size results in multiple sorted runs on disk
+        for num_process, max_run_size in [(1, 1000000), (2, 100)]:
+            num_lines, num_removed = deduplicator.dedup_files(
+                [src_path, tgt_path], [src_path + '.dedup', tgt_path + '.dedup'],
+                num_process=num_process, chunk_size=64, max_run_size=max_run_size, tmp_dir=root)
+            assert num_lines == len(lines)
+            assert num_removed == len(lines) - len(gt_pairs)
+            with open(src_path + '.dedup', 'r', encoding='utf-8') as f:
+                assert f.read().split('\n')[:-1] == [ele[0] for ele in gt_pairs]
+            with open(tgt_path + '.dedup', 'r', encoding='utf-8') as f:
+                assert f.read().split('\n')[:-1] == [ele[1] for ele in gt_pairs]
+        with open(tgt_path, 'w', encoding='utf-8') as f:
+            f.write('a\n')
+        with pytest.raises(ValueError):
+            deduplicator.dedup_files([src_path, tgt_path],
+                                     [src_path + '.dedup', tgt_path + '.dedup'])
+
+
+def test_corpus_deduplicator_minhash():
+    rng = random.Random(123)
+    words = ['w{}'.format(i) for i in range(1000)]
+    lines = [' '.join(rng.choice(words) for _ in range(50)) for _ in range(200)]
+    near_duplicates = []
+    for ele in lines:
+        tokens = ele.split()
+        tokens[rng.randrange(len(tokens))] = 'new'
+        near_duplicates.append(' '.join(tokens).upper())
+    deduplicator = CorpusDeduplicator('minhash', num_perm=128, threshold=0.7)
+    signatures = deduplicator.minhash_signatures(lines[:2] + near_duplicates[:2])
+    assert signatures.shape == (4, 128) and signatures.dtype == np.uint32
+    assert (signatures[0] == signatures[2]).mean() > 0.7
+    assert (signatures[0] == signatures[1]).mean() < 0.1
+    assert deduplicator.compute_keys(lines).shape == (len(lines), deduplicator.num_keys)
+    keep = deduplicator(lines + near_duplicates + lines[:10])
+    assert keep[:len(lines)].all()
+    assert keep[len(lines):].mean() < 0.05
+
+
+def _upper_sample(sample):
+    return tuple(ele.upper() for ele in sample)
+
+
+def _is_short_sample(sample):
+    return all(len(ele.split()) <= 3 for ele in sample)
+
+
+def _is_not_empty_samples(samples):
+    return [all(len(ele) > 0 for ele in sample) for sample in samples]
+
+
+def test_filter_pipeline():
+    rng = random.Random(123)
+    samples = [(' '.join(rng.choice('abc') for _ in range(rng.randint(0, 5))),
+                ' '.join(rng.choice('xyz') for _ in range(rng.randint(0, 5))))
+               for _ in range(500)]
+    pipeline = FilterPipeline()
+    pipeline.add_filter('short', _is_short_sample)\
+            .add_map('upper', _upper_sample)\
+            .add_filter('not_empty', _is_not_empty_samples, batched=True)
+    assert pipeline.stage_names == ['short', 'upper', 'not_empty']
+    with pytest.raises(ValueError):
+        pipeline.add_map('upper', _upper_sample)
+    short_samples = [ele for ele in samples if _is_short_sample(ele)]
+    gt_outputs = [_upper_sample(ele) for ele in short_samples
+                  if all(len(field) > 0 for field in ele)]
+    outputs, stats = pipeline(samples)
+    assert outputs == gt_outputs
+    assert stats.num_inputs == len(samples) and stats.num_outputs == len(gt_outputs)
+    assert stats.stage_num_inputs.tolist() == [len(samples), len(short_samples),
+                                               len(short_samples)]
+    assert stats.stage_num_rejected.tolist() == [len(samples) - len(short_samples), 0,
+                                                 len(short_samples) - len(gt_outputs)]
+    assert 'not_empty' in str(stats)
+    with tempfile.TemporaryDirectory() as root:
+        paths = [[], []]
+        for i in range(2):
+            for j, name in enumerate(['src', 'tgt']):
+                paths[j].append(os.path.join(root, 'corpus{}.{}'.format(i, name)))
+                with open(paths[j][-1], 'w', encoding='utf-8') as f:
+                    f.write(''.join(ele[j] + '\n' for ele in samples))
+        save_paths = [os.path.join(root, 'out.src'), os.path.join(root, 'out.tgt')]
+        for num_process in [1, 2]:
+            file_stats = pipeline.process_files(paths, save_paths, num_process=num_process,
+                                                chunk_size=64)
+            assert file_stats.num_inputs == 2 * len(samples)
+            assert file_stats.num_outputs == 2 * len(gt_outputs)
+            assert (file_stats.stage_num_rejected == 2 * stats.stage_num_rejected).all()
+            for j, path in enumerate(save_paths):
+                with open(path, 'r', encoding='utf-8') as f:
+                    assert f.read().split('\n')[:-1] == [ele[j] for ele in gt_outputs] * 2
+        with open(paths[1][0], 'a', encoding='utf-8') as f:
+            f.write('x\n')
+        with pytest.raises(ValueError):
+            pipeline.process_files(paths, save_paths)
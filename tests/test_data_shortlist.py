@@ -0,0 +1,45 @@
+import os
+import tempfile
+import numpy as np
+import pytest
+from gluonnlp.data.shortlist import LexicalShortlist
+
+
+def test_lexical_shortlist():
+    rng = np.random.RandomState(123)
+    # Each source token s in [2, 10) is translated to s + 10. The target sentences also contain
+    # the frequent tokens 0, 1 and a random token.
+    src_corpus = []
+    tgt_corpus = []
+    for _ in range(500):
+        src_ids = rng.randint(2, 10, rng.randint(1, 6))
+        src_corpus.append(src_ids.tolist())
+        tgt_corpus.append(np.concatenate([src_ids + 10, [0, 1],
+                                          rng.randint(2, 30, 1)]).tolist())
+    shortlist = LexicalShortlist.from_corpus(src_corpus, tgt_corpus, src_vocab_size=10,
+                                             tgt_vocab_size=30, num_candidates=2,
+                                             num_frequent=2, special_ids=[2], buffer_size=100)
+    assert shortlist.frequent_ids.tolist() == [0, 1, 2]
+    assert shortlist.table.shape == (10, 2)
+    assert (shortlist.table[2:10, 0] == np.arange(12, 20)).all()
+    # The source tokens that never appear have no candidates
+    assert (shortlist.table[:2] == -1).all()
+    candidate_ids, candidate_mask = shortlist([[3, 4, 0], [5]], valid_length=[2, 1],
+                                              size_multiple=8)
+    assert candidate_ids.shape[0] % 8 == 0
+    assert candidate_mask.shape == (2, candidate_ids.shape[0])
+    assert (np.sort(candidate_ids) == candidate_ids).all()
+    for i, src_ids in enumerate([[3, 4], [5]]):
+        gt_ids = set(shortlist.frequent_ids.tolist())
+        for ele in src_ids:
+            gt_ids.update(shortlist.table[ele][shortlist.table[ele] >= 0].tolist())
+        assert set(candidate_ids[candidate_mask[i]].tolist()) == gt_ids
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'shortlist.npz')
+        shortlist.save(path)
+        loaded = LexicalShortlist.load(path)
+    assert (loaded.table == shortlist.table).all()
+    assert (loaded.frequent_ids == shortlist.frequent_ids).all()
+    assert loaded.tgt_vocab_size == shortlist.tgt_vocab_size
+    with pytest.raises(ValueError):
+        LexicalShortlist.from_corpus([[10]], [[0]], src_vocab_size=10, tgt_vocab_size=30)
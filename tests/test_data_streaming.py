@@ -0,0 +1,99 @@
+import os
+import json
+import tempfile
+import pytest
+import numpy as np
+from gluonnlp.data import Vocab
+from gluonnlp.data.tokenizers import WhitespaceTokenizer
+from gluonnlp.data.streaming import RaggedIdStore, get_chunk_byte_ranges,\
+    tokenize_files_to_ids
+
+
+def test_get_chunk_byte_ranges():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'corpus.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('hello\nworld\n\nnlp')
+        for chunk_size in [1, 2, 6, 7, 100]:
+            ranges = get_chunk_byte_ranges(path, chunk_size)
+            assert ranges[0][0] == 0
+            assert ranges[-1][1] == os.path.getsize(path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            for (_, end), (next_start, _) in zip(ranges[:-1], ranges[1:]):
+                assert end == next_start
+                assert data[end - 1:end] == b'\n'
+
+
+@pytest.mark.parametrize('num_process', [1, 2])
+@pytest.mark.parametrize('chunk_size', [16, 1024])
+def test_tokenize_files_to_ids(num_process, chunk_size):
+    all_lines = [['Hello world', '', 'GluonNLP is great', '  hello   nlp  '],
+                 ['world', 'great nlp']]
+    vocab = Vocab(['Hello', 'world', 'GluonNLP', 'is', 'great', 'hello', 'nlp'],
+                  eos_token='</s>')
+    tokenizer = WhitespaceTokenizer(vocab)
+    with tempfile.TemporaryDirectory() as root:
+        paths = []
+        for i, lines in enumerate(all_lines):
+            path = os.path.join(root, 'corpus{}.txt'.format(i))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            paths.append(path)
+        out_dir = os.path.join(root, 'store')
+        store = tokenize_files_to_ids(paths, tokenizer, out_dir,
+                                      suffix_ids=[vocab.eos_id],
+                                      chunk_size=chunk_size,
+                                      num_process=num_process)
+        flatten_lines = sum(all_lines, [])
+        assert len(store) == len(flatten_lines)
+        for ids, line in zip(store, flatten_lines):
+            assert ids.tolist() == vocab[line.split()] + [vocab.eos_id]
+        assert store.file_line_range(0) == (0, 4)
+        assert store.file_line_range(1) == (4, 6)
+        assert store.lengths.tolist() == [len(line.split()) + 1 for line in flatten_lines]
+        assert not os.path.exists(os.path.join(out_dir, 'shards'))
+        # Reload from disk
+        store = RaggedIdStore(out_dir, mmap=False)
+        assert store[-1].tolist() == vocab[['great', 'nlp', '</s>']]
+        with pytest.raises(IndexError):
+            store[len(store)]
+
+
+class _CountingTokenizer(WhitespaceTokenizer):
+    def __init__(self, vocab, fail_after=None):
+        super().__init__(vocab)
+        self.num_calls = 0
+        self._fail_after = fail_after
+
+    def encode(self, sentences, output_type=str):
+        if self._fail_after is not None and self.num_calls >= self._fail_after:
+            raise RuntimeError('Interrupted')
+        self.num_calls += 1
+        return super().encode(sentences, output_type)
+
+
+def test_tokenize_files_to_ids_resume():
+    vocab = Vocab(['a', 'b', 'c'])
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'corpus.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(100):
+                f.write('a b c\n' if i % 2 == 0 else 'c\n')
+        num_chunks = len(get_chunk_byte_ranges(path, 32))
+        assert num_chunks > 2
+        gt_store = tokenize_files_to_ids(path, WhitespaceTokenizer(vocab),
+                                         os.path.join(root, 'gt'),
+                                         chunk_size=32, num_process=1)
+        out_dir = os.path.join(root, 'store')
+        with pytest.raises(RuntimeError):
+            tokenize_files_to_ids(path, _CountingTokenizer(vocab, fail_after=2), out_dir,
+                                  chunk_size=32, num_process=1)
+        with open(os.path.join(out_dir, 'progress.json'), 'r') as f:
+            assert len(json.load(f)['finished']) == 2
+        tokenizer = _CountingTokenizer(vocab)
+        store = tokenize_files_to_ids(path, tokenizer, out_dir, chunk_size=32, num_process=1)
+        assert tokenizer.num_calls == num_chunks - 2
+        assert not os.path.exists(os.path.join(out_dir, 'progress.json'))
+        np.testing.assert_equal(store.ids, gt_store.ids)
+        np.testing.assert_equal(store.offsets, gt_store.offsets)
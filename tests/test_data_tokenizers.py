@@ -6,9 +6,11 @@ from uuid import uuid4
 import os
 import unicodedata
 import tempfile
+import sacremoses
 from gluonnlp.data.tokenizers import WhitespaceTokenizer, MosesTokenizer, JiebaTokenizer,\
     SpacyTokenizer, SubwordNMTTokenizer, YTTMTokenizer, SentencepieceTokenizer, \
-    HuggingFaceBPETokenizer, HuggingFaceByteBPETokenizer, HuggingFaceWordPieceTokenizer
+    HuggingFaceBPETokenizer, HuggingFaceByteBPETokenizer, HuggingFaceWordPieceTokenizer, \
+    ByteBPETokenizer
 from gluonnlp.base import get_repo_url
 from gluonnlp.data import Vocab
 from gluonnlp.utils.misc import download
@@ -148,6 +150,19 @@ def verify_decode_hf(tokenizer, all_sentences, gt_decode_sentences):
         assert tokenizer.decode(tokenizer.encode(sentences, int)) == case_gt_deocde
 
 
+def verify_incremental_decode(tokenizer, all_sentences, out_type=str):
+    decoder = tokenizer.incremental_decoder()
+    for sentence in all_sentences:
+        tokens = tokenizer.encode(sentence, out_type)
+        gt_decode = tokenizer.decode(tokens)
+        pieces = [decoder.step(token) for token in tokens]
+        pieces.append(decoder.flush())
+        assert ''.join(pieces) == gt_decode
+        if '\ufffd' not in gt_decode:
+            # Partial characters should not be emitted
+            assert all('\ufffd' not in ele for ele in pieces)
+
+
 def verify_decode_no_vocab_raise(tokenizer):
     # When the vocab is not attached, should raise ValueError
     for sentences in [EN_SAMPLES[0], EN_SAMPLES]:
@@ -204,6 +219,8 @@ def test_whitespace_tokenizer():
     tokenizer.set_vocab(vocab)
     verify_decode(tokenizer, EN_SAMPLES + DE_SAMPLES, int)
     verify_pickleble(tokenizer, WhitespaceTokenizer)
+    verify_incremental_decode(tokenizer, EN_SAMPLES + DE_SAMPLES, str)
+    verify_incremental_decode(tokenizer, EN_SAMPLES + DE_SAMPLES, int)
     verify_encode_token_with_offsets(tokenizer, EN_SAMPLES + DE_SAMPLES)
 
 
@@ -243,6 +260,24 @@ def test_moses_tokenizer():
     verify_decode(de_tokenizer, DE_SAMPLES, int)
     verify_pickleble(en_tokenizer, MosesTokenizer)
     verify_pickleble(de_tokenizer, MosesTokenizer)
+    # Test for batch_encode
+    assert en_tokenizer.batch_encode(EN_SAMPLES) == gt_en_tokenized
+    assert de_tokenizer.batch_encode(DE_SAMPLES, int, num_process=2, chunksize=1) ==\
+        [vocab[ele_tokens] for ele_tokens in gt_de_tokenized]
+
+
+@pytest.mark.parametrize('lang', ['en', 'de', 'fr'])
+def test_moses_tokenizer_ascii_fast_path(lang):
+    tokenizer = MosesTokenizer(lang)
+    moses_tokenizer = sacremoses.MosesTokenizer(lang=lang)
+    rng = random.Random(123)
+    pieces = list(' \t"\'`,.;:!?()[]{}<>&|@#$%^*~/\\-_+=0123456789aZbyM') +\
+        ["n't", "'s", 'Mr.', 'No.', '1,000', '3.5', 'http://a.b', 'e.g.', '--', '...', 'Özil']
+    sentences = [''.join(rng.choice(pieces) for _ in range(rng.randint(0, 25)))
+                 for _ in range(1000)] + EN_SAMPLES + DE_SAMPLES
+    gt_tokens = [moses_tokenizer.tokenize(sentence, return_str=False) for sentence in sentences]
+    assert tokenizer.encode(sentences) == gt_tokens
+    assert tokenizer.batch_encode(sentences, num_process=2, chunksize=100) == gt_tokens
 
 
 def test_jieba_tokenizer():
@@ -374,6 +409,8 @@ def test_sentencepiece_tokenizer():
         verify_pickleble(tokenizer, SentencepieceTokenizer)
         verify_encode_token_with_offsets(tokenizer, SUBWORD_TEST_SAMPLES, gt_offsets)
         verify_decode_spm(tokenizer, SUBWORD_TEST_SAMPLES, gt_int_decode)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, str)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, int)
 
         # Case2, lower_case
         gt_lower_case_int_decode = ['hello, y ⁇ all! how are you viii  ⁇   ⁇   ⁇  ?',
@@ -484,6 +521,8 @@ def test_huggingface_bpe_tokenizer():
         verify_pickleble(tokenizer, HuggingFaceBPETokenizer)
         verify_encode_token_with_offsets(tokenizer, SUBWORD_TEST_SAMPLES, gt_offsets)
         verify_decode_hf(tokenizer, SUBWORD_TEST_SAMPLES, gt_decode)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, str)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, int)
 
         # Case 2, lowercase=True
         gt_lowercase_decode = ["hello , y ' all ! how are you ?",
@@ -545,6 +584,8 @@ def test_huggingface_bytebpe_tokenizer():
         verify_pickleble(tokenizer, HuggingFaceByteBPETokenizer)
         verify_encode_token_with_offsets(tokenizer, SUBWORD_TEST_SAMPLES, gt_offsets)
         verify_decode_hf(tokenizer, SUBWORD_TEST_SAMPLES, gt_decode)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, str)
+        verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES, int)
 
         # Case 2, lowercase=True
         gt_lowercase_int_decode = ["hello, y'all! how are you ⅷ 😁 😁 😁 ?",
@@ -565,6 +606,69 @@ def test_huggingface_bytebpe_tokenizer():
         os.remove(hf_vocab_path)
 
 
+def test_bytebpe_tokenizer():
+    with tempfile.TemporaryDirectory() as dir_path:
+        model_path = os.path.join(dir_path, 'hf_bytebpe.model')
+        download(url=get_repo_url() + 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.model',
+                 path=model_path)
+        vocab_path = os.path.join(dir_path, 'hf_bytebpe.vocab')
+        download(url=get_repo_url() + 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.vocab',
+                 path=vocab_path)
+        hf_vocab_path = os.path.join(dir_path, 'hf_bytebpe.hf_vocab')
+        download(url=get_repo_url() + 'tokenizer_test_models/hf_bytebpe/test_hf_bytebpe.hf_vocab',
+                 path=hf_vocab_path)
+        gt_tokenized = [['Hello', ',', 'Ġy', "'", 'all', '!', 'ĠHow', 'Ġare', 'Ġyou',
+                         'Ġâ', 'ħ', '§', 'ĠðŁĺ', 'ģ', 'ĠðŁĺ', 'ģ', 'ĠðŁĺ', 'ģ', 'Ġ?'],
+                        ['Gl', 'u', 'on', 'N', 'LP', 'Ġis', 'Ġgreat', 'ï¼', 'ģ', 'ï¼',
+                         'ģ', 'ï¼', 'ģ', '!!!'],
+                        ['Gl', 'u', 'on', 'N', 'LP', '-', 'Amazon', '-', 'Ha', 'ib', 'in',
+                         '-', 'Le', 'on', 'ard', '-', 'She', 'ng', '-', 'Sh', 'u',
+                         'ai', '-', 'X', 'ing', 'j', 'ian', '.....', '/', ':', '!', '@',
+                         '#', "Ġ'", 'ab', 'c', "'"]]
+        gt_offsets = [[(0, 5), (5, 6), (6, 8), (8, 9), (9, 12), (12, 13), (13, 17), (17, 21),
+                       (21, 25), (25, 27), (26, 27), (26, 27), (27, 29), (28, 29), (29, 31),
+                       (30, 31), (31, 33), (32, 33), (33, 35)],
+                      [(0, 2), (2, 3), (3, 5), (5, 6), (6, 8), (8, 11), (11, 17), (17, 18),
+                       (17, 18), (18, 19), (18, 19), (19, 20), (19, 20), (20, 23)],
+                      [(0, 2), (2, 3), (3, 5), (5, 6), (6, 8), (8, 9), (9, 15), (15, 16),
+                       (16, 18), (18, 20), (20, 22), (22, 23), (23, 25), (25, 27), (27, 30),
+                       (30, 31), (31, 34), (34, 36), (36, 37), (37, 39), (39, 40), (40, 42),
+                       (42, 43), (43, 44), (44, 47), (47, 48), (48, 51), (51, 56),
+                       (56, 57), (57, 58), (58, 59), (59, 60), (60, 61), (61, 63),
+                       (63, 65), (65, 66), (66, 67)]]
+        gt_decode = ["Hello, y'all! How are you Ⅷ 😁 😁 😁 ?",
+                     'GluonNLP is great！！！!!!',
+                     "GluonNLP-Amazon-Haibin-Leonard-Sheng-Shuai-Xingjian...../:!@# 'abc'"]
+        for vocab in [vocab_path, hf_vocab_path]:
+            tokenizer = ByteBPETokenizer(model_path, vocab)
+            verify_encode_token(tokenizer, SUBWORD_TEST_SAMPLES, gt_tokenized)
+            verify_pickleble(tokenizer, ByteBPETokenizer)
+            verify_encode_token_with_offsets(tokenizer, SUBWORD_TEST_SAMPLES, gt_offsets)
+            verify_decode_hf(tokenizer, SUBWORD_TEST_SAMPLES, gt_decode)
+            verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES + ZH_SAMPLES, str)
+            verify_incremental_decode(tokenizer, SUBWORD_TEST_SAMPLES + ZH_SAMPLES, int)
+
+        # Should be consistent with the HuggingFace implementation
+        all_sentences = SUBWORD_TEST_SAMPLES + EN_SAMPLES + DE_SAMPLES + ZH_SAMPLES
+        for kwargs in [{}, {'lowercase': True}]:
+            tokenizer = ByteBPETokenizer(model_path, vocab_path, **kwargs)
+            hf_tokenizer = HuggingFaceByteBPETokenizer(model_path, vocab_path, **kwargs)
+            for output_type in [str, int]:
+                assert tokenizer.encode_with_offsets(all_sentences, output_type) ==\
+                    hf_tokenizer.encode_with_offsets(all_sentences, output_type)
+            assert tokenizer.decode(tokenizer.encode(all_sentences, int)) ==\
+                hf_tokenizer.decode(hf_tokenizer.encode(all_sentences, int))
+
+        # BPE-Dropout can be switched on and off without rebuilding the tokenizer
+        tokenizer = ByteBPETokenizer(model_path, vocab_path)
+        tokenizer.set_bpe_dropout(1.0)
+        for sentence, tokens in zip(SUBWORD_TEST_SAMPLES,
+                                    tokenizer.encode(SUBWORD_TEST_SAMPLES, str)):
+            assert len(tokens) == len(sentence.encode('utf-8'))
+        tokenizer.set_bpe_dropout(0.0)
+        verify_encode_token(tokenizer, SUBWORD_TEST_SAMPLES, gt_tokenized)
+
+
 def test_huggingface_wordpiece_tokenizer():
     with tempfile.TemporaryDirectory() as dir_path:
         vocab_path = os.path.join(dir_path, 'hf_wordpiece.vocab')
@@ -1,9 +1,11 @@
 import numpy as np
 import collections
 import os
+import struct
 import tempfile
 import pytest
-from gluonnlp.embedding import load_embeddings, get_fasttext_model
+from gluonnlp.embedding import load_embeddings, get_fasttext_model,\
+    load_fasttext_subword_embedding
 from gluonnlp.data import Vocab
 
 def test_load_embeddings():
@@ -48,3 +50,156 @@ def test_get_fasttext_model():
     with pytest.raises(ValueError):
         get_fasttext_model('wiki.multi.ar')
 
+
+
+@pytest.mark.parametrize('header', [False, True])
+@pytest.mark.parametrize('num_threads,block_size', [(1, 1024 * 1024), (4, 64)])
+def test_load_embedding_txt(header, num_threads, block_size):
+    from gluonnlp.embedding.embed_loader import _load_embedding_txt
+    words = ['hello', 'world', 'a b', 'nice', '<unk>', '你好', 'hi']
+    matrix = np.random.normal(0, 1, (len(words), 20)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "tmp.txt")
+        with open(path, "w", encoding='utf-8') as f:
+            if header:
+                f.write("{} {}\n".format(matrix.shape[0], matrix.shape[1]))
+            for word, vec in zip(words, matrix):
+                f.write(word + " ")
+                # Some files use multiple spaces or end with spaces
+                f.write("  ".join([str(num) for num in vec.tolist()]) if word == 'nice'
+                        else " ".join([str(num) for num in vec.tolist()]) + " ")
+                f.write("\n")
+        # Load all the words
+        loaded_matrix, loaded_vocab = _load_embedding_txt(path, None, '<unk>',
+                                                          num_threads=num_threads,
+                                                          block_size=block_size)
+        assert loaded_vocab.all_tokens == ['hello', 'world', 'ab', 'nice', '<unk>', '你好', 'hi']
+        assert loaded_vocab.unk_token == '<unk>'
+        np.testing.assert_allclose(loaded_matrix, matrix)
+        # Load with vocab
+        vocab = Vocab(['world', 'ab', 'unseen', '你好'], unk_token='<oov>')
+        loaded_matrix, hit_indices = _load_embedding_txt(path, vocab, '<unk>',
+                                                         num_threads=num_threads,
+                                                         block_size=block_size)
+        assert vocab.all_tokens == ['world', 'ab', 'unseen', '你好', '<oov>']
+        assert hit_indices.tolist() == [1, 2, -1, 5, 4]
+        np.testing.assert_allclose(loaded_matrix[hit_indices >= 0], matrix[[1, 2, 5, 4]])
+        # Invalid numbers
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('bad ' + ' '.join(['0.1'] * 19) + ' x\n')
+        with pytest.raises(ValueError):
+            _load_embedding_txt(path, None, '<unk>', num_threads=num_threads,
+                                block_size=block_size)
+
+
+@pytest.mark.parametrize('cache_dtype', ['float32', 'float16'])
+def test_load_embeddings_cache(monkeypatch, cache_dtype):
+    words = ['hello', 'world', '<unk>', '你好', 'hi']
+    matrix = np.random.normal(0, 1, (len(words), 10)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as root:
+        monkeypatch.setenv('MXNET_HOME', os.path.join(root, 'home'))
+        path = os.path.join(root, "tmp.txt")
+        with open(path, "w", encoding='utf-8') as f:
+            for word, vec in zip(words, matrix):
+                f.write(word + " " + " ".join([str(num) for num in vec.tolist()]) + "\n")
+        gt_matrix, gt_vocab = load_embeddings(pretrained_name_or_dir=path)
+        # The cache is opt-in
+        assert gt_matrix.flags.writeable
+        assert not os.path.exists(os.path.join(root, 'home', 'embedding', 'cache'))
+        atol = 1E-6 if cache_dtype == 'float32' else 1E-2
+        for _ in range(2):
+            # The first call builds the cache and the second call directly loads the cache
+            cached_matrix, cached_vocab = load_embeddings(pretrained_name_or_dir=path, cache=True,
+                                                          cache_dtype=cache_dtype)
+            assert cached_matrix.dtype == np.dtype(cache_dtype)
+            assert cached_vocab.all_tokens == gt_vocab.all_tokens
+            np.testing.assert_allclose(cached_matrix, gt_matrix, atol=atol)
+        cache_root = os.path.join(root, 'home', 'embedding', 'cache')
+        assert len(os.listdir(cache_root)) == 1
+        vocab = Vocab(['world', 'hi', 'unseen'], unk_token='<unk>')
+        cached_matrix = load_embeddings(vocab, path, cache=True, cache_dtype=cache_dtype,
+                                        unk_method=lambda words: np.zeros((len(words), 10)))
+        assert cached_matrix.dtype == np.float32
+        np.testing.assert_allclose(cached_matrix[:2], matrix[[1, 4]], atol=atol)
+        np.testing.assert_allclose(cached_matrix[vocab['<unk>']], matrix[2], atol=atol)
+        np.testing.assert_allclose(cached_matrix[vocab['unseen']], 0)
+        # The hit indices are the same with or without the cache
+        for use_cache in [False, True]:
+            _, hit_indices = load_embeddings(vocab, path, cache=use_cache,
+                                             cache_dtype=cache_dtype, return_hit_indices=True)
+            assert hit_indices.tolist() == [1, 4, -1, 2]
+        # The cache is rebuilt after the file is modified
+        with open(path, "a", encoding='utf-8') as f:
+            f.write("new " + " ".join(['1.0'] * 10) + "\n")
+        os.utime(path, ns=(0, 0))
+        cached_matrix, cached_vocab = load_embeddings(pretrained_name_or_dir=path, cache=True,
+                                                      cache_dtype=cache_dtype)
+        assert cached_vocab.all_tokens == words + ['new']
+        assert len(os.listdir(cache_root)) == 2
+
+
+def test_align_vocab():
+    from gluonnlp.embedding.embed_loader import _align_vocab, _build_embedding_matrix
+    idx_to_token = ['hello', 'dup', '<unk>', '[UNK]', 'world', 'dup']
+    idx_to_vec = np.random.normal(0, 1, (len(idx_to_token), 5)).astype(np.float32)
+    vocab = Vocab(['world', 'dup', 'unseen', 'hello'], unk_token='[UNK]')
+    # The unknown token of the pretrained file is mapped to the unk_token of the vocab
+    # and the last row is used for the duplicated tokens
+    assert _align_vocab(vocab, idx_to_token, '<unk>').tolist() == [4, 5, -1, 0, 2]
+    assert _align_vocab(vocab, idx_to_token, '<oov>').tolist() == [4, 5, -1, 0, -1]
+    assert _align_vocab(vocab, idx_to_token, None).tolist() == [4, 5, -1, 0, 3]
+    matrix, hit_indices = _build_embedding_matrix(idx_to_token, idx_to_vec, '<unk>', vocab)
+    assert matrix.shape == (len(vocab), 5)
+    np.testing.assert_allclose(matrix[hit_indices >= 0], idx_to_vec[[4, 5, 0, 2]])
+    np.testing.assert_allclose(matrix[hit_indices < 0], 0)
+
+
+def _write_fasttext_bin(path, words, input_matrix, minn, maxn, bucket):
+    """Write a skipgram model in the binary format of FastText v12"""
+    dim = input_matrix.shape[1]
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<ii', 793712314, 12))
+        # dim, ws, epoch, minCount, neg, wordNgrams, loss, model, bucket, minn, maxn,
+        # lrUpdateRate, t
+        f.write(struct.pack('<12id', dim, 5, 1, 1, 5, 1, 2, 2, bucket, minn, maxn, 100, 1E-4))
+        f.write(struct.pack('<iiiqq', len(words), len(words), 0, len(words), -1))
+        for word in words:
+            f.write(word.encode('utf-8') + b'\0' + struct.pack('<qb', 1, 0))
+        for matrix in [input_matrix, np.zeros((len(words), dim))]:
+            f.write(struct.pack('<?qq', False, *matrix.shape))
+            f.write(matrix.astype('<f4').tobytes())
+
+
+@pytest.mark.parametrize('minn,maxn,bucket', [(3, 6, 2000), (1, 3, 100), (0, 0, 100)])
+def test_fasttext_subword_embedding(minn, maxn, bucket):
+    words = ['</s>', 'hello', 'world', 'naïve', 'café', '日本語', 'straße']
+    queries = words + ['helo', 'wörld', '😀', 'a', '', 'x' * 30]
+    input_matrix = np.random.normal(0, 1, (len(words) + bucket, 8)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'model.bin')
+        _write_fasttext_bin(path, words, input_matrix, minn, maxn, bucket)
+        for mmap in [True, False]:
+            ft_embed = load_fasttext_subword_embedding(path, mmap=mmap)
+            assert ft_embed.dim == 8
+            assert ft_embed.words == words
+            vectors = ft_embed.get_vectors(queries, batch_size=4)
+            assert vectors.shape == (len(queries), 8)
+            ft = get_fasttext_model(path)
+            for query, vector in zip(queries, vectors):
+                ids, offsets = ft_embed.get_subword_ids([query])
+                assert ids.tolist() == ft.get_subwords(query)[1].tolist()
+                assert offsets.tolist() == [0, len(ids)]
+                np.testing.assert_allclose(vector, ft.get_word_vector(query),
+                                           rtol=1E-5, atol=1E-5)
+            del ft_embed, vectors
+
+        # Fill the OOV rows with the subword embedding
+        txt_path = os.path.join(root, 'embed.txt')
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write('hello 1 1 1 1 1 1 1 1\n')
+        ft_embed = load_fasttext_subword_embedding(path)
+        vocab = Vocab(['hello', 'helo', 'café'])
+        matrix = load_embeddings(vocab, txt_path, unk_method=ft_embed)
+        np.testing.assert_allclose(matrix[vocab['hello']], 1)
+        np.testing.assert_allclose(matrix[vocab[['helo', 'café']]],
+                                   ft_embed(['helo', 'café']))
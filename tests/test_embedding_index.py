@@ -0,0 +1,91 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+from gluonnlp.embedding import ExactEmbeddingIndex, IVFEmbeddingIndex, load_embedding_index
+
+
+def gen_clustered_matrix(num_vectors, dim, num_clusters=20, seed=0):
+    rng = np.random.RandomState(seed)
+    centers = rng.normal(0, 1, (num_clusters, dim))
+    assignments = rng.randint(0, num_clusters, num_vectors)
+    return (centers[assignments] + 0.3 * rng.normal(0, 1, (num_vectors, dim))).astype(np.float32)
+
+
+def brute_force_topk(matrix, queries, k, metric):
+    if metric == 'cosine':
+        matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ matrix.T
+    indices = np.argsort(-scores, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(scores, indices, axis=1), indices
+
+
+def recall(indices, gt_indices):
+    return np.mean([len(set(a) & set(b)) / len(b)
+                    for a, b in zip(indices.tolist(), gt_indices.tolist())])
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'dot'])
+@pytest.mark.parametrize('dtype', ['float32', 'float16', 'int8'])
+@pytest.mark.parametrize('block_size', [7, 16384])
+def test_exact_embedding_index(metric, dtype, block_size):
+    matrix = gen_clustered_matrix(500, 16)
+    queries = np.random.normal(0, 1, (13, 16)).astype(np.float32)
+    index = ExactEmbeddingIndex(matrix, metric=metric, dtype=dtype, block_size=block_size)
+    assert len(index) == 500 and index.dim == 16
+    gt_scores, gt_indices = brute_force_topk(matrix, queries, 10, metric)
+    scores, indices = index.search(queries, k=10)
+    assert scores.shape == indices.shape == (13, 10)
+    assert (np.diff(scores, axis=1) <= 0).all()
+    if dtype == 'float32':
+        np.testing.assert_allclose(scores, gt_scores, rtol=1E-4, atol=1E-4)
+        assert recall(indices, gt_indices) > 0.99
+    else:
+        assert recall(indices, gt_indices) > 0.8
+    # k larger than the number of vectors
+    scores, indices = index.search(queries[:2], k=1000)
+    assert indices.shape == (2, 500)
+    assert sorted(indices[0].tolist()) == list(range(500))
+    with pytest.raises(ValueError):
+        index.search(queries[:, :8])
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'int8'])
+def test_ivf_embedding_index(dtype):
+    matrix = gen_clustered_matrix(2000, 16)
+    queries = matrix[:50] + 0.1 * np.random.normal(0, 1, (50, 16)).astype(np.float32)
+    _, gt_indices = brute_force_topk(matrix, queries, 10, 'cosine')
+    index = IVFEmbeddingIndex(matrix, nlist=32, nprobe=4, dtype=dtype, block_size=64)
+    assert index.nlist == 32
+    _, indices = index.search(queries, k=10)
+    assert recall(indices, gt_indices) > 0.8
+    # Probing all the lists is the same as the exact search
+    scores, indices = index.search(queries, k=10, nprobe=32)
+    exact_scores, exact_indices = ExactEmbeddingIndex(matrix, dtype=dtype).search(queries, k=10)
+    np.testing.assert_allclose(scores, exact_scores, rtol=1E-5, atol=1E-5)
+    assert recall(indices, exact_indices) > 0.99
+    # Fewer than k vectors in the probed lists
+    index = IVFEmbeddingIndex(matrix[:20], nlist=10, nprobe=1)
+    scores, indices = index.search(queries[:3], k=20)
+    assert ((indices == -1) == np.isinf(scores)).all()
+    assert (indices >= 0).sum(axis=1).max() < 20
+
+
+@pytest.mark.parametrize('index_cls', [ExactEmbeddingIndex, IVFEmbeddingIndex])
+@pytest.mark.parametrize('mmap', [False, True])
+def test_embedding_index_save_load(index_cls, mmap):
+    matrix = gen_clustered_matrix(300, 8)
+    queries = np.random.normal(0, 1, (5, 8)).astype(np.float32)
+    index = index_cls(matrix, dtype='int8')
+    gt_scores, gt_indices = index.search(queries, k=5)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'index')
+        index.save(path)
+        loaded_index = load_embedding_index(path, mmap=mmap)
+        assert isinstance(loaded_index, index_cls)
+        assert repr(loaded_index) == repr(index)
+        scores, indices = loaded_index.search(queries, k=5)
+        np.testing.assert_allclose(scores, gt_scores)
+        np.testing.assert_equal(indices, gt_indices)
+        del loaded_index
@@ -9,6 +9,7 @@ from gluonnlp.layers import\
     BucketPositionalEmbedding, \
     AdaptiveEmbedding, \
     ProjectedAdaptiveLogSoftmaxWithLoss, \
+    QuantizedEmbedding, \
     get_activation
 from gluonnlp.op import relative_position_bucket
 mx.npx.set_np()
@@ -70,6 +71,25 @@ def test_positional_embedding():
     assert isinstance(pos_embed._embed, LearnedPositionalEmbedding)
 
 
+@pytest.mark.parametrize('storage_dtype', ['int8', 'float16'])
+@pytest.mark.parametrize('hybridize', [False, True])
+def test_quantized_embedding(storage_dtype, hybridize):
+    vocab_size, units = 50, 16
+    weight = np.random.normal(0, 1, (vocab_size, units)).astype(np.float32)
+    embed = QuantizedEmbedding(vocab_size, units, storage_dtype=storage_dtype)
+    embed.initialize()
+    embed.set_float_weight(weight)
+    assert embed.weight.data().dtype == np.dtype(storage_dtype)
+    if hybridize:
+        embed.hybridize()
+    inputs = mx.np.random.randint(0, vocab_size, (4, 6))
+    out = embed(inputs)
+    assert out.shape == (4, 6, units)
+    assert out.dtype == np.float32
+    atol = 2E-2 if storage_dtype == 'int8' else 1E-3
+    assert_allclose(out.asnumpy(), weight[inputs.asnumpy()], atol=atol)
+
+
 def test_get_activation():
     # Here we just test that the scripts are runnable. Should be revised to test for correctness
     for act_type in ['leaky', 'identity', 'elu', 'gelu', 'gelu(tanh)', 'gelu(sigmoid)',
@@ -6,6 +6,7 @@ from numpy.testing import assert_allclose
 from gluonnlp.models.gpt2 import GPT2Model, GPT2ForLM, \
     list_pretrained_gpt2, get_pretrained_gpt2
 from gluonnlp.loss import LabelSmoothCrossEntropyLoss
+from gluonnlp.sequence_sampler import SpeculativeSampler
 
 mx.npx.set_np()
 
@@ -110,6 +111,132 @@ def test_gpt2_incremental_states(ctx):
                         hiddens.asnumpy(), 1E-4, 1E-4)
 
 
+@pytest.mark.parametrize('layout,compute_layout', [('NT', 'auto'), ('TN', 'auto'), ('NT', 'TN')])
+@pytest.mark.parametrize('hybridize', [False, True])
+def test_gpt2_preallocated_states(layout, compute_layout, hybridize, ctx):
+    cfg = GPT2Model.get_cfg()
+    cfg.defrost()
+    cfg.MODEL.vocab_size = 1000
+    cfg.MODEL.units = 64
+    cfg.MODEL.num_layers = 2
+    cfg.MODEL.num_heads = 2
+    cfg.MODEL.layout = layout
+    cfg.MODEL.compute_layout = compute_layout
+    cfg.freeze()
+    with ctx:
+        batch_size = 3
+        prompt_length = 4
+        sequence_length = 9
+        max_cache_length = 12
+        inputs = mx.np.random.randint(0, 1000, (batch_size, sequence_length), ctx=ctx)
+        if layout == 'TN':
+            inputs = inputs.T
+        gpt2_model = GPT2Model.from_cfg(cfg)
+        gpt2_model.initialize(ctx=ctx)
+        cached_gpt2_model = GPT2Model.from_cfg(cfg, max_cache_length=max_cache_length)
+        cached_gpt2_model.share_parameters(gpt2_model.collect_params())
+        if hybridize:
+            gpt2_model.hybridize()
+            cached_gpt2_model.hybridize()
+        gt_hiddens, _ = gpt2_model(inputs, gpt2_model.init_states(batch_size, ctx),
+                                   mx.np.array(0, dtype=np.int32, ctx=ctx))
+        states = cached_gpt2_model.init_states(batch_size, ctx)
+        batch_axis = cached_gpt2_model.state_batch_axis
+        assert states.shape[batch_axis] == batch_size
+        assert states.shape[5 - batch_axis] == max_cache_length
+        # Feed the prompt at once and then decode step by step
+        hiddens_l = []
+        prev_len = 0
+        for step_length in [prompt_length] + [1] * (sequence_length - prompt_length):
+            if layout == 'NT':
+                step_inputs = inputs[:, prev_len:(prev_len + step_length)]
+            else:
+                step_inputs = inputs[prev_len:(prev_len + step_length), :]
+            hiddens, states = cached_gpt2_model(step_inputs, states,
+                                                mx.np.array(prev_len, dtype=np.int32, ctx=ctx))
+            assert states.shape[5 - batch_axis] == max_cache_length
+            hiddens_l.append(hiddens)
+            prev_len += step_length
+        time_axis = 1 if layout == 'NT' else 0
+        hiddens = mx.np.concatenate(hiddens_l, axis=time_axis)
+        assert_allclose(hiddens.asnumpy(), gt_hiddens.asnumpy(), 1E-4, 1E-4)
+
+
+@pytest.mark.parametrize('max_cache_length', [None, 32])
+def test_gpt2_speculative_sampler(max_cache_length, ctx):
+    vocab_size = 6
+
+    def get_lm_model(num_layers, units):
+        cfg = GPT2Model.get_cfg()
+        cfg.defrost()
+        cfg.MODEL.vocab_size = vocab_size
+        cfg.MODEL.units = units
+        cfg.MODEL.num_layers = num_layers
+        cfg.MODEL.num_heads = 2
+        cfg.freeze()
+        model = GPT2ForLM(cfg, max_cache_length=max_cache_length)
+        model.initialize(ctx=ctx)
+        model.hybridize()
+        return model
+
+    with ctx:
+        target_model = get_lm_model(2, 32)
+        draft_model = get_lm_model(1, 16)
+        batch_size = 3
+        prompt_length = 4
+        max_length = 10
+        inputs = mx.np.random.randint(0, vocab_size, (batch_size, prompt_length), ctx=ctx)
+        # The greedy decoding of the target model
+        gt_samples = inputs.asnumpy()
+        states = target_model.init_states(batch_size, ctx)
+        prev_len = 0
+        for _ in range(max_length):
+            logits, states = target_model(
+                mx.np.array(gt_samples[:, prev_len:], dtype=np.int32, ctx=ctx), states,
+                mx.np.array(prev_len, dtype=np.int32, ctx=ctx))
+            prev_len = gt_samples.shape[1]
+            gt_samples = np.concatenate([gt_samples, logits[:, -1].asnumpy().argmax(axis=-1)
+                                        .reshape((-1, 1))], axis=1)
+        sampler = SpeculativeSampler(target_model, draft_model, num_draft_tokens=3,
+                                     max_length=max_length, sampling=False)
+        samples, valid_length = sampler(inputs)
+        assert samples.asnumpy().tolist() == gt_samples.tolist()
+        assert (valid_length.asnumpy() == prompt_length + max_length).all()
+        assert sampler.num_target_calls <= max_length
+        # All the tokens proposed by the target model itself are accepted
+        sampler = SpeculativeSampler(target_model, target_model, num_draft_tokens=3,
+                                     max_length=max_length, sampling=False)
+        samples, _ = sampler(inputs)
+        assert samples.asnumpy().tolist() == gt_samples.tolist()
+        assert sampler.acceptance_rate == 1.0
+        # Stop at the EOS token
+        eos_id = int(gt_samples[0, prompt_length + 2])
+        sampler = SpeculativeSampler(target_model, draft_model, num_draft_tokens=3,
+                                     eos_id=eos_id, max_length=max_length, sampling=False)
+        samples, valid_length = sampler(inputs)
+        samples = samples.asnumpy()
+        valid_length = valid_length.asnumpy()
+        for i in range(batch_size):
+            vl = valid_length[i]
+            assert samples[i, :vl].tolist() == gt_samples[i, :vl].tolist()
+            assert (samples[i, vl:] == -1).all()
+            if vl < prompt_length + max_length:
+                assert samples[i, vl - 1] == eos_id
+        assert valid_length[0] <= prompt_length + 3
+        # The samples follow the distribution of the target model
+        num_samples = 2000
+        sampler = SpeculativeSampler(target_model, draft_model, num_draft_tokens=2,
+                                     max_length=1, sampling=True)
+        samples, _ = sampler(mx.np.array(np.tile(inputs.asnumpy()[:1], (num_samples, 1)),
+                                         dtype=np.int32, ctx=ctx))
+        freqs = np.bincount(samples.asnumpy()[:, prompt_length],
+                            minlength=vocab_size) / num_samples
+        logits, _ = target_model(inputs[:1], target_model.init_states(1, ctx),
+                                 mx.np.array(0, dtype=np.int32, ctx=ctx))
+        gt_probs = mx.npx.softmax(logits[0, -1]).asnumpy()
+        assert_allclose(freqs, gt_probs, atol=0.05)
+
+
 @pytest.mark.remote_required
 @pytest.mark.parametrize('model_name', list_pretrained_gpt2())
 def test_gpt2(model_name, ctx):
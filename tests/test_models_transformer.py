@@ -1,12 +1,14 @@
+import numpy as np
 import mxnet as mx
 import pytest
 from numpy.testing import assert_allclose
 from gluonnlp.models.transformer import\
     TransformerEncoder, TransformerDecoder, \
-    TransformerModel, TransformerNMTInference,\
+    TransformerModel, TransformerNMTInference, TranslationEngine,\
     transformer_cfg_reg
 from gluonnlp.attention_cell import gen_mem_attn_mask, gen_self_attn_mask
 from gluonnlp.utils.testing import verify_nmt_model, verify_nmt_inference
+from gluonnlp.sequence_sampler import BeamSearchSampler
 mx.npx.set_np()
 
 
@@ -91,6 +93,22 @@ def test_transformer_encoder_decoder(pre_norm, num_enc_layers, num_dec_layers):
         val_length = dst_valid_length[i].asnumpy()
         assert_allclose(final_out_from_incremental[i, :val_length, :].asnumpy(),
                         full_decode_out[i, :val_length, :].asnumpy(), 1E-5, 1E-5)
+    # Test for the full decoder with the preallocated key/value cache
+    states = dec.init_states(batch_size, src_data.ctx, src_data.dtype,
+                             max_length=tgt_seq_length + 3)
+    final_out_from_cache = []
+    for i in range(tgt_seq_length):
+        position = mx.np.full((batch_size,), i, dtype=np.int32)
+        ele_final_out, states = dec.incremental_decode(mx, dst_data[:, i, :],
+                                                       states, encoded_mem, src_valid_length,
+                                                       position=position)
+        assert states[0][0].shape == (batch_size, tgt_seq_length + 3,
+                                      dec.layers[0]._num_heads,
+                                      dec.layers[0]._units // dec.layers[0]._num_heads)
+        final_out_from_cache.append(ele_final_out)
+    final_out_from_cache = mx.np.stack(final_out_from_cache, axis=1)
+    assert_allclose(final_out_from_cache.asnumpy(), final_out_from_incremental.asnumpy(),
+                    1E-5, 1E-5)
 
 
 @pytest.mark.parametrize('train_hybridize,inference_hybridize',
@@ -147,6 +165,179 @@ def test_transformer_nmt_model(train_hybridize, inference_hybridize,
     verify_nmt_inference(train_model=model, inference_model=inference_model)
 
 
+@pytest.mark.parametrize('inference_hybridize', [False, True])
+@pytest.mark.parametrize('layout', ['NT', 'TN'])
+def test_transformer_nmt_inference_kv_cache(inference_hybridize, layout):
+    model = TransformerModel(src_vocab_size=32,
+                             tgt_vocab_size=32,
+                             max_src_length=20,
+                             max_tgt_length=15,
+                             enc_units=24,
+                             enc_hidden_size=64,
+                             enc_num_heads=4,
+                             enc_num_layers=2,
+                             dec_units=24,
+                             dec_hidden_size=64,
+                             dec_num_heads=4,
+                             dec_num_layers=2,
+                             dropout=0.0,
+                             layout=layout)
+    inference_model = TransformerNMTInference(model=model, max_cache_length=15)
+    model.initialize()
+    if inference_hybridize:
+        inference_model.hybridize()
+    verify_nmt_inference(train_model=model, inference_model=inference_model)
+
+
+@pytest.mark.parametrize('inference_hybridize', [False, True])
+@pytest.mark.parametrize('beam_size', [1, 4])
+def test_transformer_nmt_inference_kv_cache_beam_search(beam_size, inference_hybridize):
+    model = TransformerModel(src_vocab_size=32,
+                             tgt_vocab_size=32,
+                             max_src_length=20,
+                             max_tgt_length=20,
+                             enc_units=24,
+                             enc_hidden_size=64,
+                             enc_num_heads=4,
+                             enc_num_layers=2,
+                             dec_units=24,
+                             dec_hidden_size=64,
+                             dec_num_heads=4,
+                             dec_num_layers=2,
+                             dropout=0.0)
+    model.initialize()
+    max_length = 12
+    src_data = mx.np.random.randint(0, 32, (3, 8))
+    src_valid_length = mx.np.array([8, 3, 5], dtype=np.int32)
+    outputs = []
+    for inference_model in [TransformerNMTInference(model=model),
+                            TransformerNMTInference(model=model, max_cache_length=max_length)]:
+        if inference_hybridize:
+            inference_model.hybridize()
+        sampler = BeamSearchSampler(beam_size=beam_size, decoder=inference_model, eos_id=1,
+                                    vocab_size=32, max_length_b=max_length - 1)
+        states = inference_model.init_states(src_data, src_valid_length)
+        outputs.append(sampler(mx.np.full((3,), 2, dtype=np.int32), states))
+    (gt_samples, gt_scores, gt_valid_length), (samples, scores, valid_length) = outputs
+    assert_allclose(samples.asnumpy(), gt_samples.asnumpy())
+    assert_allclose(scores.asnumpy(), gt_scores.asnumpy(), 1E-4, 1E-4)
+    assert_allclose(valid_length.asnumpy(), gt_valid_length.asnumpy())
+
+
+@pytest.mark.parametrize('inference_hybridize', [False, True])
+@pytest.mark.parametrize('tie_weights', [False, True])
+def test_transformer_nmt_inference_shortlist(inference_hybridize, tie_weights):
+    vocab_size = 32
+    model = TransformerModel(src_vocab_size=vocab_size,
+                             tgt_vocab_size=vocab_size,
+                             max_src_length=20,
+                             max_tgt_length=20,
+                             enc_units=24,
+                             enc_hidden_size=64,
+                             enc_num_heads=4,
+                             enc_num_layers=2,
+                             dec_units=24,
+                             dec_hidden_size=64,
+                             dec_num_heads=4,
+                             dec_num_layers=2,
+                             dropout=0.0,
+                             tie_weights=tie_weights)
+    model.initialize()
+    inference_model = TransformerNMTInference(model=model)
+    shortlist_model = TransformerNMTInference(model=model, use_shortlist=True)
+    if inference_hybridize:
+        inference_model.hybridize()
+        shortlist_model.hybridize()
+    src_data = mx.np.random.randint(0, vocab_size, (3, 8))
+    src_valid_length = mx.np.array([8, 3, 5], dtype=np.int32)
+    candidate_ids = np.array([0, 1, 2, 5, 7, 11, 20, 31], dtype=np.int32)
+    candidate_mask = np.ones((3, candidate_ids.shape[0]), dtype=np.bool_)
+    candidate_mask[1, 3:6] = False
+    step_data = mx.np.array([2, 5, 7], dtype=np.int32)
+    gt_out, _ = inference_model(step_data, inference_model.init_states(src_data,
+                                                                       src_valid_length))
+    states = shortlist_model.init_states(src_data, src_valid_length,
+                                         shortlist=(candidate_ids, candidate_mask))
+    out, new_states = shortlist_model(step_data, states)
+    assert len(new_states) == len(states)
+    gt_out = gt_out.asnumpy()
+    out = out.asnumpy()
+    assert out.shape == gt_out.shape
+    for i in range(3):
+        allowed = candidate_ids[candidate_mask[i]]
+        assert_allclose(out[i, allowed], gt_out[i, allowed], 1E-4, 1E-4)
+        assert (np.delete(out[i], allowed) < -1E10).all()
+    # The beam search gives the same results if all the tokens are candidates
+    outputs = []
+    for decoder, shortlist in [(inference_model, None),
+                               (shortlist_model,
+                                (np.arange(vocab_size), np.ones((3, vocab_size), dtype=np.bool_)))]:
+        sampler = BeamSearchSampler(beam_size=4, decoder=decoder, eos_id=1,
+                                    vocab_size=vocab_size, max_length_b=10)
+        states = decoder.init_states(src_data, src_valid_length, shortlist=shortlist)
+        outputs.append(sampler(mx.np.full((3,), 2, dtype=np.int32), states))
+    (gt_samples, gt_scores, _), (samples, scores, _) = outputs
+    assert_allclose(samples.asnumpy(), gt_samples.asnumpy())
+    assert_allclose(scores.asnumpy(), gt_scores.asnumpy(), 1E-4, 1E-4)
+    with pytest.raises(ValueError):
+        shortlist_model.init_states(src_data, src_valid_length)
+
+
+@pytest.mark.parametrize('layout', ['NT', 'TN'])
+def test_translation_engine(layout):
+    vocab_size = 32
+    bos_id, eos_id = 2, 1
+    model = TransformerModel(src_vocab_size=vocab_size,
+                             tgt_vocab_size=vocab_size,
+                             max_src_length=20,
+                             max_tgt_length=20,
+                             enc_units=24,
+                             enc_hidden_size=64,
+                             enc_num_heads=4,
+                             enc_num_layers=2,
+                             dec_units=24,
+                             dec_hidden_size=64,
+                             dec_num_heads=4,
+                             dec_num_layers=2,
+                             dropout=0.0,
+                             layout=layout)
+    model.initialize()
+    inference_model = TransformerNMTInference(model=model)
+    inference_model.hybridize()
+    sampler = BeamSearchSampler(beam_size=2, decoder=inference_model, eos_id=eos_id,
+                                vocab_size=vocab_size, max_length_b=8)
+    rng = np.random.RandomState(100)
+    src_ids = [rng.randint(3, vocab_size, rng.randint(1, 10)).tolist() + [eos_id]
+               for _ in range(20)]
+    # Translate each sentence separately
+    gt_tgt_ids = []
+    for ele in src_ids:
+        src_data = mx.np.array([ele], dtype=np.int32)
+        if layout == 'TN':
+            src_data = src_data.T
+        src_valid_length = mx.np.array([len(ele)], dtype=np.int32)
+        states = inference_model.init_states(src_data, src_valid_length)
+        samples, _, valid_length = sampler(mx.np.array([bos_id], dtype=np.int32), states,
+                                           src_valid_length)
+        tgt_ids = samples[0, 0, 1:int(valid_length[0, 0])].asnumpy().tolist()
+        if len(tgt_ids) > 0 and tgt_ids[-1] == eos_id:
+            tgt_ids = tgt_ids[:-1]
+        gt_tgt_ids.append(tgt_ids)
+    engine = TranslationEngine(inference_model, sampler, bos_id=bos_id, eos_id=eos_id,
+                               encode_fn=lambda lines: [[int(token) for token in line.split()]
+                                                        + [eos_id] for line in lines],
+                               decode_fn=lambda ids: ' '.join(str(token) for token in ids),
+                               max_num_tokens=24, num_workers=2)
+    assert engine.translate_ids(src_ids) == gt_tgt_ids
+    assert engine.translate_ids([]) == []
+    sentences = [' '.join(str(token) for token in ele[:-1]) for ele in src_ids]
+    assert engine.translate(sentences) == [' '.join(str(token) for token in ele)
+                                           for ele in gt_tgt_ids]
+    with pytest.raises(ValueError):
+        TranslationEngine(inference_model, sampler, bos_id=bos_id,
+                          eos_id=eos_id).translate(sentences)
+
+
 def test_transformer_cfg_registry():
     assert len(transformer_cfg_reg.list_keys()) > 0
 
@@ -1,3 +1,4 @@
+import asyncio
 import collections
 import functools
 import mxnet as mx
@@ -6,7 +7,10 @@ import scipy
 import pytest
 from mxnet.gluon import nn, HybridBlock
 from numpy.testing import assert_allclose
-from gluonnlp.sequence_sampler import BeamSearchScorer, BeamSearchSampler
+from gluonnlp.sequence_sampler import BeamSearchScorer, BeamSearchSampler, IndirectBatchAxis,\
+    ContinuousBatchingScheduler, ForcedPrefixLogitsProcessor, BannedTokensLogitsProcessor,\
+    NGramBlockingLogitsProcessor, LexicalConstraintLogitsProcessor, _expand_to_beam_size,\
+    _choose_states, _get_sampling_candidates
 mx.npx.set_np()
 
 
@@ -36,6 +40,23 @@ def test_beam_search_score(length, alpha, K, batch_size, vocab_size, from_logits
     assert_allclose(scores.asnumpy(), sum_log_probs.asnumpy() / lp, 1E-5, 1E-5)
 
 
+def test_choose_states_indirect_batch_axis():
+    states = [mx.np.arange(6).reshape((2, 3)),
+              (mx.np.arange(12).reshape((3, 2, 2)), mx.np.arange(2))]
+    state_batch_axis = [0, (IndirectBatchAxis(1), 0)]
+    assert repr(state_batch_axis[1][0]) == 'IndirectBatchAxis(1)'
+    expanded = _expand_to_beam_size(states, beam_size=2, batch_size=2,
+                                    state_batch_axis=state_batch_axis)
+    assert expanded[0].shape == (4, 3)
+    assert expanded[1][0].shape == (3, 4, 2)
+    indices = mx.np.array([1, 1, 2, 3], dtype=np.int32)
+    chosen = _choose_states(expanded, indices, state_batch_axis)
+    assert_allclose(chosen[0].asnumpy(), expanded[0].asnumpy()[[1, 1, 2, 3]])
+    # The state with the indirect batch axis is not reordered
+    assert chosen[1][0] is expanded[1][0]
+    assert_allclose(chosen[1][1].asnumpy(), expanded[1][1].asnumpy()[[1, 1, 2, 3]])
+
+
 # TODO(sxjscience) Test for the state_batch_axis
 @pytest.mark.parametrize('early_return', [False, True])
 @pytest.mark.parametrize('eos_id', [0, None])
@@ -74,7 +95,7 @@ def test_beam_search(early_return, eos_id):
             return out, new_state
 
     vocab_size = 3
-    batch_size = 2
+    batch_size = 8
     hidden_units = 3
     beam_size = 4
     step_decoder = SimpleStepDecoder(vocab_size, hidden_units)
@@ -94,6 +115,83 @@ def test_beam_search(early_return, eos_id):
             if vl < samples.shape[2]:
                 assert (samples[i, j, vl:] == -1).all()
             assert (samples[i, :, 0] == inputs[i].asnumpy()).all()
+    # Check the termination every 4 steps, fuse the decoder and the step update and drop the
+    # finished rows from the batch
+    for early_return_interval, fuse_step, compact_interval in [(4, False, None),
+                                                               (1, True, None),
+                                                               (4, True, None),
+                                                               (1, False, 1),
+                                                               (4, True, 3)]:
+        fast_sampler = BeamSearchSampler(beam_size=4, decoder=step_decoder, eos_id=eos_id,
+                                         vocab_size=vocab_size, max_length_b=100,
+                                         early_return=early_return,
+                                         early_return_interval=early_return_interval,
+                                         fuse_step=fuse_step,
+                                         compact_interval=compact_interval)
+        fast_samples, fast_scores, fast_valid_length = fast_sampler(inputs, states)
+        fast_samples = fast_samples.asnumpy()
+        assert fast_samples.shape[2] >= samples.shape[2]
+        assert_allclose(fast_samples[:, :, :samples.shape[2]], samples)
+        assert (fast_samples[:, :, samples.shape[2]:] == -1).all()
+        assert_allclose(fast_scores.asnumpy(), scores.asnumpy(), 1E-5, 1E-5)
+        assert_allclose(fast_valid_length.asnumpy(), valid_length)
+
+
+@pytest.mark.parametrize('early_return', [False, True])
+@pytest.mark.parametrize('num_steps', [[1, 30, 2, 15, 3, 40, 5, 8],
+                                       [1, 30, 2, 15, 3, 100, 5, 8]])
+def test_beam_search_compaction(early_return, num_steps):
+    class CountdownStepDecoder(HybridBlock):
+        """Emit EOS=0 after the number of steps stored in the state"""
+        def __init__(self, vocab_size=5):
+            super().__init__()
+            self._vocab_size = vocab_size
+            self.x2logits_map = nn.Embedding(input_dim=vocab_size, output_dim=vocab_size)
+
+        @property
+        def state_batch_axis(self):
+            return 0
+
+        def hybrid_forward(self, F, data, state):
+            eos_logits = F.np.where(state <= 1, 100.0, -100.0)
+            # Scale the logits by the step to avoid the ties between the beams
+            out = self.x2logits_map(data) * F.np.expand_dims(1 + 0.1 * F.np.abs(state), axis=1)\
+                + F.npx.one_hot(F.np.zeros_like(data), depth=self._vocab_size)\
+                * F.np.expand_dims(eos_logits, axis=1)
+            return out, state - 1
+
+    vocab_size = 5
+    batch_size = len(num_steps)
+    step_decoder = CountdownStepDecoder(vocab_size)
+    step_decoder.initialize()
+    states = mx.np.array(num_steps, dtype=np.float32)
+    inputs = mx.np.random.randint(1, vocab_size, (batch_size,))
+    sampler = BeamSearchSampler(beam_size=4, decoder=step_decoder, eos_id=0,
+                                vocab_size=vocab_size, max_length_b=50,
+                                early_return=early_return)
+    samples, scores, valid_length = sampler(inputs, states)
+    samples = samples.asnumpy()
+    # The rows finish at very different steps
+    assert sorted(set(valid_length.asnumpy()[:, 0].tolist())) == sorted(
+        set([min(ele, 51) + 1 for ele in num_steps]))
+    for early_return_interval, fuse_step, compact_interval in [(1, False, 1),
+                                                               (4, False, 1),
+                                                               (1, True, 3),
+                                                               (4, True, 7)]:
+        compact_sampler = BeamSearchSampler(beam_size=4, decoder=step_decoder, eos_id=0,
+                                            vocab_size=vocab_size, max_length_b=50,
+                                            early_return=early_return,
+                                            early_return_interval=early_return_interval,
+                                            fuse_step=fuse_step,
+                                            compact_interval=compact_interval)
+        compact_samples, compact_scores, compact_valid_length = compact_sampler(inputs, states)
+        compact_samples = compact_samples.asnumpy()
+        assert compact_samples.shape[0] == batch_size
+        assert compact_samples.shape[2] >= samples.shape[2]
+        assert_allclose(compact_samples[:, :, :samples.shape[2]], samples)
+        assert (compact_samples[:, :, samples.shape[2]:] == -1).all()
+        assert_allclose(compact_scores.asnumpy(), scores.asnumpy(), 1E-5, 1E-5)
+        assert_allclose(compact_valid_length.asnumpy(), valid_length.asnumpy())
 
 
 # TODO(sxjscience) Test for the state_batch_axis
@@ -208,3 +306,216 @@ def test_multinomial_sampling(early_return, sampling_paras, eos_id):
             if vl < samples.shape[2]:
                 assert (samples[i, j, vl:] == -1).all()
             assert (samples[i, :, 0] == inputs[i].asnumpy()).all()
+
+
+@pytest.mark.parametrize('sampling_topp,sampling_topk', [(-1.0, -1), (0.01, -1), (0.1, -1),
+                                                         (0.9, -1), (-1.0, 1), (-1.0, 5),
+                                                         (-1.0, 2000)])
+def test_get_sampling_candidates(sampling_topp, sampling_topk):
+    vocab_size = 1000
+    logits = np.random.normal(0, 3, (6, 4, vocab_size))
+    # Peaky distributions
+    logits[:3, :, :4] += 10
+    probs = scipy.special.softmax(logits, axis=-1)
+    # The filtering over the whole vocabulary
+    if sampling_topp > 0:
+        gt_probs = np.where(probs > sampling_topp, probs, 0)
+    elif sampling_topk > 0:
+        k_prob = np.sort(probs, axis=-1)[:, :, -min(sampling_topk, vocab_size)][:, :, None]
+        gt_probs = np.where(probs >= k_prob, probs, 0)
+    else:
+        gt_probs = probs
+    keep = gt_probs.sum(axis=-1) > 0
+    gt_probs = gt_probs / np.maximum(gt_probs.sum(axis=-1, keepdims=True), 1E-30)
+    candidate_probs, candidate_ids = _get_sampling_candidates(mx.np.array(probs),
+                                                              sampling_topp, sampling_topk)
+    candidate_probs = candidate_probs.asnumpy()
+    if sampling_topp <= 0 and sampling_topk <= 0:
+        assert candidate_ids is None
+        assert_allclose(candidate_probs, gt_probs, 1E-5, 1E-6)
+        return
+    if sampling_topp > 0:
+        assert candidate_probs.shape[-1] == int(np.ceil(1 / sampling_topp))
+    else:
+        assert candidate_probs.shape[-1] == min(sampling_topk, vocab_size)
+    all_probs = np.zeros_like(gt_probs)
+    np.put_along_axis(all_probs, candidate_ids.asnumpy().astype(np.int64), candidate_probs,
+                      axis=-1)
+    assert_allclose(all_probs[keep], gt_probs[keep], 1E-5, 1E-6)
+
+
+@pytest.mark.parametrize('fuse_step,compact_interval', [(False, None), (True, None), (False, 2)])
+@pytest.mark.parametrize('sampling', [False, True])
+def test_beam_search_logits_processors(fuse_step, compact_interval, sampling):
+    class EOSStepDecoder(HybridBlock):
+        """The logit of EOS grows after num_free_steps steps, so the beams finish before
+        max_length steps unless a processor forbids EOS"""
+        def __init__(self, vocab_size=5, hidden_units=4, eos_id=0, num_free_steps=5):
+            super().__init__()
+            self._vocab_size = vocab_size
+            self._eos_id = eos_id
+            self._num_free_steps = num_free_steps
+            self.x2h_map = nn.Embedding(input_dim=vocab_size, output_dim=hidden_units)
+            self.h2h_map = nn.Dense(units=hidden_units, flatten=False)
+            self.vocab_map = nn.Dense(units=vocab_size, flatten=False)
+
+        @property
+        def state_batch_axis(self):
+            return [0, 0]
+
+        def hybrid_forward(self, F, data, states):
+            state, num_steps = states
+            new_state = F.np.tanh(self.h2h_map(state) + self.x2h_map(data))
+            num_steps = num_steps + 1
+            eos_mask = F.npx.one_hot(F.np.zeros_like(num_steps) + self._eos_id, self._vocab_size)
+            eos_bonus = F.npx.relu(num_steps - self._num_free_steps) * 10.0
+            out = self.vocab_map(new_state) + F.np.expand_dims(eos_bonus, axis=1) * eos_mask
+            return out, [new_state, num_steps]
+
+    vocab_size = 8
+    batch_size = 3
+    hidden_units = 4
+    beam_size = 4
+    eos_id = 0
+    max_length = 12
+    step_decoder = EOSStepDecoder(vocab_size, hidden_units, eos_id)
+    step_decoder.initialize()
+    states = [mx.np.random.normal(0, 1, (batch_size, hidden_units)),
+              mx.np.zeros((batch_size,))]
+    inputs = mx.np.random.randint(1, vocab_size, (batch_size,))
+
+    def get_sampler(logits_processors):
+        return BeamSearchSampler(beam_size=beam_size, decoder=step_decoder, eos_id=eos_id,
+                                 vocab_size=vocab_size, max_length_b=max_length, sampling=sampling,
+                                 fuse_step=fuse_step, compact_interval=compact_interval,
+                                 logits_processors=logits_processors)
+
+    def get_sequences(samples, scores, valid_length):
+        # The beams that have to choose the forbidden tokens have the scores of -inf. The beams
+        # that are still alive after max_length steps get the EOS token appended by the sampler
+        # instead of the processors, so they are skipped. The valid length includes the initial
+        # input.
+        samples = samples.asnumpy()
+        scores = scores.asnumpy()
+        valid_length = valid_length.asnumpy()
+        for i in range(batch_size):
+            for j in range(beam_size):
+                if scores[i, j] > -1E10 and valid_length[i, j] <= max_length + 1:
+                    yield i, samples[i, j, 1:valid_length[i, j]].tolist()
+
+    # Force the prefixes, ban a token and block the repeated bigrams together
+    prefix = np.array([[3, 4, 5], [6, -1, -1], [-1, -1, -1]], dtype=np.int32)
+    sampler = get_sampler([ForcedPrefixLogitsProcessor(),
+                           BannedTokensLogitsProcessor(vocab_size, banned_ids=[1]),
+                           NGramBlockingLogitsProcessor(2, vocab_size, max_length)])
+    assert 'NGramBlockingLogitsProcessor' in repr(sampler)
+    outputs = sampler(inputs, states, None, [{'prefix': mx.np.array(prefix)}, {}, {}])
+    num_sequences = 0
+    for i, sequence in get_sequences(*outputs):
+        num_sequences += 1
+        row_prefix = prefix[i][prefix[i] >= 0].tolist()
+        assert sequence[:len(row_prefix)] == row_prefix
+        assert 1 not in sequence
+        bigrams = list(zip(sequence[:-1], sequence[1:]))
+        assert len(set(bigrams)) == len(bigrams)
+    assert num_sequences >= batch_size
+    # The banned tokens of each sample override the banned tokens of the processor
+    banned_ids = np.array([[3, -1], [4, 5], [-1, -1]], dtype=np.int32)
+    sampler = get_sampler([BannedTokensLogitsProcessor(vocab_size, banned_ids=[1])])
+    outputs = sampler(inputs, states, None, [{'banned_ids': mx.np.array(banned_ids)}])
+    for i, sequence in get_sequences(*outputs):
+        assert not set(sequence) & set(banned_ids[i][banned_ids[i] >= 0].tolist())
+    with pytest.raises(ValueError):
+        sampler(inputs, states, None, [{}, {}])
+    # The finished samples include all of their constraints
+    constraints = np.array([[[3, 4], [5, -1]], [[6, 7], [-1, -1]], [[-1, -1], [-1, -1]]],
+                           dtype=np.int32)
+    sampler = get_sampler([LexicalConstraintLogitsProcessor(eos_id=eos_id, bonus=2.0)])
+    outputs = sampler(inputs, states, None, [{'constraints': mx.np.array(constraints)}])
+    for i, sequence in get_sequences(*outputs):
+        if len(sequence) == 0 or sequence[-1] != eos_id:
+            continue
+        for constraint in constraints[i]:
+            phrase = constraint[constraint >= 0].tolist()
+            if len(phrase) > 0:
+                assert any(sequence[k:k + len(phrase)] == phrase
+                           for k in range(len(sequence) - len(phrase) + 1))
+
+
+@pytest.mark.parametrize('eos_id', [0, None])
+def test_continuous_batching_scheduler(eos_id):
+    class SimpleStepDecoder(HybridBlock):
+        def __init__(self, vocab_size=5, hidden_units=4):
+            super().__init__()
+            self.x2h_map = nn.Embedding(input_dim=vocab_size, output_dim=hidden_units)
+            self.h2h_map = nn.Dense(units=hidden_units, flatten=False)
+            self.vocab_map = nn.Dense(units=vocab_size, flatten=False)
+
+        @property
+        def state_batch_axis(self):
+            return 0, 0
+
+        def init_states(self, state):
+            return state, mx.np.zeros((state.shape[0],), dtype=np.int32)
+
+        def hybrid_forward(self, F, data, states):
+            state, position = states
+            new_state = F.np.tanh(self.h2h_map(state) + self.x2h_map(data))
+            out = self.vocab_map(new_state)
+            return out, (new_state, position + 1)
+
+    vocab_size = 5
+    hidden_units = 4
+    max_length = 8
+    step_decoder = SimpleStepDecoder(vocab_size, hidden_units)
+    step_decoder.initialize()
+    rng = np.random.RandomState(100)
+    requests = [(int(rng.randint(1, vocab_size)), int(rng.randint(1, max_length + 1)),
+                 mx.np.array(rng.normal(0, 1, (1, hidden_units)), dtype=np.float32))
+                for _ in range(10)]
+    gt_samples = []
+    for step_input, request_max_length, state in requests:
+        states = step_decoder.init_states(state)
+        samples = [step_input]
+        for _ in range(request_max_length):
+            out, states = step_decoder(mx.np.array([samples[-1]], dtype=np.int32), states)
+            samples.append(int(out.asnumpy()[0].argmax()))
+            if samples[-1] == eos_id:
+                break
+        gt_samples.append(samples)
+    scheduler = ContinuousBatchingScheduler(step_decoder, num_slots=3, eos_id=eos_id,
+                                            max_length=max_length)
+    # Add half of the requests while the others are running
+    request_ids = [scheduler.add_request(step_input, request_max_length, state=state)
+                   for step_input, request_max_length, state in requests[:5]]
+    results = dict()
+    for _ in range(3):
+        results.update(scheduler.step())
+    assert scheduler.num_active + scheduler.num_pending + len(results) == 5
+    request_ids += [scheduler.add_request(step_input, request_max_length, state=state)
+                    for step_input, request_max_length, state in requests[5:]]
+    results.update(scheduler.run())
+    assert scheduler.num_active == 0 and scheduler.num_pending == 0
+    for request_id, samples in zip(request_ids, gt_samples):
+        assert results[request_id].tolist() == samples
+    with pytest.raises(ValueError):
+        scheduler.add_request(1, max_length + 1, state=requests[0][2])
+    scheduler.add_request(1, state=mx.np.zeros((1, hidden_units + 1)))
+    with pytest.raises(ValueError):
+        scheduler.step()
+
+    # Serve the requests with asyncio
+    async def serve_requests():
+        serve_task = asyncio.ensure_future(scheduler.serve())
+        await asyncio.sleep(0)
+        outputs = await asyncio.gather(
+            *[scheduler.submit(step_input, request_max_length, state=state)
+              for step_input, request_max_length, state in requests])
+        with pytest.raises(ValueError):
+            await scheduler.submit(1, state=mx.np.zeros((2, hidden_units)))
+        scheduler.stop()
+        await serve_task
+        return outputs
+
+    for samples, gt in zip(asyncio.run(serve_requests()), gt_samples):
+        assert samples.tolist() == gt
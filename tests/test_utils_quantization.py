@@ -0,0 +1,63 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+import mxnet as mx
+from numpy.testing import assert_allclose
+from gluonnlp.models.bert import BertModel
+from gluonnlp.utils.quantization import quantize_rows, dequantize_rows,\
+    quantize_embedding_params
+mx.npx.set_np()
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'float16'])
+@pytest.mark.parametrize('block_size', [3, 65536])
+def test_quantize_rows(dtype, block_size):
+    matrix = np.random.normal(0, 1, (10, 20)).astype(np.float32)
+    matrix[1] *= 1000
+    matrix[2] = 0
+    data, scale = quantize_rows(matrix, dtype, block_size=block_size)
+    assert data.dtype == np.dtype(dtype)
+    assert scale.shape == (10,) and scale.dtype == np.float32
+    recovered = dequantize_rows(data, scale)
+    max_err = np.abs(recovered - matrix).max(axis=1)
+    row_max = np.abs(matrix).max(axis=1)
+    rtol = 1 / 254 if dtype == 'int8' else 1E-3
+    assert (max_err <= row_max * rtol + 1E-6).all()
+    assert_allclose(recovered[2], 0)
+    with pytest.raises(ValueError):
+        quantize_rows(matrix, 'int4')
+
+
+@pytest.mark.parametrize('dtype', ['int8', 'float16'])
+def test_quantize_embedding_params(dtype):
+    cfg = BertModel.get_cfg()
+    cfg.defrost()
+    cfg.MODEL.vocab_size = 100
+    cfg.MODEL.units = 32
+    cfg.MODEL.hidden_size = 64
+    cfg.MODEL.num_layers = 2
+    cfg.MODEL.num_heads = 2
+    cfg.freeze()
+    inputs = mx.np.random.randint(0, 100, (2, 8))
+    token_types = mx.np.zeros((2, 8), dtype=np.int32)
+    valid_length = mx.np.array([8, 5], dtype=np.int32)
+    model = BertModel.from_cfg(cfg)
+    model.initialize()
+    contextual_embedding, _ = model(inputs, token_types, valid_length)
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'model.params')
+        model.save_parameters(path)
+        params = mx.npx.load(path)
+        new_params = quantize_embedding_params(params, dtype=dtype)
+        assert new_params['word_embed.weight'].dtype == np.dtype(dtype)
+        assert new_params['word_embed.scale'].shape == (100,)
+        quantized_path = os.path.join(root, 'model_quantized.params')
+        mx.npx.save(quantized_path, new_params)
+        quantized_model = BertModel.from_cfg(cfg, word_embed_storage_dtype=dtype)
+        quantized_model.load_parameters(quantized_path)
+        quantized_contextual_embedding, _ = quantized_model(inputs, token_types, valid_length)
+        assert_allclose(quantized_contextual_embedding.asnumpy(),
+                        contextual_embedding.asnumpy(), 5E-2, 5E-2)
+    with pytest.raises(KeyError):
+        quantize_embedding_params(params, ['unknown.weight'])